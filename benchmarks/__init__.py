@@ -0,0 +1,7 @@
+"""
+Performance benchmarks for the Database MCP project.
+
+The pipeline benchmark (``python -m benchmarks.pipeline``) runs the
+natural language -> SQL -> answer pipeline against generated databases
+using a deterministic local stand-in for the OpenAI client.
+"""
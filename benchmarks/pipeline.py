@@ -0,0 +1,328 @@
+"""
+End-to-end benchmark of the natural language -> SQL -> answer pipeline.
+
+For each scale factor a database is generated with
+database/seed_data/populate_database.py (fixed seed, cached under
+benchmarks/.data/). DatabaseQueryEngine.process_natural_language_query is
+then driven with the SQL_FEW_SHOT_EXAMPLES workload while the engine's
+OpenAI client is replaced by StubLLMClient. Each pipeline stage is timed:
+
+    generate_sql   question -> SQL (resolve_sql: templates, SQL and
+                   similarity caches, simulated LLM call)
+    execute_sql    running the SQL (result cache, columnar store, rollup
+                   rewrite, SQLite)
+    interpret      rows -> answer (simulated LLM call)
+    total          the whole process_natural_language_query call
+
+Two scenarios run per scale:
+
+- 'uncached': every shortcut layer (SHORTCUTS: SQL cache, similarity
+  cache, templates, result cache, columnar store, rollup rewriting) is
+  disabled. Each query therefore calls the stub LLM twice and runs its SQL
+  in SQLite.
+- 'cached': all of them are on and warmed by a first pass.
+
+p50/p95/p99 per stage and overall throughput are written to JSON. They
+are then compared with the committed baseline (benchmarks/baseline.json),
+and the exit status is non-zero on regressions.
+
+    python -m benchmarks.pipeline --scales 1,10 --iterations 20
+
+The baseline holds timings from one machine, so compare runs on similar
+hardware. After an intentional performance change, regenerate it with the
+default settings and commit the result:
+
+    python -m benchmarks.pipeline --update-baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Add project root to path when run as a script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# The engine refuses to start without a key; the stub never uses it
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark-stub')
+
+from benchmarks.stub_llm import StubLLMClient
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.query_engine import DatabaseQueryEngine
+from database.seed_data import populate_database
+
+BENCHMARK_DIR = Path(__file__).parent
+DATA_DIR = BENCHMARK_DIR / '.data'
+DEFAULT_RESULTS = BENCHMARK_DIR / 'results.json'
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baseline.json'
+
+STAGES = ('generate_sql', 'execute_sql', 'interpret', 'total')
+PERCENTILES = (50, 95, 99)
+SCENARIOS = ('uncached', 'cached')
+
+# Engine layers that answer without the LLM or without SQLite ('uncached' turns them all off)
+SHORTCUTS = ('sql_cache', 'similar_sql', 'templates', 'result_cache', 'columnar', 'rollups')
+
+# A stage regresses when its p95 exceeds the baseline by both margins
+REGRESSION_TOLERANCE = 0.20
+REGRESSION_MIN_MS = 1.0
+
+
+def prepare_database(scale: float, seed: int, regenerate: bool = False) -> Path:
+    """Generate (or reuse) the benchmark database for one scale factor."""
+    DATA_DIR.mkdir(exist_ok=True)
+    path = DATA_DIR / f"usage_scale{scale:g}_seed{seed}.db"
+    if path.exists() and not regenerate:
+        return path
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    print(f"🏗️  Generating scale {scale:g} database at {path}...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        populate_database.main(['--db', str(path), '--scale', str(scale), '--seed', str(seed),
+                                '--workers', str(min(4, os.cpu_count() or 1))])
+    return path
+
+
+class StageRecorder:
+    """
+    Wraps engine methods so each call's duration is attributed to a stage.
+    """
+
+    def __init__(self, engine: DatabaseQueryEngine):
+        self._local = threading.local()
+        for stage, method in (('generate_sql', 'resolve_sql'),
+                              ('execute_sql', 'execute_sql_query'),
+                              ('interpret', 'interpret_data_with_llm')):
+            setattr(engine, method, self._timed(stage, getattr(engine, method)))
+
+    def _timed(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sample = getattr(self._local, 'sample', None)
+                if sample is not None:
+                    sample[stage] = (time.perf_counter() - start) * 1000
+        return wrapper
+
+    def run(self, func, *args) -> Dict[str, float]:
+        """Call ``func`` and return the per-stage timings (ms) it produced."""
+        self._local.sample = {}
+        start = time.perf_counter()
+        try:
+            func(*args)
+        finally:
+            sample, self._local.sample = self._local.sample, None
+        sample['total'] = (time.perf_counter() - start) * 1000
+        return sample
+
+
+def summarize(samples: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Percentiles per stage over a list of per-query samples."""
+    summary = {}
+    for stage in STAGES:
+        values = np.array([sample[stage] for sample in samples if stage in sample])
+        if not len(values):
+            continue
+        stats = {f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}
+        stats.update(mean=float(values.mean()), count=int(len(values)))
+        summary[stage] = stats
+    return summary
+
+
+def run_scenario(db_path: Path, scenario: str, iterations: int, concurrency: int,
+                 llm_latency_ms: float, llm_jitter_ms: float, seed: int) -> Dict[str, Any]:
+    """Benchmark one (database, scenario) pair."""
+    engine = DatabaseQueryEngine(db_path)
+    engine.client = StubLLMClient(latency_ms=llm_latency_ms, jitter_ms=llm_jitter_ms, seed=seed)
+    cached = scenario == 'cached'
+    for layer in SHORTCUTS:
+        getattr(engine, layer).enabled = cached
+    engine.sql_cache.clear()
+    engine.result_cache.clear()
+    recorder = StageRecorder(engine)
+
+    questions = [example['question'] for example in SQL_FEW_SHOT_EXAMPLES]
+    workload = questions * iterations
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up pass: schema/prompt cache, pool, page cache (and the caches when enabled)
+        for question in questions:
+            engine.process_natural_language_query(question)
+        if cached:
+            # Both are built in the background
+            engine.columnar.wait_until_loaded()
+            engine.rollups.wait_for_refresh()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(
+                lambda q: recorder.run(engine.process_natural_language_query, q), workload))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'queries': len(workload),
+        'seconds': elapsed,
+        'throughput_qps': len(workload) / elapsed if elapsed else 0.0,
+        'stages': summarize(samples),
+        'llm_calls': dict(engine.client.calls),
+    }
+
+
+def run_benchmarks(scales: Sequence[float], iterations: int = 10, concurrency: int = 1,
+                   llm_latency_ms: float = 0.0, llm_jitter_ms: float = 0.0, seed: int = 42,
+                   scenarios: Sequence[str] = SCENARIOS, regenerate: bool = False) -> Dict[str, Any]:
+    """
+    Run every scenario at every scale factor.
+
+    Returns:
+        JSON-serialisable results document
+    """
+    results = {}
+    for scale in scales:
+        db_path = prepare_database(scale, seed, regenerate)
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT COUNT(*) FROM usage_data").fetchone()[0]
+        conn.close()
+
+        entry = {'rows': rows, 'scenarios': {}}
+        for scenario in scenarios:
+            print(f"⏱️  scale {scale:g} ({rows:,} rows), {scenario}...")
+            entry['scenarios'][scenario] = run_scenario(
+                db_path, scenario, iterations, concurrency, llm_latency_ms, llm_jitter_ms, seed)
+        results[f"{scale:g}"] = entry
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'config': {
+                'scales': list(scales),
+                'iterations': iterations,
+                'concurrency': concurrency,
+                'llm_latency_ms': llm_latency_ms,
+                'llm_jitter_ms': llm_jitter_ms,
+                'seed': seed,
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = REGRESSION_TOLERANCE,
+            min_ms: float = REGRESSION_MIN_MS) -> List[Dict[str, Any]]:
+    """
+    Compare p95 per stage with a baseline results document.
+
+    Returns:
+        One entry per (scale, scenario, stage) present in both, with a
+        'regression' flag
+    """
+    comparisons = []
+    for scale, entry in current['results'].items():
+        base_entry = baseline.get('results', {}).get(scale)
+        if not base_entry:
+            continue
+        for scenario, result in entry['scenarios'].items():
+            base_stages = base_entry['scenarios'].get(scenario, {}).get('stages', {})
+            for stage, stats in result['stages'].items():
+                if stage not in base_stages:
+                    continue
+                now, before = stats['p95'], base_stages[stage]['p95']
+                comparisons.append({
+                    'scale': scale,
+                    'scenario': scenario,
+                    'stage': stage,
+                    'baseline_p95': before,
+                    'current_p95': now,
+                    'change': (now - before) / before if before else 0.0,
+                    'regression': now > before * (1 + tolerance) and now - before > min_ms,
+                })
+    return comparisons
+
+
+def format_results(document: Dict[str, Any]) -> str:
+    """Render results as a plain-text table."""
+    lines = [f"{'scale':>6} {'scenario':<9} {'stage':<13} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'qps':>9}"]
+    for scale, entry in document['results'].items():
+        for scenario, result in entry['scenarios'].items():
+            for stage, stats in result['stages'].items():
+                qps = f"{result['throughput_qps']:9.1f}" if stage == 'total' else ''
+                lines.append(f"{scale:>6} {scenario:<9} {stage:<13} {stats['p50']:9.2f} "
+                             f"{stats['p95']:9.2f} {stats['p99']:9.2f} {qps}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NL -> SQL -> answer pipeline")
+    parser.add_argument('--scales', default='1,10',
+                        help="Comma-separated populate_database --scale factors (default 1,10)")
+    parser.add_argument('--iterations', type=int, default=10, help="Passes over the workload per scenario")
+    parser.add_argument('--concurrency', type=int, default=1, help="Queries in flight at once")
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help="Simulated LLM latency per call")
+    parser.add_argument('--llm-jitter-ms', type=float, default=0.0, help="Extra random LLM latency per call")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for data generation and LLM jitter")
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate cached benchmark databases")
+    parser.add_argument('--output', default=str(DEFAULT_RESULTS), help="Where to write the results JSON")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline results to compare with")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="Allowed p95 slowdown as a fraction (default 0.20)")
+    args = parser.parse_args(argv)
+
+    scales = [float(scale) for scale in args.scales.split(',') if scale.strip()]
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    document = run_benchmarks(scales, args.iterations, args.concurrency, args.llm_latency_ms,
+                              args.llm_jitter_ms, args.seed, scenarios, args.regenerate)
+
+    Path(args.output).write_text(json.dumps(document, indent=2))
+    print(format_results(document))
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(document, indent=2))
+        print(f"📌 Baseline updated: {args.baseline}")
+        return 0
+
+    if not Path(args.baseline).exists():
+        print(f"ℹ️  No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    settings = ('concurrency', 'llm_latency_ms', 'llm_jitter_ms', 'seed')
+    base_config = baseline.get('meta', {}).get('config', {})
+    mismatched = [key for key in settings if base_config.get(key) != document['meta']['config'][key]]
+    if mismatched:
+        print(f"⚠️  Baseline was recorded with different settings ({', '.join(mismatched)}); "
+              f"comparison may not be meaningful")
+
+    comparisons = compare(document, baseline, args.tolerance)
+    regressions = [c for c in comparisons if c['regression']]
+    for c in regressions:
+        print(f"❌ Regression: scale {c['scale']} {c['scenario']} {c['stage']} p95 "
+              f"{c['baseline_p95']:.2f} ms -> {c['current_p95']:.2f} ms ({c['change']:+.0%})")
+    if not regressions:
+        print(f"✅ No regressions against baseline ({len(comparisons)} stage comparisons)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
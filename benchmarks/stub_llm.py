@@ -0,0 +1,113 @@
+"""
+Deterministic local stand-in for the OpenAI chat completions client.
+
+StubLLMClient exposes the ``client.chat.completions.create(**request)`` call
+used by DatabaseQueryEngine (``stream=True`` yields one chunk per word). SQL-generation requests are answered from the
+few-shot workload (question -> SQL); interpretation requests get a short
+canned summary. Every call sleeps for a configurable simulated latency. The
+jitter comes from a seeded generator, so runs are repeatable.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional
+
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.sql_cache import normalize_question
+
+# Returned for SQL-generation requests the workload does not know
+FALLBACK_SQL = "SELECT COUNT(*) AS result FROM usage_data"
+
+
+def _completion(content: str):
+    message = SimpleNamespace(role='assistant', content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason='stop')])
+
+
+def _chunks(content: str):
+    """Split a response into streaming chunks, one per word."""
+    words = content.split(' ')
+    for i, word in enumerate(words):
+        delta = SimpleNamespace(role='assistant', content=word if i == 0 else ' ' + word)
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)], usage=None)
+
+
+class _StubCompletions:
+    def __init__(self, owner: 'StubLLMClient'):
+        self._owner = owner
+
+    def create(self, **request):
+        return self._owner.complete(request)
+
+
+class StubLLMClient:
+    """
+    Drop-in replacement for ``openai.OpenAI()`` in benchmarks.
+
+    Args:
+        workload: Iterable of {'question', 'sql'} pairs (default: few-shot examples)
+        latency_ms: Simulated latency per call
+        jitter_ms: Maximum extra latency per call, drawn from a seeded RNG
+        seed: Seed for the jitter
+    """
+
+    def __init__(self, workload: Optional[Iterable[Dict[str, str]]] = None,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = 0):
+        workload = SQL_FEW_SHOT_EXAMPLES if workload is None else workload
+        self.answers = {normalize_question(item['question']): item['sql'] for item in workload}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {'sql': 0, 'interpretation': 0}
+        self.chat = SimpleNamespace(completions=_StubCompletions(self))
+
+    def _delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+    def _respond(self, request) -> str:
+        system, user = request['messages'][0]['content'], request['messages'][-1]['content']
+        sql = self.answers.get(normalize_question(user))
+        with self._lock:
+            if sql is not None or 'SQL' in system:
+                self.calls['sql'] += 1
+            else:
+                self.calls['interpretation'] += 1
+                return "Here is a summary of the requested usage data."
+        return sql if sql is not None else FALLBACK_SQL
+
+    def complete(self, request):
+        """Answer one chat completion request."""
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        if request.get('stream'):
+            return _chunks(self._respond(request))
+        return _completion(self._respond(request))
+
+
+class _AsyncStubCompletions:
+    def __init__(self, owner: 'AsyncStubLLMClient'):
+        self._owner = owner
+
+    async def create(self, **request):
+        return await self._owner.complete(request)
+
+
+class AsyncStubLLMClient(StubLLMClient):
+    """Async variant, a drop-in for ``openai.AsyncOpenAI()``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chat = SimpleNamespace(completions=_AsyncStubCompletions(self))
+
+    async def complete(self, request):
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return _completion(self._respond(request))
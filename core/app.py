@@ -10,15 +10,24 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
+import io
 import sqlite3
 import json
-from flask import Flask, jsonify, render_template, request
+import time
+from flask import Flask, Response, g, jsonify, render_template, request, send_file, stream_with_context, url_for
 from dotenv import load_dotenv
 
 # Import our shared database query engine
 from database.query_engine import DatabaseQueryEngine
 from database.models import DATABASE
 from database.connection import get_db_connection
+from database.ingest import IngestError, detect_format, ingest_stream
+from database.budget import BudgetExceededError, get_budget
+from database.result_export import EXPORTS, ExportError
+from database.history_writer import get_history_writer
+from database.batch import BATCH_CONCURRENCY, run_batch, validate_batch
+from database.history_store import DEFAULT_HISTORY_PAGE_SIZE, ensure_history_schema, get_history_item, list_history
+from core import metrics
 
 # --- 1. CONFIGURATION ---
 # Load environment variables from .env file if present
@@ -37,11 +46,32 @@ except Exception as e:
     print(f"❌ Failed to initialize database engine: {e}")
     db_engine = None
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - started,
+                                     endpoint=request.endpoint or 'unknown',
+                                     status=response.status_code)
+    return response
+
 # --- 3. HELPER FUNCTIONS ---
 def get_db_connection_legacy():
     """Legacy helper function for backward compatibility."""
     return get_db_connection()
 
+def save_query_history(user_query, result):
+    """Queue a successful query and its response for the background history writer."""
+    get_history_writer().record(user_query, result, success=True)
+
+def sse_event(event, payload):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'), default=str)}\n\n"
+
 # --- 4. API ENDPOINTS ---
 @app.route('/api/llm_query', methods=['POST'])
 def llm_query():
@@ -63,32 +93,23 @@ def llm_query():
             }), 400
         
         # Use the shared database query engine
-        result = db_engine.process_natural_language_query(user_query)
+        result = db_engine.process_natural_language_query(user_query, get_budget('web'))
         
         # Add success flag for compatibility
         result['success'] = True
         
         # Store successful queries in history
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO query_history (query, sql_query, response, success)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                user_query,
-                result.get('sql', ''),  # Changed from 'sql_query' to 'sql'
-                json.dumps(result),
-                1
-            ))
-            conn.commit()
-        except Exception as e:
-            print(f"Warning: Failed to save query to history: {e}")
-        finally:
-            conn.close()
+        save_query_history(user_query, result)
         
         return jsonify(result)
         
+    except BudgetExceededError as e:
+        print(f"Error in llm_query: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'budget_exceeded': e.to_dict()
+        }), 422
     except Exception as e:
         print(f"Error in llm_query: {e}")
         return jsonify({
@@ -96,37 +117,170 @@ def llm_query():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@app.route('/api/llm_query/stream', methods=['POST'])
+def llm_query_stream():
+    """
+    Stream an LLM-powered database query as Server-Sent Events.
+    
+    Events, in order: 'sql' (generated SQL), 'data' (result rows), 'token'
+    (interpretation fragments as the LLM produces them) and 'done' (the
+    /api/llm_query payload without the rows). Failures end the stream with 'error'.
+    """
+    if not db_engine:
+        return jsonify({
+            'success': False, 
+            'error': 'Database engine not initialized'
+        }), 500
+    
+    data = request.get_json(silent=True) or {}
+    user_query = data.get('query', '').strip()
+    if not user_query:
+        return jsonify({
+            'success': False, 
+            'error': 'Query is required'
+        }), 400
+    
+    def generate():
+        try:
+            for event, payload in db_engine.stream_natural_language_query(user_query, get_budget('web')):
+                if event == 'done':
+                    payload['success'] = True
+                    save_query_history(user_query, payload)
+                    # The rows were already sent in the 'data' event
+                    payload = {key: value for key, value in payload.items() if key != 'data'}
+                yield sse_event(event, payload)
+        except BudgetExceededError as e:
+            print(f"Error in llm_query_stream: {e}")
+            yield sse_event('error', {'success': False, 'error': str(e), 'budget_exceeded': e.to_dict()})
+        except Exception as e:
+            print(f"Error in llm_query_stream: {e}")
+            yield sse_event('error', {'success': False, 'error': str(e)})
+    
+    return Response(stream_with_context(generate()), content_type='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/llm_query/batch', methods=['POST'])
+def llm_query_batch():
+    """
+    Answer a batch of questions concurrently.
+    
+    Body: {"questions": [...], "concurrency": optional int}. Duplicates are
+    answered once; results come back in input order with per-item errors
+    and timings. Successful answers are recorded in history.
+    """
+    if not db_engine:
+        return jsonify({
+            'success': False, 
+            'error': 'Database engine not initialized'
+        }), 500
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        questions = validate_batch(data.get('questions'))
+        concurrency = min(int(data.get('concurrency') or BATCH_CONCURRENCY), 32)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    budget = get_budget('web')
+    batch = run_batch(lambda question: db_engine.process_natural_language_query(question, budget),
+                      questions, concurrency)
+    
+    for item in batch['results']:
+        if item['success'] and 'duplicate_of' not in item:
+            save_query_history(item['question'], item)
+    
+    batch['success'] = True
+    return jsonify(batch)
+
+@app.route('/api/export', methods=['POST'])
+def export_query_results():
+    """
+    Answer a question with a downloadable Arrow IPC stream or Parquet file.
+    
+    Body: {"query": "...", "format": "arrow" | "parquet"}. The full result
+    is written to a file (no row cap beyond the export budget) and the
+    response carries its download URL, row count, size and column types.
+    """
+    if not db_engine:
+        return jsonify({
+            'success': False, 
+            'error': 'Database engine not initialized'
+        }), 500
+    
+    data = request.get_json(silent=True) or {}
+    user_query = data.get('query', '').strip()
+    if not user_query:
+        return jsonify({
+            'success': False, 
+            'error': 'Query is required'
+        }), 400
+    
+    try:
+        result = db_engine.export_natural_language_query(user_query, data.get('format') or 'arrow',
+                                                         get_budget('export'))
+        result['url'] = url_for('download_query_results', export_id=result['id'])
+        result['success'] = True
+        return jsonify(result)
+        
+    except (ExportError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except BudgetExceededError as e:
+        print(f"Error in export_query_results: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'budget_exceeded': e.to_dict()
+        }), 422
+    except Exception as e:
+        print(f"Error in export_query_results: {e}")
+        return jsonify({
+            'success': False, 
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/results/<export_id>', methods=['GET'])
+def download_query_results(export_id):
+    """Download an exported result file."""
+    export = EXPORTS.get(export_id)
+    if export is None:
+        return jsonify({
+            'success': False,
+            'error': 'Export not found or expired'
+        }), 404
+    return send_file(export.path, mimetype=export.format.mimetype,
+                     as_attachment=True, download_name=export.filename)
+
 @app.route('/api/history', methods=['GET'])
 def get_query_history():
-    """Get query history from database."""
+    """
+    List query history summaries, newest first.
+    
+    Query parameters:
+        limit: Page size (default 50)
+        before: Id of the last item on the previous page (keyset cursor)
+    
+    Items carry answer_preview and row_count; fetch /api/history/<id> for the
+    full stored response.
+    """
     try:
+        limit = request.args.get('limit', DEFAULT_HISTORY_PAGE_SIZE, type=int)
+        before = request.args.get('before', type=int)
+        
+        # Rows still queued in the background writer appear within HISTORY_FLUSH_INTERVAL
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, query, sql_query, response, success, timestamp
-            FROM query_history 
-            ORDER BY timestamp DESC 
-            LIMIT 50
-        ''')
-        
-        history = []
-        for row in cursor.fetchall():
-            try:
-                response_data = json.loads(row['response']) if row['response'] else {}
-            except json.JSONDecodeError:
-                response_data = {'error': 'Invalid JSON in stored response'}
-            
-            history.append({
-                'id': row['id'],
-                'query': row['query'],
-                'sql_query': row['sql_query'],
-                'response': response_data,
-                'success': bool(row['success']),
-                'timestamp': row['timestamp']
-            })
+        try:
+            ensure_history_schema(conn, key='default')
+            page = list_history(conn, limit, before)
+        finally:
+            conn.close()
         
-        conn.close()
-        return jsonify({'success': True, 'history': history})
+        return jsonify({'success': True, 'history': page['items'], 'next_before': page['next_before']})
         
     except Exception as e:
         print(f"Error getting history: {e}")
@@ -135,6 +289,30 @@ def get_query_history():
             'error': f'Failed to retrieve history: {str(e)}'
         }), 500
 
+@app.route('/api/history/<int:history_id>', methods=['GET'])
+def get_history_entry(history_id):
+    """Get one history item with its full (decompressed) response."""
+    try:
+        conn = get_db_connection()
+        try:
+            item = get_history_item(conn, history_id)
+        finally:
+            conn.close()
+        
+        if item is None:
+            return jsonify({
+                'success': False, 
+                'error': 'History item not found'
+            }), 404
+        return jsonify({'success': True, 'item': item})
+        
+    except Exception as e:
+        print(f"Error getting history item: {e}")
+        return jsonify({
+            'success': False, 
+            'error': f'Failed to retrieve history item: {str(e)}'
+        }), 500
+
 @app.route('/api/history/<int:history_id>', methods=['DELETE'])
 def delete_history_item(history_id):
     """Delete a specific history item."""
@@ -162,6 +340,38 @@ def delete_history_item(history_id):
             'error': f'Failed to delete history item: {str(e)}'
         }), 500
 
+@app.route('/api/ingest', methods=['POST'])
+def ingest_usage_data():
+    """
+    Bulk-ingest usage events.
+    
+    The request body is streamed as NDJSON (application/x-ndjson) or CSV
+    with a header row (text/csv); ``?format=`` overrides the Content-Type.
+    """
+    data_format = request.args.get('format') or detect_format(request.content_type)
+    
+    try:
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        result = ingest_stream(stream, data_format)
+        return jsonify({'success': True, **result.to_dict()})
+        
+    except (IngestError, UnicodeDecodeError) as e:
+        return jsonify({
+            'success': False, 
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error ingesting usage data: {e}")
+        return jsonify({
+            'success': False, 
+            'error': f'Ingestion failed: {str(e)}'
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose pipeline, cache, LLM and pool metrics in Prometheus text format."""
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
 # --- 5. WEB ROUTES ---
 @app.route('/')
 def index():
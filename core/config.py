@@ -26,7 +26,7 @@ class Config:
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
     
     # LLM processing limits
-    MAX_ROWS_FOR_LLM_SUMMARY = int(os.getenv('MAX_ROWS_FOR_LLM_SUMMARY', '200'))
+    MAX_ROWS_FOR_LLM_SUMMARY = int(os.getenv('MAX_ROWS_FOR_LLM_SUMMARY', '20'))
     
     # Server settings
     HOST = os.getenv('HOST', '0.0.0.0')
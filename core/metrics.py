@@ -0,0 +1,328 @@
+"""
+In-process metrics: timing spans, histograms and counters.
+
+Pipeline stages are wrapped in spans:
+
+    with metrics.span('execute_sql'):
+        rows = conn.execute(sql).fetchall()
+
+A span costs two perf_counter() calls and one locked histogram update.
+If the block raises, the error is counted once against the innermost
+stage it escaped from.
+
+Everything is kept in a process-wide registry. The registry is exposed in
+Prometheus text format (Flask ``/metrics``) and as a JSON-friendly
+snapshot (MCP ``get_statistics`` tool). Callback gauges read live values,
+such as connection pool usage, at scrape time.
+"""
+
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Histogram buckets (upper bounds)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self.values().items())]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {','.join(key) or 'total': value for key, value in sorted(self.values().items())}
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels.
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # key -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _copy(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in sorted(self._copy().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+    def _quantile(self, series: List[float], q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation within its bucket."""
+        total = series[-1]
+        if not total:
+            return None
+        rank, cumulative, lower = q * total, 0, 0.0
+        for bound, count in zip(self.buckets, series):
+            if count and cumulative + count >= rank:
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]  # in the +Inf bucket: report the largest finite bound
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for key, series in sorted(self._copy().items()):
+            count = series[-1]
+            result[','.join(key) or 'total'] = {
+                'count': count,
+                'mean': series[-2] / count if count else None,
+                'p50': self._quantile(series, 0.50),
+                'p95': self._quantile(series, 0.95),
+                'p99': self._quantile(series, 0.99),
+            }
+        return result
+
+
+class CallbackGauge:
+    """
+    Gauge whose labelled values are read from a callback at scrape time.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        try:
+            return self.callback()
+        except Exception:
+            return {}  # a failing source must not break the scrape
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self.values().items())]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {','.join(key) or 'value': value for key, value in sorted(self.values().items())}
+
+
+class MetricsRegistry:
+    """
+    Named collection of metrics, rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric (replacing any metric with the same name)."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, labelnames: Sequence[str],
+                       callback: Callable[[], Dict[Tuple[str, ...], float]]) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, labelnames, callback))
+
+    def metrics(self) -> Iterable[Any]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every metric as plain Python data."""
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+
+REGISTRY = MetricsRegistry()
+
+# --- pipeline metrics ---
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'nlq_stage_duration_seconds', 'Time spent in each query pipeline stage.', ['stage'])
+STAGE_ERRORS = REGISTRY.counter(
+    'nlq_stage_errors_total', 'Errors raised by each query pipeline stage.', ['stage', 'error'])
+ROWS_RETURNED = REGISTRY.histogram(
+    'nlq_rows_returned', 'Rows returned by executed SQL queries.', buckets=ROW_COUNT_BUCKETS)
+CACHE_LOOKUPS = REGISTRY.counter(
+    'nlq_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result'])
+LLM_REQUESTS = REGISTRY.counter(
+    'llm_requests_total', 'LLM completion requests by purpose.', ['purpose'])
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total', 'LLM tokens used, by purpose and kind (prompt or completion).', ['purpose', 'kind'])
+TOOL_SECONDS = REGISTRY.histogram(
+    'mcp_tool_duration_seconds', 'MCP tool call latency by tool and outcome.', ['tool', 'outcome'])
+HTTP_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Flask request latency by endpoint and status.', ['endpoint', 'status'])
+
+
+class span:
+    """
+    Time a pipeline stage; usable as a context manager or a decorator.
+
+    Args:
+        stage: Stage label on nlq_stage_duration_seconds / nlq_stage_errors_total
+        histogram: Histogram to record into (default STAGE_SECONDS)
+    """
+    __slots__ = ('stage', 'histogram', '_start')
+
+    def __init__(self, stage: str, histogram: Optional[Histogram] = None):
+        self.stage = stage
+        self.histogram = histogram or STAGE_SECONDS
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self._start, stage=self.stage)
+        if exc is not None and not getattr(exc, '_metrics_stage', None):
+            STAGE_ERRORS.inc(stage=self.stage, error=exc_type.__name__)
+            try:
+                exc._metrics_stage = self.stage  # counted once, at the innermost stage
+            except AttributeError:
+                pass
+        return False
+
+    def __call__(self, func):
+        stage, histogram = self.stage, self.histogram
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, histogram):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, histogram):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Count a cache hit or miss."""
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def record_llm_usage(purpose: str, completion):
+    """Count an LLM request and its token usage (if the response reports it)."""
+    LLM_REQUESTS.inc(purpose=purpose)
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        return
+    for kind in ('prompt', 'completion'):
+        tokens = getattr(usage, f'{kind}_tokens', None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, purpose=purpose, kind=kind)
+
+
+def _pool_stat(key: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    def collect():
+        from database.pool import get_all_pool_stats
+        return {(database,): stats[key] for database, stats in get_all_pool_stats().items()}
+    return collect
+
+
+REGISTRY.gauge_callback('db_pool_connections_in_use', 'Pooled SQLite connections checked out.',
+                        ['database'], _pool_stat('in_use'))
+REGISTRY.gauge_callback('db_pool_connections_open', 'Open pooled SQLite connections.',
+                        ['database'], _pool_stat('open_connections'))
+REGISTRY.gauge_callback('db_pool_wait_seconds_total', 'Cumulative time spent waiting for a pooled connection.',
+                        ['database'], _pool_stat('total_wait_seconds'))
+
+
+def render_prometheus() -> str:
+    """Render the process-wide registry in Prometheus text format."""
+    return REGISTRY.render_prometheus()
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return the process-wide registry as plain Python data."""
+    return REGISTRY.snapshot()
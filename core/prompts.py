@@ -137,7 +137,7 @@ def get_sql_generation_prompt(schema):
 
 
 
-def get_data_interpretation_prompt(user_question, data_json):
+def get_data_interpretation_prompt(user_question, data_json, data_format='JSON'):
     """Returns the prompt for data interpretation"""
     return f"""
     You are a helpful data analyst assistant. Your job is to provide a concise, natural language answer and insightful interpretation to a user's original question based on the provided data.
@@ -150,8 +150,34 @@ def get_data_interpretation_prompt(user_question, data_json):
     ---
     User's Original Question: "{user_question}"
     ---
-    Data Result from Database (in JSON format):
+    Data Result from Database (in {data_format} format):
     {data_json}
     ---
     Your concise, natural language answer and interpretation:
     """
+
+
+def get_profile_interpretation_prompt(user_question, row_count, profile_json):
+    """Returns the prompt for interpreting a statistical profile of a large result"""
+    return f"""
+    You are a helpful data analyst assistant. Your job is to provide a concise, natural language answer and insightful interpretation to a user's original question based on the provided data.
+    
+    The query returned {row_count} rows, so instead of the raw rows you are given a statistical profile computed over all of them:
+    - `columns`: per-column counts, distinct values, numeric statistics (min, max, mean, quartiles, sum), top values and top rows, and outliers.
+    - `trends`: when the result has a date column, each numeric column totalled per period with its trend direction.
+    - `sample_rows`: the first few rows as `columns` plus `rows` arrays, to show the shape of the data.
+    
+    Do not just repeat the statistics. Instead:
+    - **Interpret:** Explain what the data means in simple terms.
+    - **Summarize:** Describe the overall picture using the totals, distributions and top values.
+    - **Identify Patterns:** Point out trends, outliers, or anything noteworthy.
+    Base every number you mention on the profile; do not invent values for individual rows that are not shown.
+
+    ---
+    User's Original Question: "{user_question}"
+    ---
+    Statistical Profile of the Result (JSON):
+    {profile_json}
+    ---
+    Your concise, natural language answer and interpretation:
+    """
@@ -0,0 +1,371 @@
+"""
+Parser for simple aggregate queries over usage_data.
+
+Most generated SQL has one shape:
+
+    SELECT <columns and aggregates> FROM usage_data
+    [WHERE <pred> AND <pred> ...] [GROUP BY ...] [ORDER BY ...] [LIMIT n]
+
+This module parses exactly that shape into an AggregateQuery that other
+layers (e.g. the rollup rewriter) can reason about. Anything outside the
+shape is rejected (parse_aggregate_query returns None): joins, OR/NOT,
+subqueries, HAVING, CASE, arithmetic around aggregates and so on.
+Callers then fall back to running the SQL unchanged.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from database.sql_normalize import normalize_sql
+
+AGGREGATE_FUNCTIONS = {'SUM', 'COUNT', 'AVG', 'MIN', 'MAX', 'TOTAL'}
+
+_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<op>>=|<=|<>|!=|==|=|<|>|\|\|)
+  | (?P<punct>[(),*+\-/%;])
+  | (?P<space>\s+)
+""", re.VERBOSE)
+
+# Top-level words that put a statement outside the supported shape
+_REJECT_WORDS = {
+    'JOIN', 'UNION', 'INTERSECT', 'EXCEPT', 'HAVING', 'WITH', 'OVER', 'WINDOW',
+    'OR', 'NOT', 'CASE', 'EXISTS', 'LIKE', 'GLOB', 'IS', 'NULL',
+}
+_CLAUSE_WORDS = ('SELECT', 'FROM', 'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'OFFSET')
+
+
+@dataclass
+class Token:
+    kind: str
+    text: str
+    start: int
+    end: int
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper()
+
+
+@dataclass
+class SelectItem:
+    """
+    One entry of the select list: a plain column or a single aggregate call.
+    """
+    text: str
+    alias: Optional[str] = None
+    column: Optional[str] = None
+    function: Optional[str] = None
+    argument: Optional[str] = None  # column name or '*'
+    distinct: bool = False
+
+    @property
+    def is_aggregate(self) -> bool:
+        return self.function is not None
+
+    @property
+    def output_name(self) -> str:
+        """Column name SQLite reports for this item."""
+        return self.alias or self.text
+
+
+@dataclass
+class Predicate:
+    """
+    One AND-ed WHERE condition on a single column.
+
+    ``values`` holds Python literals when the operands are literals;
+    ``operands`` always holds the operand SQL text (e.g. strftime(...) calls).
+    """
+    text: str
+    column: str
+    op: str
+    operands: List[str]
+    values: Optional[List[Any]] = None
+    lower: bool = False
+
+
+@dataclass
+class AggregateQuery:
+    """
+    Parsed form of a supported single-table query.
+    """
+    sql: str
+    table: str
+    select_items: List[SelectItem]
+    distinct: bool = False
+    predicates: List[Predicate] = field(default_factory=list)
+    group_by: List[str] = field(default_factory=list)
+    order_by: List[Tuple[str, bool]] = field(default_factory=list)  # (key text, descending)
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+
+    @property
+    def referenced_columns(self) -> List[str]:
+        columns = []
+        for item in self.select_items:
+            for name in (item.column, item.argument):
+                if name and name != '*' and name not in columns:
+                    columns.append(name)
+        for name in [p.column for p in self.predicates] + self.group_by:
+            if name not in columns:
+                columns.append(name)
+        return columns
+
+
+def _tokenize(sql: str) -> Optional[List[Token]]:
+    tokens, position = [], 0
+    while position < len(sql):
+        match = _TOKEN_RE.match(sql, position)
+        if not match:
+            return None
+        if match.lastgroup != 'space':
+            tokens.append(Token(match.lastgroup, match.group(), match.start(), match.end()))
+        position = match.end()
+    return tokens
+
+
+def _unquote_identifier(text: str) -> str:
+    if text[:1] in ('"', '`', '['):
+        return text[1:-1]
+    return text.split('.')[-1]
+
+
+def _literal_value(token: Token) -> Tuple[bool, Any]:
+    if token.kind == 'string':
+        return True, token.text[1:-1].replace("''", "'")
+    if token.kind == 'number':
+        return True, float(token.text) if '.' in token.text else int(token.text)
+    if token.kind == 'ident' and token.upper in ('TRUE', 'FALSE'):
+        return True, 1 if token.upper == 'TRUE' else 0
+    return False, None
+
+
+def _split_top_level(tokens: List[Token], separator) -> List[List[Token]]:
+    """Split tokens on top-level separators; ``separator(token)`` decides."""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.text == '(':
+            depth += 1
+        elif token.text == ')':
+            depth -= 1
+        if depth == 0 and separator(token, current):
+            parts.append(current)
+            current = []
+            continue
+        current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _span(sql: str, tokens: List[Token]) -> str:
+    return sql[tokens[0].start:tokens[-1].end] if tokens else ''
+
+
+def _parse_column(tokens: List[Token]) -> Tuple[Optional[str], bool]:
+    """Parse ``col`` or ``LOWER(col)``; returns (column, lowered)."""
+    if len(tokens) == 1 and tokens[0].kind == 'ident':
+        return _unquote_identifier(tokens[0].text), False
+    if (len(tokens) == 4 and tokens[0].upper == 'LOWER' and tokens[1].text == '('
+            and tokens[2].kind == 'ident' and tokens[3].text == ')'):
+        return _unquote_identifier(tokens[2].text), True
+    return None, False
+
+
+def _parse_select_item(sql: str, tokens: List[Token]) -> Optional[SelectItem]:
+    if not tokens:
+        return None
+
+    alias = None
+    if len(tokens) >= 3 and tokens[-2].upper == 'AS' and tokens[-1].kind == 'ident':
+        alias = _unquote_identifier(tokens[-1].text)
+        tokens = tokens[:-2]
+    elif len(tokens) >= 2 and tokens[-1].kind == 'ident' and tokens[-2].text == ')':
+        alias = _unquote_identifier(tokens[-1].text)
+        tokens = tokens[:-1]
+
+    text = _span(sql, tokens)
+    if len(tokens) == 1 and tokens[0].kind == 'ident':
+        return SelectItem(text=text, alias=alias, column=_unquote_identifier(tokens[0].text))
+
+    if (len(tokens) >= 4 and tokens[0].upper in AGGREGATE_FUNCTIONS
+            and tokens[1].text == '(' and tokens[-1].text == ')'):
+        inner = tokens[2:-1]
+        distinct = bool(inner) and inner[0].upper == 'DISTINCT'
+        if distinct:
+            inner = inner[1:]
+        if len(inner) == 1 and (inner[0].text == '*' or inner[0].kind == 'ident'):
+            argument = '*' if inner[0].text == '*' else _unquote_identifier(inner[0].text)
+            if argument == '*' and (tokens[0].upper != 'COUNT' or distinct):
+                return None
+            return SelectItem(text=text, alias=alias, function=tokens[0].upper,
+                              argument=argument, distinct=distinct)
+    return None
+
+
+def _parse_predicate(sql: str, tokens: List[Token]) -> Optional[Predicate]:
+    text = _span(sql, tokens)
+
+    # column [NOT] BETWEEN low AND high
+    for index, token in enumerate(tokens):
+        if token.upper == 'BETWEEN':
+            column, lowered = _parse_column(tokens[:index])
+            rest = tokens[index + 1:]
+            parts = _split_top_level(rest, lambda t, cur: t.upper == 'AND')
+            if column is None or len(parts) != 2 or not all(parts):
+                return None
+            return _build_predicate(sql, text, column, lowered, 'BETWEEN', parts)
+
+    # column IN (a, b, ...)
+    for index, token in enumerate(tokens):
+        if token.upper == 'IN':
+            column, lowered = _parse_column(tokens[:index])
+            rest = tokens[index + 1:]
+            if column is None or len(rest) < 3 or rest[0].text != '(' or rest[-1].text != ')':
+                return None
+            parts = _split_top_level(rest[1:-1], lambda t, cur: t.text == ',')
+            if not all(parts):
+                return None
+            return _build_predicate(sql, text, column, lowered, 'IN', parts)
+
+    # column <op> operand
+    for index, token in enumerate(tokens):
+        if token.kind == 'op' and token.text in ('=', '==', '>=', '<=', '>', '<', '!=', '<>'):
+            column, lowered = _parse_column(tokens[:index])
+            rest = tokens[index + 1:]
+            if column is None or not rest:
+                return None
+            op = {'==': '=', '<>': '!='}.get(token.text, token.text)
+            return _build_predicate(sql, text, column, lowered, op, [rest])
+    return None
+
+
+def _build_predicate(sql, text, column, lowered, op, operand_tokens) -> Optional[Predicate]:
+    operands, values = [], []
+    for part in operand_tokens:
+        if any(t.upper == 'SELECT' for t in part):
+            return None
+        operands.append(_span(sql, part))
+        if values is not None:
+            is_literal, value = _literal_value(part[0]) if len(part) == 1 else (False, None)
+            if is_literal:
+                values.append(value)
+            else:
+                values = None
+    return Predicate(text=text, column=column, op=op, operands=operands, values=values, lower=lowered)
+
+
+def parse_aggregate_query(sql: str) -> Optional[AggregateQuery]:
+    """
+    Parse a single-table SELECT into an AggregateQuery.
+
+    Returns:
+        AggregateQuery, or None if the statement is outside the supported shape
+    """
+    normalized = normalize_sql(sql)
+    tokens = _tokenize(normalized)
+    if not tokens or tokens[0].upper != 'SELECT':
+        return None
+
+    # Locate top-level clauses and reject unsupported constructs anywhere
+    clauses, depth = {}, 0
+    order = []
+    for index, token in enumerate(tokens):
+        if token.text == '(':
+            depth += 1
+        elif token.text == ')':
+            depth -= 1
+        elif token.text == ';':
+            return None
+        if token.upper in _REJECT_WORDS or (token.upper == 'SELECT' and index > 0):
+            return None
+        if depth == 0 and token.upper in _CLAUSE_WORDS:
+            if token.upper in ('GROUP', 'ORDER'):
+                if index + 1 >= len(tokens) or tokens[index + 1].upper != 'BY':
+                    return None
+            if token.upper in clauses:
+                return None
+            clauses[token.upper] = index
+            order.append(token.upper)
+
+    if order[:2] != ['SELECT', 'FROM'] or order != sorted(order, key=_CLAUSE_WORDS.index):
+        return None
+
+    def clause_tokens(name):
+        if name not in clauses:
+            return None
+        start = clauses[name] + (2 if name in ('GROUP', 'ORDER') else 1)
+        later = [clauses[other] for other in order if clauses[other] > clauses[name]]
+        return tokens[start:min(later) if later else len(tokens)]
+
+    # SELECT list
+    select_tokens = clause_tokens('SELECT')
+    distinct = bool(select_tokens) and select_tokens[0].upper == 'DISTINCT'
+    if distinct:
+        select_tokens = select_tokens[1:]
+    select_items = []
+    for part in _split_top_level(select_tokens, lambda t, cur: t.text == ','):
+        item = _parse_select_item(normalized, part)
+        if item is None:
+            return None
+        select_items.append(item)
+
+    # FROM: exactly one table, no alias list
+    from_tokens = clause_tokens('FROM')
+    if not from_tokens or len(from_tokens) > 1 or from_tokens[0].kind != 'ident':
+        return None
+    table = _unquote_identifier(from_tokens[0].text)
+
+    query = AggregateQuery(sql=normalized, table=table, select_items=select_items, distinct=distinct)
+
+    # WHERE: AND-ed predicates (the AND inside BETWEEN is kept with its predicate)
+    where_tokens = clause_tokens('WHERE')
+    if where_tokens is not None:
+        def is_conjunction(token, current):
+            if token.upper != 'AND':
+                return False
+            between = sum(1 for t in current if t.upper == 'BETWEEN')
+            ands = sum(1 for t in current if t.upper == 'AND')
+            return between <= ands
+        for part in _split_top_level(where_tokens, is_conjunction):
+            predicate = _parse_predicate(normalized, part) if part else None
+            if predicate is None:
+                return None
+            query.predicates.append(predicate)
+
+    # GROUP BY: plain columns only
+    group_tokens = clause_tokens('GROUP')
+    if group_tokens is not None:
+        for part in _split_top_level(group_tokens, lambda t, cur: t.text == ','):
+            if len(part) != 1 or part[0].kind != 'ident':
+                return None
+            query.group_by.append(_unquote_identifier(part[0].text))
+
+    # ORDER BY: keys are kept as text and resolved by the consumer
+    order_tokens = clause_tokens('ORDER')
+    if order_tokens is not None:
+        for part in _split_top_level(order_tokens, lambda t, cur: t.text == ','):
+            descending = False
+            if part and part[-1].upper in ('ASC', 'DESC'):
+                descending = part[-1].upper == 'DESC'
+                part = part[:-1]
+            if not part:
+                return None
+            query.order_by.append((_span(normalized, part), descending))
+
+    for name, attribute in (('LIMIT', 'limit'), ('OFFSET', 'offset')):
+        limit_tokens = clause_tokens(name)
+        if limit_tokens is not None:
+            if len(limit_tokens) != 1 or limit_tokens[0].kind != 'number' or '.' in limit_tokens[0].text:
+                return None
+            setattr(query, attribute, int(limit_tokens[0].text))
+
+    return query
+
+
+def expression_key(text: str) -> str:
+    """Case- and whitespace-insensitive key for comparing expressions."""
+    return re.sub(r'\s+', '', text).lower()
@@ -0,0 +1,244 @@
+"""
+Asynchronous query engine for the MCP server.
+
+AsyncDatabaseQueryEngine runs the same natural language to SQL pipeline
+as DatabaseQueryEngine, without blocking the event loop:
+
+- Both LLM calls use the async OpenAI client.
+- SQLite work (schema lookups, caches, query execution) runs on a bounded
+  thread pool.
+
+Each stage is wrapped in a timeout (StageTimeoutError names the stage
+and the limit that expired), and cancelling the calling task abandons the
+in-flight LLM request, so many tool calls can be in flight at once.
+"""
+
+import asyncio
+import functools
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from core import metrics
+from database.query_engine import DatabaseQueryEngine
+from database.pagination import DEFAULT_PAGE_SIZE, ResultPage
+from database.budget import QueryBudget, QueryGuard, get_budget
+from database.result_export import ResultExport
+from database.sql_normalize import inline_params
+
+# Threads available for SQLite work (schema, caches, query execution)
+DB_EXECUTOR_WORKERS = int(os.getenv('DB_EXECUTOR_WORKERS', '4'))
+
+# Per-stage timeouts in seconds
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '60'))
+DB_TIMEOUT_SECONDS = float(os.getenv('DB_TIMEOUT_SECONDS', '30'))
+
+# Chat completion requests in flight at once (shared by all callers)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+
+
+class StageTimeoutError(asyncio.TimeoutError):
+    """
+    Raised when one pipeline stage (database or LLM) exceeds its own timeout.
+    """
+
+    def __init__(self, stage: str, setting: str, seconds: float):
+        super().__init__(f"{stage} stage timed out after {setting}={seconds:g} seconds")
+        self.stage = stage
+        self.setting = setting
+        self.seconds = seconds
+
+
+class AsyncDatabaseQueryEngine:
+    """
+    Async facade over DatabaseQueryEngine used by the MCP server.
+
+    Prompt building, SQL validation and the schema/SQL/result caches are
+    shared with the wrapped synchronous engine.
+    """
+
+    def __init__(self, engine: Optional[DatabaseQueryEngine] = None,
+                 max_workers: int = DB_EXECUTOR_WORKERS):
+        self.engine = engine or DatabaseQueryEngine()
+
+        try:
+            self.client = openai.AsyncOpenAI(api_key=self.engine.openai_api_key)
+        except Exception as e:
+            raise ValueError(f"Error initializing async OpenAI client: {e}")
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='sqlite-worker')
+        self._llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    async def run_db(self, func: Callable, *args, timeout: Optional[float] = DB_TIMEOUT_SECONDS, **kwargs):
+        """
+        Run a blocking database callable on the SQLite thread pool.
+
+        Args:
+            func: Blocking callable to run
+            timeout: Seconds to wait before raising StageTimeoutError
+
+        Returns:
+            Whatever ``func`` returns
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeoutError('database', 'DB_TIMEOUT_SECONDS', timeout) from None
+
+    async def _run_guarded(self, func: Callable, *args, guard: QueryGuard,
+                           timeout: Optional[float] = DB_TIMEOUT_SECONDS, **kwargs):
+        """
+        Run a guarded query on the thread pool, interrupting it if we stop waiting.
+
+        A timed-out or cancelled await would otherwise leave the statement
+        running on a worker thread; cancelling the guard stops it inside SQLite.
+        """
+        try:
+            return await self.run_db(func, *args, guard=guard, timeout=timeout, **kwargs)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            guard.cancel()
+            raise
+
+    async def _complete(self, request: Dict[str, Any], timeout: Optional[float]):
+        """Issue a chat completion with the async client (at most LLM_MAX_CONCURRENCY at once)."""
+        async with self._llm_slots:
+            try:
+                return await asyncio.wait_for(self.client.chat.completions.create(**request), timeout)
+            except asyncio.TimeoutError:
+                raise StageTimeoutError('LLM', 'LLM_TIMEOUT_SECONDS', timeout) from None
+
+    async def get_database_schema(self) -> str:
+        """Retrieve the cached usage_data schema."""
+        return await self.run_db(self.engine.get_database_schema)
+
+    async def generate_sql_from_question(self, question: str,
+                                         timeout: Optional[float] = LLM_TIMEOUT_SECONDS) -> str:
+        """
+        Convert a natural language question to SQL with the async OpenAI client.
+
+        Raises:
+            ValueError: If the LLM generates an unsafe query
+            StageTimeoutError: If the LLM call exceeds ``timeout``
+        """
+        schema_entry = await self.run_db(self.engine._load_schema_cache)
+
+        cached_sql = await self.run_db(self.engine.sql_cache.get, question, schema_entry['prompt_hash'])
+        if self.engine.sql_cache.enabled:
+            metrics.record_cache_lookup('sql', bool(cached_sql))
+        if cached_sql:
+            print(f"⚡ Using cached SQL: {cached_sql}")
+            return cached_sql
+
+        similar = await self.run_db(self.engine.reuse_similar_sql, question, schema_entry['prompt_hash'])
+        if similar:
+            return similar
+
+        print("🤖 Converting natural language to SQL using LLM (async)...")
+        completion = await self._complete(
+            self.engine._sql_generation_request(question, schema_entry['prompt']), timeout
+        )
+        generated_sql = self.engine._extract_generated_sql(completion)
+
+        await self.run_db(self.engine.sql_cache.put, question, generated_sql, schema_entry['prompt_hash'])
+        await self.run_db(self.engine.similar_sql.put, question, generated_sql, schema_entry['prompt_hash'])
+        return generated_sql
+
+    async def resolve_sql(self, question: str) -> Tuple[str, Tuple[Any, ...]]:
+        """Async version of DatabaseQueryEngine.resolve_sql (templates first, then the LLM)."""
+        template = await self.run_db(self.engine.templates.match, question)
+        if template is not None:
+            print(f"⚡ Using SQL template '{template.name}': {template.sql} {template.params}")
+            return template.sql, template.params
+        return await self.generate_sql_from_question(question), ()
+
+    async def execute_sql_query(self, sql: str, budget: Optional[QueryBudget] = None,
+                                timeout: Optional[float] = DB_TIMEOUT_SECONDS,
+                                params: Tuple[Any, ...] = ()) -> List[sqlite3.Row]:
+        """Execute SQL on the SQLite thread pool (result cache included)."""
+        guard = QueryGuard(budget or get_budget('mcp_nl'))
+        return await self._run_guarded(self.engine.execute_sql_query, sql, params=params,
+                                       guard=guard, timeout=timeout)
+
+    async def execute_sql_page(self, sql: str, page_size: int = DEFAULT_PAGE_SIZE,
+                               token: Optional[str] = None, budget: Optional[QueryBudget] = None,
+                               timeout: Optional[float] = DB_TIMEOUT_SECONDS) -> ResultPage:
+        """Fetch one page of a SQL result on the SQLite thread pool."""
+        guard = QueryGuard(budget or get_budget('mcp_sql'))
+        return await self._run_guarded(self.engine.execute_sql_page, sql, page_size, token,
+                                       guard=guard, timeout=timeout)
+
+    async def export_sql_query(self, sql: str, result_format: str = 'arrow',
+                               budget: Optional[QueryBudget] = None, timeout: Optional[float] = None,
+                               params: Tuple[Any, ...] = ()) -> ResultExport:
+        """Write a SQL result to an Arrow or Parquet file on the SQLite thread pool (bounded by the export budget)."""
+        guard = QueryGuard(budget or get_budget('export'))
+        return await self._run_guarded(self.engine.export_sql_query, sql, result_format, params=params,
+                                       guard=guard, timeout=timeout)
+
+    async def interpret_data_with_llm(self, question: str, data: List[Dict[str, Any]],
+                                      timeout: Optional[float] = LLM_TIMEOUT_SECONDS) -> str:
+        """Convert query results to a human-readable answer with the async client."""
+        print("📝 Converting data to human-readable response (async)...")
+        completion = await self._complete(self.engine._interpretation_request(question, data), timeout)
+        return self.engine._extract_interpretation(completion)
+
+    @metrics.span('total')
+    async def process_natural_language_query(self, question: str,
+                                             budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """
+        Async version of DatabaseQueryEngine.process_natural_language_query.
+
+        Args:
+            question: Natural language question from user
+            budget: Execution budget for the generated SQL (defaults to 'mcp_nl')
+
+        Returns:
+            Dictionary with answer, data, question and sql keys
+        """
+        with metrics.span('validate'):
+            is_valid, error_msg = self.engine.validate_question(question)
+            if not is_valid:
+                raise ValueError(error_msg)
+
+        with metrics.span('generate_sql'):
+            sql, params = await self.resolve_sql(question)
+
+        try:
+            with metrics.span('execute_sql'):
+                results = await self.execute_sql_query(sql, budget, params=params)
+        except sqlite3.Error:
+            # Never keep serving SQL that does not run
+            await self.run_db(self.engine.invalidate_question, question)
+            raise
+        sql = inline_params(sql, params)
+
+        if not results:
+            return {
+                'answer': "I couldn't find any data that answers your question.",
+                'data': [],
+                'question': question,
+                'sql': sql
+            }
+
+        with metrics.span('to_dicts'):
+            data = [dict(row) for row in results]
+
+        with metrics.span('interpret'):
+            human_answer = await self.interpret_data_with_llm(question, data)
+
+        return {
+            'answer': human_answer,
+            'data': data,
+            'question': question,
+            'sql': sql
+        }
+
+    def shutdown(self):
+        """Stop the SQLite thread pool."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,159 @@
+"""
+Batch execution of natural language questions.
+
+Dashboards and notebooks send many questions at once. run_batch() (threads,
+for Flask) and run_batch_async() (asyncio, for the MCP server):
+
+1. deduplicate the questions on their normalized form (the key used by the
+   SQL cache), so repeated questions run once
+2. run the unique questions concurrently, at most ``concurrency`` at a time;
+   SQLite work is further bounded by the engine's worker pool and LLM calls
+   by LLM_MAX_CONCURRENCY in the async engine
+3. return one result per input question, in input order, each with its
+   own success flag, error and timing
+
+A failing question never fails the batch, so wall-clock time tracks the
+slowest question rather than the sum of all of them.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database.budget import BudgetExceededError, QueryBudget
+from database.sql_cache import normalize_question
+
+# Questions accepted in one batch
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '100'))
+
+# Questions processed at the same time within one batch
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+
+
+def dedupe_questions(questions: List[str]) -> Tuple[List[str], List[int]]:
+    """
+    Collapse questions that normalize to the same text.
+
+    Returns:
+        (unique questions, index into the unique list for every input question)
+    """
+    unique, positions, mapping = [], {}, []
+    for question in questions:
+        key = normalize_question(question)
+        if key not in positions:
+            positions[key] = len(unique)
+            unique.append(question)
+        mapping.append(positions[key])
+    return unique, mapping
+
+
+def validate_batch(questions: Any) -> List[str]:
+    """
+    Check a batch request's questions.
+
+    Raises:
+        ValueError: If questions is not a non-empty list of strings within BATCH_MAX_QUESTIONS
+    """
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("questions must be a non-empty list of strings")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"At most {BATCH_MAX_QUESTIONS} questions are allowed per batch")
+    if not all(isinstance(question, str) for question in questions):
+        raise ValueError("questions must be a non-empty list of strings")
+    return [question.strip() for question in questions]
+
+
+def _item_error(error: Exception) -> Dict[str, Any]:
+    item = {'success': False, 'error': str(error)}
+    if isinstance(error, BudgetExceededError):
+        item['budget_exceeded'] = error.to_dict()
+    elif isinstance(error, asyncio.TimeoutError):
+        item['error'] = str(error) or 'Timed out'  # StageTimeoutError names the stage
+    return item
+
+
+def _assemble(questions: List[str], mapping: List[int], unique_items: List[Dict[str, Any]],
+              unique_count: int, started: float) -> Dict[str, Any]:
+    results, first_index = [], {}
+    for index, (question, position) in enumerate(zip(questions, mapping)):
+        item = dict(unique_items[position])
+        item['index'] = index
+        item['question'] = question
+        if first_index.setdefault(position, index) != index:
+            item['duplicate_of'] = first_index[position]
+        results.append(item)
+    succeeded = sum(1 for item in results if item['success'])
+    return {
+        'results': results,
+        'total': len(questions),
+        'unique': unique_count,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'wall_seconds': round(time.perf_counter() - started, 4),
+    }
+
+
+def run_batch(process: Callable[[str], Dict[str, Any]], questions: List[str],
+              concurrency: int = BATCH_CONCURRENCY) -> Dict[str, Any]:
+    """
+    Answer a batch of questions on a thread pool.
+
+    Args:
+        process: Callable answering one question (e.g. a bound
+            DatabaseQueryEngine.process_natural_language_query)
+        questions: Questions, in the order results should be returned
+        concurrency: Maximum questions in flight
+
+    Returns:
+        Dictionary with per-question 'results' (input order) and batch totals
+    """
+    started = time.perf_counter()
+    unique, mapping = dedupe_questions(questions)
+
+    def answer(question: str) -> Dict[str, Any]:
+        item_started = time.perf_counter()
+        try:
+            item = {'success': True, **process(question)}
+        except Exception as e:
+            item = _item_error(e)
+        item['seconds'] = round(time.perf_counter() - item_started, 4)
+        return item
+
+    workers = max(1, min(concurrency, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-question') as executor:
+        unique_items = list(executor.map(answer, unique))
+    return _assemble(questions, mapping, unique_items, len(unique), started)
+
+
+async def run_batch_async(async_engine, questions: List[str], concurrency: int = BATCH_CONCURRENCY,
+                          budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+    """
+    Answer a batch of questions with an AsyncDatabaseQueryEngine.
+
+    Args:
+        async_engine: AsyncDatabaseQueryEngine
+        questions: Questions, in the order results should be returned
+        concurrency: Maximum questions in flight
+        budget: Execution budget applied to each question's SQL
+
+    Returns:
+        Dictionary with per-question 'results' (input order) and batch totals
+    """
+    started = time.perf_counter()
+    unique, mapping = dedupe_questions(questions)
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(question: str) -> Dict[str, Any]:
+        async with slots:
+            item_started = time.perf_counter()
+            try:
+                item = {'success': True, **await async_engine.process_natural_language_query(question, budget)}
+            except Exception as e:
+                item = _item_error(e)
+            item['seconds'] = round(time.perf_counter() - item_started, 4)
+            return item
+
+    unique_items = await asyncio.gather(*(answer(question) for question in unique))
+    return _assemble(questions, mapping, list(unique_items), len(unique), started)
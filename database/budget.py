@@ -0,0 +1,200 @@
+"""
+Per-request execution budgets for SQL queries.
+
+A QueryBudget caps how long a query may run and how many rows it may
+return. QueryGuard enforces one budget for one execution:
+
+- Time: a SQLite progress handler runs every PROGRESS_HANDLER_INSTRUCTIONS
+  VM instructions and aborts the statement once the deadline passes, so a
+  runaway scan or cartesian join stops inside SQLite itself.
+- Rows: results are pulled with fetchmany(max_rows + 1), so an oversized
+  result is detected without ever materialising it.
+- Cancellation: cancel() (called when an async caller times out or is
+  cancelled) calls connection.interrupt() and flags the progress handler.
+
+Exceeding a budget raises BudgetExceededError, which carries a structured
+description for API and MCP responses. Budgets are configured per entry
+point (web, mcp_nl, mcp_sql, export) so one bad query cannot starve the others.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from core import metrics
+
+# SQLite VM instructions between progress handler checks
+PROGRESS_HANDLER_INSTRUCTIONS = int(os.getenv('QUERY_PROGRESS_INSTRUCTIONS', '10000'))
+
+BUDGET_EXCEEDED = metrics.REGISTRY.counter(
+    'nlq_budget_exceeded_total', 'Queries stopped by their execution budget.', ['entry_point', 'kind'])
+
+
+def _env_float(name: str, default: str) -> Optional[float]:
+    value = float(os.getenv(name, default))
+    return value if value > 0 else None  # 0 disables the limit
+
+
+def _env_int(name: str, default: str) -> Optional[int]:
+    value = int(os.getenv(name, default))
+    return value if value > 0 else None
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """
+    Limits for one query execution (None means unlimited).
+    """
+    entry_point: str
+    time_limit_seconds: Optional[float] = None
+    max_rows: Optional[int] = None
+
+    def to_dict(self):
+        """Convert the budget to a dictionary."""
+        return {
+            'entry_point': self.entry_point,
+            'time_limit_seconds': self.time_limit_seconds,
+            'max_rows': self.max_rows,
+        }
+
+
+BUDGETS: Dict[str, QueryBudget] = {
+    'default': QueryBudget('default', _env_float('QUERY_TIME_BUDGET_DEFAULT', '30'),
+                           _env_int('QUERY_MAX_ROWS_DEFAULT', '100000')),
+    'web': QueryBudget('web', _env_float('QUERY_TIME_BUDGET_WEB', '10'),
+                       _env_int('QUERY_MAX_ROWS_WEB', '10000')),
+    'mcp_nl': QueryBudget('mcp_nl', _env_float('QUERY_TIME_BUDGET_MCP_NL', '10'),
+                          _env_int('QUERY_MAX_ROWS_MCP_NL', '10000')),
+    'mcp_sql': QueryBudget('mcp_sql', _env_float('QUERY_TIME_BUDGET_MCP_SQL', '30'),
+                           _env_int('QUERY_MAX_ROWS_MCP_SQL', '100000')),
+    'export': QueryBudget('export', _env_float('QUERY_TIME_BUDGET_EXPORT', '120'),
+                          _env_int('QUERY_MAX_ROWS_EXPORT', '10000000')),
+}
+
+
+def get_budget(entry_point: str = 'default') -> QueryBudget:
+    """Return the configured budget for an entry point."""
+    return BUDGETS.get(entry_point, BUDGETS['default'])
+
+
+class BudgetExceededError(Exception):
+    """
+    Raised when a query runs out of time or returns too many rows.
+    """
+
+    def __init__(self, kind: str, budget: QueryBudget, elapsed: float, rows: Optional[int] = None):
+        self.kind = kind  # 'time', 'rows' or 'cancelled'
+        self.budget = budget
+        self.elapsed = elapsed
+        self.rows = rows
+        if kind == 'rows':
+            message = (f"Query returned more than {budget.max_rows} rows "
+                       f"(the {budget.entry_point} row limit); add filters, aggregation or a LIMIT")
+        elif kind == 'time':
+            message = (f"Query exceeded the {budget.time_limit_seconds:g}s "
+                       f"{budget.entry_point} time budget and was stopped")
+        else:
+            message = "Query was cancelled"
+        super().__init__(message)
+
+    def to_dict(self):
+        """Structured description for API and tool responses."""
+        return {
+            'error': 'budget_exceeded',
+            'kind': self.kind,
+            'message': str(self),
+            'elapsed_seconds': round(self.elapsed, 4),
+            'rows_fetched': self.rows,
+            'budget': self.budget.to_dict(),
+        }
+
+
+class QueryGuard:
+    """
+    Enforces a QueryBudget on one connection for the duration of a ``with`` block.
+
+    Usage:
+        guard = QueryGuard(get_budget('web'))
+        with guard.attach(conn):
+            rows = guard.fetch(conn.execute(sql))
+    """
+
+    def __init__(self, budget: Optional[QueryBudget] = None):
+        self.budget = budget or get_budget()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._cancelled = False
+        self._started = None
+        self._deadline = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started if self._started is not None else 0.0
+
+    def _progress(self) -> int:
+        # Non-zero aborts the running statement with OperationalError('interrupted')
+        if self._cancelled:
+            return 1
+        return 1 if self._deadline is not None and time.monotonic() > self._deadline else 0
+
+    def attach(self, conn) -> 'QueryGuard':
+        """Bind the guard to a connection; use as a context manager."""
+        self._conn = conn
+        return self
+
+    def __enter__(self):
+        if self._cancelled:
+            raise self._error('cancelled')
+        self._started = time.monotonic()
+        if self.budget.time_limit_seconds:
+            self._deadline = self._started + self.budget.time_limit_seconds
+        self._conn.set_progress_handler(self._progress, PROGRESS_HANDLER_INSTRUCTIONS)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        conn.set_progress_handler(None, 0)  # pooled connections are reused
+
+        if exc_type is not None and issubclass(exc_type, Exception) and 'interrupted' in str(exc):
+            if self._cancelled:
+                raise self._error('cancelled') from exc
+            if self._deadline is not None and time.monotonic() > self._deadline:
+                raise self._error('time') from exc
+        return False
+
+    def _error(self, kind: str, rows: Optional[int] = None) -> BudgetExceededError:
+        if kind != 'cancelled':
+            BUDGET_EXCEEDED.inc(entry_point=self.budget.entry_point, kind=kind)
+        return BudgetExceededError(kind, self.budget, self.elapsed, rows)
+
+    def fetch(self, cursor) -> List[Any]:
+        """
+        Fetch all rows from ``cursor`` without exceeding the row cap.
+
+        Raises:
+            BudgetExceededError: If the result has more than max_rows rows
+        """
+        max_rows = self.budget.max_rows
+        if max_rows is None:
+            return cursor.fetchall()
+        try:
+            rows = cursor.fetchmany(max_rows + 1)
+        finally:
+            cursor.close()
+        self.check_rows(len(rows))
+        return rows
+
+    def check_rows(self, count: int):
+        """Raise BudgetExceededError if ``count`` rows exceed the row cap."""
+        if self.budget.max_rows is not None and count > self.budget.max_rows:
+            raise self._error('rows', rows=count)
+
+    def cancel(self):
+        """Stop the running statement (safe to call from any thread)."""
+        with self._lock:
+            self._cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
@@ -0,0 +1,747 @@
+"""
+In-process columnar copy of usage_data for aggregate queries.
+
+Most analytical questions are group-by sums and counts over a few
+low-cardinality dimensions. ColumnarStore keeps usage_data in NumPy arrays
+and answers those queries without touching SQLite:
+
+- dimensions (user, application_name, platform, application_version,
+  monitor_app_version) are dictionary-encoded into the smallest unsigned
+  integer type that holds their codes
+- log_date is int64 epoch seconds, duration_seconds int32, legacy_app int8
+
+Queries are parsed with database/aggregate_query.py. A predicate on a
+dimension is evaluated once per dictionary entry and then gathered by code.
+Groups are formed by combining the group-by codes into one integer key,
+then aggregated with bincount/reduceat. Results are identical to SQLite's:
+comparisons follow SQLite's text and numeric semantics, including
+lexicographic bounds on log_date; rows are returned in group-key order
+unless ORDER BY says otherwise, as sqlite3.Row objects. Anything the store
+cannot evaluate exactly (non-literal operands, LIKE, expressions,
+non-canonical dates...) is rejected, and the caller runs the SQL in SQLite
+as before.
+
+Snapshots are built on a background thread. Until the first one is ready,
+and whenever usage_data has changed since the current one, queries are
+rejected ('loading') and run in SQLite, so a load never holds up a
+request. The store follows the usage_data data version: when only rows
+were added (the UPDATE/DELETE counter of database/data_version.py is
+unchanged), rows with an id above the last one loaded are appended;
+otherwise the snapshot is rebuilt.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import metrics
+from database.aggregate_query import AggregateQuery, Predicate, SelectItem, expression_key, parse_aggregate_query
+from database.connection import get_db_connection
+from database.data_version import get_data_version_tracker, read_rewrites
+
+# usage_data tables larger than this are not loaded (queries go to SQLite)
+COLUMNAR_MAX_ROWS = int(os.getenv('COLUMNAR_MAX_ROWS', '20000000'))
+
+# Rows read from SQLite per batch while loading
+LOAD_BATCH_SIZE = 50000
+
+SOURCE_TABLE = 'usage_data'
+
+# Dictionary-encoded text columns
+DIMENSIONS = ('user', 'application_name', 'platform', 'application_version', 'monitor_app_version')
+
+# Integer columns and the dtype they are stored as
+NUMERIC_COLUMNS = {'id': np.int64, 'duration_seconds': np.int32, 'legacy_app': np.int8}
+
+DATE_COLUMN = 'log_date'
+
+# Columns that may appear in GROUP BY (and as plain select items)
+GROUPABLE_COLUMNS = DIMENSIONS + ('legacy_app',)
+
+COLUMNAR_QUERIES = metrics.REGISTRY.counter(
+    'columnar_queries_total', 'Aggregate queries considered by the columnar store, by outcome (answered/fallback).',
+    ['outcome'])
+
+_CANONICAL_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$')
+_DATE_PREFIX_RE = re.compile(r'^\d{4}(?:-\d{2}(?:-\d{2}(?:T\d{2}(?::\d{2}(?::\d{2})?)?)?)?)?$')
+_DATE_PADDING = '0000-01-01T00:00:00'
+
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+# Group keys are counted directly (no sort) up to this many combinations, or one per row
+_DENSE_GROUP_LIMIT = 1 << 16
+
+# Integer sums below this are exact in float64, so bincount can add them
+_EXACT_FLOAT_SUM = 1 << 53
+
+# Parsed statements kept for repeated SQL (results still follow the data version)
+_parse = lru_cache(maxsize=1024)(parse_aggregate_query)
+
+
+class _Unsupported(Exception):
+    """The query (or data) is outside what the store evaluates exactly."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _code_dtype(size: int):
+    if size <= 1 << 8:
+        return np.uint8
+    if size <= 1 << 16:
+        return np.uint16
+    return np.int32
+
+
+def _format_date(epoch: int) -> str:
+    return str(np.datetime64(int(epoch), 's')) + 'Z'
+
+
+@dataclass
+class _Columns:
+    """
+    One immutable snapshot of the store; refreshes build a new one.
+    """
+    codes: Dict[str, np.ndarray]
+    dictionaries: Dict[str, Tuple[str, ...]]
+    numeric: Dict[str, np.ndarray]
+    log_date: np.ndarray
+    dates_exact: bool  # every log_date was 'YYYY-MM-DDTHH:MM:SSZ'
+    _labels: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = field(default_factory=dict, repr=False)
+
+    @property
+    def count(self) -> int:
+        return len(self.log_date)
+
+    @property
+    def max_id(self) -> int:
+        return int(self.numeric['id'][-1]) if self.count else 0
+
+    def _dictionary_order(self, dim: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        cached = self._labels.get(dim)
+        if cached is None:
+            labels = np.array(self.dictionaries[dim] + ('',), dtype=object)[:-1]
+            order = np.array(sorted(range(len(labels)), key=labels.__getitem__), dtype=np.int64)
+            rank = np.empty(len(labels), dtype=np.int64)
+            rank[order] = np.arange(len(labels))
+            cached = self._labels[dim] = (labels, rank, labels[order])
+        return cached
+
+    def labels(self, dim: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Dictionary values (object array, indexed by code) and each code's rank in sorted order."""
+        labels, rank, _ = self._dictionary_order(dim)
+        return labels, rank
+
+    def sorted_labels(self, dim: str) -> np.ndarray:
+        """Dictionary values in sorted order (indexed by rank)."""
+        return self._dictionary_order(dim)[2]
+
+    @property
+    def memory_bytes(self) -> int:
+        arrays = list(self.codes.values()) + list(self.numeric.values()) + [self.log_date]
+        return sum(array.nbytes for array in arrays)
+
+
+class _Loader:
+    """
+    Encodes batches of usage_data rows, continuing an existing snapshot's dictionaries.
+    """
+
+    def __init__(self, base: Optional[_Columns] = None):
+        self.base = base
+        self.dictionaries = {dim: list(base.dictionaries[dim]) if base else [] for dim in DIMENSIONS}
+        self.lookups = {dim: {value: code for code, value in enumerate(values)}
+                        for dim, values in self.dictionaries.items()}
+        self.parts: Dict[str, List[np.ndarray]] = {name: [] for name in DIMENSIONS + tuple(NUMERIC_COLUMNS) + (DATE_COLUMN,)}
+        self.dates_exact = base.dates_exact if base else True
+
+    def _encode(self, dim: str, values: Sequence[Any]) -> np.ndarray:
+        unique, inverse = np.unique(np.asarray(values, dtype=object), return_inverse=True)
+        lookup, dictionary = self.lookups[dim], self.dictionaries[dim]
+        mapping = np.empty(len(unique), dtype=np.int64)
+        for index, value in enumerate(unique):
+            if not isinstance(value, str):
+                raise _Unsupported(f'non_text_{dim}')
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(dictionary)
+                dictionary.append(value)
+            mapping[index] = code
+        return mapping[inverse]
+
+    def _parse_dates(self, values: Sequence[Any]) -> np.ndarray:
+        dates = np.asarray(values)
+        if self.dates_exact and dates.dtype.kind == 'U' and dates.dtype.itemsize == 80:
+            try:
+                trimmed = dates.astype('U19')
+                epochs = trimmed.astype('datetime64[s]')
+                if (np.char.endswith(dates, 'Z').all()
+                        and (np.datetime_as_string(epochs, unit='s') == trimmed).all()):
+                    return epochs.astype(np.int64)
+            except ValueError:
+                pass
+        # Not canonical: keep the rows, but never evaluate log_date
+        self.dates_exact = False
+        return np.zeros(len(dates), dtype=np.int64)
+
+    def add(self, rows: List[sqlite3.Row]):
+        columns = list(zip(*rows))
+        for index, dim in enumerate(DIMENSIONS):
+            self.parts[dim].append(self._encode(dim, columns[index]))
+        offset = len(DIMENSIONS)
+        for index, (name, dtype) in enumerate(NUMERIC_COLUMNS.items()):
+            values = np.asarray(columns[offset + index])
+            if values.dtype.kind not in 'iub':
+                raise _Unsupported(f'non_integer_{name}')
+            if values.size and dtype != np.int64 and (values.min() < np.iinfo(dtype).min
+                                                      or values.max() > np.iinfo(dtype).max):
+                raise _Unsupported(f'{name}_out_of_range')
+            self.parts[name].append(values.astype(dtype))
+        self.parts[DATE_COLUMN].append(self._parse_dates(columns[-1]))
+
+    def finish(self) -> _Columns:
+        def combined(name, dtype):
+            arrays = ([] if self.base is None else
+                      [self.base.codes[name] if name in DIMENSIONS else
+                       self.base.log_date if name == DATE_COLUMN else self.base.numeric[name]])
+            arrays += self.parts[name]
+            return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.zeros(0, dtype=dtype)
+
+        return _Columns(
+            codes={dim: combined(dim, _code_dtype(len(self.dictionaries[dim]))) for dim in DIMENSIONS},
+            dictionaries={dim: tuple(values) for dim, values in self.dictionaries.items()},
+            numeric={name: combined(name, dtype) for name, dtype in NUMERIC_COLUMNS.items()},
+            log_date=combined(DATE_COLUMN, np.int64),
+            dates_exact=self.dates_exact,
+        )
+
+
+def _read_rows(conn, base: Optional[_Columns]) -> Tuple[_Columns, int]:
+    """Load rows with id above base.max_id (all rows without a base)."""
+    loader = _Loader(base)
+    cursor = conn.execute(
+        f"SELECT {', '.join(DIMENSIONS + tuple(NUMERIC_COLUMNS) + (DATE_COLUMN,))} "
+        f"FROM {SOURCE_TABLE} WHERE id > ? ORDER BY id",
+        (base.max_id if base else -1,))
+    added = 0
+    while True:
+        rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+        if not rows:
+            break
+        loader.add(rows)
+        added += len(rows)
+    return loader.finish(), added
+
+
+def _compare(value: Any, op: str, operands: List[Any]) -> bool:
+    if op == '=':
+        return value == operands[0]
+    if op == '!=':
+        return value != operands[0]
+    if op == '<':
+        return value < operands[0]
+    if op == '<=':
+        return value <= operands[0]
+    if op == '>':
+        return value > operands[0]
+    if op == '>=':
+        return value >= operands[0]
+    if op == 'IN':
+        return value in operands
+    if op == 'BETWEEN':
+        return operands[0] <= value <= operands[1]
+    raise _Unsupported('unsupported_operator')
+
+
+def _compare_array(values: np.ndarray, op: str, operands: List[Any]) -> np.ndarray:
+    if op == 'IN':
+        return np.isin(values, operands)
+    if op == 'BETWEEN':
+        return (values >= operands[0]) & (values <= operands[1])
+    return {
+        '=': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+        '>': np.greater, '>=': np.greater_equal,
+    }[op](values, operands[0])
+
+
+class _Query:
+    """
+    Evaluates one parsed query against a snapshot.
+    """
+
+    def __init__(self, store: 'ColumnarStore', columns: _Columns, query: AggregateQuery):
+        self.store = store
+        self.columns = columns
+        self.query = query
+        self._ordering = None
+
+    # --- WHERE ---
+
+    def _date_mask(self, predicate: Predicate) -> np.ndarray:
+        if not self.columns.dates_exact or predicate.lower:
+            raise _Unsupported('log_date_predicate')
+        operands = predicate.values
+        if operands is None:
+            operands = [self.store.evaluate_constant(text) for text in predicate.operands]
+        if not all(isinstance(value, str) for value in operands):
+            raise _Unsupported('log_date_predicate')
+        dates = self.columns.log_date
+
+        if predicate.op in ('=', '!=', 'IN'):
+            # Only a canonical string can equal a canonical log_date
+            exact = [np.datetime64(value[:19], 's').astype(np.int64)
+                     for value in operands if _CANONICAL_DATE_RE.match(value)]
+            matches = np.isin(dates, exact)
+            return ~matches if predicate.op == '!=' else matches
+
+        bounds = ([('>=', operands[0]), ('<=', operands[1])] if predicate.op == 'BETWEEN'
+                  else [(predicate.op, operands[0])])
+        mask = None
+        for op, value in bounds:
+            if _CANONICAL_DATE_RE.match(value):
+                epoch = np.datetime64(value[:19], 's').astype(np.int64)
+                bound = _compare_array(dates, op, [epoch])
+            elif _DATE_PREFIX_RE.match(value):
+                # A canonical date sorts after any shorter prefix it extends:
+                # d >= '2024-05' and d > '2024-05' both mean d >= 2024-05-01T00:00:00Z
+                try:
+                    epoch = np.datetime64(value + _DATE_PADDING[len(value):], 's').astype(np.int64)
+                except ValueError:
+                    raise _Unsupported('log_date_predicate')
+                bound = dates >= epoch if op in ('>=', '>') else dates < epoch
+            else:
+                raise _Unsupported('log_date_predicate')
+            mask = bound if mask is None else mask & bound
+        return mask
+
+    def _predicate_mask(self, predicate: Predicate) -> np.ndarray:
+        column = predicate.column
+        if column == DATE_COLUMN:
+            return self._date_mask(predicate)
+        operands = predicate.values
+        if operands is None:
+            raise _Unsupported('non_literal_predicate')
+
+        if column in DIMENSIONS:
+            # Text affinity: only text operands compare the way Python does
+            if not all(isinstance(value, str) for value in operands):
+                raise _Unsupported('non_text_operand')
+            dictionary = self.columns.dictionaries[column]
+            if predicate.lower:
+                # SQLite's built-in lower() folds ASCII only
+                table = [_compare(value.translate(_ASCII_LOWER), predicate.op, operands) for value in dictionary]
+            else:
+                table = [_compare(value, predicate.op, operands) for value in dictionary]
+            return np.array(table, dtype=bool)[self.columns.codes[column]]
+
+        if column in NUMERIC_COLUMNS:
+            if predicate.lower or not all(isinstance(value, (int, float)) for value in operands):
+                raise _Unsupported('non_numeric_operand')
+            return _compare_array(self.columns.numeric[column], predicate.op, operands)
+
+        raise _Unsupported('unknown_column')
+
+    def _mask(self) -> Optional[np.ndarray]:
+        mask = None
+        for predicate in self.query.predicates:
+            predicate_mask = self._predicate_mask(predicate)
+            mask = predicate_mask if mask is None else mask & predicate_mask
+        return mask
+
+    # --- GROUP BY ---
+
+    def _group_codes(self, column: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Codes of a group column, the output value of each code and each code's sort rank."""
+        if column in DIMENSIONS:
+            labels, rank = self.columns.labels(column)
+            return self.columns.codes[column], labels, rank
+        labels, codes = np.unique(self.columns.numeric[column], return_inverse=True)
+        return codes, labels.astype(object), np.arange(len(labels))
+
+    def _groups(self, mask: Optional[np.ndarray], group_by: List[str]):
+        """
+        Returns:
+            (group id per selected row, number of groups,
+             {group column: (output values, sort rank) per group})
+        """
+        count = int(mask.sum()) if mask is not None else self.columns.count
+        if not group_by:
+            return np.zeros(count, dtype=np.int64), 1, {}
+
+        key, combinations, parts = None, 1, []
+        for column in group_by:
+            codes, labels, rank = self._group_codes(column)
+            size = max(len(labels), 1)
+            codes = codes[mask] if mask is not None else codes
+            key = codes.astype(np.int64) if key is None else key * size + codes
+            combinations *= size
+            if combinations > 1 << 62:
+                raise _Unsupported('too_many_groups')
+            parts.append((column, size, labels, rank))
+
+        if combinations <= max(_DENSE_GROUP_LIMIT, len(key)):
+            present = np.flatnonzero(np.bincount(key, minlength=combinations))
+            remap = np.zeros(combinations, dtype=np.int64)
+            remap[present] = np.arange(len(present))
+            group_ids, group_keys = remap[key], present
+        else:
+            group_keys, group_ids = np.unique(key, return_inverse=True)
+
+        columns = {}
+        remaining = group_keys.astype(np.int64)
+        for column, size, labels, rank in reversed(parts):
+            remaining, codes = np.divmod(remaining, size)
+            columns[column] = (labels[codes].tolist(), rank[codes])
+        return group_ids, len(group_keys), columns
+
+    # --- aggregates ---
+
+    def _column_values(self, column: str, mask: Optional[np.ndarray]) -> np.ndarray:
+        if column in NUMERIC_COLUMNS:
+            values = self.columns.numeric[column]
+        elif column in DIMENSIONS:
+            values = self.columns.codes[column]
+        elif column == DATE_COLUMN and self.columns.dates_exact:
+            values = self.columns.log_date
+        else:
+            raise _Unsupported('unsupported_aggregate')
+        return values[mask] if mask is not None else values
+
+    def _group_ordering(self, group_ids: np.ndarray, groups: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows sorted by group, and where each group starts (shared by MIN/MAX items)."""
+        if self._ordering is None:
+            ordering = np.argsort(group_ids)
+            self._ordering = ordering, np.searchsorted(group_ids[ordering], np.arange(groups))
+        return self._ordering
+
+    def _aggregate(self, item: SelectItem, mask, group_ids, groups) -> Tuple[List[Any], np.ndarray]:
+        """
+        Returns:
+            (output value per group, sort key per group)
+        """
+        function, argument = item.function, item.argument
+        counts = np.bincount(group_ids, minlength=groups)
+        empty = not counts.all()  # only an ungrouped aggregate over no rows
+
+        if function == 'COUNT' and not item.distinct:
+            # usage_data columns are NOT NULL, so COUNT(col) == COUNT(*)
+            if argument != '*':
+                self._column_values(argument, None)
+            return counts.tolist(), counts
+
+        if function == 'COUNT':
+            values = self._column_values(argument, mask)
+            if values.size == 0:
+                return [0] * groups, np.zeros(groups, dtype=np.int64)
+            if argument in DIMENSIONS:
+                codes, cardinality = values.astype(np.int64), len(self.columns.dictionaries[argument])
+            else:
+                _, codes = np.unique(values, return_inverse=True)
+                cardinality = int(codes.max()) + 1
+            pairs = group_ids * cardinality + codes
+            if groups * cardinality <= max(_DENSE_GROUP_LIMIT, len(pairs)):
+                present = np.bincount(pairs, minlength=groups * cardinality).reshape(groups, cardinality)
+                distinct = np.count_nonzero(present, axis=1)
+            else:
+                distinct = np.bincount(np.unique(pairs) // cardinality, minlength=groups)
+            return distinct.tolist(), distinct
+
+        if item.distinct:
+            raise _Unsupported('unsupported_aggregate')
+
+        if function in ('SUM', 'TOTAL', 'AVG'):
+            if argument not in NUMERIC_COLUMNS:
+                raise _Unsupported('unsupported_aggregate')
+            values = self._column_values(argument, mask).astype(np.int64)
+            if np.abs(values).sum() < _EXACT_FLOAT_SUM:
+                sums = np.bincount(group_ids, weights=values, minlength=groups).astype(np.int64)
+            else:
+                sums = np.zeros(groups, dtype=np.int64)
+                np.add.at(sums, group_ids, values)
+            if function == 'TOTAL':
+                return sums.astype(float).tolist(), sums
+            # SQLite's AVG divides the integer sum and count as doubles
+            results = sums if function == 'SUM' else sums.astype(float) / np.maximum(counts, 1)
+            return ([None] if empty else results.tolist()), results
+
+        # MIN / MAX
+        values = self._column_values(argument, mask)
+        if values.size == 0:
+            return [None] * groups, np.zeros(groups, dtype=np.int64)
+        if argument in DIMENSIONS:
+            labels, rank = self.columns.labels(argument)
+            values = rank[values]
+        ordering, starts = self._group_ordering(group_ids, groups)
+        reduce = np.minimum if function == 'MIN' else np.maximum
+        results = reduce.reduceat(values[ordering], starts)
+        if argument in DIMENSIONS:
+            return self.columns.sorted_labels(argument)[results].tolist(), results
+        if argument == DATE_COLUMN:
+            return [_format_date(value) for value in results.tolist()], results
+        return results.tolist(), results
+
+    # --- result ---
+
+    def run(self) -> Tuple[List[str], List[tuple]]:
+        query = self.query
+        items = query.select_items
+        has_aggregates = any(item.is_aggregate for item in items)
+        group_by = list(query.group_by)
+
+        for item in items:
+            if not item.is_aggregate and item.column not in GROUPABLE_COLUMNS:
+                raise _Unsupported('non_dimension_column')
+        if any(column not in GROUPABLE_COLUMNS for column in group_by):
+            raise _Unsupported('non_dimension_group_by')
+        if has_aggregates:
+            if query.distinct:
+                raise _Unsupported('distinct_aggregate')
+            if any(not item.is_aggregate and item.column not in group_by for item in items):
+                raise _Unsupported('bare_column')
+        elif query.distinct and not group_by:
+            group_by = [item.column for item in items]  # SELECT DISTINCT a, b == GROUP BY a, b
+        elif not group_by:
+            raise _Unsupported('not_aggregate')
+        elif any(item.column not in group_by for item in items):
+            raise _Unsupported('bare_column')
+        if query.offset is not None and query.limit is None:
+            raise _Unsupported('offset_without_limit')
+
+        mask = self._mask()
+        group_ids, groups, group_columns = self._groups(mask, group_by)
+
+        names, outputs = [], []
+        for item in items:
+            names.append(item.alias or (item.column if not item.is_aggregate else item.text))
+            if item.is_aggregate:
+                outputs.append(self._aggregate(item, mask, group_ids, groups))
+            else:
+                outputs.append(group_columns[item.column])
+
+        # ORDER BY keys first, then the group key: SQLite emits groups in key order
+        sort_keys = []
+        for key, descending in query.order_by:
+            values = self._order_key(key, names, items, outputs, group_columns)
+            sort_keys.append(-values if descending else values)
+        sort_keys += [group_columns[column][1] for column in group_by]
+        order = np.lexsort(sort_keys[::-1]) if sort_keys and groups > 1 else np.arange(groups)
+        if query.limit is not None:
+            start = query.offset or 0
+            order = order[start:start + query.limit]
+
+        selected = order.tolist()
+        columns = [[values[index] for index in selected] for values, _ in outputs]
+        return names, list(zip(*columns))
+
+    def _order_key(self, key: str, names: List[str], items: List[SelectItem], outputs, group_columns) -> np.ndarray:
+        """Sort key (one value per group) for an ORDER BY term."""
+        if key.isdigit():
+            position = int(key) - 1
+            if not 0 <= position < len(names):
+                raise _Unsupported('unsupported_order_by')
+            return outputs[position][1]
+        normalized = expression_key(key.strip('"`[]'))
+        for position, (name, item) in enumerate(zip(names, items)):
+            if normalized in (expression_key(name), expression_key(item.text)):
+                return outputs[position][1]
+        if normalized in group_columns:
+            return group_columns[normalized][1]
+        raise _Unsupported('unsupported_order_by')
+
+
+class ColumnarStore:
+    """
+    Answers recognised usage_data aggregates from in-memory NumPy columns.
+
+    Args:
+        db_path: Database whose usage_data is loaded
+        enabled: When False, execute() always returns None
+    """
+
+    def __init__(self, db_path=None, enabled: bool = True):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.data_version = get_data_version_tracker(db_path)
+        self._lock = threading.Lock()
+        self._constants_lock = threading.Lock()
+        self._constants = None
+        self._columns: Optional[_Columns] = None
+        self._generation = None  # data version the columns were built for
+        self._rewrites = None  # UPDATE/DELETE counter when the columns were built
+        self._loader: Optional[threading.Thread] = None
+        self._stats = {
+            'considered': 0,
+            'answered': 0,
+            'rejected': {},
+            'loads': 0,
+            'appends': 0,
+            'last_load_seconds': None,
+            'query_seconds': 0.0,
+            'last_error': None,
+        }
+
+    def _reject(self, reason: str) -> None:
+        COLUMNAR_QUERIES.inc(outcome='fallback')
+        with self._lock:
+            self._stats['rejected'][reason] = self._stats['rejected'].get(reason, 0) + 1
+        return None
+
+    # --- loading ---
+
+    def _load(self, current: Optional[_Columns], rewrites: Optional[int]) -> Tuple[_Columns, Optional[int]]:
+        conn = get_db_connection(self.db_path)
+        try:
+            conn.execute("BEGIN")  # one consistent snapshot for the count, the counter and the rows
+            total = conn.execute(f"SELECT COUNT(*) FROM {SOURCE_TABLE}").fetchone()[0]
+            if total > COLUMNAR_MAX_ROWS:
+                raise _Unsupported(f'{total} rows is above COLUMNAR_MAX_ROWS={COLUMNAR_MAX_ROWS}')
+            current_rewrites = read_rewrites(conn, SOURCE_TABLE)
+            if current is not None and rewrites is not None and current_rewrites == rewrites:
+                # No UPDATE or DELETE since the last load: only rows were added
+                columns, _ = _read_rows(conn, current)
+                if columns.count == total:
+                    with self._lock:
+                        self._stats['appends'] += 1
+                    return columns, current_rewrites
+            columns, _ = _read_rows(conn, None)
+            with self._lock:
+                self._stats['loads'] += 1
+            return columns, current_rewrites
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def _refresh(self, generation: Any):
+        """Build a snapshot for generation (runs on the loader thread)."""
+        started = time.perf_counter()
+        with self._lock:
+            current, rewrites = self._columns, self._rewrites
+        try:
+            columns, rewrites = self._load(current, rewrites)
+            error = None
+        except Exception as e:
+            # Queries keep working through SQLite; retried when usage_data changes
+            print(f"⚠️ Columnar store unavailable: {e}")
+            columns, rewrites, error = None, None, str(e)
+        with self._lock:
+            # Rows added during the load are picked up by the next refresh
+            self._columns, self._rewrites, self._generation = columns, rewrites, generation
+            self._loader = None
+            self._stats['last_error'] = error
+            self._stats['last_load_seconds'] = time.perf_counter() - started
+
+    def snapshot(self) -> Optional[_Columns]:
+        """
+        Return columns for the current data version.
+
+        Returns:
+            The columns, or None while they are being (re)built in the background
+        """
+        generation = self.data_version.current()
+        with self._lock:
+            if generation == self._generation:
+                return self._columns
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._refresh, args=(generation,),
+                                                name='columnar-load', daemon=True)
+                self._loader.start()
+            return None
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the columns match the current data version (benchmarks and tests).
+
+        Returns:
+            True if a snapshot for the current data version is available
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.snapshot() is None:
+            with self._lock:
+                loader = self._loader
+            if loader is None:
+                return False  # loaded, but unavailable (e.g. too many rows)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            loader.join(remaining)
+        return True
+
+    def evaluate_constant(self, expression: str) -> Any:
+        """Evaluate a constant SQL expression (e.g. a strftime bound) without touching usage.db."""
+        with self._constants_lock:
+            if self._constants is None:
+                self._constants = sqlite3.connect(':memory:', check_same_thread=False)
+            try:
+                return self._constants.execute(f"SELECT {expression}").fetchone()[0]
+            except sqlite3.Error:
+                raise _Unsupported('non_constant_operand')
+
+    # --- queries ---
+
+    def _rows(self, names: List[str], values: List[tuple]) -> List[sqlite3.Row]:
+        """sqlite3.Row objects with the given column names, as SQLite would return them."""
+        columns = ', '.join('NULL AS "{}"'.format(name.replace('"', '""')) for name in names)
+        with self._constants_lock:
+            if self._constants is None:
+                self._constants = sqlite3.connect(':memory:', check_same_thread=False)
+            cursor = self._constants.execute(f"SELECT {columns} LIMIT 0")
+        return [sqlite3.Row(cursor, row) for row in values]
+
+    def execute(self, sql: str) -> Optional[List[sqlite3.Row]]:
+        """
+        Answer sql from the columnar store.
+
+        Returns:
+            Rows as sqlite3.Row objects, or None to run the SQL in SQLite
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._stats['considered'] += 1
+
+        query = _parse(sql)
+        if query is None:
+            return self._reject('unparsed')
+        if query.table != SOURCE_TABLE:
+            return self._reject('other_table')
+        columns = self.snapshot()
+        if columns is None:
+            return self._reject('loading' if self._loader is not None else 'unavailable')
+
+        started = time.perf_counter()
+        try:
+            names, values = _Query(self, columns, query).run()
+        except _Unsupported as e:
+            return self._reject(e.reason)
+        rows = self._rows(names, values)
+        COLUMNAR_QUERIES.inc(outcome='answered')
+        with self._lock:
+            self._stats['answered'] += 1
+            self._stats['query_seconds'] += time.perf_counter() - started
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Answered/rejected counts plus the size of the loaded columns."""
+        columns = self._columns
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rejected'] = dict(self._stats['rejected'])
+        stats['enabled'] = self.enabled
+        stats['answer_rate'] = stats['answered'] / stats['considered'] if stats['considered'] else 0.0
+        stats['mean_query_ms'] = stats['query_seconds'] / stats['answered'] * 1000 if stats['answered'] else 0.0
+        if columns is not None:
+            stats.update({
+                'rows': columns.count,
+                'memory_bytes': columns.memory_bytes,
+                'dictionary_sizes': {dim: len(values) for dim, values in columns.dictionaries.items()},
+                'dates_exact': columns.dates_exact,
+            })
+        return stats
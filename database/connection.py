@@ -2,43 +2,100 @@
 Database connection management for the Database MCP project.
 
 This module handles SQLite database connections and basic operations.
+Connections are handed out from a shared pool (see database/pool.py).
 """
 
 import sqlite3
 import os
 from pathlib import Path
 
+from database.pool import get_pool
+
 # Get the database path relative to this file
-DB_PATH = Path(__file__).parent / 'usage.db'
+DB_PATH = Path(os.getenv('DATABASE_PATH', Path(__file__).parent / 'usage.db'))
 
-def get_db_connection():
+def get_db_connection(db_path=None):
     """
-    Creates and returns a SQLite database connection.
+    Returns a pooled SQLite database connection.
+    
+    The connection is pre-configured (WAL, mmap, cache size, etc.) and
+    calling ``close()`` on it returns it to the pool.
+    
+    Args:
+        db_path: Optional database path; defaults to DB_PATH.
     
     Returns:
-        sqlite3.Connection: Database connection object with row factory enabled.
+        PooledConnection: Database connection object with row factory enabled.
     """
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row  # Enable column access by name
-    return conn
+    return get_pool(db_path or DB_PATH).acquire()
 
-def init_database():
+async def get_db_connection_async(db_path=None):
+    """
+    Async variant of get_db_connection that does not block the event loop
+    while waiting for a free connection.
+    """
+    return await get_pool(db_path or DB_PATH).acquire_async()
+
+def get_pool_stats(db_path=None):
+    """
+    Get utilisation and wait-time statistics for the connection pool.
+    
+    Returns:
+        dict: Pool statistics.
+    """
+    return get_pool(db_path or DB_PATH).get_stats()
+
+def init_database(db_path=None):
     """
     Initialize the database with required tables if they don't exist.
+    
+    Args:
+        db_path: Optional database path; defaults to DB_PATH.
     """
-    conn = get_db_connection()
+    conn = get_db_connection(db_path)
     try:
-        # Create usage_data table
+        # Create usage_data table (columns match the schema described in core/prompts.py)
         conn.execute('''
             CREATE TABLE IF NOT EXISTS usage_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                monitor_app_version TEXT NOT NULL,
+                platform TEXT NOT NULL,
                 user TEXT NOT NULL,
                 application_name TEXT NOT NULL,
-                duration_seconds INTEGER NOT NULL,
+                application_version TEXT NOT NULL,
+                log_date TEXT NOT NULL,
+                legacy_app BOOLEAN NOT NULL,
+                duration_seconds INTEGER NOT NULL
+            )
+        ''')
+        # Create query_history table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                sql_query TEXT,
+                response TEXT,
+                success BOOLEAN NOT NULL DEFAULT 1,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         conn.commit()
+        
+        # Add query_history summary/compressed columns and its listing index
+        from database.history_store import ensure_history_schema
+        ensure_history_schema(conn)
+        
+        # Create or migrate the managed usage_data indexes
+        from database.indexes import ensure_indexes
+        report = ensure_indexes(conn)
+        if report['created'] or report['dropped']:
+            print(f"✅ Indexes created: {report['created']}, dropped: {report['dropped']}")
+        # Count in-place changes to usage_data for the data version tracker
+        from database.data_version import ensure_change_tracking
+        ensure_change_tracking(conn)
+        # Create the daily rollup and fold in any existing rows
+        from database.rollups import refresh_rollups
+        refresh_rollups(conn)
         print("✅ Database initialized successfully")
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
@@ -0,0 +1,164 @@
+"""
+Data version tracking for usage_data.
+
+Caches that hold derived data (query results, rollups, replicas) need to
+know when new rows have been committed, by this process or any other.
+This module watches ``PRAGMA data_version`` on a dedicated connection.
+That pragma changes whenever another connection commits to the database
+file. When it moves, the tracker re-reads a cheap usage_data fingerprint
+and bumps its generation number only if that fingerprint changed, so
+unrelated writes such as query_history inserts do not invalidate data
+caches.
+
+The fingerprint is:
+
+- the AUTOINCREMENT sequence and max rowid, which move on every INSERT
+  that lets SQLite assign the id (all ingestion paths do)
+- the table_changes counters, which AFTER UPDATE and AFTER DELETE triggers
+  on usage_data increment (ensure_change_tracking installs them)
+
+INSERTs are deliberately not counted by a trigger: a per-row trigger
+slowed bulk ingestion by 50-90%. An INSERT with an explicit id below the
+sequence (refilling a deleted id) is therefore not seen on its own.
+
+Derived data that can only be appended to (rollups, the columnar store)
+compares read_rewrites() with the value it was built at to tell appends
+from in-place changes, which need a rebuild.
+"""
+
+import sqlite3
+import threading
+from typing import Dict, Optional, Tuple
+
+from database.connection import DB_PATH
+
+# Per-table UPDATE/DELETE counters maintained by triggers
+CHANGE_TABLE = 'table_changes'
+
+
+def ensure_change_tracking(conn, table: str = 'usage_data'):
+    """Create the change counters and the UPDATE/DELETE triggers that maintain them."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {CHANGE_TABLE} (
+            name TEXT PRIMARY KEY,
+            updates INTEGER NOT NULL DEFAULT 0,
+            deletes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute(f"INSERT OR IGNORE INTO {CHANGE_TABLE} (name) VALUES (?)", (table,))
+    for event, counter in (('UPDATE', 'updates'), ('DELETE', 'deletes')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_count_{counter} AFTER {event} ON {table}
+            BEGIN
+                UPDATE {CHANGE_TABLE} SET {counter} = {counter} + 1 WHERE name = '{table}';
+            END
+        ''')
+    conn.commit()
+
+
+def read_rewrites(conn, table: str = 'usage_data') -> Optional[int]:
+    """
+    Number of UPDATE and DELETE row changes recorded for a table.
+
+    Returns:
+        The counter, or None if change tracking is not installed
+    """
+    try:
+        row = conn.execute(f"SELECT updates + deletes FROM {CHANGE_TABLE} WHERE name = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+class DataVersionTracker:
+    """
+    Cheap, thread-safe "has usage_data changed?" check.
+    """
+
+    def __init__(self, db_path=None, table: str = 'usage_data'):
+        self.db_path = str(db_path or DB_PATH)
+        self.table = table
+        self._conn = None
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._fingerprint = None
+        self._generation = 0
+        self._tracking = False
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def _ensure_tracking(self, conn: sqlite3.Connection):
+        if self._tracking:
+            return
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (self.table,)).fetchone():
+                ensure_change_tracking(conn, self.table)
+                self._tracking = True
+        except sqlite3.Error as e:
+            # Read-only or locked database: retried on the next change
+            conn.rollback()
+            print(f"⚠️ Could not install change tracking on {self.table}: {e}")
+
+    def _read_fingerprint(self, conn: sqlite3.Connection) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        try:
+            seq_row = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = ?", (self.table,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            seq_row = None  # no AUTOINCREMENT tables yet
+        try:
+            max_row = conn.execute(f"SELECT MAX(rowid) FROM {self.table}").fetchone()
+        except sqlite3.OperationalError:
+            max_row = None  # table does not exist yet
+        return (seq_row[0] if seq_row else None, max_row[0] if max_row else None,
+                read_rewrites(conn, self.table))
+
+    def current(self) -> int:
+        """
+        Return the current data generation for the tracked table.
+
+        The number only increases, and it changes whenever rows are
+        inserted, updated or deleted.
+        """
+        with self._lock:
+            conn = self._connection()
+            self._ensure_tracking(conn)
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                fingerprint = self._read_fingerprint(conn)
+                if fingerprint != self._fingerprint:
+                    if self._fingerprint is not None:
+                        self._generation += 1
+                    self._fingerprint = fingerprint
+            return self._generation
+
+    def invalidate(self):
+        """Force a new generation (e.g. after an explicit-id INSERT the fingerprint misses)."""
+        with self._lock:
+            self._generation += 1
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_trackers: Dict[str, DataVersionTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_data_version_tracker(db_path=None) -> DataVersionTracker:
+    """Return the shared tracker for a database path, creating it on first use."""
+    key = str(db_path or DB_PATH)
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = DataVersionTracker(key)
+            _trackers[key] = tracker
+        return tracker
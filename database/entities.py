@@ -0,0 +1,183 @@
+"""
+Known entity values from usage_data, for recognising slots in questions.
+
+EntityCatalog loads the distinct applications, users and platforms and
+indexes them by a "squashed" key: lowercase with everything but letters
+and digits removed. That way "VS Code", "vscode" and "VSCode" all find the
+same value, and "chrome" finds "chrome.exe". Platforms also get common
+synonyms (mac, osx, win, ...).
+
+find_entities() scans a question's words, trying the longest span (up to
+MAX_ENTITY_WORDS words) first at each position, so lookup cost depends on
+the question length rather than on how many values exist. The catalog is
+reloaded when the usage_data data version changes.
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from database.connection import get_db_connection
+from database.data_version import get_data_version_tracker
+
+# usage_data column for each slot
+ENTITY_COLUMNS = {
+    'app': 'application_name',
+    'user': 'user',
+    'platform': 'platform',
+}
+
+# Longest entity name, in question words, that is looked up
+MAX_ENTITY_WORDS = 3
+
+# Extra spellings for platform values (keyed by squashed canonical value)
+PLATFORM_SYNONYMS = {
+    'macos': ('mac', 'macs', 'osx', 'macintosh', 'apple'),
+    'windows': ('win', 'pc', 'pcs'),
+    'linux': ('ubuntu',),
+    'android': (),
+    'ios': ('iphone', 'ipad'),
+}
+
+# Spelled-out numbers accepted for N slots ("top five apps")
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'fifteen': 15,
+    'twenty': 20, 'thirty': 30, 'fifty': 50, 'ninety': 90, 'hundred': 100,
+}
+NUMBER_PATTERN = r'(\d+|' + '|'.join(NUMBER_WORDS) + r')'
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+(?:[.+#'\-][A-Za-z0-9]+)*[+#]*")
+_SQUASH_RE = re.compile(r'[^a-z0-9+#]+')
+_EXTENSION_RE = re.compile(r'\.(exe|app)$', re.IGNORECASE)
+
+
+def squash(text: str) -> str:
+    """Lowercase and drop separators: 'VS Code' -> 'vscode'."""
+    return _SQUASH_RE.sub('', text.lower())
+
+
+def parse_number(text: str) -> int:
+    """Value of a NUMBER_PATTERN match: '3' -> 3, 'five' -> 5."""
+    text = text.lower()
+    return int(text) if text.isdigit() else NUMBER_WORDS[text]
+
+
+@dataclass(frozen=True)
+class Word:
+    text: str
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class EntityMatch:
+    """
+    A known value found in a question.
+    """
+    slot: str  # 'app', 'user' or 'platform'
+    value: str  # canonical value as stored in usage_data
+    start: int  # character span in the question
+    end: int
+
+
+def split_words(question: str) -> List[Word]:
+    """Split a question into words, keeping dotted names like chrome.exe whole."""
+    return [Word(match.group(), match.start(), match.end()) for match in _WORD_RE.finditer(question)]
+
+
+class EntityCatalog:
+    """
+    Distinct application, user and platform values, indexed for lookup.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.data_version = get_data_version_tracker(db_path)
+        self._lock = threading.Lock()
+        self._generation = None
+        self._index: Dict[str, Dict[str, str]] = {}  # squashed key -> {slot: canonical value}
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        index: Dict[str, Dict[str, str]] = {}
+
+        def add(key: str, slot: str, value: str):
+            if key:
+                index.setdefault(key, {}).setdefault(slot, value)
+
+        conn = get_db_connection(self.db_path)
+        try:
+            for slot, column in ENTITY_COLUMNS.items():
+                for (value,) in conn.execute(f"SELECT DISTINCT {column} FROM usage_data WHERE {column} IS NOT NULL"):
+                    value = str(value)
+                    add(squash(value), slot, value)
+                    if slot == 'app':
+                        add(squash(_EXTENSION_RE.sub('', value)), slot, value)
+                    elif slot == 'platform':
+                        for synonym in PLATFORM_SYNONYMS.get(squash(value), ()):
+                            add(synonym, slot, value)
+        finally:
+            conn.close()
+        return index
+
+    def index(self) -> Dict[str, Dict[str, str]]:
+        """Return the lookup index, reloading it if usage_data changed."""
+        generation = self.data_version.current()
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._index = self._load()
+                    self._generation = generation
+        return self._index
+
+    def find_entities(self, question: str, ignore: FrozenSet[str] = frozenset()) -> Tuple[List[EntityMatch], bool]:
+        """
+        Find known values mentioned in a question.
+
+        Args:
+            question: The question text
+            ignore: Lowercase words that are never read as a single-word
+                entity unless capitalised (e.g. template vocabulary, so a
+                user named "Will" does not match "will")
+
+        Returns:
+            (matches in question order, ambiguous) where ambiguous is True if
+            some span names values in more than one slot
+        """
+        index = self.index()
+        words = split_words(question)
+        matches, ambiguous = [], False
+        position = 0
+        while position < len(words):
+            for size in range(min(MAX_ENTITY_WORDS, len(words) - position), 0, -1):
+                span = words[position:position + size]
+                key = squash(''.join(word.text for word in span))
+                found = index.get(key)
+                if not found:
+                    continue
+                if size == 1 and span[0].text.lower() in ignore and not span[0].text[:1].isupper():
+                    continue
+                if len(found) > 1:
+                    ambiguous = True
+                slot, value = next(iter(found.items()))
+                matches.append(EntityMatch(slot, value, span[0].start, span[-1].end))
+                position += size
+                break
+            else:
+                position += 1
+        return matches, ambiguous
+
+
+_catalogs: Dict[str, EntityCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_entity_catalog(db_path=None) -> EntityCatalog:
+    """Return the shared catalog for a database, creating it on first use."""
+    key = str(db_path)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = EntityCatalog(db_path)
+        return catalog
@@ -0,0 +1,302 @@
+"""
+Storage layout, listing and retention for query_history.
+
+The response payload (answer plus full result rows) can be large, and list
+views only need a line of it. Rows therefore carry:
+
+- summary columns (``answer_preview``, ``row_count``), which are all a list
+  view reads
+- ``response_blob``: the JSON payload compressed with zlib, decoded only
+  when a single item is requested
+
+The legacy ``response`` TEXT column is still read for rows written before
+this layout. compact_history() moves those rows to the compressed form.
+
+Listing uses ``idx_query_history_timestamp`` on (timestamp, id) and keyset
+pagination: ``before=<id>`` continues after that row without OFFSET, so
+every page costs the same however deep it is.
+
+Retention: rows older than HISTORY_RETENTION_DAYS, and rows beyond the
+newest HISTORY_MAX_ROWS, are deleted by apply_retention(). The background
+history writer runs it every HISTORY_RETENTION_INTERVAL seconds. Run
+``python -m database.history_store --compact`` to apply retention and
+convert legacy rows by hand.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.connection import get_db_connection
+from database.result_encoding import from_columnar, to_columnar
+
+# zlib level for stored payloads (1 fastest .. 9 smallest)
+HISTORY_COMPRESSION_LEVEL = int(os.getenv('HISTORY_COMPRESSION_LEVEL', '6'))
+
+# Retention policy (0 disables each limit)
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+HISTORY_MAX_ROWS = int(os.getenv('HISTORY_MAX_ROWS', '100000'))
+
+# Seconds between retention passes run by the background writer
+HISTORY_RETENTION_INTERVAL = float(os.getenv('HISTORY_RETENTION_INTERVAL', '3600'))
+
+# Characters of the answer kept in answer_preview
+ANSWER_PREVIEW_CHARS = 200
+
+# Page size limits for list_history()
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+
+# Columns written by the background writer, in insert order
+HISTORY_COLUMNS = ('query', 'sql_query', 'response_blob', 'answer_preview', 'row_count', 'success', 'timestamp')
+
+_SUMMARY_COLUMNS = {
+    'response_blob': 'BLOB',
+    'answer_preview': 'TEXT',
+    'row_count': 'INTEGER',
+}
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def ensure_history_schema(conn, key: Any = None):
+    """
+    Add the summary/compressed columns and the listing index if missing.
+
+    Args:
+        conn: Database connection
+        key: Identifies the database; the check runs once per key and process
+    """
+    with _ready_lock:
+        if key is not None and key in _ready:
+            return
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(query_history)")}
+    if not existing:
+        return  # init_database creates the table
+    for column, column_type in _SUMMARY_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE query_history ADD COLUMN {column} {column_type}")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_query_history_timestamp
+        ON query_history (timestamp, id)
+    ''')
+    conn.commit()
+    if key is not None:
+        with _ready_lock:
+            _ready.add(key)
+
+
+def encode_response(result: Dict[str, Any]) -> bytes:
+    """Serialize a query result (rows stored columnar) and compress it."""
+    payload = {**result, 'data': to_columnar(result.get('data') or [])}
+    text = json.dumps(payload, separators=(',', ':'), default=str)
+    return zlib.compress(text.encode('utf-8'), HISTORY_COMPRESSION_LEVEL)
+
+
+def decode_response(blob: Optional[bytes], legacy_text: Optional[str] = None) -> Dict[str, Any]:
+    """Inverse of encode_response(); also reads legacy uncompressed rows."""
+    if blob is not None:
+        text = zlib.decompress(blob).decode('utf-8')
+    elif legacy_text:
+        text = legacy_text
+    else:
+        return {}
+    payload = json.loads(text)
+    if isinstance(payload.get('data'), dict):
+        payload['data'] = from_columnar(payload['data'])
+    return payload
+
+
+def _preview(answer: Optional[str]) -> Optional[str]:
+    if answer is None:
+        return None
+    answer = ' '.join(str(answer).split())
+    return answer if len(answer) <= ANSWER_PREVIEW_CHARS else answer[:ANSWER_PREVIEW_CHARS - 1] + '…'
+
+
+def history_row(query: str, result: Dict[str, Any], success: bool, timestamp: str) -> Tuple[Any, ...]:
+    """Build the HISTORY_COLUMNS values for one query result."""
+    return (
+        query,
+        result.get('sql', ''),
+        encode_response(result),
+        _preview(result.get('answer')),
+        len(result.get('data') or []),
+        int(bool(success)),
+        timestamp,
+    )
+
+
+def list_history(conn, limit: int = DEFAULT_HISTORY_PAGE_SIZE, before: Optional[int] = None) -> Dict[str, Any]:
+    """
+    List history summaries, newest first, without reading payloads.
+
+    Args:
+        conn: Database connection
+        limit: Page size (capped at MAX_HISTORY_PAGE_SIZE)
+        before: Return rows older than the row with this id (keyset cursor)
+
+    Returns:
+        Dictionary with 'items' and 'next_before' (None on the last page)
+    """
+    limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+    columns = '''id, query, sql_query, answer_preview, row_count, success, timestamp,
+                 response_blob IS NULL AND response IS NOT NULL AS legacy'''
+    if before is None:
+        rows = conn.execute(f'''
+            SELECT {columns} FROM query_history
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (limit + 1,)).fetchall()
+    else:
+        rows = conn.execute(f'''
+            SELECT {columns} FROM query_history
+            WHERE (timestamp, id) < (SELECT timestamp, id FROM query_history WHERE id = ?)
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (before, limit + 1)).fetchall()
+
+    items = []
+    for row in rows[:limit]:
+        answer_preview, row_count = row['answer_preview'], row['row_count']
+        if row['legacy']:
+            # Rows from before the summary columns: fall back to parsing once
+            legacy = get_history_item(conn, row['id']) or {}
+            answer_preview = _preview(legacy['response'].get('answer'))
+            row_count = len(legacy['response'].get('data') or [])
+        items.append({
+            'id': row['id'],
+            'query': row['query'],
+            'sql_query': row['sql_query'],
+            'answer_preview': answer_preview,
+            'row_count': row_count,
+            'success': bool(row['success']),
+            'timestamp': row['timestamp'],
+        })
+    has_more = len(rows) > limit
+    return {'items': items, 'next_before': items[-1]['id'] if has_more and items else None}
+
+
+def get_history_item(conn, history_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Fetch one history entry with its decompressed response.
+
+    Returns:
+        The entry, or None if no row has this id
+    """
+    row = conn.execute('''
+        SELECT id, query, sql_query, response, response_blob, success, timestamp
+        FROM query_history WHERE id = ?
+    ''', (history_id,)).fetchone()
+    if row is None:
+        return None
+    try:
+        response = decode_response(row['response_blob'], row['response'])
+    except (zlib.error, json.JSONDecodeError):
+        response = {'error': 'Invalid JSON in stored response'}
+    return {
+        'id': row['id'],
+        'query': row['query'],
+        'sql_query': row['sql_query'],
+        'response': response,
+        'success': bool(row['success']),
+        'timestamp': row['timestamp'],
+    }
+
+
+def apply_retention(conn, retention_days: int = HISTORY_RETENTION_DAYS,
+                    max_rows: int = HISTORY_MAX_ROWS) -> int:
+    """
+    Delete history rows outside the retention policy.
+
+    Returns:
+        Number of rows deleted
+    """
+    deleted = 0
+    if retention_days > 0:
+        deleted += conn.execute('''
+            DELETE FROM query_history WHERE timestamp < datetime('now', ?)
+        ''', (f'-{retention_days} days',)).rowcount
+    if max_rows > 0:
+        cutoff = conn.execute('''
+            SELECT timestamp, id FROM query_history
+            ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?
+        ''', (max_rows - 1,)).fetchone()
+        if cutoff is not None:
+            deleted += conn.execute('''
+                DELETE FROM query_history WHERE (timestamp, id) < (?, ?)
+            ''', (cutoff[0], cutoff[1])).rowcount
+    conn.commit()
+    return deleted
+
+
+def compact_history(conn, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Apply retention, then move legacy text payloads to compressed blobs.
+
+    Returns:
+        Dictionary with 'deleted' and 'converted' row counts
+    """
+    ensure_history_schema(conn)
+    deleted = apply_retention(conn)
+    converted = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, response FROM query_history
+            WHERE response_blob IS NULL AND response IS NOT NULL
+            LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            try:
+                result = decode_response(None, row['response'])
+            except json.JSONDecodeError:
+                result = {'error': 'Invalid JSON in stored response'}
+            updates.append((encode_response(result), _preview(result.get('answer')),
+                            len(result.get('data') or []), row['id']))
+        conn.executemany('''
+            UPDATE query_history
+            SET response_blob = ?, answer_preview = ?, row_count = ?, response = NULL
+            WHERE id = ?
+        ''', updates)
+        conn.commit()
+        converted += len(updates)
+    return {'deleted': deleted, 'converted': converted}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the query_history table")
+    parser.add_argument('--compact', action='store_true',
+                        help="Apply retention and compress legacy payloads")
+    parser.add_argument('--db', help="Database path (default: DATABASE_PATH)")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection(args.db)
+    try:
+        ensure_history_schema(conn)
+        if args.compact:
+            result = compact_history(conn)
+            print(f"✅ History compacted: {result['deleted']} rows deleted, "
+                  f"{result['converted']} payloads compressed")
+        total, size = conn.execute('''
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(response_blob)), 0) + COALESCE(SUM(LENGTH(response)), 0)
+            FROM query_history
+        ''').fetchone()
+        print(f"📊 query_history: {total} rows, {size / 1024:.1f} KiB of payloads")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+Background, batched writer for query_history.
+
+Recording a query used to run INSERT + COMMIT on the request thread. That
+added a WAL fsync to every response and competed with ingestion for the
+write lock. Requests now only enqueue the row. A single writer thread drains
+the bounded queue and group-commits up to HISTORY_BATCH_SIZE rows per
+transaction, so write-lock contention stays on that one thread.
+
+Back-pressure: when the queue is full, record() blocks for up to
+HISTORY_ENQUEUE_TIMEOUT seconds, then drops the row and counts it in
+``history_rows_dropped_total``. History is best-effort and must never fail
+a request. close() (also registered with atexit) flushes queued rows before
+the process exits. Readers do not wait for the writer: history lags
+requests by up to HISTORY_FLUSH_INTERVAL. flush(timeout) is available where
+read-your-writes matters; it waits for the rows queued before the call,
+never for rows that keep arriving after it.
+
+Rows are serialized and compressed on the writer thread (see
+database/history_store.py), which also applies the retention policy every
+HISTORY_RETENTION_INTERVAL seconds.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import metrics
+from database.connection import get_db_connection
+from database.history_store import (HISTORY_COLUMNS, HISTORY_RETENTION_INTERVAL, compact_history,
+                                    ensure_history_schema, history_row)
+
+# Rows buffered between request threads and the writer
+HISTORY_QUEUE_SIZE = int(os.getenv('HISTORY_QUEUE_SIZE', '10000'))
+
+# Rows per INSERT transaction
+HISTORY_BATCH_SIZE = int(os.getenv('HISTORY_BATCH_SIZE', '500'))
+
+# Longest a row waits for more rows to share its commit
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '0.2'))
+
+# Seconds record() blocks on a full queue before dropping the row
+HISTORY_ENQUEUE_TIMEOUT = float(os.getenv('HISTORY_ENQUEUE_TIMEOUT', '0.05'))
+
+HISTORY_WRITTEN = metrics.REGISTRY.counter(
+    'history_rows_written_total', 'query_history rows committed by the background writer.')
+HISTORY_DROPPED = metrics.REGISTRY.counter(
+    'history_rows_dropped_total', 'query_history rows dropped (queue full or write failed).', ['reason'])
+HISTORY_BATCH_SECONDS = metrics.REGISTRY.histogram(
+    'history_batch_duration_seconds', 'Time to insert and commit one query_history batch.')
+
+_STOP = object()
+
+HistoryEntry = Tuple[str, Dict[str, Any], bool, str]  # query, result, success, timestamp
+
+_INSERT_SQL = (f"INSERT INTO query_history ({', '.join(HISTORY_COLUMNS)}) "
+               f"VALUES ({', '.join('?' for _ in HISTORY_COLUMNS)})")
+
+
+class HistoryWriter:
+    """
+    Single-threaded, group-committing writer for query_history rows.
+
+    Args:
+        db_path: Database path (defaults to the shared connection's DB_PATH)
+        queue_size: Maximum rows waiting to be written
+        batch_size: Maximum rows per transaction
+        flush_interval: Seconds to wait for a batch to fill up
+        retention_interval: Seconds between retention passes (0 disables them)
+    """
+
+    def __init__(self, db_path=None, queue_size: int = HISTORY_QUEUE_SIZE,
+                 batch_size: int = HISTORY_BATCH_SIZE, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 retention_interval: float = HISTORY_RETENTION_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_interval = retention_interval
+        self._next_retention = 0.0  # first batch runs a pass
+        self._queue: 'queue.Queue[Any]' = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # Rows queued / rows handled (written or dropped) by the writer, for flush()
+        self._progress = threading.Condition()
+        self._queued = 0
+        self._handled = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, query: str, result: Dict[str, Any], success: bool = True,
+               timeout: float = HISTORY_ENQUEUE_TIMEOUT) -> bool:
+        """
+        Queue one query_history row.
+
+        Args:
+            query: The user's question
+            result: Query result (answer, data, sql, ...); not modified afterwards
+            success: Whether the query succeeded
+            timeout: Seconds to wait for space in a full queue
+
+        Returns:
+            True if the row was queued, False if it was dropped
+        """
+        if self._closed:
+            HISTORY_DROPPED.inc(reason='closed')
+            return False
+        self._ensure_started()
+
+        # Stamp now so batching does not shift the recorded time
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._queue.put((query, result, success, timestamp), timeout=timeout)
+        except queue.Full:
+            HISTORY_DROPPED.inc(reason='queue_full')
+            print("⚠️ query_history queue is full; dropping history row")
+            return False
+        with self._progress:
+            self._queued += 1
+        return True
+
+    def _next_batch(self) -> Tuple[List[HistoryEntry], bool]:
+        """Block for the first row, then gather more until the batch is full or the interval ends."""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _write(self, batch: List[HistoryEntry]):
+        started = time.perf_counter()
+        conn = get_db_connection(self.db_path)
+        try:
+            ensure_history_schema(conn, key=self.db_path or 'default')
+            conn.executemany(_INSERT_SQL, [history_row(*entry) for entry in batch])
+            conn.commit()
+            HISTORY_WRITTEN.inc(len(batch))
+        except Exception as e:
+            conn.rollback()
+            HISTORY_DROPPED.inc(len(batch), reason='write_error')
+            print(f"Warning: Failed to save {len(batch)} queries to history: {e}")
+        finally:
+            conn.close()
+            HISTORY_BATCH_SECONDS.observe(time.perf_counter() - started)
+
+    def _maintain(self):
+        """Run a retention/compaction pass if one is due."""
+        if not self.retention_interval or time.monotonic() < self._next_retention:
+            return
+        self._next_retention = time.monotonic() + self.retention_interval
+        conn = get_db_connection(self.db_path)
+        try:
+            result = compact_history(conn)
+            if result['deleted'] or result['converted']:
+                print(f"🧹 History retention: {result['deleted']} rows deleted, "
+                      f"{result['converted']} payloads compressed")
+        except Exception as e:
+            conn.rollback()
+            print(f"Warning: History retention failed: {e}")
+        finally:
+            conn.close()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if batch:
+                self._write(batch)
+                with self._progress:
+                    self._handled += len(batch)
+                    self._progress.notify_all()
+                self._maintain()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until the rows queued before this call have been written.
+
+        Args:
+            timeout: Longest wait in seconds
+
+        Returns:
+            True if they were written, False on timeout or if the writer is not running
+        """
+        with self._progress:
+            target = self._queued
+            if self._thread is None or not self._thread.is_alive():
+                return self._handled >= target
+            return self._progress.wait_for(lambda: self._handled >= target, timeout)
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Stop accepting rows, write what is queued and stop the thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and writer state."""
+        return {
+            'queued': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'batch_size': self.batch_size,
+            'running': self._thread is not None and self._thread.is_alive(),
+        }
+
+
+_writers: Dict[Any, HistoryWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_history_writer(db_path=None) -> HistoryWriter:
+    """Return the process-wide writer for a database, creating it on first use."""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = HistoryWriter(db_path)
+        return writer
+
+
+def close_history_writers():
+    """Flush and stop every writer (registered with atexit)."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_history_writers)
+
+metrics.REGISTRY.gauge_callback(
+    'history_queue_depth', 'query_history rows waiting for the background writer.', ['database'],
+    lambda: {(str(path or 'default'),): writer.get_stats()['queued'] for path, writer in list(_writers.items())})
@@ -0,0 +1,520 @@
+"""
+Index management and index advisor for usage_data.
+
+This module keeps a managed set of composite and covering indexes in step
+with INDEX_DEFINITIONS (creating missing ones, replacing changed ones and
+dropping retired ones). It also provides an advisor that replays SQL from
+query_history through EXPLAIN QUERY PLAN, finds full scans and temp
+B-trees, proposes indexes for them and reports before/after timings.
+
+Every managed index slows down inserts, so the advisor can also audit the
+managed set: each index is dropped inside a transaction that is rolled
+back, and the workload is timed without it. Indexes whose removal slows
+nothing down are not worth their write cost.
+
+Run ``python -m database.indexes --advise [--apply]`` to use the advisor
+and ``python -m database.indexes --audit`` to audit the managed indexes.
+"""
+
+import argparse
+import hashlib
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+# Add project root to path when run as a script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.connection import get_db_connection
+from database.sql_normalize import normalize_sql
+
+# Prefixes tell managed, advisor-created and foreign indexes apart
+MANAGED_INDEX_PREFIX = 'idx_usage_'
+ADVISED_INDEX_PREFIX = 'idx_advised_'
+
+# An index must make some query at least this much faster to be worth keeping
+AUDIT_MIN_SLOWDOWN = 2.0
+
+
+@dataclass(frozen=True)
+class IndexDefinition:
+    """
+    A single index on a table; columns may be expressions such as LOWER(platform).
+    """
+    name: str
+    table: str
+    columns: tuple
+
+    @property
+    def create_sql(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+    def signature(self) -> str:
+        """Whitespace/case-insensitive description used to compare definitions."""
+        return f"{self.table}({','.join(self.columns)})".replace(' ', '').lower()
+
+
+# Indexes shaped after the query patterns in core/prompts.py: equality on
+# LOWER(application_name)/LOWER(platform)/legacy_app and GROUP BY
+# user/application_name, each covering duration_seconds. Only indexes the
+# audit (--audit --include-examples, 1M rows) showed the workload needs are
+# kept. A log_date-first index was dropped because skip-scans of
+# idx_usage_app_date_cov serve date ranges just as well. An
+# application_name-first index was dropped because it only sped up the
+# unfiltered per-app totals (3-5x) while the planner preferred it for
+# "legacy_app = 1" queries, which then ran about 1000x slower.
+INDEX_DEFINITIONS = [
+    IndexDefinition('idx_usage_app_date_cov', 'usage_data',
+                    ('LOWER(application_name)', 'log_date', 'user', 'duration_seconds')),
+    IndexDefinition('idx_usage_platform_user_cov', 'usage_data',
+                    ('LOWER(platform)', 'user', 'duration_seconds')),
+    IndexDefinition('idx_usage_user_app_cov', 'usage_data',
+                    ('user', 'application_name', 'duration_seconds')),
+    IndexDefinition('idx_usage_legacy_platform_app', 'usage_data',
+                    ('legacy_app', 'LOWER(platform)', 'application_name')),
+]
+
+_INDEX_COLUMNS_RE = re.compile(r'ON\s+"?(\w+)"?\s*\((.*)\)\s*$', re.IGNORECASE | re.DOTALL)
+
+
+def _existing_indexes(conn, prefix: str) -> Dict[str, str]:
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE ?",
+        (prefix + '%',)
+    ).fetchall()
+    existing = {}
+    for name, sql in rows:
+        match = _INDEX_COLUMNS_RE.search(sql or '')
+        if match:
+            existing[name] = f"{match.group(1)}({match.group(2)})".replace(' ', '').lower()
+    return existing
+
+
+def ensure_indexes(conn, definitions: Sequence[IndexDefinition] = INDEX_DEFINITIONS,
+                   analyze: bool = True) -> Dict[str, List[str]]:
+    """
+    Bring the managed indexes in line with ``definitions``.
+
+    Creates missing indexes, recreates ones whose definition changed and
+    drops managed indexes that are no longer defined. Indexes outside the
+    managed prefix (including advisor-created ones) are left alone.
+
+    Args:
+        conn: Open database connection
+        definitions: Desired managed indexes
+        analyze: Refresh planner statistics after changes
+
+    Returns:
+        Dictionary with 'created', 'dropped' and 'unchanged' index names
+    """
+    report = {'created': [], 'dropped': [], 'unchanged': []}
+    existing = _existing_indexes(conn, MANAGED_INDEX_PREFIX)
+    wanted = {definition.name: definition for definition in definitions}
+
+    for name, signature in existing.items():
+        definition = wanted.get(name)
+        if definition is None or definition.signature() != signature:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+            report['dropped'].append(name)
+
+    for name, definition in wanted.items():
+        if name in existing and name not in report['dropped']:
+            report['unchanged'].append(name)
+            continue
+        conn.execute(definition.create_sql)
+        report['created'].append(name)
+
+    if analyze and (report['created'] or report['dropped']):
+        conn.execute("ANALYZE")
+    conn.commit()
+    return report
+
+
+def drop_managed_indexes(conn) -> List[str]:
+    """Drop all managed indexes (e.g. before a bulk load)."""
+    names = list(_existing_indexes(conn, MANAGED_INDEX_PREFIX))
+    for name in names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    return names
+
+
+def suspend_indexes(conn, table: str = 'usage_data') -> List[str]:
+    """
+    Drop every explicit index on ``table`` for a bulk load, without committing.
+
+    The indexes are dropped inside the current transaction (one is opened
+    if needed), so other connections keep seeing them until the caller
+    commits, and a rollback brings them back.
+
+    Returns:
+        The CREATE INDEX statements to pass to restore_indexes
+    """
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)
+    ).fetchall()
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    for name, _ in rows:
+        conn.execute(f"DROP INDEX {name}")
+    return [sql for _, sql in rows]
+
+
+def restore_indexes(conn, statements: Sequence[str]):
+    """Recreate indexes removed by suspend_indexes and refresh planner statistics (no commit)."""
+    for sql in statements:
+        conn.execute(sql)
+    if statements:
+        conn.execute("ANALYZE")
+
+
+# --- Index advisor ---
+
+_TEMP_BTREE_RE = re.compile(r'USE TEMP B-TREE FOR (.+)')
+_WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|$)',
+                       re.IGNORECASE | re.DOTALL)
+_GROUP_BY_RE = re.compile(r'\bGROUP\s+BY\b(.*?)(?:\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|$)',
+                          re.IGNORECASE | re.DOTALL)
+_EQUALITY_RE = re.compile(r"(LOWER\(\s*(\w+)\s*\)|\b(\w+))\s*(?:=|\bIN\b)", re.IGNORECASE)
+_RANGE_RE = re.compile(r"\b(\w+)\s*(?:\bBETWEEN\b|>=|<=|>|<)", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_LOWER_CALL_RE = re.compile(r"LOWER\(\s*\w+\s*\)", re.IGNORECASE)
+
+
+@dataclass
+class QueryPlanFindings:
+    """
+    What EXPLAIN QUERY PLAN reported for one statement.
+    """
+    sql: str
+    plan: List[str]
+    full_scans: List[str] = field(default_factory=list)
+    temp_btrees: List[str] = field(default_factory=list)
+
+    @property
+    def needs_attention(self) -> bool:
+        return bool(self.full_scans or self.temp_btrees)
+
+
+@dataclass
+class AdvisorEntry:
+    """
+    Advisor outcome for one query.
+    """
+    sql: str
+    findings: QueryPlanFindings
+    proposal: Optional[IndexDefinition] = None
+    before_ms: Optional[float] = None
+    after_ms: Optional[float] = None
+
+    @property
+    def speedup(self) -> Optional[float]:
+        if self.before_ms and self.after_ms:
+            return self.before_ms / self.after_ms
+        return None
+
+
+def explain(conn, sql: str) -> QueryPlanFindings:
+    """Run EXPLAIN QUERY PLAN and pick out full scans and temp B-trees."""
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+    findings = QueryPlanFindings(sql=sql, plan=plan)
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'INDEX' not in detail:
+            findings.full_scans.append(detail)
+        match = _TEMP_BTREE_RE.search(detail)
+        if match:
+            findings.temp_btrees.append(match.group(1))
+    return findings
+
+
+def _table_columns(conn, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def propose_index(sql: str, columns: Sequence[str], table: str = 'usage_data') -> Optional[IndexDefinition]:
+    """
+    Propose a composite, covering index for a single-table query.
+
+    Column order: equality predicates, then range predicates, then GROUP BY
+    columns, then any other referenced columns so the index covers the query.
+    """
+    known = {column.lower(): column for column in columns}
+    shape = _STRING_RE.sub("''", sql)
+
+    ordered: List[str] = []
+
+    def add(expression: str):
+        if expression.lower() not in [existing.lower() for existing in ordered]:
+            ordered.append(expression)
+
+    where = _WHERE_RE.search(shape)
+    if where:
+        for match in _EQUALITY_RE.finditer(where.group(1)):
+            column = (match.group(2) or match.group(3) or '').lower()
+            if column in known:
+                add(f"LOWER({known[column]})" if match.group(2) else known[column])
+        for match in _RANGE_RE.finditer(where.group(1)):
+            if match.group(1).lower() in known:
+                add(known[match.group(1).lower()])
+
+    group_by = _GROUP_BY_RE.search(shape)
+    if group_by:
+        for part in group_by.group(1).split(','):
+            column = part.strip().lower()
+            if column in known:
+                add(known[column])
+
+    # Columns only used inside LOWER() are already covered by the expression
+    for token in re.findall(r'\b\w+\b', _LOWER_CALL_RE.sub('', shape)):
+        if token.lower() in known and token.lower() != 'id':
+            add(known[token.lower()])
+
+    if not ordered:
+        return None
+
+    digest = hashlib.sha1(','.join(ordered).lower().encode('utf-8')).hexdigest()[:8]
+    return IndexDefinition(f"{ADVISED_INDEX_PREFIX}{digest}", table, tuple(ordered))
+
+
+def _is_covered(proposal: IndexDefinition, existing_signatures: Sequence[str]) -> bool:
+    """True if an existing index already starts with the proposed columns."""
+    wanted = proposal.signature().rstrip(')')
+    return any(signature.rstrip(')').startswith(wanted) for signature in existing_signatures)
+
+
+def _time_query(conn, sql: str, repeat: int) -> float:
+    """Median of ``repeat`` runs in milliseconds, after one untimed warm-up run."""
+    conn.execute(sql).fetchall()
+    timings = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+@dataclass
+class IndexAudit:
+    """
+    How much slower (and faster) the workload got with one managed index removed.
+    """
+    name: str
+    slowdown: float = 1.0
+    slowest_sql: Optional[str] = None
+    speedup: float = 1.0
+    fastest_sql: Optional[str] = None
+
+    @property
+    def verdict(self) -> str:
+        if self.speedup >= AUDIT_MIN_SLOWDOWN:
+            return 'harmful'  # the planner picks it for a query it makes slower
+        return 'needed' if self.slowdown >= AUDIT_MIN_SLOWDOWN else 'unused'
+
+
+class IndexAdvisor:
+    """
+    Replays historical SQL through EXPLAIN QUERY PLAN and proposes indexes.
+    """
+
+    def __init__(self, db_path=None, history_limit: int = 500, repeat: int = 5):
+        self.db_path = db_path
+        self.history_limit = history_limit
+        self.repeat = repeat
+
+    def collect_queries(self, conn, extra: Sequence[str] = ()) -> List[str]:
+        """Distinct SELECT statements from successful query_history rows (plus ``extra``)."""
+        rows = conn.execute('''
+            SELECT sql_query FROM query_history
+            WHERE success = 1 AND sql_query IS NOT NULL AND sql_query != ''
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (self.history_limit,)).fetchall()
+
+        seen, queries = set(), []
+        for sql in [row[0] for row in rows] + list(extra):
+            normalized = normalize_sql(sql)
+            if normalized.upper().startswith('SELECT') and normalized not in seen:
+                seen.add(normalized)
+                queries.append(normalized)
+        return queries
+
+    def run(self, apply: bool = False, extra_queries: Sequence[str] = ()) -> List[AdvisorEntry]:
+        """
+        Analyse historical queries and measure proposed indexes.
+
+        Args:
+            apply: Keep proposed indexes that made at least one query faster;
+                otherwise every proposal is dropped after measuring.
+            extra_queries: Additional statements to analyse
+
+        Returns:
+            One AdvisorEntry per analysed query
+        """
+        conn = get_db_connection(self.db_path)
+        try:
+            columns = _table_columns(conn, 'usage_data')
+            existing = list(_existing_indexes(conn, 'idx_').values())
+            entries = []
+            for sql in self.collect_queries(conn, extra_queries):
+                try:
+                    findings = explain(conn, sql)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Skipping query that no longer plans: {e}")
+                    continue
+                entry = AdvisorEntry(sql=sql, findings=findings)
+                if findings.needs_attention:
+                    proposal = propose_index(sql, columns)
+                    if proposal and not _is_covered(proposal, existing):
+                        entry.proposal = proposal
+                entries.append(entry)
+
+            proposals = {entry.proposal for entry in entries if entry.proposal}
+            if not proposals:
+                return entries
+
+            measured = [entry for entry in entries if entry.proposal]
+            for entry in measured:
+                entry.before_ms = _time_query(conn, entry.sql, self.repeat)
+
+            for proposal in proposals:
+                conn.execute(proposal.create_sql)
+            conn.execute("ANALYZE")
+            conn.commit()
+
+            for entry in measured:
+                entry.after_ms = _time_query(conn, entry.sql, self.repeat)
+
+            helpful = {entry.proposal for entry in measured if (entry.speedup or 0) > 1.0}
+            for proposal in proposals:
+                if not apply or proposal not in helpful:
+                    conn.execute(f"DROP INDEX IF EXISTS {proposal.name}")
+            conn.commit()
+            return entries
+        finally:
+            conn.close()
+
+    def audit(self, extra_queries: Sequence[str] = ()) -> List[IndexAudit]:
+        """
+        Time the workload with each managed index removed in turn.
+
+        Each index is dropped inside a transaction that is rolled back, so
+        nothing is rebuilt and the database is left unchanged.
+
+        Args:
+            extra_queries: Additional statements to include in the workload
+
+        Returns:
+            One IndexAudit per managed index, in name order
+        """
+        conn = get_db_connection(self.db_path)
+        try:
+            queries = []
+            for sql in self.collect_queries(conn, extra_queries):
+                try:
+                    explain(conn, sql)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Skipping query that no longer plans: {e}")
+                    continue
+                queries.append(sql)
+            baseline = {sql: _time_query(conn, sql, self.repeat) for sql in queries}
+
+            audits = []
+            for name in sorted(_existing_indexes(conn, MANAGED_INDEX_PREFIX)):
+                audit = IndexAudit(name=name)
+                conn.execute("BEGIN")
+                try:
+                    conn.execute(f"DROP INDEX {name}")
+                    for sql in queries:
+                        # Ignore sub-millisecond differences, which are mostly noise
+                        without = max(_time_query(conn, sql, self.repeat), 1.0)
+                        with_index = max(baseline[sql], 1.0)
+                        if without / with_index > audit.slowdown:
+                            audit.slowdown, audit.slowest_sql = without / with_index, sql
+                        if with_index / without > audit.speedup:
+                            audit.speedup, audit.fastest_sql = with_index / without, sql
+                finally:
+                    conn.rollback()
+                audits.append(audit)
+            return audits
+        finally:
+            conn.close()
+
+
+def format_report(entries: Sequence[AdvisorEntry], applied: bool = False) -> str:
+    """Render advisor results as a plain-text before/after report."""
+    lines = [f"Index advisor: {len(entries)} queries analysed"]
+    flagged = [entry for entry in entries if entry.findings.needs_attention]
+    lines.append(f"  {len(flagged)} with full scans or temp B-trees")
+
+    for entry in flagged:
+        lines.append("")
+        lines.append(f"SQL: {entry.sql}")
+        for detail in entry.findings.full_scans:
+            lines.append(f"  full scan:  {detail}")
+        for detail in entry.findings.temp_btrees:
+            lines.append(f"  temp b-tree: {detail}")
+        if entry.proposal:
+            lines.append(f"  proposal:   {entry.proposal.create_sql}")
+            if entry.speedup:
+                lines.append(f"  timing:     {entry.before_ms:.2f} ms -> {entry.after_ms:.2f} ms "
+                             f"({entry.speedup:.1f}x)")
+        else:
+            lines.append("  proposal:   none (already covered or not indexable)")
+
+    lines.append("")
+    lines.append("Helpful proposals were applied." if applied else "Proposals were measured and rolled back.")
+    return "\n".join(lines)
+
+
+def format_audit(audits: Sequence[IndexAudit]) -> str:
+    """Render an index audit as plain text."""
+    lines = [f"Index audit: {len(audits)} managed indexes"]
+    for audit in audits:
+        lines.append(f"  {audit.name}: {audit.verdict}, up to {audit.slowdown:.1f}x slower "
+                     f"and {audit.speedup:.1f}x faster without it")
+        if audit.slowdown >= AUDIT_MIN_SLOWDOWN:
+            lines.append(f"    slower: {audit.slowest_sql}")
+        if audit.speedup >= AUDIT_MIN_SLOWDOWN:
+            lines.append(f"    faster: {audit.fastest_sql}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage usage_data indexes")
+    parser.add_argument('--advise', action='store_true', help="Run the index advisor over query_history")
+    parser.add_argument('--apply', action='store_true', help="Keep advisor indexes that improved timings")
+    parser.add_argument('--audit', action='store_true',
+                        help="Time the workload without each managed index to find unused ones")
+    parser.add_argument('--include-examples', action='store_true',
+                        help="Also analyse the few-shot example queries from core/prompts.py")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    try:
+        report = ensure_indexes(conn)
+    finally:
+        conn.close()
+    print(f"✅ Managed indexes: created {report['created'] or 'none'}, "
+          f"dropped {report['dropped'] or 'none'}, unchanged {len(report['unchanged'])}")
+
+    extra = []
+    if args.include_examples:
+        from core.prompts import SQL_FEW_SHOT_EXAMPLES
+        extra = [example['sql'] for example in SQL_FEW_SHOT_EXAMPLES]
+
+    if args.audit:
+        print(format_audit(IndexAdvisor().audit(extra_queries=extra)))
+
+    if args.advise:
+        entries = IndexAdvisor().run(apply=args.apply, extra_queries=extra)
+        print(format_report(entries, applied=args.apply))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+"""
+Bulk ingestion of usage events into usage_data.
+
+Monitor agents post NDJSON (one JSON object per line) or CSV (with a header
+row). Both formats arrive as text streams.
+
+- Input is read in batches and transposed into one list per column.
+- Each column is validated and converted in a single pass against the
+  UsageRecord field types. No Python object is built per row.
+- Only when a column fails its fast check are its values re-checked one
+  by one, to find the offending rows. Those rows are reported and
+  dropped; the rest of the batch is inserted.
+- Rows are written with executemany inside large transactions. Commits
+  happen every INGEST_COMMIT_ROWS rows, so WAL readers keep seeing
+  consistent snapshots and are never blocked for long.
+- Once a load reaches INGEST_REBUILD_MIN_ROWS rows and at least
+  INGEST_REBUILD_RATIO times the rows already in usage_data, the
+  usage_data indexes are dropped. They are rebuilt at the end, in the same
+  transaction as the remaining rows, so readers never see the table
+  without them.
+
+After a successful ingest the daily rollup is refreshed. The result cache
+invalidates itself through the data version.
+
+Throughput was measured on one core with 500,000 generated rows
+(CPython 3.11, SQLite 3.50, WAL, synchronous=NORMAL), stage by stage:
+
+- Parsing: CSV about 250k rows/s, NDJSON about 160k rows/s. json.loads
+  alone manages about 300k lines/s. Parsing each batch as a single JSON
+  array is faster, but a crafted line can then merge with its
+  neighbours, so lines are decoded one by one.
+- Column validation: 700k-950k rows/s.
+- executemany: about 330k rows/s into an unindexed table, 35k rows/s with
+  the four managed indexes, and 21k rows/s with the six indexes kept
+  before the index audit.
+
+End to end that is about 100k rows/s without indexes, 45k rows/s with the
+current indexes and 31k rows/s with the old six, for both formats.
+Rebuilding the four indexes plus ANALYZE costs about 7.5 microseconds per
+table row, while maintaining them costs about 12 microseconds per inserted
+row, so rebuilding pays off once a load is about the size of the table.
+Loading 500,000 rows into an empty table went from about 50k to about
+60k rows/s (both formats) with the rebuild.
+Parsing in a separate thread did not help, because the parsers hold the
+GIL. A sustained rate of several hundred thousand rows per second is not
+reachable with a single CPython process writing to SQLite. Parsing alone
+is below that, and one connection writes serially.
+"""
+
+import csv
+import dataclasses
+import io
+import itertools
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from database.connection import get_db_connection
+from database.indexes import restore_indexes, suspend_indexes
+from database.models import UsageRecord
+
+# Rows parsed and validated together
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '50000'))
+
+# Rows written per transaction
+INGEST_COMMIT_ROWS = int(os.getenv('INGEST_COMMIT_ROWS', '250000'))
+
+# Loads at least this large (and at least INGEST_REBUILD_RATIO times the
+# existing rows) drop the usage_data indexes and rebuild them at the end
+INGEST_REBUILD_MIN_ROWS = int(os.getenv('INGEST_REBUILD_MIN_ROWS', '100000'))
+INGEST_REBUILD_RATIO = float(os.getenv('INGEST_REBUILD_RATIO', '1.0'))
+
+# Rejected rows reported back to the caller (all are counted)
+MAX_REPORTED_ERRORS = 50
+
+SUPPORTED_FORMATS = ('ndjson', 'csv')
+
+LOG_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z')
+
+_BOOL_VALUES = {
+    True: 1, False: 0, 1: 1, 0: 0,
+    '1': 1, '0': 0, 'true': 1, 'false': 0, 'True': 1, 'False': 0, 'TRUE': 1, 'FALSE': 0,
+}
+
+
+class IngestError(ValueError):
+    """Raised when a stream cannot be ingested at all (bad format or header)."""
+
+
+@dataclass
+class IngestResult:
+    """
+    Summary of one ingestion run.
+    """
+    format: str
+    rows_received: int = 0
+    rows_inserted: int = 0
+    rows_rejected: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    indexes_rebuilt: bool = False
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_inserted / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        """Convert the result to a dictionary."""
+        return {
+            'format': self.format,
+            'rows_received': self.rows_received,
+            'rows_inserted': self.rows_inserted,
+            'rows_rejected': self.rows_rejected,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 4),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'indexes_rebuilt': self.indexes_rebuilt,
+            'errors': self.errors,
+        }
+
+
+# --- Column validation -----------------------------------------------------
+
+def _convert_str(value):
+    if type(value) is not str or not value:
+        raise ValueError("expected a non-empty string")
+    return value
+
+
+def _convert_log_date(value):
+    if type(value) is not str or not LOG_DATE_RE.fullmatch(value):
+        raise ValueError("expected 'YYYY-MM-DDTHH:MM:SSZ'")
+    return value
+
+
+def _convert_bool(value):
+    try:
+        return _BOOL_VALUES[value]
+    except (KeyError, TypeError):
+        raise ValueError("expected a boolean (true/false/1/0)")
+
+
+def _convert_int(value):
+    if type(value) is bool or type(value) is float:
+        raise ValueError("expected a non-negative integer")
+    converted = int(value)
+    if converted < 0:
+        raise ValueError("expected a non-negative integer")
+    return converted
+
+
+def _str_column(values: List[Any]) -> List[Any]:
+    if set(map(type, values)) != {str} or '' in values:
+        raise ValueError
+    return values
+
+
+def _log_date_column(values: List[Any]) -> List[Any]:
+    _str_column(values)
+    if not all(map(LOG_DATE_RE.fullmatch, values)):
+        raise ValueError
+    return values
+
+
+def _bool_column(values: List[Any]) -> List[Any]:
+    return list(map(_BOOL_VALUES.__getitem__, values))
+
+
+def _int_column(values: List[Any]) -> List[Any]:
+    types = set(map(type, values))
+    if types == {int}:
+        converted = values
+    elif types == {str}:
+        converted = list(map(int, values))
+    else:
+        raise ValueError
+    if converted and min(converted) < 0:
+        raise ValueError
+    return converted
+
+
+@dataclass
+class ColumnSpec:
+    """
+    Validation for one usage_data column: a whole-column fast path and a
+    per-value check used to locate bad rows when the fast path fails.
+    """
+    name: str
+    convert_column: Callable[[List[Any]], List[Any]]
+    convert_value: Callable[[Any], Any]
+
+
+_CONVERTERS = {
+    str: (_str_column, _convert_str),
+    int: (_int_column, _convert_int),
+    bool: (_bool_column, _convert_bool),
+}
+_SPECIAL_CONVERTERS = {
+    'log_date': (_log_date_column, _convert_log_date),
+}
+
+
+def _build_column_specs() -> List[ColumnSpec]:
+    """Derive ingest columns and their checks from the UsageRecord fields."""
+    specs = []
+    for record_field in dataclasses.fields(UsageRecord):
+        if record_field.name == 'id':
+            continue  # assigned by SQLite
+        column_fn, value_fn = _SPECIAL_CONVERTERS.get(record_field.name) or _CONVERTERS[record_field.type]
+        specs.append(ColumnSpec(record_field.name, column_fn, value_fn))
+    return specs
+
+
+COLUMN_SPECS = _build_column_specs()
+INGEST_COLUMNS = [spec.name for spec in COLUMN_SPECS]
+INSERT_SQL = (f"INSERT INTO usage_data ({', '.join(INGEST_COLUMNS)}) "
+              f"VALUES ({', '.join('?' for _ in INGEST_COLUMNS)})")
+
+
+def validate_columns(columns: List[List[Any]], line_numbers: Optional[Sequence[int]] = None
+                     ) -> Tuple[List[List[Any]], List[Dict[str, Any]]]:
+    """
+    Validate and convert a batch held as one list per column.
+
+    Args:
+        columns: Values in INGEST_COLUMNS order, one list per column
+        line_numbers: Input line number of each row (for error messages)
+
+    Returns:
+        Tuple of (converted columns with bad rows removed, row errors)
+    """
+    converted = []
+    bad_rows: Dict[int, str] = {}
+    for spec, values in zip(COLUMN_SPECS, columns):
+        try:
+            converted.append(spec.convert_column(values))
+            continue
+        except (ValueError, TypeError, KeyError):
+            pass
+
+        # Slow path: locate the offending rows in this column only
+        column = []
+        for index, value in enumerate(values):
+            try:
+                column.append(spec.convert_value(value))
+            except (ValueError, TypeError) as e:
+                bad_rows.setdefault(index, f"{spec.name}: {e}")
+                column.append(None)
+        converted.append(column)
+
+    if not bad_rows:
+        return converted, []
+
+    if line_numbers is None:
+        line_numbers = range(1, len(columns[0]) + 1)
+    keep = [index not in bad_rows for index in range(len(columns[0]))]
+    converted = [list(itertools.compress(column, keep)) for column in converted]
+    errors = [{'line': line_numbers[index], 'error': message}
+              for index, message in sorted(bad_rows.items())]
+    return converted, errors
+
+
+# --- Readers ---------------------------------------------------------------
+
+_Batch = Tuple[Sequence[int], List[List[Any]], List[Dict[str, Any]]]
+
+
+def _ndjson_batches(stream: TextIO, batch_size: int) -> Iterator[_Batch]:
+    """Yield (line numbers, columns, parse errors) per batch of NDJSON."""
+    line_number = 0
+    while True:
+        lines = list(itertools.islice(stream, batch_size))
+        if not lines:
+            return
+        first_line = line_number + 1
+        line_number += len(lines)
+
+        records, errors, skipped = [], [], False
+        for offset, line in enumerate(lines):
+            if not line.strip():
+                skipped = True
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                errors.append({'line': first_line + offset, 'error': f"invalid JSON: {e}"})
+                skipped = True
+                continue
+            records.append(record)
+
+        line_numbers: Sequence[int] = range(first_line, line_number + 1)
+        if skipped:
+            bad_lines = {error['line'] for error in errors}
+            line_numbers = [number for number, line in zip(line_numbers, lines)
+                            if line.strip() and number not in bad_lines]
+
+        columns = [[record.get(name) for record in records] for name in INGEST_COLUMNS]
+        yield line_numbers, columns, errors
+
+
+def _csv_batches(stream: TextIO, batch_size: int) -> Iterator[_Batch]:
+    """Yield (line numbers, columns, parse errors) per batch of CSV rows."""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    missing = [name for name in INGEST_COLUMNS if name not in header]
+    if missing:
+        raise IngestError(f"CSV header is missing columns: {', '.join(missing)}")
+    positions = [header.index(name) for name in INGEST_COLUMNS]
+    width = len(header)
+
+    row_number = 1  # the header is row 1
+    while True:
+        rows = list(itertools.islice(reader, batch_size))
+        if not rows:
+            return
+        first_row = row_number + 1
+        row_number += len(rows)
+
+        errors = []
+        line_numbers: Sequence[int] = range(first_row, row_number + 1)
+        if set(map(len, rows)) != {width}:
+            good, good_numbers = [], []
+            for number, row in zip(line_numbers, rows):
+                if len(row) == width:
+                    good.append(row)
+                    good_numbers.append(number)
+                elif row:
+                    errors.append({'line': number, 'error': f"expected {width} fields, got {len(row)}"})
+            rows, line_numbers = good, good_numbers
+
+        transposed = list(zip(*rows)) if rows else [()] * width
+        columns = [list(transposed[position]) for position in positions]
+        yield line_numbers, columns, errors
+
+
+def _batches(stream: TextIO, data_format: str, batch_size: int):
+    if data_format == 'ndjson':
+        return _ndjson_batches(stream, batch_size)
+    if data_format == 'csv':
+        return _csv_batches(stream, batch_size)
+    raise IngestError(f"Unsupported format '{data_format}'; expected one of {', '.join(SUPPORTED_FORMATS)}")
+
+
+# --- Writer ----------------------------------------------------------------
+
+def ingest_stream(stream: TextIO, data_format: str = 'ndjson', db_path=None,
+                  batch_size: int = INGEST_BATCH_SIZE,
+                  commit_rows: int = INGEST_COMMIT_ROWS,
+                  refresh_rollup: bool = True,
+                  rebuild_indexes: Optional[bool] = None) -> IngestResult:
+    """
+    Validate and insert usage events from a text stream.
+
+    Args:
+        stream: Text stream of NDJSON lines or CSV with a header row
+        data_format: 'ndjson' or 'csv'
+        db_path: Optional database path; defaults to DB_PATH
+        batch_size: Rows parsed and validated per batch
+        commit_rows: Rows written per transaction
+        refresh_rollup: Fold the new rows into the daily rollup afterwards
+        rebuild_indexes: True drops the usage_data indexes before the first
+            row and rebuilds them at the end, False keeps them, and None
+            (the default) switches over once the load is large enough
+
+    Returns:
+        IngestResult with counts, rejected rows and throughput
+
+    Raises:
+        IngestError: If the format is unsupported or the CSV header is unusable
+    """
+    data_format = data_format.lower()
+    result = IngestResult(format=data_format)
+    batches = _batches(stream, data_format, batch_size)
+
+    def note_errors(errors):
+        result.rows_rejected += len(errors)
+        room = MAX_REPORTED_ERRORS - len(result.errors)
+        if room > 0:
+            result.errors.extend(errors[:room])
+
+    start = time.perf_counter()
+    conn = get_db_connection(db_path)
+    try:
+        rebuild_after = None
+        if rebuild_indexes:
+            rebuild_after = 0
+        elif rebuild_indexes is None:
+            # MAX(id) approximates the table size without scanning it
+            existing_rows = conn.execute("SELECT MAX(id) FROM usage_data").fetchone()[0] or 0
+            rebuild_after = max(INGEST_REBUILD_MIN_ROWS, int(existing_rows * INGEST_REBUILD_RATIO))
+        suspended = None
+
+        uncommitted = 0
+        for line_numbers, columns, parse_errors in batches:
+            result.batches += 1
+            result.rows_received += len(columns[0]) + len(parse_errors)
+            note_errors(parse_errors)
+
+            columns, row_errors = validate_columns(columns, line_numbers)
+            note_errors(row_errors)
+            if not columns[0]:
+                continue
+
+            if suspended is None and rebuild_after is not None and result.rows_inserted >= rebuild_after:
+                suspended = suspend_indexes(conn)
+
+            conn.executemany(INSERT_SQL, zip(*columns))
+            result.rows_inserted += len(columns[0])
+            uncommitted += len(columns[0])
+            # Without its indexes the table is only committed once they are back
+            if suspended is None and uncommitted >= commit_rows:
+                conn.commit()
+                uncommitted = 0
+        if suspended is not None:
+            restore_indexes(conn, suspended)
+            result.indexes_rebuilt = True
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        result.seconds = time.perf_counter() - start
+        conn.close()
+
+    if refresh_rollup and result.rows_inserted:
+        from database.rollups import refresh_rollups
+        conn = get_db_connection(db_path)
+        try:
+            refresh_rollups(conn)
+        finally:
+            conn.close()
+
+    print(f"📥 Ingested {result.rows_inserted} rows ({result.rows_rejected} rejected) "
+          f"in {result.seconds:.2f}s — {result.rows_per_second:,.0f} rows/sec"
+          f"{' (indexes rebuilt)' if result.indexes_rebuilt else ''}")
+    return result
+
+
+def ingest_text(text: str, data_format: str = 'ndjson', db_path=None, **kwargs) -> IngestResult:
+    """Ingest an in-memory NDJSON or CSV document (see ingest_stream)."""
+    return ingest_stream(io.StringIO(text), data_format, db_path, **kwargs)
+
+
+def detect_format(content_type: Optional[str], default: str = 'ndjson') -> str:
+    """Map a Content-Type header to an ingest format."""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                        'application/json-lines', 'application/json'):
+        return 'ndjson'
+    return default
@@ -16,32 +16,52 @@ DATABASE = os.getenv('DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'u
 class UsageRecord:
     """
     Represents a single usage record in the database.
+    
+    Field order and types mirror the usage_data table; the bulk ingestion
+    path (database/ingest.py) derives its column validation from them.
     """
     id: Optional[int]
+    monitor_app_version: str
+    platform: str
     user: str
     application_name: str
+    application_version: str
+    log_date: str  # 'YYYY-MM-DDTHH:MM:SSZ'
+    legacy_app: bool
     duration_seconds: int
-    timestamp: Optional[datetime] = None
     
     def to_dict(self):
         """Convert the usage record to a dictionary."""
         return {
             'id': self.id,
+            'monitor_app_version': self.monitor_app_version,
+            'platform': self.platform,
             'user': self.user,
             'application_name': self.application_name,
-            'duration_seconds': self.duration_seconds,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+            'application_version': self.application_version,
+            'log_date': self.log_date,
+            'legacy_app': self.legacy_app,
+            'duration_seconds': self.duration_seconds
         }
     
+    @property
+    def timestamp(self) -> datetime:
+        """log_date parsed as a datetime."""
+        return datetime.strptime(self.log_date, '%Y-%m-%dT%H:%M:%SZ')
+    
     @classmethod
     def from_row(cls, row):
         """Create a UsageRecord from a database row."""
         return cls(
             id=row['id'],
+            monitor_app_version=row['monitor_app_version'],
+            platform=row['platform'],
             user=row['user'],
             application_name=row['application_name'],
-            duration_seconds=row['duration_seconds'],
-            timestamp=datetime.fromisoformat(row['timestamp']) if row['timestamp'] else None
+            application_version=row['application_version'],
+            log_date=row['log_date'],
+            legacy_app=bool(row['legacy_app']),
+            duration_seconds=row['duration_seconds']
         )
 
 @dataclass
@@ -0,0 +1,319 @@
+"""
+Cursor-based pagination for raw SQL results.
+
+Large SELECTs are read a page at a time with ``fetchmany`` instead of
+being fully materialized. Where the query has a usable ordering key (a
+single-table read of usage_data that exposes ``id`` and is unordered or
+ordered by ``id``), pages use keyset pagination (``WHERE id > ?``), so
+every page costs the same regardless of depth.
+
+Any other query falls back to offset mode: each page re-runs the whole
+statement and discards the rows before the requested offset with
+fetchmany, so page N costs O(offset) rows of work. Offset pages are only
+consistent with each other if ORDER BY fully determines the row order
+(it includes ``id``, or every GROUP BY term). Otherwise SQLite may return
+rows in a different order on the next run, and pages can repeat or miss
+rows; such pages are marked ``stable=False`` so callers can warn.
+
+Continuation tokens are opaque, URL-safe strings. They are bound to the
+SQL text they were issued for.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.sql_normalize import normalize_sql
+from database.statements import execute_statement
+
+# Page size limits
+DEFAULT_PAGE_SIZE = int(os.getenv('SQL_DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('SQL_MAX_PAGE_SIZE', '1000'))
+
+# Rows skipped per fetchmany call in offset mode
+SKIP_CHUNK_SIZE = 1000
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_KEYSET_BLOCKERS_RE = re.compile(
+    r'\b(JOIN|GROUP\s+BY|DISTINCT|UNION|INTERSECT|EXCEPT|LIMIT|OFFSET|HAVING|WITH)\b'
+)
+_SINGLE_TABLE_RE = re.compile(
+    r'^SELECT\s+(?P<columns>.+?)\s+FROM\s+USAGE_DATA\b(?P<rest>.*)$', re.DOTALL
+)
+_ORDER_BY_RE = re.compile(r'\bORDER\s+BY\s+(?:USAGE_DATA\.)?ID(?:\s+(?P<direction>ASC|DESC))?$')
+_ID_COLUMN_RE = re.compile(r'(^|,)\s*(\*|(USAGE_DATA\.)?ID)\s*(,|$)')
+_CLAUSE_RE = re.compile(r'\b(ORDER\s+BY|GROUP\s+BY|HAVING|LIMIT|OFFSET|WINDOW)\b')
+_ORDER_TERM_SUFFIX_RE = re.compile(r'\s+(ASC|DESC|NULLS\s+FIRST|NULLS\s+LAST|COLLATE\s+\w+)\b.*$')
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a continuation token is malformed or belongs to other SQL."""
+
+
+@dataclass
+class ResultPage:
+    """
+    One page of a paginated query result.
+    """
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    page_size: int
+    mode: str
+    next_token: Optional[str] = None
+    offset: int = 0
+    stable: bool = True
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_token is not None
+
+    def to_dict(self):
+        """Convert the page to a dictionary."""
+        return {
+            'columns': self.columns,
+            'rows': self.rows,
+            'row_count': len(self.rows),
+            'page_size': self.page_size,
+            'mode': self.mode,
+            'offset': self.offset,
+            'next_token': self.next_token,
+            'has_more': self.has_more,
+            'stable': self.stable,
+        }
+
+
+@dataclass
+class PagePlan:
+    """
+    How to fetch one page: the statement to run and how to continue.
+    """
+    sql: str
+    params: Tuple[Any, ...]
+    page_size: int
+    mode: str
+    fingerprint: str
+    offset: int = 0
+    skip: int = 0
+    descending: bool = False
+    key_column: str = 'id'
+    stable: bool = True
+    cache_key: Tuple[Any, ...] = field(default_factory=tuple)
+
+
+def _fingerprint(sql: str) -> str:
+    return hashlib.sha256(sql.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_token(state: Dict[str, Any]) -> str:
+    """Encode continuation state as an opaque URL-safe token."""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_token(token: str, fingerprint: str) -> Dict[str, Any]:
+    """
+    Decode a continuation token and check it was issued for this SQL.
+
+    Raises:
+        InvalidCursorError: If the token is malformed or for a different query
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+
+    if not isinstance(state, dict) or state.get('f') != fingerprint:
+        raise InvalidCursorError("Cursor does not belong to this SQL query")
+    # Tokens are client-supplied: the offset and key must be what build_page() writes
+    for name in ('o', 'k'):
+        value = state.get(name, 0)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise InvalidCursorError(f"Invalid cursor: '{name}' is not an integer")
+    if state.get('o', 0) < 0:
+        raise InvalidCursorError("Invalid cursor: negative offset")
+    return state
+
+
+def keyset_direction(sql: str) -> Optional[str]:
+    """
+    Decide whether a query can be paginated by ``id``.
+
+    Returns:
+        'ASC' or 'DESC' if keyset pagination is safe, otherwise None.
+    """
+    # Look only at the SQL structure, never inside string literals
+    shape = _STRING_LITERAL_RE.sub("''", sql).upper()
+    if _KEYSET_BLOCKERS_RE.search(shape) or shape.count('SELECT') != 1:
+        return None
+
+    match = _SINGLE_TABLE_RE.match(shape)
+    if not match or not _ID_COLUMN_RE.search(match.group('columns')):
+        return None
+
+    rest = match.group('rest').strip()
+    if ',' in rest.split('WHERE')[0]:
+        return None  # implicit join: FROM usage_data, other
+    if 'ORDER BY' not in rest:
+        return 'ASC'
+    order = _ORDER_BY_RE.search(rest)
+    if not order:
+        return None
+    return order.group('direction') or 'ASC'
+
+
+def _top_level_clauses(shape: str) -> Dict[str, str]:
+    """Split the outermost statement into its GROUP BY / ORDER BY / ... clauses."""
+    depth, clauses, current, start = 0, {}, None, 0
+    for match in re.finditer(r'[()]|' + _CLAUSE_RE.pattern, shape):
+        token = match.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0:
+            if current is not None:
+                clauses[current] = shape[start:match.start()]
+            current, start = ' '.join(token.split()), match.end()
+    if current is not None:
+        clauses[current] = shape[start:]
+    return clauses
+
+
+def _split_terms(clause: str) -> List[str]:
+    terms, depth, term = [], 0, ''
+    for char in clause:
+        depth += char == '('
+        depth -= char == ')'
+        if char == ',' and depth == 0:
+            terms.append(term)
+            term = ''
+        else:
+            term += char
+    terms.append(term)
+    normalized = []
+    for term in terms:
+        term = _ORDER_TERM_SUFFIX_RE.sub('', term.strip())
+        normalized.append(re.sub(r'^USAGE_DATA\.', '', term.replace('"', '').replace('`', '')).strip())
+    return [term for term in normalized if term]
+
+
+def has_total_order(sql: str) -> bool:
+    """
+    Whether ORDER BY fully determines the row order of ``sql``.
+
+    True when the outermost ORDER BY includes ``id`` or every GROUP BY term
+    (each group is one row); a heuristic that errs towards False.
+    """
+    shape = _STRING_LITERAL_RE.sub("''", normalize_sql(sql)).upper()
+    clauses = _top_level_clauses(shape)
+    if 'ORDER BY' not in clauses:
+        return False
+    order_terms = set(_split_terms(clauses['ORDER BY']))
+    if 'ID' in order_terms:
+        return True
+    group_terms = _split_terms(clauses.get('GROUP BY', ''))
+    return bool(group_terms) and all(term in order_terms for term in group_terms)
+
+
+def plan_page(sql: str, page_size: int = DEFAULT_PAGE_SIZE, token: Optional[str] = None) -> PagePlan:
+    """
+    Build the plan for fetching one page of ``sql``.
+
+    Args:
+        sql: SELECT statement supplied by the caller
+        page_size: Rows per page (clamped to MAX_PAGE_SIZE)
+        token: Continuation token from the previous page, if any
+
+    Returns:
+        PagePlan describing the statement to run
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    base_sql = normalize_sql(sql)
+    fingerprint = _fingerprint(base_sql)
+    state = decode_token(token, fingerprint) if token else {}
+
+    direction = keyset_direction(base_sql)
+    offset = state.get('o', 0)
+
+    if direction is not None:
+        descending = direction == 'DESC'
+        params: Tuple[Any, ...] = ()
+        where = ''
+        if 'k' in state:
+            where = f"WHERE id {'<' if descending else '>'} ?"
+            params = (state['k'],)
+        page_sql = f"SELECT * FROM ({base_sql}) {where} ORDER BY id {direction} LIMIT ?"
+        return PagePlan(
+            sql=page_sql,
+            params=params + (page_size + 1,),  # one extra row tells us if there is more
+            page_size=page_size,
+            mode='keyset',
+            fingerprint=fingerprint,
+            offset=offset,
+            descending=descending,
+            cache_key=('page', page_sql, params, page_size),
+        )
+
+    return PagePlan(
+        sql=base_sql,
+        params=(),
+        page_size=page_size,
+        mode='offset',
+        fingerprint=fingerprint,
+        offset=offset,
+        skip=offset,
+        stable=has_total_order(base_sql),
+        cache_key=('page', base_sql, offset, page_size),
+    )
+
+
+def fetch_page_rows(conn, plan: PagePlan) -> List[Any]:
+    """
+    Run a page plan, holding at most one page (plus one row) in memory.
+
+    Returns:
+        Up to ``page_size + 1`` rows; the extra row signals more data.
+    """
+    cursor = execute_statement(conn, plan.sql, plan.params)
+    try:
+        remaining = plan.skip
+        while remaining > 0:
+            skipped = cursor.fetchmany(min(remaining, SKIP_CHUNK_SIZE))
+            if not skipped:
+                break
+            remaining -= len(skipped)
+        return cursor.fetchmany(plan.page_size + 1)
+    finally:
+        cursor.close()
+
+
+def build_page(plan: PagePlan, rows: List[Any], columns: Optional[List[str]] = None) -> ResultPage:
+    """
+    Turn fetched rows into a ResultPage with its continuation token.
+    """
+    has_more = len(rows) > plan.page_size
+    rows = rows[:plan.page_size]
+    if columns is None:
+        columns = list(rows[0].keys()) if rows else []
+
+    next_token = None
+    if has_more:
+        state = {'f': plan.fingerprint, 'o': plan.offset + len(rows)}
+        if plan.mode == 'keyset':
+            state['k'] = rows[-1][plan.key_column]
+        next_token = encode_token(state)
+
+    return ResultPage(
+        columns=columns,
+        rows=[dict(row) for row in rows],
+        page_size=plan.page_size,
+        mode=plan.mode,
+        next_token=next_token,
+        offset=plan.offset,
+        stable=plan.stable,
+    )
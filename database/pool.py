@@ -0,0 +1,365 @@
+"""
+SQLite connection pooling for the Database MCP project.
+
+This module keeps a bounded set of pre-tuned SQLite connections that are
+reused across requests instead of opening a new connection for every call.
+The pool is thread-safe for Flask's threaded server and exposes an
+asyncio-friendly acquire for the MCP server.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Pool sizing and health check settings
+POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '8'))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+# Prepared statements kept per connection, keyed on the parameterized SQL shape
+STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+
+# Per-connection tuning applied once when a connection is created
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': int(os.getenv('DB_CACHE_SIZE', '-65536')),  # negative values are KiB
+    'mmap_size': int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'busy_timeout': 5000,
+}
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a pooled sqlite3.Connection.
+
+    Behaves like the underlying connection, except that ``close()`` hands the
+    connection back to its pool instead of closing it. This keeps existing
+    ``conn = get_db_connection() ... conn.close()`` call sites working.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    @property
+    def raw(self) -> sqlite3.Connection:
+        """The underlying sqlite3.Connection."""
+        return self._conn
+
+    def close(self):
+        """Return the connection to the pool."""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # Safety net for callers that forget to close
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of reusable, pre-configured SQLite connections.
+
+    Connections are created lazily up to ``max_size``. Idle connections are
+    health-checked before reuse if they have been idle longer than
+    ``health_check_interval`` seconds, and broken ones are replaced.
+    """
+
+    def __init__(self, database: str, max_size: int = POOL_MAX_SIZE,
+                 timeout: float = POOL_ACQUIRE_TIMEOUT,
+                 health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+                 pragmas: Optional[Dict[str, Any]] = None, uri: bool = False):
+        if max_size < 1:
+            raise ValueError("Pool max_size must be at least 1")
+
+        self.database = str(database)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.uri = uri
+
+        self._idle = []  # stack of (connection, last_used) tuples
+        self._in_use = 0
+        self._created = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+
+        # Statistics
+        self._stats = {
+            'acquisitions': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'peak_in_use': 0,
+        }
+
+    # --- connection lifecycle ---
+
+    def _create_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, uri=self.uri, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        for name, value in self.pragmas.items():
+            try:
+                conn.execute(f"PRAGMA {name} = {value}")
+            except sqlite3.DatabaseError as e:
+                # Read-only or in-memory targets reject some pragmas (e.g. WAL)
+                print(f"⚠️ Could not apply PRAGMA {name}={value}: {e}")
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+        with self._cond:
+            self._stats['health_checks'] += 1
+            if not healthy:
+                self._stats['health_check_failures'] += 1
+        return healthy
+
+    def _discard(self, conn: sqlite3.Connection):
+        # Caller holds self._cond
+        self._stats['connections_discarded'] += 1
+        self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Check a connection out of the pool, waiting if the pool is exhausted.
+
+        Args:
+            timeout: Seconds to wait for a free connection (defaults to pool timeout).
+
+        Returns:
+            PooledConnection: Proxy whose ``close()`` returns it to the pool.
+
+        Raises:
+            PoolTimeoutError: If no connection is available before the timeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        deadline = start + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+
+                if self._created < self.max_size:
+                    # Reserve the slot, create the connection outside the lock
+                    self._created += 1
+                    self._in_use += 1
+                    conn, last_used = None, None
+                    break
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout:.1f}s waiting for a database connection "
+                        f"(pool size {self.max_size})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._stats['acquisitions'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+
+        try:
+            if conn is None:
+                conn = self._create_connection()
+                with self._cond:
+                    self._stats['connections_created'] += 1
+            elif (time.monotonic() - last_used > self.health_check_interval
+                    and not self._is_healthy(conn)):
+                with self._cond:
+                    self._stats['connections_discarded'] += 1
+                self._close_quietly(conn)
+                conn = self._create_connection()
+                with self._cond:
+                    self._stats['connections_created'] += 1
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        wait_seconds = time.perf_counter() - start
+        with self._cond:
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['total_wait_seconds'] += wait_seconds
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait_seconds)
+
+        return PooledConnection(self, conn)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Asyncio-friendly variant of ``acquire`` that never blocks the event loop.
+
+        The fast path (a recently used idle connection is available) completes
+        inline without touching SQLite. Everything else (creating a connection,
+        a health check, waiting for a free one) runs in a worker thread.
+        """
+        with self._cond:
+            if not self._closed and self._idle:
+                conn, last_used = self._idle[-1]
+                if time.monotonic() - last_used <= self.health_check_interval:
+                    self._idle.pop()
+                    self._in_use += 1
+                    self._stats['acquisitions'] += 1
+                    self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+                    return PooledConnection(self, conn)
+        return await asyncio.to_thread(self.acquire, timeout)
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a raw connection to the pool."""
+        if conn.in_transaction:
+            # Never hand out a connection with a dangling transaction
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._created -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager yielding a pooled connection."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close all idle connections; in-use ones are closed on release."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._created -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+    # --- reporting ---
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Report pool usage so the pool can be sized.
+
+        Returns:
+            Dictionary with current utilisation and cumulative wait statistics.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'database': self.database,
+                'max_size': self.max_size,
+                'open_connections': self._created,
+                'idle_connections': len(self._idle),
+                'in_use': self._in_use,
+                'utilisation': self._in_use / self.max_size,
+                'peak_utilisation': stats['peak_in_use'] / self.max_size,
+            })
+        acquisitions = stats['acquisitions'] or 1
+        stats['avg_wait_ms'] = stats['total_wait_seconds'] / acquisitions * 1000
+        stats['max_wait_ms'] = stats['max_wait_seconds'] * 1000
+        return stats
+
+
+# --- module-level pool registry ---
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database, **kwargs) -> ConnectionPool:
+    """
+    Return the shared pool for a database path, creating it on first use.
+
+    Args:
+        database: Path (or URI) of the SQLite database.
+        **kwargs: Extra ConnectionPool arguments used only when creating the pool.
+
+    Returns:
+        ConnectionPool: The shared pool for that database.
+    """
+    key = str(database)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(key, **kwargs)
+                _pools[key] = pool
+    return pool
+
+
+def get_all_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Return statistics for every pool created in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.database: pool.get_stats() for pool in pools}
+
+
+def close_all_pools():
+    """Close every pool (used on shutdown and in benchmarks)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -12,13 +12,32 @@ sys.path.insert(0, str(project_root))
 import os
 import sqlite3
 import json
+import hashlib
+import threading
+import time
 import openai
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, Iterator, List, Any, Tuple, Optional
 from dotenv import load_dotenv
 
 # Import our modules
 from database.connection import get_db_connection
-from core.prompts import get_sql_generation_prompt, get_data_interpretation_prompt
+from database.sql_cache import SQLCache
+from database.similarity_cache import SimilarityCache
+from database.result_cache import ResultCache, TIME_DEPENDENT_TTL_SECONDS
+from database.data_version import get_data_version_tracker
+from database.sql_normalize import normalize_sql, is_volatile_sql, is_time_dependent_sql, inline_params
+from database.pagination import DEFAULT_PAGE_SIZE, ResultPage, plan_page, fetch_page_rows, build_page
+from database.rollups import RollupRewriter
+from database.columnar import ColumnarStore
+from database.budget import QueryBudget, QueryGuard, get_budget
+from database.result_profile import profile_results, render_profile
+from database.result_encoding import resolve_encoding
+from database.question_templates import TemplateMatcher
+from database.statements import execute_statement
+from database.result_export import EXPORTS, ResultExport
+from database.replica import READ_REPLICA_ENABLED, get_read_replica
+from core.prompts import get_sql_generation_prompt, get_data_interpretation_prompt, get_profile_interpretation_prompt
+from core import metrics
 
 # Load environment variables
 load_dotenv()
@@ -26,8 +45,33 @@ load_dotenv()
 # Database configuration
 DATABASE = os.path.join(os.path.dirname(__file__), 'usage.db')
 
-# Token limit considerations for LLM processing
-MAX_ROWS_FOR_LLM_SUMMARY = 200  # Balanced limit for good performance and comprehensive analysis
+# Results up to this many rows are sent to the LLM verbatim; larger results
+# are condensed into a statistical profile first (see database/result_profile.py)
+MAX_ROWS_FOR_LLM_SUMMARY = int(os.getenv('MAX_ROWS_FOR_LLM_SUMMARY', '20'))
+
+# How often (in seconds) the cached schema is re-validated against PRAGMA schema_version
+SCHEMA_VERSION_CHECK_INTERVAL = float(os.getenv('SCHEMA_VERSION_CHECK_INTERVAL', '5'))
+
+# Reuse SQL generated for previously seen questions instead of calling the LLM
+SQL_CACHE_ENABLED = os.getenv('SQL_CACHE_ENABLED', 'True').lower() == 'true'
+
+# Reuse (re-parameterized) SQL from similarly worded questions
+SIMILAR_SQL_CACHE_ENABLED = os.getenv('SIMILAR_SQL_CACHE_ENABLED', 'True').lower() == 'true'
+
+# Reuse query results until new rows are committed to usage_data
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True').lower() == 'true'
+
+# Encoding of raw rows in interpretation prompts ('auto' picks the most compact)
+LLM_RESULT_FORMAT = os.getenv('LLM_RESULT_FORMAT', 'auto')
+
+# Answer eligible aggregates from the usage_daily_rollup table
+ROLLUP_REWRITE_ENABLED = os.getenv('ROLLUP_REWRITE_ENABLED', 'True').lower() == 'true'
+
+# Answer recognised aggregates from the in-process columnar copy of usage_data
+COLUMNAR_STORE_ENABLED = os.getenv('COLUMNAR_STORE_ENABLED', 'True').lower() == 'true'
+
+# Answer common question shapes from local SQL templates instead of the LLM
+TEMPLATE_MATCHING_ENABLED = os.getenv('TEMPLATE_MATCHING_ENABLED', 'True').lower() == 'true'
 
 class DatabaseQueryEngine:
     """
@@ -35,7 +79,8 @@ class DatabaseQueryEngine:
     and data interpretation. Used by both Flask web interface and MCP server.
     """
     
-    def __init__(self):
+    def __init__(self, db_path=None):
+        self.db_path = db_path
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
@@ -45,10 +90,43 @@ class DatabaseQueryEngine:
             self.client = openai.OpenAI()
         except Exception as e:
             raise ValueError(f"Error initializing OpenAI client: {e}")
+        
+        # Schema and rendered SQL-generation prompt, keyed on PRAGMA schema_version
+        self._schema_lock = threading.Lock()
+        self._schema_cache = None
+        self._schema_checked_at = 0.0
+        
+        # Question -> SQL cache (in-process LRU backed by the sql_cache table)
+        self.sql_cache = SQLCache(db_path, enabled=SQL_CACHE_ENABLED)
+        
+        # Paraphrased questions reuse SQL from similar ones (see database/similarity_cache.py)
+        self.similar_sql = SimilarityCache(db_path, enabled=SIMILAR_SQL_CACHE_ENABLED)
+        
+        # Query results, invalidated by the usage_data data version
+        self.result_cache = ResultCache(enabled=RESULT_CACHE_ENABLED)
+        self.data_version = get_data_version_tracker(db_path)
+        
+        # Rewrites daily-grain aggregates to run against the rollup table
+        self.rollups = RollupRewriter(db_path, enabled=ROLLUP_REWRITE_ENABLED)
+        
+        # Group-by aggregates evaluated with NumPy, without SQLite (see database/columnar.py)
+        self.columnar = ColumnarStore(db_path, enabled=COLUMNAR_STORE_ENABLED)
+        
+        # Deterministic SQL for common question shapes (no LLM call)
+        self.templates = TemplateMatcher(db_path, enabled=TEMPLATE_MATCHING_ENABLED)
+        
+        # Optional in-memory copy of the database that serves reads (see database/replica.py)
+        self.replica = get_read_replica(db_path) if READ_REPLICA_ENABLED else None
     
     def get_db_connection(self) -> sqlite3.Connection:
         """Get database connection using the centralized connection module."""
-        return get_db_connection()
+        return get_db_connection(self.db_path)
+    
+    def get_read_connection(self) -> sqlite3.Connection:
+        """Get a connection for read-only queries (the in-memory replica when enabled and current)."""
+        if self.replica is not None:
+            return self.replica.acquire()
+        return get_db_connection(self.db_path)
     
     def validate_question(self, question: str) -> Tuple[bool, Optional[str]]:
         """
@@ -67,18 +145,89 @@ class DatabaseQueryEngine:
         
         return True, None
     
+    def _load_schema_cache(self) -> Dict[str, Any]:
+        """
+        Return the cached schema entry, refreshing it if the schema changed.
+        
+        PRAGMA schema_version is re-checked at most every
+        SCHEMA_VERSION_CHECK_INTERVAL seconds; the schema text and prompt are
+        only rebuilt when the version actually differs.
+        """
+        entry = self._schema_cache
+        if entry is not None and time.monotonic() - self._schema_checked_at < SCHEMA_VERSION_CHECK_INTERVAL:
+            return entry
+        
+        with self._schema_lock:
+            entry = self._schema_cache
+            if entry is not None and time.monotonic() - self._schema_checked_at < SCHEMA_VERSION_CHECK_INTERVAL:
+                return entry
+            
+            conn = self.get_read_connection()
+            try:
+                version = conn.execute("PRAGMA schema_version").fetchone()[0]
+                if entry is None or entry['version'] != version:
+                    schema_result = conn.execute(
+                        "SELECT sql FROM sqlite_master WHERE type='table' AND name='usage_data'"
+                    ).fetchone()
+                    if not schema_result:
+                        raise ValueError("Database schema not found for usage_data table")
+                    
+                    schema = schema_result[0]
+                    prompt = get_sql_generation_prompt(schema)
+                    entry = {
+                        'version': version,
+                        'schema': schema,
+                        'prompt': prompt,
+                        'prompt_hash': hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16],
+                    }
+                    self._schema_cache = entry
+            finally:
+                conn.close()
+            
+            self._schema_checked_at = time.monotonic()
+            return entry
+    
+    def invalidate_schema_cache(self):
+        """Drop the cached schema and prompt so the next call reloads them."""
+        with self._schema_lock:
+            self._schema_cache = None
+            self._schema_checked_at = 0.0
+    
     def get_database_schema(self) -> str:
-        """Retrieve database schema for the usage_data table."""
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='usage_data'")
-        schema_result = cursor.fetchone()
-        conn.close()
+        """Retrieve database schema for the usage_data table (cached)."""
+        return self._load_schema_cache()['schema']
+    
+    def get_sql_generation_prompt(self) -> str:
+        """Return the rendered SQL-generation system prompt (cached)."""
+        return self._load_schema_cache()['prompt']
+    
+    def _sql_generation_request(self, question: str, sql_generation_prompt: str) -> Dict[str, Any]:
+        """Build the chat completion arguments for SQL generation."""
+        return {
+            'model': "gpt-3.5-turbo",
+            'messages': [
+                {"role": "system", "content": sql_generation_prompt},
+                {"role": "user", "content": question}
+            ],
+            'temperature': 0.0  # Use deterministic output for SQL generation
+        }
+    
+    def _extract_generated_sql(self, completion) -> str:
+        """
+        Extract, clean and validate the SQL from a completion.
+        
+        Raises:
+            ValueError: If the LLM generated anything other than a SELECT
+        """
+        metrics.record_llm_usage('sql', completion)
+        generated_sql = completion.choices[0].message.content.strip().replace('`', '')
+        print(f"Generated SQL: {generated_sql}")
         
-        if not schema_result:
-            raise ValueError("Database schema not found for usage_data table")
+        # Security validation - ensure only SELECT queries are executed
+        if not generated_sql.upper().startswith("SELECT"):
+            raise ValueError("LLM generated a non-SELECT query. Aborting for safety.")
         
-        return schema_result[0]
+        return generated_sql
     
     def generate_sql_from_question(self, question: str) -> str:
         """
@@ -94,70 +243,253 @@ class DatabaseQueryEngine:
             ValueError: If LLM generates unsafe query
             openai.APIError: If OpenAI API call fails
         """
-        print("🤖 Converting natural language to SQL using LLM...")
+        schema_entry = self._load_schema_cache()
         
-        # Import prompts (assuming they exist)
-        try:
-            from core.prompts import get_sql_generation_prompt
-        except ImportError:
-            # Fallback basic prompt if prompts.py doesn't exist
-            schema = self.get_database_schema()
-            sql_generation_prompt = f"""
-            You are a SQL expert. Given the database schema and a natural language question, 
-            generate ONLY a SELECT SQL query. Do not include any explanations.
-            
-            Database Schema:
-            {schema}
-            
-            Rules:
-            1. Only generate SELECT queries
-            2. Use proper SQL syntax for SQLite
-            3. Return only the SQL query, no markdown or explanations
-            """
-        else:
-            schema = self.get_database_schema()
-            sql_generation_prompt = get_sql_generation_prompt(schema)
+        # Repeated questions are answered from the cache without an LLM call
+        cached_sql = self.sql_cache.get(question, schema_entry['prompt_hash'])
+        if self.sql_cache.enabled:
+            metrics.record_cache_lookup('sql', bool(cached_sql))
+        if cached_sql:
+            print(f"⚡ Using cached SQL: {cached_sql}")
+            return cached_sql
+        
+        similar = self.reuse_similar_sql(question, schema_entry['prompt_hash'])
+        if similar:
+            return similar
+        
+        print("🤖 Converting natural language to SQL using LLM...")
         
         # Make API call to generate SQL
         completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": sql_generation_prompt},
-                {"role": "user", "content": question}
-            ],
-            temperature=0.0  # Use deterministic output for SQL generation
+            **self._sql_generation_request(question, schema_entry['prompt'])
         )
+        generated_sql = self._extract_generated_sql(completion)
         
-        # Extract and clean the generated SQL
-        generated_sql = completion.choices[0].message.content.strip().replace('`', '')
-        print(f"Generated SQL: {generated_sql}")
+        self.sql_cache.put(question, generated_sql, schema_entry['prompt_hash'])
+        self.similar_sql.put(question, generated_sql, schema_entry['prompt_hash'])
+        return generated_sql
+    
+    def reuse_similar_sql(self, question: str, prompt_hash: str) -> Optional[str]:
+        """
+        Look up SQL from a similarly worded question and cache it for this one.
         
-        # Security validation - ensure only SELECT queries are executed
-        if not generated_sql.upper().startswith("SELECT"):
-            raise ValueError("LLM generated a non-SELECT query. Aborting for safety.")
+        Returns:
+            Re-parameterized SQL, or None if no indexed question is close enough
+        """
+        match = self.similar_sql.get(question, prompt_hash)
+        if self.similar_sql.enabled:
+            metrics.record_cache_lookup('similar_sql', match is not None)
+        if match is None:
+            return None
+        print(f"⚡ Reusing SQL from similar question ({match.similarity:.2f}): {match.source_question!r}")
+        self.sql_cache.put(question, match.sql, prompt_hash)
+        return match.sql
+    
+    def invalidate_question(self, question: str):
+        """Forget SQL cached for a question (e.g. because it failed to run)."""
+        self.sql_cache.invalidate(question)
+        self.similar_sql.invalidate(question)
+    
+    def resolve_sql(self, question: str) -> Tuple[str, Tuple[Any, ...]]:
+        """
+        Get SQL for a question, from a local template when one fits.
         
-        return generated_sql
+        Args:
+            question: Natural language question from user
+            
+        Returns:
+            (sql, params): template SQL with its bound parameters, or the
+            LLM-generated SQL with no parameters
+        """
+        template = self.templates.match(question)
+        if template is not None:
+            print(f"⚡ Using SQL template '{template.name}': {template.sql} {template.params}")
+            return template.sql, template.params
+        return self.generate_sql_from_question(question), ()
     
-    def execute_sql_query(self, sql: str) -> List[sqlite3.Row]:
+    def execute_sql_query(self, sql: str, guard: Optional[QueryGuard] = None,
+                          params: Tuple[Any, ...] = ()) -> List[sqlite3.Row]:
         """
         Execute SQL query and return results.
         
+        Results are served from the result cache while usage_data is unchanged.
+        Aggregates the columnar store recognises are answered in-process;
+        other aggregates that the daily rollup can answer exactly are run
+        against usage_daily_rollup instead of scanning usage_data.
+        
         Args:
             sql: SQL query to execute
+            guard: Execution budget enforcer (defaults to the 'default' budget)
+            params: Values for ``?`` placeholders in sql
             
         Returns:
             List of database rows
+            
+        Raises:
+            BudgetExceededError: If the query runs too long or returns too many rows
         """
         print("💾 Executing SQL query...")
+        guard = guard or QueryGuard()
         
-        conn = self.get_db_connection()
+        # Cache keys and rollup rewriting work on the statement with values inlined
+        resolved_sql = inline_params(sql, params)
+        
+        cacheable = self.result_cache.enabled and not is_volatile_sql(resolved_sql)
+        if cacheable:
+            cache_key = normalize_sql(resolved_sql)
+            version = self.data_version.current()
+            cached = self.result_cache.get(cache_key, version)
+            metrics.record_cache_lookup('result', cached is not None)
+            if cached is not None:
+                print(f"⚡ Query served from result cache ({len(cached)} rows)")
+                guard.check_rows(len(cached))
+                metrics.ROWS_RETURNED.observe(len(cached))
+                return cached
+        
+        results = self.columnar.execute(resolved_sql)
+        if results is not None:
+            print(f"🧮 Answered from columnar store ({len(results)} rows)")
+            guard.check_rows(len(results))
+        else:
+            conn = self.get_read_connection()
+            try:
+                # Time budget is enforced inside SQLite; rows are capped while fetching
+                with guard.attach(conn):
+                    rollup_sql = self.rollups.rewrite(conn, resolved_sql)
+                    if rollup_sql is not None:
+                        print(f"📊 Answering from daily rollup: {rollup_sql}")
+                        start = time.perf_counter()
+                        results = guard.fetch(execute_statement(conn, rollup_sql))
+                        self.rollups.record_execution(time.perf_counter() - start)
+                    else:
+                        results = guard.fetch(execute_statement(conn, sql, params))
+                print(f"Query returned {len(results)} rows")
+            finally:
+                conn.close()
+        metrics.ROWS_RETURNED.observe(len(results))
+        
+        if cacheable:
+            ttl = TIME_DEPENDENT_TTL_SECONDS if is_time_dependent_sql(resolved_sql) else None
+            self.result_cache.put(cache_key, version, results, ttl=ttl)
+        return results
+    
+    def execute_sql_page(self, sql: str, page_size: int = DEFAULT_PAGE_SIZE,
+                         token: Optional[str] = None, guard: Optional[QueryGuard] = None) -> ResultPage:
+        """
+        Execute SQL and return a single page of results.
+        
+        Rows are streamed with fetchmany, using keyset pagination on ``id``
+        where possible, so memory stays flat regardless of result size.
+        Pages are cached like full results.
+        
+        Args:
+            sql: SQL query to execute
+            page_size: Number of rows per page
+            token: Continuation token returned with the previous page
+            guard: Execution budget enforcer (time budget; pages are already bounded)
+            
+        Returns:
+            ResultPage with rows and the token for the next page
+        """
+        plan = plan_page(sql, page_size, token)
+        print(f"💾 Fetching {plan.mode} page at offset {plan.offset} ({plan.page_size} rows)...")
+        
+        cacheable = self.result_cache.enabled and not is_volatile_sql(sql)
+        if cacheable:
+            version = self.data_version.current()
+            rows = self.result_cache.get(plan.cache_key, version)
+            if rows is not None:
+                return build_page(plan, rows)
+        
+        conn = self.get_read_connection()
+        try:
+            with (guard or QueryGuard()).attach(conn):
+                rows = fetch_page_rows(conn, plan)
+        finally:
+            conn.close()
+        
+        if cacheable:
+            ttl = TIME_DEPENDENT_TTL_SECONDS if is_time_dependent_sql(sql) else None
+            self.result_cache.put(plan.cache_key, version, rows, ttl=ttl)
+        return build_page(plan, rows)
+    
+    def export_sql_query(self, sql: str, result_format: str = 'arrow', guard: Optional[QueryGuard] = None,
+                         params: Tuple[Any, ...] = ()) -> ResultExport:
+        """
+        Execute SQL and write the full result to an Arrow IPC stream or Parquet file.
+        
+        Rows go from the cursor into Arrow record batches without building
+        sqlite3.Row objects or dicts, so the result cache and columnar store
+        (which hold rows) are bypassed.
+        
+        Args:
+            sql: SQL query to execute
+            result_format: 'arrow' or 'parquet'
+            guard: Execution budget enforcer (defaults to the 'export' budget)
+            params: Values for ``?`` placeholders in sql
+            
+        Returns:
+            ResultExport describing the file (see database/result_export.py)
+            
+        Raises:
+            ExportError: If the format is unsupported or pyarrow is missing
+            BudgetExceededError: If the query runs too long or returns too many rows
+        """
+        print(f"📦 Exporting SQL results as {result_format}...")
+        guard = guard or QueryGuard(get_budget('export'))
+        conn = self.get_read_connection()
         try:
-            results = conn.execute(sql).fetchall()
-            print(f"Query returned {len(results)} rows")
-            return results
+            with guard.attach(conn):
+                return EXPORTS.export(conn, sql, params, result_format, guard)
         finally:
             conn.close()
     
+    def export_natural_language_query(self, question: str, result_format: str = 'arrow',
+                                      budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
+        """
+        Answer a question with an exported result file instead of an interpretation.
+        
+        Args:
+            question: Natural language question from user
+            result_format: 'arrow' or 'parquet'
+            budget: Execution budget for the generated SQL (defaults to 'export')
+            
+        Returns:
+            The export's dictionary plus the question
+        """
+        is_valid, error_msg = self.validate_question(question)
+        if not is_valid:
+            raise ValueError(error_msg)
+        
+        sql, params = self.resolve_sql(question)
+        try:
+            export = self.export_sql_query(sql, result_format, QueryGuard(budget or get_budget('export')), params)
+        except sqlite3.Error:
+            # Never keep serving SQL that does not run
+            self.invalidate_question(question)
+            raise
+        return {**export.to_dict(), 'question': question}
+    
+    def _interpretation_request(self, question: str, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the chat completion arguments for data interpretation."""
+        # Small results go verbatim; larger ones as a profile computed over every row
+        if len(data) <= MAX_ROWS_FOR_LLM_SUMMARY:
+            encoded = resolve_encoding(data, LLM_RESULT_FORMAT)
+            interpretation_prompt = get_data_interpretation_prompt(question, encoded.text, encoded.label)
+        else:
+            with metrics.span('profile'):
+                profile_json = render_profile(profile_results(data))
+            interpretation_prompt = get_profile_interpretation_prompt(question, len(data), profile_json)
+        
+        return {
+            'model': "gpt-3.5-turbo-0125",
+            'messages': [
+                {"role": "system", "content": "You are a helpful data analyst assistant who provides clear, natural language answers based on data."},
+                {"role": "user", "content": interpretation_prompt}
+            ],
+            'temperature': 0.5  # Allow some creativity in response formatting
+        }
+    
     def interpret_data_with_llm(self, question: str, data: List[Dict[str, Any]]) -> str:
         """
         Convert query results to human-readable response using LLM.
@@ -171,38 +503,113 @@ class DatabaseQueryEngine:
         """
         print("📝 Converting data to human-readable response...")
         
-        # Prepare data for LLM interpretation
-        data_json = json.dumps(data, indent=2)
+        # Generate human-readable interpretation
+        final_completion = self.client.chat.completions.create(
+            **self._interpretation_request(question, data)
+        )
         
-        # Try to import custom prompt, fallback to basic one
-        try:
-            from core.prompts import get_data_interpretation_prompt
-            interpretation_prompt = get_data_interpretation_prompt(question, data_json)
-        except ImportError:
-            interpretation_prompt = f"""
-            Analyze the following data and provide a clear, natural language answer to the user's question.
+        return self._extract_interpretation(final_completion)
+    
+    def _extract_interpretation(self, completion) -> str:
+        """Extract the answer text from an interpretation completion."""
+        metrics.record_llm_usage('interpretation', completion)
+        return completion.choices[0].message.content.strip()
+    
+    def stream_interpretation(self, question: str, data: List[Dict[str, Any]]) -> Iterator[str]:
+        """
+        Stream the human-readable interpretation as the LLM produces it.
+        
+        Args:
+            question: Original user question
+            data: Query results as list of dictionaries
             
-            User Question: {question}
+        Yields:
+            Fragments of the answer text, in order
+        """
+        print("📝 Streaming human-readable response...")
+        request = self._interpretation_request(question, data)
+        stream = self.client.chat.completions.create(
+            **request, stream=True, stream_options={'include_usage': True}
+        )
+        
+        metrics.LLM_REQUESTS.inc(purpose='interpretation')
+        for chunk in stream:
+            # With include_usage the final chunk carries token counts and no choices
+            usage = getattr(chunk, 'usage', None)
+            if usage is not None:
+                for kind in ('prompt', 'completion'):
+                    tokens = getattr(usage, f'{kind}_tokens', None)
+                    if tokens:
+                        metrics.LLM_TOKENS.inc(tokens, purpose='interpretation', kind=kind)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    def stream_natural_language_query(self, question: str,
+                                      budget: Optional[QueryBudget] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming version of process_natural_language_query.
+        
+        Each stage is reported as soon as it finishes, so callers can show the
+        SQL and the rows while the interpretation is still being generated.
+        
+        Args:
+            question: Natural language question from user
+            budget: Execution budget for the generated SQL (defaults to 'default')
             
-            Data:
-            {data_json}
+        Yields:
+            (event, payload) pairs, in order:
+            - ('sql', {'question', 'sql'})
+            - ('data', {'data', 'row_count'})
+            - ('token', {'text'}) for each answer fragment
+            - ('done', {'answer', 'data', 'question', 'sql'}), the same result
+              process_natural_language_query() returns
             
-            Please provide a concise, helpful summary of what this data shows in relation to the user's question.
-            """
+        Raises:
+            ValueError: For validation errors or unsafe queries
+            Exception: For database or API errors
+        """
+        started = time.perf_counter()
         
-        # Generate human-readable interpretation
-        final_completion = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": "You are a helpful data analyst assistant who provides clear, natural language answers based on data."},
-                {"role": "user", "content": interpretation_prompt}
-            ],
-            temperature=0.5  # Allow some creativity in response formatting
-        )
+        with metrics.span('validate'):
+            is_valid, error_msg = self.validate_question(question)
+            if not is_valid:
+                raise ValueError(error_msg)
+        
+        with metrics.span('generate_sql'):
+            sql, params = self.resolve_sql(question)
+        display_sql = inline_params(sql, params)
+        yield 'sql', {'question': question, 'sql': display_sql}
+        
+        try:
+            with metrics.span('execute_sql'):
+                results = self.execute_sql_query(sql, QueryGuard(budget), params)
+        except sqlite3.Error:
+            # Never keep serving SQL that does not run
+            self.invalidate_question(question)
+            raise
+        
+        with metrics.span('to_dicts'):
+            data = [dict(row) for row in results]
+        yield 'data', {'data': data, 'row_count': len(data)}
         
-        return final_completion.choices[0].message.content.strip()
+        if not data:
+            answer = "I couldn't find any data that answers your question."
+            yield 'token', {'text': answer}
+        else:
+            fragments = []
+            interpret_started = time.perf_counter()
+            for text in self.stream_interpretation(question, data):
+                fragments.append(text)
+                yield 'token', {'text': text}
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - interpret_started, stage='interpret')
+            answer = ''.join(fragments).strip()
+        
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='total')
+        yield 'done', {'answer': answer, 'data': data, 'question': question, 'sql': display_sql}
     
-    def process_natural_language_query(self, question: str) -> Dict[str, Any]:
+    @metrics.span('total')
+    def process_natural_language_query(self, question: str,
+                                       budget: Optional[QueryBudget] = None) -> Dict[str, Any]:
         """
         Main method to process a natural language question and return results.
         
@@ -215,6 +622,7 @@ class DatabaseQueryEngine:
         
         Args:
             question: Natural language question from user
+            budget: Execution budget for the generated SQL (defaults to 'default')
             
         Returns:
             Dictionary containing:
@@ -229,17 +637,26 @@ class DatabaseQueryEngine:
         """
         # Step 1: Validate input
         print("🔍 Step 1: Validating input...")
-        is_valid, error_msg = self.validate_question(question)
-        if not is_valid:
-            raise ValueError(error_msg)
+        with metrics.span('validate'):
+            is_valid, error_msg = self.validate_question(question)
+            if not is_valid:
+                raise ValueError(error_msg)
         
-        # Step 2: Generate SQL from question
+        # Step 2: Generate SQL from question (templates first, then the LLM)
         print("📋 Step 2: Generating SQL from question...")
-        sql = self.generate_sql_from_question(question)
+        with metrics.span('generate_sql'):
+            sql, params = self.resolve_sql(question)
         
         # Step 3: Execute SQL query
         print("💾 Step 3: Executing SQL query...")
-        results = self.execute_sql_query(sql)
+        try:
+            with metrics.span('execute_sql'):
+                results = self.execute_sql_query(sql, QueryGuard(budget), params)
+        except sqlite3.Error:
+            # Never keep serving SQL that does not run
+            self.invalidate_question(question)
+            raise
+        sql = inline_params(sql, params)
         
         # Step 4: Handle empty results
         if not results:
@@ -251,32 +668,16 @@ class DatabaseQueryEngine:
             }
         
         # Step 5: Convert results to list of dictionaries
-        data = [dict(row) for row in results]
-        
-        # Step 6: Handle large result sets (circuit breaker)
-        print("🔄 Step 4: Checking result set size...")
-        if len(results) > MAX_ROWS_FOR_LLM_SUMMARY:
-            total_rows = len(results)
-            sample_data = data[:10]
-            human_answer = (
-                f"Your query returned {total_rows} rows, which is too large to summarize.\n"
-                f"Please try a more specific question (e.g., 'who were the top 5 most active users last week?').\n\n"
-                f"Here is a sample of the first 10 rows:\n"
-                f"{json.dumps(sample_data, indent=2)}"
-            )
-            return {
-                'answer': human_answer,
-                'data': data,
-                'question': question,
-                'sql': sql
-            }
+        with metrics.span('to_dicts'):
+            data = [dict(row) for row in results]
         
-        # Step 7: Generate human-readable interpretation
-        print("📝 Step 5: Generating human-readable response...")
-        human_answer = self.interpret_data_with_llm(question, data)
+        # Step 6: Generate human-readable interpretation (large results are profiled)
+        print("📝 Step 4: Generating human-readable response...")
+        with metrics.span('interpret'):
+            human_answer = self.interpret_data_with_llm(question, data)
         
-        # Step 8: Return complete response
-        print("✅ Step 6: Returning successful response...")
+        # Step 7: Return complete response
+        print("✅ Step 5: Returning successful response...")
         return {
             'answer': human_answer,
             'data': data,
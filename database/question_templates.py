@@ -0,0 +1,300 @@
+"""
+Deterministic SQL for common question shapes, without calling the LLM.
+
+Most questions follow a handful of shapes (see SQL_FEW_SHOT_EXAMPLES): the
+total or average duration of something, how many users or applications
+match a filter, the top N users or applications, and listings of distinct
+values. TemplateMatcher recognises these shapes locally and fills their
+slots:
+
+- app / user / platform: known values from usage_data (database/entities.py)
+- legacy: the word "legacy" adds ``legacy_app = 1``
+- N: "top 3", "five users"; defaults to 1 for a singular subject
+  ("which user") and DEFAULT_TOP_N for a plural one
+- date range: today, yesterday, last/past N days, last week, this/last
+  month, this year. Ranges are whole days evaluated by SQLite, so the
+  rollup rewriter can answer them from usage_daily_rollup
+
+Values are passed as bound parameters. A question is only matched when
+every word is accounted for: a slot value, a date phrase, or a word from
+the template vocabulary. Anything else ("per", "and", "least", "compare",
+an unknown name, a second app...) falls through to the LLM, so a wrong
+template answer is never returned for a question it does not fit.
+
+Rankings are by total duration or session count only. Questions about the
+length of single sessions ("the longest session", "the most time in one
+session") or ranked averages ("the highest average duration") need MAX or
+AVG per group and go to the LLM, as do averages of counts ("the average
+number of sessions").
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import metrics
+from database.entities import NUMBER_PATTERN, get_entity_catalog, parse_number, split_words
+
+# Rows returned for "top apps" when the question gives no N
+DEFAULT_TOP_N = 5
+
+# Largest N accepted from a question
+MAX_TOP_N = 100
+
+TEMPLATE_MATCHES = metrics.REGISTRY.counter(
+    'template_matches_total', 'Questions answered by a local SQL template (template="none": sent to the LLM).',
+    ['template'])
+
+# Subject nouns: what the question groups by, lists or counts
+_SUBJECTS = {
+    'user': 'user', 'users': 'user', 'people': 'user', 'person': 'user',
+    'employee': 'user', 'employees': 'user', 'who': 'user',
+    'app': 'app', 'apps': 'app', 'application': 'app', 'applications': 'app',
+    'program': 'app', 'programs': 'app', 'software': 'app', 'tool': 'app', 'tools': 'app',
+    'platform': 'platform', 'platforms': 'platform',
+    'os': 'platform', 'system': 'platform', 'systems': 'platform',
+}
+_PLURAL_SUBJECTS = {'users', 'people', 'employees', 'apps', 'applications', 'programs', 'software',
+                    'tools', 'platforms', 'systems'}
+
+_RANK_CUES = {'most', 'top', 'longest', 'highest', 'biggest', 'heaviest', 'popular', 'busiest'}
+_AVERAGE_CUES = {'average', 'avg', 'mean', 'typical'}
+_TOTAL_CUES = {'total', 'sum', 'overall', 'combined', 'cumulative'}
+_LIST_CUES = {'list', 'show', 'which', 'what', 'name', 'names', 'distinct', 'unique', 'all', 'different'}
+_SESSION_CUES = {'sessions', 'session', 'often', 'frequently', 'times', 'launches', 'opened'}
+_DURATION_UNITS = {'hours', 'minutes', 'seconds', 'time', 'duration', 'long'}
+# Rank cues that, next to a session word, describe session length ("longest sessions")
+_LENGTH_CUES = {'longest', 'biggest', 'heaviest'}
+# Words that make an average one of counts, not of durations
+_COUNT_CUES = {'number', 'count', 'many'}
+
+# Words a matched question may contain besides slot values and date phrases
+_FILLER = {
+    'what', "what's", 'whats', 'which', 'who', 'is', 'are', 'was', 'were', 'be', 'the', 'a', 'an',
+    'of', 'for', 'on', 'in', 'by', 'with', 'to', 'from', 'at', 'across', 'during', 'over', 'within',
+    'did', 'do', 'does', 'has', 'have', 'had', 'been', 'being', 'tracked', 'recorded', 'logged',
+    'me', 'give', 'tell', 'get', 'find', 'display', 'please', 'there', 'it', 'its', 'their', 'they',
+    'how', 'many', 'much', 'number', 'count', 'usage', 'use', 'used', 'using', 'uses', 'spent',
+    'spend', 'spends', 'spending', 'amount', 'so', 'far', 'currently', 'ever', 'legacy',
+    'run', 'running', 'ran', 'active', 'date',
+}
+_VOCABULARY = (_FILLER | set(_SUBJECTS) | _RANK_CUES | _AVERAGE_CUES | _TOTAL_CUES | _LIST_CUES
+               | _SESSION_CUES | _DURATION_UNITS)
+
+# (pattern, SQL predicate, parameter builder); each bound is a whole day
+_DATE_RANGES = [
+    (re.compile(rf'\b(?:last|past|previous) {NUMBER_PATTERN} days?\b'),
+     "log_date >= strftime('%Y-%m-%dT00:00:00Z', 'now', ?)",
+     lambda n: (f'-{n - 1} days',)),
+    (re.compile(r'\b(?:last|past|previous) week\b'),
+     "log_date >= strftime('%Y-%m-%dT00:00:00Z', 'now', '-6 days')",
+     None),
+    (re.compile(r'\b(?:last|previous) month\b'),
+     "log_date >= strftime('%Y-%m-01T00:00:00Z', 'now', 'start of month', '-1 month') "
+     "AND log_date < strftime('%Y-%m-01T00:00:00Z', 'now')",
+     None),
+    (re.compile(r'\bthis month\b'),
+     "log_date >= strftime('%Y-%m-01T00:00:00Z', 'now')",
+     None),
+    (re.compile(r'\bthis year\b'),
+     "log_date >= strftime('%Y-01-01T00:00:00Z', 'now')",
+     None),
+    (re.compile(r'\byesterday\b'),
+     "log_date >= strftime('%Y-%m-%dT00:00:00Z', 'now', '-1 day') "
+     "AND log_date < strftime('%Y-%m-%dT00:00:00Z', 'now')",
+     None),
+    (re.compile(r'\btoday\b'),
+     "log_date >= strftime('%Y-%m-%dT00:00:00Z', 'now')",
+     None),
+]
+
+_NUMBER_RE = re.compile(rf'\b{NUMBER_PATTERN}\b')
+_HOW_MANY_RE = re.compile(r'\bhow many\b')
+_HOW_LONG_RE = re.compile(r'\bhow (?:long|much time)\b')
+
+# usage_data column for each subject / slot
+_COLUMNS = {'user': 'user', 'app': 'application_name', 'platform': 'platform'}
+
+
+@dataclass(frozen=True)
+class TemplateMatch:
+    """
+    A question answered by a template.
+    """
+    name: str
+    sql: str
+    params: Tuple[Any, ...]
+    slots: Dict[str, Any] = field(default_factory=dict)
+
+
+class TemplateMatcher:
+    """
+    Matches questions to parameterized SQL templates.
+
+    Args:
+        db_path: Database whose usage_data values fill the slots
+        enabled: When False, match() always returns None
+    """
+
+    def __init__(self, db_path=None, enabled: bool = True):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.catalog = get_entity_catalog(db_path)
+        self._lock = threading.Lock()
+        self._stats = {'matched': {}, 'fallthrough': 0}
+
+    def _record(self, name: Optional[str]):
+        TEMPLATE_MATCHES.inc(template=name or 'none')
+        with self._lock:
+            if name is None:
+                self._stats['fallthrough'] += 1
+            else:
+                self._stats['matched'][name] = self._stats['matched'].get(name, 0) + 1
+
+    def match(self, question: str) -> Optional[TemplateMatch]:
+        """
+        Return SQL for the question if it fits a template with confidence.
+
+        Returns:
+            TemplateMatch, or None if the question should go to the LLM
+        """
+        if not self.enabled:
+            return None
+        try:
+            result = self._match(question)
+        except Exception as e:
+            # Never fail a question because of the fast path
+            print(f"Warning: Template matching failed: {e}")
+            result = None
+        self._record(result.name if result else None)
+        return result
+
+    def _match(self, question: str) -> Optional[TemplateMatch]:
+        entities, ambiguous = self.catalog.find_entities(question, ignore=frozenset(_VOCABULARY))
+        if ambiguous:
+            return None
+
+        # Slot values: one per dimension
+        filters: Dict[str, str] = {}
+        for entity in entities:
+            if entity.slot in filters:
+                return None
+            filters[entity.slot] = entity.value
+
+        # Blank out the entity spans; everything left must be explained
+        text = question
+        for entity in reversed(entities):
+            text = text[:entity.start] + ' ' + text[entity.end:]
+        text = ' '.join(word.text for word in split_words(text.lower()))
+
+        conditions, params, date_range = [], [], None
+        for pattern, predicate, build_params in _DATE_RANGES:
+            found = pattern.search(text)
+            if found is None:
+                continue
+            if date_range:
+                return None  # two date ranges
+            date_range = found.group()
+            if build_params is not None:
+                days = parse_number(found.group(1))
+                if not 1 <= days <= 3660:
+                    return None
+                params.extend(build_params(days))
+            conditions.append(predicate)
+            text = text[:found.start()] + text[found.end():]
+
+        numbers = _NUMBER_RE.findall(text)
+        if len(numbers) > 1:
+            return None
+        text = _NUMBER_RE.sub(' ', text)
+
+        words = text.split()
+        if any(word not in _VOCABULARY for word in words):
+            return None
+        vocabulary = set(words)
+
+        # The first subject noun decides the grouping: "which user ... using apps"
+        subject_word = next((word for word in words if word in _SUBJECTS), None)
+        subject = _SUBJECTS.get(subject_word)
+        plural = subject_word in _PLURAL_SUBJECTS
+        ranked = bool(vocabulary & _RANK_CUES)
+        sessions = bool(vocabulary & _SESSION_CUES)
+        # "the longest session", "most time in one session": MAX per group, not COUNT or SUM
+        per_session = 'session' in vocabulary or (sessions and bool(vocabulary & _LENGTH_CUES))
+        averaged = bool(vocabulary & _AVERAGE_CUES)
+
+        for slot, value in filters.items():
+            conditions.append(f"{_COLUMNS[slot]} = ?")
+            params.append(value)
+        if 'legacy' in vocabulary:
+            conditions.append("legacy_app = 1")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        slots = {**filters, 'legacy': 'legacy' in vocabulary, 'date_range': date_range}
+
+        if ranked and subject:
+            if subject in filters:
+                return None  # "top users ... Aarav"
+            if per_session or averaged:
+                return None  # ranks by MAX or AVG per group
+            # "the most apps" ranks by a distinct count the templates do not build
+            if re.search(r'\bmost (?:different |distinct |unique )?(?:users|apps|applications|platforms|people)\b', text):
+                return None
+            limit = parse_number(numbers[0]) if numbers else (DEFAULT_TOP_N if plural else 1)
+            if not 1 <= limit <= MAX_TOP_N:
+                return None
+            column = _COLUMNS[subject]
+            if sessions:
+                measure, alias = 'COUNT(*)', 'session_count'
+            else:
+                measure, alias = 'SUM(duration_seconds)', 'total_duration_seconds'
+            sql = (f"SELECT {column}, {measure} AS {alias} FROM usage_data{where} "
+                   f"GROUP BY {column} ORDER BY {alias} DESC LIMIT ?")
+            return TemplateMatch(f'top_{subject}s', sql, tuple(params) + (limit,), {**slots, 'n': limit})
+
+        if numbers:
+            return None  # a number we cannot place
+
+        if ranked:
+            return None
+
+        if averaged:
+            if subject or sessions or vocabulary & _COUNT_CUES:
+                return None  # "average number of sessions" is not AVG(duration_seconds)
+            sql = f"SELECT AVG(duration_seconds) AS average_duration_seconds FROM usage_data{where}"
+            return TemplateMatch('average_duration', sql, tuple(params), slots)
+
+        if _HOW_MANY_RE.search(text):
+            if vocabulary & {'hours', 'minutes', 'seconds'}:
+                sql = f"SELECT SUM(duration_seconds) AS total_duration_seconds FROM usage_data{where}"
+                return TemplateMatch('total_duration', sql, tuple(params), slots)
+            if sessions:
+                sql = f"SELECT COUNT(*) AS session_count FROM usage_data{where}"
+                return TemplateMatch('count_sessions', sql, tuple(params), slots)
+            if subject is None or subject in filters:
+                return None
+            column = _COLUMNS[subject]
+            sql = f"SELECT COUNT(DISTINCT {column}) AS {subject}_count FROM usage_data{where}"
+            return TemplateMatch(f'count_{subject}s', sql, tuple(params), slots)
+
+        if vocabulary & _TOTAL_CUES or _HOW_LONG_RE.search(text):
+            if sessions or not vocabulary & (_DURATION_UNITS | {'usage'}):
+                return None
+            sql = f"SELECT SUM(duration_seconds) AS total_duration_seconds FROM usage_data{where}"
+            return TemplateMatch('total_duration', sql, tuple(params), slots)
+
+        if subject and plural and vocabulary & _LIST_CUES and subject not in filters:
+            column = _COLUMNS[subject]
+            sql = f"SELECT DISTINCT {column} FROM usage_data{where} ORDER BY {column}"
+            return TemplateMatch(f'list_{subject}s', sql, tuple(params), slots)
+
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Matches per template and questions sent on to the LLM."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'matched': dict(self._stats['matched']),
+                'fallthrough': self._stats['fallthrough'],
+            }
@@ -0,0 +1,310 @@
+"""
+In-memory read replica of the usage database.
+
+With READ_REPLICA_ENABLED, the query engine serves read traffic (generated
+and raw SQL, result pages, schema and sample-data lookups) from an
+in-memory copy of the database. Those reads then no longer compete with
+ingestion and query_history writes for the file.
+
+- At startup, the file is opened with a read-only URI (``mode=ro``) and
+  copied with the SQLite backup API into a shared-cache in-memory database
+  (``file:...?mode=memory&cache=shared``). The copy gets its own small
+  connection pool, and its connections are ``query_only``.
+- A replica is only used while it is current: its usage_data generation
+  (PRAGMA data_version, see database/data_version.py) and schema version
+  must match the file. The result cache and rollups key on the same
+  generation, so a stale replica can never produce results cached as
+  fresh.
+- When the file moves on, a background thread copies it into a new
+  in-memory database and swaps it in atomically. Until then reads go to a
+  read-only pool on the file itself. Connections still checked out of the
+  old replica finish their queries. Its memory is freed when the last one
+  is returned.
+
+get_stats() reports the replica's size, how long the last copy took, and
+the refresh lag: the time from noticing a change to serving the new copy.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from database.connection import DB_PATH, get_db_connection
+from database.data_version import get_data_version_tracker
+from database.pool import DEFAULT_PRAGMAS, POOL_MAX_SIZE, ConnectionPool, get_pool
+from database.rollups import refresh_rollups
+
+# Serve reads from an in-memory copy of the database
+READ_REPLICA_ENABLED = os.getenv('READ_REPLICA_ENABLED', 'False').lower() == 'true'
+
+# Databases larger than this (in MB) are not copied into memory (0 = no limit)
+READ_REPLICA_MAX_MB = float(os.getenv('READ_REPLICA_MAX_MB', '1024'))
+
+# Seconds to wait before retrying a failed refresh
+READ_REPLICA_RETRY_INTERVAL = float(os.getenv('READ_REPLICA_RETRY_INTERVAL', '30'))
+
+# Connections to the in-memory copy; they never write
+REPLICA_PRAGMAS = {
+    'query_only': 1,
+    'temp_store': 'MEMORY',
+}
+
+# Read-only connections to the file, used while the replica is stale
+READ_ONLY_PRAGMAS = {name: value for name, value in DEFAULT_PRAGMAS.items() if name != 'journal_mode'}
+READ_ONLY_PRAGMAS['query_only'] = 1
+
+_replica_names = itertools.count(1)
+
+
+def read_only_uri(db_path) -> str:
+    """``file:`` URI that opens the database read-only."""
+    return Path(db_path).resolve().as_uri() + '?mode=ro'
+
+
+class _Snapshot:
+    """
+    One in-memory copy of the database and its connection pool.
+    """
+
+    def __init__(self, uri: str, anchor: sqlite3.Connection, generation: int, schema_version: int,
+                 load_seconds: float):
+        self.uri = uri
+        self.anchor = anchor  # keeps the shared in-memory database alive
+        self.generation = generation
+        self.schema_version = schema_version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        page_count = anchor.execute("PRAGMA page_count").fetchone()[0]
+        page_size = anchor.execute("PRAGMA page_size").fetchone()[0]
+        self.memory_bytes = page_count * page_size
+        self.pool = ConnectionPool(uri, max_size=POOL_MAX_SIZE, pragmas=REPLICA_PRAGMAS, uri=True)
+
+    def close(self):
+        # In-use connections are closed when they are returned
+        self.pool.close()
+        self.anchor.close()
+
+
+class ReadReplica:
+    """
+    Read-only, in-memory copy of a database file, kept current by swapping.
+
+    Args:
+        db_path: Database file to copy (defaults to DB_PATH)
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = str(db_path or DB_PATH)
+        self.source_uri = read_only_uri(self.db_path)
+        self.data_version = get_data_version_tracker(db_path)
+        self._lock = threading.Lock()
+        self._source_lock = threading.Lock()
+        self._source = None
+        self._snapshot: Optional[_Snapshot] = None
+        self._refreshing = False
+        self._retry_at = 0.0
+        self._stale_since: Optional[float] = None
+        self._closed = False
+        self._stats = {
+            'refreshes': 0,
+            'refresh_failures': 0,
+            'replica_reads': 0,
+            'fallback_reads': 0,
+            'last_refresh_seconds': None,
+            'last_refresh_lag_seconds': None,
+            'max_refresh_lag_seconds': 0.0,
+            'last_error': None,
+        }
+
+    # --- source state ---
+
+    def _source_schema_version(self) -> int:
+        with self._source_lock:
+            if self._source is None:
+                self._source = sqlite3.connect(self.source_uri, uri=True, check_same_thread=False)
+            return self._source.execute("PRAGMA schema_version").fetchone()[0]
+
+    def _load(self) -> _Snapshot:
+        """Copy the file into a new in-memory database."""
+        size_mb = os.path.getsize(self.db_path) / (1024 * 1024)
+        if READ_REPLICA_MAX_MB and size_mb > READ_REPLICA_MAX_MB:
+            raise ValueError(f"Database is {size_mb:.0f} MB, above READ_REPLICA_MAX_MB={READ_REPLICA_MAX_MB:.0f}")
+
+        # The replica cannot fold new rows into the rollup itself, so do it on the file first
+        conn = get_db_connection(self.db_path)
+        try:
+            refresh_rollups(conn)
+        finally:
+            conn.close()
+
+        # Versions are read before copying: a write during the copy makes the
+        # replica look stale (and triggers another refresh), never fresher
+        generation = self.data_version.current()
+        schema_version = self._source_schema_version()
+
+        started = time.perf_counter()
+        uri = f"file:usage_replica_{os.getpid()}_{next(_replica_names)}?mode=memory&cache=shared"
+        anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(self.source_uri, uri=True)
+        try:
+            source.backup(anchor)
+        except Exception:
+            anchor.close()
+            raise
+        finally:
+            source.close()
+        return _Snapshot(uri, anchor, generation, schema_version, time.perf_counter() - started)
+
+    # --- refresh ---
+
+    def refresh(self) -> bool:
+        """
+        Copy the file now and swap the new replica in.
+
+        Returns:
+            True if the replica was refreshed
+        """
+        try:
+            snapshot = self._load()
+        except Exception as e:
+            with self._lock:
+                self._stats['refresh_failures'] += 1
+                self._stats['last_error'] = str(e)
+                self._retry_at = time.monotonic() + READ_REPLICA_RETRY_INTERVAL
+            print(f"⚠️ Read replica refresh failed: {e}")
+            return False
+
+        with self._lock:
+            if self._closed:
+                snapshot.close()
+                return False
+            old, self._snapshot = self._snapshot, snapshot
+            self._stats['refreshes'] += 1
+            self._stats['last_refresh_seconds'] = snapshot.load_seconds
+            self._stats['last_error'] = None
+            if self._stale_since is not None:
+                lag = time.monotonic() - self._stale_since
+                self._stats['last_refresh_lag_seconds'] = lag
+                self._stats['max_refresh_lag_seconds'] = max(self._stats['max_refresh_lag_seconds'], lag)
+                self._stale_since = None
+        if old is not None:
+            old.close()
+        return True
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _schedule_refresh(self):
+        with self._lock:
+            if self._stale_since is None:
+                self._stale_since = time.monotonic()
+            if self._refreshing or self._closed or time.monotonic() < self._retry_at:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name='read-replica-refresh', daemon=True).start()
+
+    def _current_snapshot(self) -> Optional[_Snapshot]:
+        """The replica if it matches the file, else None (and start a refresh)."""
+        snapshot = self._snapshot
+        if (snapshot is not None and snapshot.generation == self.data_version.current()
+                and snapshot.schema_version == self._source_schema_version()):
+            return snapshot
+        self._schedule_refresh()
+        return None
+
+    # --- connections ---
+
+    def acquire(self):
+        """
+        Return a read-only pooled connection: the replica if current, else the file.
+
+        Calling ``close()`` on it returns it to its pool.
+        """
+        snapshot = self._current_snapshot()
+        if snapshot is not None:
+            try:
+                conn = snapshot.pool.acquire()
+            except RuntimeError:
+                pass  # swapped out (or exhausted) since the check; read the file instead
+            else:
+                with self._lock:
+                    self._stats['replica_reads'] += 1
+                return conn
+        with self._lock:
+            self._stats['fallback_reads'] += 1
+        return get_pool(self.source_uri, pragmas=READ_ONLY_PRAGMAS, uri=True).acquire()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            snapshot, self._snapshot = self._snapshot, None
+        if snapshot is not None:
+            snapshot.close()
+        with self._source_lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+    # --- reporting ---
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Replica size, freshness and how reads were served."""
+        snapshot = self._snapshot
+        with self._lock:
+            stats = dict(self._stats)
+            stale_since = self._stale_since
+            stats['refreshing'] = self._refreshing
+        stats['enabled'] = True
+        stats['source'] = self.source_uri
+        stats['current_lag_seconds'] = time.monotonic() - stale_since if stale_since is not None else 0.0
+        if snapshot is not None:
+            stats.update({
+                'generation': snapshot.generation,
+                'memory_bytes': snapshot.memory_bytes,
+                'memory_mb': round(snapshot.memory_bytes / (1024 * 1024), 2),
+                'loaded_at': snapshot.loaded_at,
+                'pool': snapshot.pool.get_stats(),
+            })
+        reads = stats['replica_reads'] + stats['fallback_reads']
+        stats['replica_read_rate'] = stats['replica_reads'] / reads if reads else 0.0
+        return stats
+
+
+_replicas: Dict[str, ReadReplica] = {}
+_replicas_lock = threading.Lock()
+
+
+def get_read_replica(db_path=None) -> ReadReplica:
+    """
+    Return the shared replica for a database path, loading it on first use.
+
+    The first load runs synchronously (at engine startup); a failure is
+    reported and reads fall back to the file until a refresh succeeds.
+    """
+    key = str(db_path or DB_PATH)
+    with _replicas_lock:
+        replica = _replicas.get(key)
+        if replica is None:
+            replica = _replicas[key] = ReadReplica(key)
+            if replica.refresh():
+                stats = replica.get_stats()
+                print(f"✅ Read replica loaded into memory ({stats['memory_mb']} MB "
+                      f"in {stats['last_refresh_seconds']:.2f}s)")
+        return replica
+
+
+def close_all_replicas():
+    """Drop every replica (used on shutdown and in benchmarks)."""
+    with _replicas_lock:
+        replicas = list(_replicas.values())
+        _replicas.clear()
+    for replica in replicas:
+        replica.close()
@@ -0,0 +1,159 @@
+"""
+Query result cache for the Database MCP project.
+
+Caches the rows returned by ``DatabaseQueryEngine.execute_sql_query``,
+keyed on normalized SQL text. Every entry is tagged with the usage_data
+generation from ``DataVersionTracker``, so it becomes stale as soon as
+usage_data rows are inserted, updated or deleted. The cache enforces a memory budget with LRU eviction
+and per-entry size accounting.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Memory budget for cached results
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# A single result may use at most this share of the budget
+MAX_ENTRY_FRACTION = 0.25
+
+# Results that depend on 'now' are only reused for this many seconds
+TIME_DEPENDENT_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TIME_DEPENDENT_TTL', '60'))
+
+
+def estimate_rows_size(rows: List[Any]) -> int:
+    """
+    Estimate the memory held by a list of result rows, in bytes.
+
+    Counts the list, each row object and each value it holds.
+    """
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            size += sys.getsizeof(value)
+    return size
+
+
+class ResultCache:
+    """
+    Memory-bounded LRU cache of query results tagged with a data version.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * MAX_ENTRY_FRACTION)
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # key -> (version, rows, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'expired': 0,
+            'evictions': 0,
+            'rejected_too_large': 0,
+            'stores': 0,
+        }
+
+    def _drop(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, version: int) -> Optional[List[Any]]:
+        """
+        Return cached rows for a key if they were produced at ``version``.
+
+        Args:
+            key: Cache key (normalized SQL, optionally with parameters).
+            version: Current data generation.
+
+        Returns:
+            A fresh list of the cached rows, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            entry_version, rows, _, expires_at = entry
+            if entry_version != version:
+                self._drop(key)
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._drop(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return list(rows)
+
+    def put(self, key, version: int, rows: List[Any], ttl: Optional[float] = None) -> bool:
+        """
+        Store rows for a key, evicting least recently used entries to fit.
+
+        Returns:
+            True if the rows were cached, False if they exceed the per-entry limit.
+        """
+        if not self.enabled:
+            return False
+
+        size = estimate_rows_size(rows)
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self._stats['rejected_too_large'] += 1
+            return False
+
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats['evictions'] += 1
+
+            self._entries[key] = (version, tuple(rows), size, expires_at)
+            self._bytes += size
+            self._stats['stores'] += 1
+        return True
+
+    def clear(self):
+        """Remove every cached result."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters and memory usage.
+
+        Returns:
+            Dictionary with hit/miss/eviction counters, entry count and bytes used.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._entries),
+                'bytes_used': self._bytes,
+                'max_bytes': self.max_bytes,
+                'enabled': self.enabled,
+            })
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
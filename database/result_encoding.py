@@ -0,0 +1,193 @@
+"""
+Token-efficient encodings for query results.
+
+Pretty-printed JSON repeats every column name on every row and pads each
+value with whitespace. For tabular results that is mostly overhead in LLM
+prompts and MCP messages. The encoders here hold the same data:
+
+- columnar: compact JSON ``{"columns": [...], "rows": [[...], ...]}``
+- csv / tsv: a header line plus one line per row
+- json: compact JSON records (no indentation)
+- pretty: indented JSON records (the previous format, for comparison)
+
+estimate_tokens() approximates the LLM token count of a string, and
+choose_encoding() encodes a result in each candidate format and returns the
+cheapest one. Callers can use it to fit a token budget. New formats can be
+added with register_encoder().
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Formats tried by choose_encoding() when the caller does not name any
+DEFAULT_CANDIDATES = tuple(
+    name.strip() for name in os.getenv('RESULT_ENCODING_CANDIDATES', 'csv,columnar,json').split(',') if name.strip()
+)
+
+# Word pieces, digit groups and single symbols roughly track BPE token boundaries
+_TOKEN_RE = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]|\s+")
+
+
+@dataclass(frozen=True)
+class ResultEncoder:
+    """
+    A named result encoding.
+    """
+    name: str
+    encode: Callable[[List[Dict[str, Any]]], str]
+    content_type: str
+    fence: str  # language tag for Markdown code fences
+
+
+@dataclass(frozen=True)
+class EncodedResult:
+    """
+    A result rendered in one format, with its estimated token cost.
+    """
+    format: str
+    text: str
+    tokens: int
+    fits: bool = True
+
+    @property
+    def label(self) -> str:
+        """Human-readable format name for prompts (JSON, CSV, TSV)."""
+        return ENCODERS[self.format].fence.upper() or self.format
+
+    def fenced(self) -> str:
+        """Wrap the text in a Markdown code fence for tool responses."""
+        return f"```{ENCODERS[self.format].fence}\n{self.text}\n```"
+
+
+def _columns(data: List[Dict[str, Any]]) -> List[str]:
+    return list(data[0].keys()) if data else []
+
+
+def to_columnar(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert row dictionaries to {'columns': [...], 'rows': [[...], ...]}."""
+    columns = _columns(data)
+    return {'columns': columns, 'rows': [[row[name] for name in columns] for row in data]}
+
+
+def from_columnar(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Inverse of to_columnar()."""
+    columns = table['columns']
+    return [dict(zip(columns, row)) for row in table['rows']]
+
+
+def _encode_columnar(data: List[Dict[str, Any]]) -> str:
+    return json.dumps(to_columnar(data), separators=(',', ':'), default=str)
+
+
+def _encode_delimited(delimiter: str) -> Callable[[List[Dict[str, Any]]], str]:
+    def encode(data: List[Dict[str, Any]]) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=delimiter, lineterminator='\n')
+        columns = _columns(data)
+        writer.writerow(columns)
+        writer.writerows([row[name] for name in columns] for row in data)
+        return buffer.getvalue().rstrip('\n')
+    return encode
+
+
+def _encode_json(data: List[Dict[str, Any]]) -> str:
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+
+def _encode_pretty(data: List[Dict[str, Any]]) -> str:
+    return json.dumps(data, indent=2, default=str)
+
+
+ENCODERS: Dict[str, ResultEncoder] = {}
+
+
+def register_encoder(name: str, encode: Callable[[List[Dict[str, Any]]], str],
+                     content_type: str = 'text/plain', fence: str = '') -> ResultEncoder:
+    """
+    Register (or replace) a result encoding.
+
+    Args:
+        name: Format name used by encode_results() and choose_encoding()
+        encode: Callable turning row dictionaries into text
+        content_type: MIME type of the encoded text
+        fence: Markdown code fence language tag
+
+    Returns:
+        The registered ResultEncoder
+    """
+    encoder = ResultEncoder(name, encode, content_type, fence)
+    ENCODERS[name] = encoder
+    return encoder
+
+
+register_encoder('columnar', _encode_columnar, 'application/json', 'json')
+register_encoder('csv', _encode_delimited(','), 'text/csv', 'csv')
+register_encoder('tsv', _encode_delimited('\t'), 'text/tab-separated-values', 'tsv')
+register_encoder('json', _encode_json, 'application/json', 'json')
+register_encoder('pretty', _encode_pretty, 'application/json', 'json')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the LLM token count of ``text``.
+
+    Counts short letter runs, digit groups of up to three, single symbols
+    and whitespace runs, which tracks BPE tokenizers closely enough to
+    compare formats without a tokenizer dependency.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def encode_results(data: List[Dict[str, Any]], fmt: str = 'columnar') -> EncodedResult:
+    """
+    Encode a result in one format.
+
+    Args:
+        data: Query results as list of dictionaries
+        fmt: Registered format name
+
+    Returns:
+        EncodedResult with the text and its token estimate
+
+    Raises:
+        ValueError: If the format is not registered
+    """
+    encoder = ENCODERS.get(fmt)
+    if encoder is None:
+        raise ValueError(f"Unknown result format '{fmt}'. Available: {', '.join(sorted(ENCODERS))}")
+    text = encoder.encode(data)
+    return EncodedResult(fmt, text, estimate_tokens(text))
+
+
+def choose_encoding(data: List[Dict[str, Any]], max_tokens: Optional[int] = None,
+                    candidates: Optional[Sequence[str]] = None) -> EncodedResult:
+    """
+    Encode a result in the cheapest of several formats.
+
+    Args:
+        data: Query results as list of dictionaries
+        max_tokens: Optional token budget; the result's ``fits`` flag reports
+            whether the cheapest encoding is within it
+        candidates: Format names to try (default RESULT_ENCODING_CANDIDATES)
+
+    Returns:
+        The EncodedResult with the fewest estimated tokens
+    """
+    encoded = [encode_results(data, fmt) for fmt in (candidates or DEFAULT_CANDIDATES)]
+    best = min(encoded, key=lambda result: result.tokens)
+    if max_tokens is not None and best.tokens > max_tokens:
+        return EncodedResult(best.format, best.text, best.tokens, fits=False)
+    return best
+
+
+def resolve_encoding(data: List[Dict[str, Any]], fmt: str = 'auto',
+                     max_tokens: Optional[int] = None) -> EncodedResult:
+    """Encode in ``fmt``, or pick the cheapest candidate when ``fmt`` is 'auto'."""
+    if fmt == 'auto':
+        return choose_encoding(data, max_tokens)
+    return encode_results(data, fmt)
@@ -0,0 +1,410 @@
+"""
+Export large query results as Arrow IPC streams or Parquet files.
+
+The question/answer pipeline turns every row into a dict, because the LLM
+interprets the rows and the web and MCP layers return them as JSON. That is
+the wrong shape for results with tens of thousands of rows. Those are best
+handed to pandas, polars or DuckDB as files. export_cursor() writes them
+straight from the SQLite cursor:
+
+- The cursor returns plain tuples (no sqlite3.Row, no dicts). Rows are
+  pulled with fetchmany(RESULT_EXPORT_BATCH_ROWS), transposed into columns
+  and converted with ``pyarrow.array`` into one RecordBatch per fetch, so
+  memory is bounded by one batch whatever the result size.
+- Column types are inferred from the first non-NULL values. A column
+  that starts with NULLs (SQLite sorts them first) is typed by reading
+  ahead up to SCHEMA_PEEK_BATCHES batches; if it is still all NULL, it is
+  written as strings. Later batches are converted to the same types: an
+  integer column that later returns a REAL or TEXT value is rejected with
+  a hint to CAST it.
+- ``arrow`` writes an uncompressed IPC stream (``.arrows``) that readers
+  can memory-map and use without copying. ``parquet`` writes one row group
+  per batch with RESULT_EXPORT_PARQUET_COMPRESSION, which is the smaller
+  file on the wire.
+
+Finished files are registered in an ExportStore under a random id. The
+Flask app serves them at ``/api/results/<id>`` and the MCP server at
+``database://results/<id>``. Exports expire after RESULT_EXPORT_TTL_SECONDS,
+and only the newest RESULT_EXPORT_MAX_FILES are kept.
+
+pyarrow is optional: without it, exporting raises ExportError and
+everything else works as before.
+"""
+
+import os
+import secrets
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from core import metrics
+from database.sql_normalize import inline_params
+from database.statements import execute_statement
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+# Directory for exported files
+RESULT_EXPORT_DIR = os.getenv('RESULT_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'usage_exports'))
+
+# Seconds an export stays downloadable
+RESULT_EXPORT_TTL_SECONDS = float(os.getenv('RESULT_EXPORT_TTL_SECONDS', '3600'))
+
+# Exports kept at once (oldest are deleted first)
+RESULT_EXPORT_MAX_FILES = int(os.getenv('RESULT_EXPORT_MAX_FILES', '100'))
+
+# Rows fetched from SQLite per record batch
+RESULT_EXPORT_BATCH_ROWS = int(os.getenv('RESULT_EXPORT_BATCH_ROWS', '65536'))
+
+# Parquet compression codec (zstd, snappy, gzip, lz4 or none)
+RESULT_EXPORT_PARQUET_COMPRESSION = os.getenv('RESULT_EXPORT_PARQUET_COMPRESSION', 'zstd')
+
+# Batches read ahead to type columns that start with NULLs
+SCHEMA_PEEK_BATCHES = 16
+
+RESULT_EXPORTS = metrics.REGISTRY.counter(
+    'result_exports_total', 'Query results exported to files, by format.', ['format'])
+RESULT_EXPORT_ROWS = metrics.REGISTRY.counter(
+    'result_export_rows_total', 'Rows written to exported result files.', ['format'])
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    """
+    File format an export can be written in.
+    """
+    name: str
+    suffix: str
+    mimetype: str
+
+
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    'arrow': ExportFormat('arrow', '.arrows', 'application/vnd.apache.arrow.stream'),
+    'parquet': ExportFormat('parquet', '.parquet', 'application/vnd.apache.parquet'),
+}
+
+# URI prefix of exports served by the MCP server
+RESULT_URI_PREFIX = 'database://results/'
+
+
+class ExportError(Exception):
+    """
+    Raised when a result cannot be exported (format, column types, no pyarrow).
+    """
+
+
+def get_export_format(name: str) -> ExportFormat:
+    """
+    Look up an export format by name.
+
+    Raises:
+        ExportError: If the format is unknown or pyarrow is not installed
+    """
+    if pa is None:
+        raise ExportError("Result export requires pyarrow (pip install pyarrow)")
+    export_format = EXPORT_FORMATS.get((name or 'arrow').lower())
+    if export_format is None:
+        raise ExportError(f"Unsupported export format '{name}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+@dataclass
+class ResultExport:
+    """
+    One exported result file.
+    """
+    id: str
+    format: ExportFormat
+    path: str
+    sql: str
+    rows: int
+    columns: List[Dict[str, str]]
+    bytes: int
+    seconds: float
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def uri(self) -> str:
+        return RESULT_URI_PREFIX + self.id
+
+    @property
+    def filename(self) -> str:
+        return f"results_{self.id}{self.format.suffix}"
+
+    @property
+    def expires_at(self) -> float:
+        return self.created_at + RESULT_EXPORT_TTL_SECONDS
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def to_dict(self):
+        """Convert the export to a dictionary."""
+        return {
+            'id': self.id,
+            'uri': self.uri,
+            'format': self.format.name,
+            'mimetype': self.format.mimetype,
+            'filename': self.filename,
+            'sql': self.sql,
+            'rows': self.rows,
+            'columns': self.columns,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 4),
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+        }
+
+
+def _record_batch(rows: List[tuple], schema):
+    """Transpose one fetchmany() batch into a RecordBatch of the schema's types."""
+    arrays = []
+    for column, values in zip(schema, zip(*rows)):
+        try:
+            arrays.append(pa.array(values, type=column.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ExportError(f"Column '{column.name}' mixes value types ({column.type} expected: {e}); "
+                              f"CAST it to one type in the SQL") from e
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _infer_types(names: Sequence[str], types: List[Any], rows: List[tuple]):
+    """Fill in the Arrow type of every column still untyped that has a non-NULL value in rows."""
+    for index, name in enumerate(names):
+        if types[index] is not None:
+            continue
+        try:
+            arrow_type = pa.array([row[index] for row in rows]).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ExportError(f"Column '{name}' mixes value types ({e}); CAST it to one type in the SQL") from e
+        if not pa.types.is_null(arrow_type):
+            types[index] = arrow_type
+
+
+class _Writer:
+    """Opens the format's writer once the schema is known."""
+
+    def __init__(self, path: str, export_format: ExportFormat):
+        self.path = path
+        self.format = export_format
+        self._sink = None
+        self._writer = None
+
+    def open(self, schema):
+        if self.format.name == 'parquet':
+            compression = RESULT_EXPORT_PARQUET_COMPRESSION
+            self._writer = pq.ParquetWriter(self.path, schema,
+                                            compression=None if compression == 'none' else compression)
+        else:
+            self._sink = pa.OSFile(self.path, 'wb')
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+
+    def write(self, batch):
+        self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def export_cursor(cursor, path: str, export_format: ExportFormat, guard=None,
+                  batch_rows: int = RESULT_EXPORT_BATCH_ROWS):
+    """
+    Write every row of an executed cursor to path as Arrow record batches.
+
+    Args:
+        cursor: Executed sqlite3 cursor returning tuples
+        path: File to write
+        export_format: Arrow IPC stream or Parquet
+        guard: QueryGuard whose row cap is checked after every batch
+        batch_rows: Rows per record batch
+
+    Returns:
+        (rows, schema) written
+    """
+    names = [column[0] for column in cursor.description]
+    types: List[Any] = [None] * len(names)
+    writer = _Writer(path, export_format)
+    schema = None
+    pending: List[List[tuple]] = []
+    total = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if rows:
+                total += len(rows)
+                if guard is not None:
+                    guard.check_rows(total)
+            if schema is None:
+                if rows:
+                    pending.append(rows)
+                    _infer_types(names, types, rows)
+                    if None in types and len(pending) < SCHEMA_PEEK_BATCHES:
+                        continue
+                schema = pa.schema([pa.field(name, arrow_type or pa.string())
+                                    for name, arrow_type in zip(names, types)])
+                writer.open(schema)
+                for buffered in pending:
+                    writer.write(_record_batch(buffered, schema))
+                pending = []
+            elif rows:
+                writer.write(_record_batch(rows, schema))
+            if not rows:
+                break
+    finally:
+        cursor.close()
+        writer.close()
+    return total, schema
+
+
+class ExportStore:
+    """
+    Exported result files by id, deleted when they expire.
+
+    Args:
+        directory: Where files are written (created on first export)
+        ttl_seconds: How long an export stays available
+        max_files: Exports kept at once
+    """
+
+    def __init__(self, directory: str = RESULT_EXPORT_DIR, ttl_seconds: float = RESULT_EXPORT_TTL_SECONDS,
+                 max_files: int = RESULT_EXPORT_MAX_FILES):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_files = max_files
+        self._exports: Dict[str, ResultExport] = {}
+        self._lock = threading.Lock()
+        self._stats = {'exports': 0, 'rows': 0, 'bytes': 0, 'failures': 0, 'expired': 0}
+
+    def export(self, conn, sql: str, params: Sequence[Any] = (), result_format: str = 'arrow',
+               guard=None) -> ResultExport:
+        """
+        Execute SQL on conn and write the result to a new export file.
+
+        Args:
+            conn: Connection to run the query on (the caller attaches any guard)
+            sql: SQL query to execute
+            params: Values for ``?`` placeholders in sql
+            result_format: 'arrow' or 'parquet'
+            guard: QueryGuard whose row cap applies
+
+        Returns:
+            The registered ResultExport
+
+        Raises:
+            ExportError: If the format is unsupported or a column has mixed types
+        """
+        export_format = get_export_format(result_format)
+        os.makedirs(self.directory, exist_ok=True)
+        export_id = secrets.token_hex(16)
+        path = os.path.join(self.directory, f"{export_id}{export_format.suffix}")
+        partial = path + '.partial'
+
+        started = time.perf_counter()
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None  # plain tuples
+            rows, schema = export_cursor(execute_statement(cursor, sql, params), partial, export_format, guard)
+            os.replace(partial, path)
+        except Exception:
+            with self._lock:
+                self._stats['failures'] += 1
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+        export = ResultExport(
+            id=export_id,
+            format=export_format,
+            path=path,
+            sql=inline_params(sql, params),
+            rows=rows,
+            columns=[{'name': column.name, 'type': str(column.type)} for column in schema],
+            bytes=os.path.getsize(path),
+            seconds=time.perf_counter() - started,
+        )
+        RESULT_EXPORTS.inc(format=export_format.name)
+        RESULT_EXPORT_ROWS.inc(rows, format=export_format.name)
+        with self._lock:
+            self._exports[export_id] = export
+            self._stats['exports'] += 1
+            self._stats['rows'] += rows
+            self._stats['bytes'] += export.bytes
+            evicted = self._prune()
+        self._delete(evicted)
+        print(f"📦 Exported {rows} rows to {export_format.name} ({export.bytes:,} bytes "
+              f"in {export.seconds:.2f}s)")
+        return export
+
+    def _prune(self) -> List[ResultExport]:
+        """Drop expired and surplus exports (caller holds the lock)."""
+        now = time.time()
+        evicted = [export for export in self._exports.values() if now - export.created_at > self.ttl_seconds]
+        self._stats['expired'] += len(evicted)
+        for export in evicted:
+            del self._exports[export.id]
+        while len(self._exports) > self.max_files:
+            oldest = min(self._exports.values(), key=lambda export: export.created_at)
+            evicted.append(self._exports.pop(oldest.id))
+        return evicted
+
+    @staticmethod
+    def _delete(exports: List[ResultExport]):
+        for export in exports:
+            try:
+                os.remove(export.path)
+            except OSError:
+                pass
+
+    def get(self, export_id: str) -> Optional[ResultExport]:
+        """Return an export that has not expired, or None."""
+        with self._lock:
+            evicted = self._prune()
+            export = self._exports.get(export_id)
+        self._delete(evicted)
+        return export
+
+    def get_by_uri(self, uri: str) -> Optional[ResultExport]:
+        """Return the export for a ``database://results/<id>`` URI, or None."""
+        if not uri.startswith(RESULT_URI_PREFIX):
+            return None
+        return self.get(uri[len(RESULT_URI_PREFIX):])
+
+    def list(self) -> List[ResultExport]:
+        """Exports still available, newest first."""
+        with self._lock:
+            evicted = self._prune()
+            exports = sorted(self._exports.values(), key=lambda export: export.created_at, reverse=True)
+        self._delete(evicted)
+        return exports
+
+    def clear(self):
+        """Delete every export."""
+        with self._lock:
+            exports = list(self._exports.values())
+            self._exports.clear()
+        self._delete(exports)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Export counts, sizes and the files currently kept."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['available'] = len(self._exports)
+            stats['available_bytes'] = sum(export.bytes for export in self._exports.values())
+        stats['enabled'] = pa is not None
+        stats['directory'] = self.directory
+        return stats
+
+
+# Process-wide store
+EXPORTS = ExportStore()
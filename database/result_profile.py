@@ -0,0 +1,223 @@
+"""
+Statistical profiles of query results for LLM interpretation.
+
+Sending every row to the interpretation LLM costs prompt tokens linear in
+the result size. profile_results() condenses a result of any size into a
+compact per-column description instead:
+
+- every column: non-null count, null count and distinct count
+- numeric columns: min/max/mean/std/sum, quartiles and p95, Tukey (1.5 x IQR)
+  outliers, and the top rows labelled by the most distinct text column
+- text columns: top-k values with counts
+- date/time columns: range and span; each numeric column is also
+  aggregated per time value and fitted with a linear trend
+
+Column statistics are computed with NumPy over the full result.
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from database.result_encoding import to_columnar
+
+# Values reported for top-k lists, outliers and top rows
+PROFILE_TOP_K = int(os.getenv('PROFILE_TOP_K', '5'))
+
+# Rows included verbatim next to the profile so the LLM sees the shape
+PROFILE_SAMPLE_ROWS = int(os.getenv('PROFILE_SAMPLE_ROWS', '5'))
+
+# ISO dates and timestamps as stored in log_date, or produced by strftime groupings
+_TEMPORAL_RE = re.compile(r'^\d{4}-\d{2}(-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?Z?)?)?$')
+
+
+def _number(value: float) -> Any:
+    """Round floats for the prompt; keep integers exact."""
+    value = float(value)
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return int(value)
+    return round(value, 4)
+
+
+def _classify(values: List[Any]) -> str:
+    if not values:
+        return 'empty'
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return 'numeric'
+    if all(isinstance(v, str) and _TEMPORAL_RE.match(v) for v in values):
+        return 'temporal'
+    return 'text'
+
+
+def _to_datetime(values: List[str]) -> np.ndarray:
+    # NumPy rejects the trailing 'Z' of UTC timestamps
+    return np.array([v[:-1] if v.endswith('Z') else v for v in values], dtype='datetime64[s]')
+
+
+def _numeric_profile(array: np.ndarray, labels: Optional[np.ndarray], label_column: Optional[str]) -> Dict[str, Any]:
+    p25, p50, p75, p95 = np.percentile(array, [25, 50, 75, 95])
+    profile = {
+        'type': 'numeric',
+        'min': _number(array.min()),
+        'max': _number(array.max()),
+        'mean': _number(array.mean()),
+        'std': _number(array.std()),
+        'sum': _number(array.sum()),
+        'p25': _number(p25),
+        'median': _number(p50),
+        'p75': _number(p75),
+        'p95': _number(p95),
+    }
+
+    iqr = p75 - p25
+    if iqr > 0:
+        low, high = p25 - 1.5 * iqr, p75 + 1.5 * iqr
+        outliers = np.flatnonzero((array < low) | (array > high))
+        if outliers.size:
+            # Most extreme first
+            order = outliers[np.argsort(-np.abs(array[outliers] - p50))][:PROFILE_TOP_K]
+            profile['outliers'] = {
+                'count': int(outliers.size),
+                'rule': f'outside [{_number(low)}, {_number(high)}]',
+                'examples': [_labelled(array, labels, label_column, i) for i in order],
+            }
+
+    if labels is not None and array.size > 1:
+        top = np.argsort(-array, kind='stable')[:PROFILE_TOP_K]
+        profile['top_rows'] = [_labelled(array, labels, label_column, i) for i in top]
+    return profile
+
+
+def _labelled(array: np.ndarray, labels: Optional[np.ndarray], label_column: Optional[str], index: int) -> Dict[str, Any]:
+    item = {'value': _number(array[index])}
+    if labels is not None:
+        item[label_column] = labels[index]
+    return item
+
+
+def _text_profile(values: List[Any]) -> Dict[str, Any]:
+    uniques, counts = np.unique(np.array([str(v) for v in values], dtype=object), return_counts=True)
+    order = np.argsort(-counts, kind='stable')[:PROFILE_TOP_K]
+    profile = {'type': 'text'}
+    if uniques.size == len(values):
+        profile['all_distinct'] = True
+        profile['examples'] = [uniques[i] for i in order]
+    else:
+        profile['top_values'] = [{'value': uniques[i], 'count': int(counts[i])} for i in order]
+    return profile
+
+
+def _temporal_profile(times: np.ndarray) -> Dict[str, Any]:
+    first, last = times.min(), times.max()
+    return {
+        'type': 'temporal',
+        'min': str(first),
+        'max': str(last),
+        'span_days': _number((last - first) / np.timedelta64(1, 'D')),
+    }
+
+
+def _trend(times: np.ndarray, array: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Aggregate a numeric column per time value and fit a linear trend."""
+    if np.ptp(times) >= np.timedelta64(2, 'D'):
+        times = times.astype('datetime64[D]')  # raw timestamps: aggregate per day
+    periods, inverse = np.unique(times, return_inverse=True)
+    if periods.size < 3:
+        return None
+    totals = np.bincount(inverse, weights=array)
+
+    days = (periods - periods[0]) / np.timedelta64(1, 'D')
+    slope = np.polyfit(days, totals, 1)[0] if np.ptp(days) > 0 else 0.0
+    mean = totals.mean()
+    relative = slope * float(np.ptp(days)) / mean if mean else 0.0
+    if abs(relative) < 0.05:
+        direction = 'flat'
+    else:
+        direction = 'increasing' if relative > 0 else 'decreasing'
+
+    peak, trough = int(totals.argmax()), int(totals.argmin())
+    return {
+        'periods': int(periods.size),
+        'first': {'period': str(periods[0]), 'total': _number(totals[0])},
+        'last': {'period': str(periods[-1]), 'total': _number(totals[-1])},
+        'peak': {'period': str(periods[peak]), 'total': _number(totals[peak])},
+        'trough': {'period': str(periods[trough]), 'total': _number(totals[trough])},
+        'slope_per_day': _number(slope),
+        'change_over_range_pct': _number(relative * 100),
+        'direction': direction,
+    }
+
+
+def profile_results(data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a compact statistical profile of a query result.
+
+    Args:
+        data: Query results as list of dictionaries
+
+    Returns:
+        Dictionary with row_count, columns (per-column profiles), trends
+        (per numeric column, when the result has a date/time column) and
+        sample_rows.
+    """
+    columns = list(data[0].keys()) if data else []
+    column_values = {name: [row[name] for row in data] for name in columns}
+
+    kinds, non_null = {}, {}
+    for name in columns:
+        present = [v for v in column_values[name] if v is not None]
+        non_null[name] = present
+        kinds[name] = _classify(present)
+
+    # Label top rows and outliers with the most specific fully-populated text column
+    text_columns = [name for name in columns if kinds[name] == 'text' and len(non_null[name]) == len(data)]
+    label_column = max(text_columns, key=lambda name: len(set(non_null[name])), default=None)
+    labels = np.array(column_values[label_column], dtype=object) if label_column else None
+    time_column = next((name for name in columns
+                        if kinds[name] == 'temporal' and len(non_null[name]) == len(data)), None)
+    times = _to_datetime(column_values[time_column]) if time_column else None
+
+    profiles, trends = {}, {}
+    for name in columns:
+        values = column_values[name]
+        present = non_null[name]
+        profile = {
+            'non_null': len(present),
+            'nulls': len(values) - len(present),
+            'distinct': len(set(present)),
+        }
+        kind = kinds[name]
+        if kind == 'numeric':
+            if len(present) == len(values):
+                array = np.asarray(values, dtype=float)
+                profile.update(_numeric_profile(array, labels, label_column))
+                if times is not None:
+                    trend = _trend(times, array)
+                    if trend:
+                        trends[name] = trend
+            else:
+                profile.update(_numeric_profile(np.asarray(present, dtype=float), None, None))
+        elif kind == 'temporal':
+            profile.update(_temporal_profile(_to_datetime(present)))
+        elif kind == 'text':
+            profile.update(_text_profile(present))
+        else:
+            profile['type'] = 'empty'
+        profiles[name] = profile
+
+    profile = {
+        'row_count': len(data),
+        'columns': profiles,
+        'sample_rows': to_columnar(data[:PROFILE_SAMPLE_ROWS]),
+    }
+    if trends:
+        profile['trends'] = {'time_column': time_column, 'by_column': trends}
+    return profile
+
+
+def render_profile(profile: Dict[str, Any]) -> str:
+    """Serialize a profile compactly for the interpretation prompt."""
+    return json.dumps(profile, separators=(',', ':'), default=str)
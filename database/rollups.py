@@ -0,0 +1,544 @@
+"""
+Daily rollup tables and transparent query rewriting.
+
+usage_daily_rollup stores one row per
+(day, user, application_name, platform, legacy_app), holding the sum,
+count, min and max of duration_seconds. It is maintained incrementally:
+refresh_rollups() aggregates only usage_data rows beyond the last rolled-up
+id and upserts them; after UPDATEs or DELETEs (see read_rewrites in
+database/data_version.py) it rebuilds the rollup instead. It runs on the
+write side: init_database, bulk ingestion after each load, the read
+replica before each copy, and a background thread of the rewriter when
+the data version moves. The read path never writes. Before rewriting,
+RollupRewriter checks on the query's own connection that rollup_state
+covers every usage_data row and the current UPDATE/DELETE count; while it
+does not, queries run against usage_data.
+
+RollupRewriter routes generated SQL to the rollup when the answer is
+identical. That requires every referenced column to be a rollup
+dimension, aggregates limited to SUM/COUNT/AVG/MIN/MAX(duration_seconds),
+COUNT(*) and COUNT(DISTINCT <dimension>), and log_date bounds that fall on
+whole days. All other SQL runs unchanged against usage_data.
+
+The rollup only saves work when many sessions share a
+(day, user, application, platform) key. When it holds more than
+ROLLUP_MAX_ROW_RATIO of usage_data's row count, it is kept up to date
+but not used: scanning it would cost as much as scanning the source,
+without the source's indexes. The ratio is re-measured by the background
+refresh whenever the data version moves.
+
+Run ``python -m database.rollups --report`` to replay query_history and
+see how many queries would be rewritten and the latency saved.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Add project root to path when run as a script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.connection import get_db_connection
+from database.aggregate_query import AggregateQuery, Predicate, parse_aggregate_query, expression_key
+from database.data_version import get_data_version_tracker, read_rewrites
+from database.pagination import has_total_order
+
+# Use the rollup only while it has at most this fraction of usage_data's rows
+ROLLUP_MAX_ROW_RATIO = float(os.getenv('ROLLUP_MAX_ROW_RATIO', '0.5'))
+
+ROLLUP_TABLE = 'usage_daily_rollup'
+SOURCE_TABLE = 'usage_data'
+ROLLUP_DIMENSIONS = ('user', 'application_name', 'platform', 'legacy_app')
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_DATE_ONLY_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_DAY_START_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})T00:00:00Z$')
+_DAY_END_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})T23:59:59Z$')
+_QUALIFIED_RE = re.compile(r'\b\w+\s*\.\s*[A-Za-z_"`\[]')
+
+# duration_seconds aggregates and their rollup equivalents
+_DURATION_AGGREGATES = {
+    'SUM': 'SUM(total_duration)',
+    'TOTAL': 'TOTAL(total_duration)',
+    'MIN': 'MIN(min_duration)',
+    'MAX': 'MAX(max_duration)',
+    'AVG': 'CAST(SUM(total_duration) AS REAL) / SUM(session_count)',
+    'COUNT': 'COALESCE(SUM(session_count), 0)',
+}
+
+
+def ensure_rollup_tables(conn):
+    """Create the rollup table, its indexes and the watermark table."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+            day TEXT NOT NULL,
+            user TEXT NOT NULL,
+            application_name TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            legacy_app BOOLEAN NOT NULL,
+            total_duration INTEGER NOT NULL,
+            session_count INTEGER NOT NULL,
+            min_duration INTEGER NOT NULL,
+            max_duration INTEGER NOT NULL,
+            PRIMARY KEY (day, user, application_name, platform, legacy_app)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rollup_app_day ON {ROLLUP_TABLE} '
+                 f'(LOWER(application_name), day, user)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rollup_platform_user ON {ROLLUP_TABLE} '
+                 f'(LOWER(platform), user)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            rewrites INTEGER
+        )
+    ''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rollup_state)")}
+    if 'rewrites' not in columns:
+        conn.execute("ALTER TABLE rollup_state ADD COLUMN rewrites INTEGER")
+    conn.commit()
+
+
+def _aggregate_into_rollup(conn, low_id: int, high_id: int):
+    conn.execute(f'''
+        INSERT INTO {ROLLUP_TABLE}
+            (day, user, application_name, platform, legacy_app,
+             total_duration, session_count, min_duration, max_duration)
+        SELECT substr(log_date, 1, 10), user, application_name, platform, legacy_app,
+               SUM(duration_seconds), COUNT(*), MIN(duration_seconds), MAX(duration_seconds)
+        FROM {SOURCE_TABLE}
+        WHERE id > ? AND id <= ?
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (day, user, application_name, platform, legacy_app) DO UPDATE SET
+            total_duration = total_duration + excluded.total_duration,
+            session_count = session_count + excluded.session_count,
+            min_duration = MIN(min_duration, excluded.min_duration),
+            max_duration = MAX(max_duration, excluded.max_duration)
+    ''', (low_id, high_id))
+
+
+def refresh_rollups(conn) -> Dict[str, Any]:
+    """
+    Bring the rollup up to date with usage_data.
+
+    New rows (id above the watermark) are folded in incrementally. If rows
+    were updated or deleted since the last refresh, or the source shrank
+    below the watermark, the rollup is rebuilt.
+
+    Returns:
+        Dictionary with 'mode' ('noop', 'incremental' or 'rebuild') and row ids
+    """
+    ensure_rollup_tables(conn)
+    state = conn.execute("SELECT last_id, rewrites FROM rollup_state WHERE name = ?", (ROLLUP_TABLE,)).fetchone()
+    last_id, last_rewrites = state if state else (0, None)
+    max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {SOURCE_TABLE}").fetchone()[0]
+    rewrites = read_rewrites(conn, SOURCE_TABLE)
+    rewritten = state is not None and rewrites != last_rewrites
+
+    if max_id == last_id and not rewritten:
+        return {'mode': 'noop', 'from_id': last_id, 'to_id': max_id}
+
+    mode = 'incremental'
+    if max_id < last_id or rewritten:
+        mode = 'rebuild'
+        conn.execute(f"DELETE FROM {ROLLUP_TABLE}")
+        last_id = 0
+
+    _aggregate_into_rollup(conn, last_id, max_id)
+    conn.execute('''
+        INSERT INTO rollup_state (name, last_id, rewrites) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, rewrites = excluded.rewrites
+    ''', (ROLLUP_TABLE, max_id, rewrites))
+    conn.commit()
+    return {'mode': mode, 'from_id': last_id, 'to_id': max_id}
+
+
+def rebuild_rollups(conn) -> Dict[str, Any]:
+    """Recompute the rollup from scratch."""
+    ensure_rollup_tables(conn)
+    conn.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    conn.execute("DELETE FROM rollup_state WHERE name = ?", (ROLLUP_TABLE,))
+    conn.commit()
+    return refresh_rollups(conn)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _day_bound(op: str, value: Any) -> Optional[Tuple[str, str]]:
+    """
+    Translate a log_date bound into an equivalent bound on ``day``.
+
+    Only bounds that fall exactly on day boundaries translate; log_date is
+    stored as 'YYYY-MM-DDTHH:MM:SSZ'.
+    """
+    if not isinstance(value, str):
+        return None
+    if _DATE_ONLY_RE.match(value):
+        # Any timestamp on that day sorts after the bare date
+        return ('>=', value) if op in ('>=', '>') else ('<', value)
+    start = _DAY_START_RE.match(value)
+    if start and op in ('>=', '<'):
+        return op, start.group(1)
+    end = _DAY_END_RE.match(value)
+    if end and op in ('<=', '>'):
+        return op, end.group(1)
+    return None
+
+
+class RollupRewriter:
+    """
+    Rewrites eligible usage_data aggregates to run against the daily rollup.
+    """
+
+    def __init__(self, db_path=None, enabled: bool = True, max_row_ratio: float = ROLLUP_MAX_ROW_RATIO):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.max_row_ratio = max_row_ratio
+        self.data_version = get_data_version_tracker(db_path)
+        self._refreshed_generation = None
+        self._row_ratio = None
+        self._refresher: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'considered': 0,
+            'rewritten': 0,
+            'rejected': {},
+            'refreshes': 0,
+            'rollup_query_seconds': 0.0,
+            'last_error': None,
+        }
+
+    def _reject(self, reason: str) -> None:
+        with self._lock:
+            self._stats['rejected'][reason] = self._stats['rejected'].get(reason, 0) + 1
+        return None
+
+    def refresh(self):
+        """
+        Fold usage_data changes into the rollup and re-measure its size.
+
+        Writes on its own connection; runs on the background refresher (or
+        from tools and tests), never on a query's connection.
+        """
+        generation = self.data_version.current()
+        conn = get_db_connection(self.db_path)
+        try:
+            refresh_rollups(conn)
+            rollup_rows = conn.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}").fetchone()[0]
+            source_rows = conn.execute(f"SELECT COUNT(*) FROM {SOURCE_TABLE}").fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            self._row_ratio = rollup_rows / source_rows if source_rows else 1.0
+            self._refreshed_generation = generation
+            self._stats['refreshes'] += 1
+
+    def _background_refresh(self, generation: Any):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Queries keep running against usage_data; retried when the data version moves
+            print(f"⚠️ Rollup refresh failed: {e}")
+            with self._lock:
+                self._refreshed_generation = generation
+                self._stats['last_error'] = str(e)
+        finally:
+            with self._lock:
+                self._refresher = None
+
+    def _schedule_refresh(self):
+        """Start a background refresh if the data version moved since the last one."""
+        generation = self.data_version.current()
+        with self._lock:
+            if generation == self._refreshed_generation or self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._background_refresh, args=(generation,),
+                                               name='rollup-refresh', daemon=True)
+            self._refresher.start()
+
+    def wait_for_refresh(self, timeout: Optional[float] = None):
+        """Wait for a running background refresh to finish (tests and tools)."""
+        with self._lock:
+            refresher = self._refresher
+        if refresher is not None:
+            refresher.join(timeout)
+
+    @staticmethod
+    def _is_current(conn) -> bool:
+        """Whether the rollup seen by conn covers every usage_data row (reads only)."""
+        try:
+            state = conn.execute("SELECT last_id, rewrites FROM rollup_state WHERE name = ?",
+                                 (ROLLUP_TABLE,)).fetchone()
+            if state is None:
+                return False
+            max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {SOURCE_TABLE}").fetchone()[0]
+            return (state[0], state[1]) == (max_id, read_rewrites(conn, SOURCE_TABLE))
+        except sqlite3.Error:
+            return False
+
+    def _translate_predicate(self, conn, predicate: Predicate) -> Optional[List[str]]:
+        if predicate.column in ROLLUP_DIMENSIONS:
+            return [predicate.text]
+        if predicate.column != 'log_date' or predicate.lower:
+            return None
+
+        if predicate.op == 'BETWEEN':
+            bounds = [('>=', predicate.operands[0]), ('<=', predicate.operands[1])]
+        elif predicate.op in ('>=', '<=', '>', '<'):
+            bounds = [(predicate.op, predicate.operands[0])]
+        else:
+            return None
+
+        translated = []
+        for op, operand in bounds:
+            # Evaluate the bound (e.g. strftime(..., 'now', ...)) once, here
+            try:
+                value = conn.execute(f"SELECT {operand}").fetchone()[0]
+            except sqlite3.Error:
+                return None
+            day_bound = _day_bound(op, value)
+            if day_bound is None:
+                return None
+            translated.append(f"day {day_bound[0]} '{day_bound[1]}'")
+        return translated
+
+    def _translate_aggregate(self, item) -> Optional[str]:
+        if item.argument == '*':
+            return _DURATION_AGGREGATES['COUNT']
+        if item.argument == 'duration_seconds' and not item.distinct:
+            return _DURATION_AGGREGATES.get(item.function)
+        if item.argument in ROLLUP_DIMENSIONS and item.function == 'COUNT' and item.distinct:
+            return f"COUNT(DISTINCT {item.argument})"
+        if item.argument in ROLLUP_DIMENSIONS and item.function in ('MIN', 'MAX'):
+            return f"{item.function}({item.argument})"
+        return None
+
+    def build_rollup_sql(self, conn, query: AggregateQuery) -> Optional[str]:
+        """
+        Render the rollup equivalent of a parsed query, or None if not eligible.
+        """
+        if query.table != SOURCE_TABLE:
+            return self._reject('other_table')
+
+        aggregates = {}
+        select_parts = []
+        has_aggregates = any(item.is_aggregate for item in query.select_items)
+        for item in query.select_items:
+            if item.is_aggregate:
+                expression = self._translate_aggregate(item)
+                if expression is None:
+                    return self._reject('unsupported_aggregate')
+                aggregates[expression_key(item.text)] = expression
+                select_parts.append(f'{expression} AS {_quote(item.output_name)}')
+            else:
+                if item.column not in ROLLUP_DIMENSIONS:
+                    return self._reject('non_dimension_column')
+                if has_aggregates and item.column not in query.group_by:
+                    return self._reject('bare_column')
+                select_parts.append(item.text if item.alias is None else f'{item.text} AS {_quote(item.alias)}')
+
+        if any(column not in ROLLUP_DIMENSIONS for column in query.group_by):
+            return self._reject('non_dimension_group_by')
+        if not aggregates and not (query.distinct or query.group_by):
+            return self._reject('not_aggregate')
+
+        where_parts = []
+        for predicate in query.predicates:
+            translated = self._translate_predicate(conn, predicate)
+            if translated is None:
+                return self._reject('non_daily_predicate')
+            where_parts.extend(translated)
+
+        output_names = {expression_key(item.output_name) for item in query.select_items}
+        order_parts = []
+        for key, descending in query.order_by:
+            normalized = expression_key(key)
+            if normalized in aggregates:
+                key = aggregates[normalized]
+            elif not (normalized in output_names or key.isdigit() or normalized in ROLLUP_DIMENSIONS):
+                return self._reject('unsupported_order_by')
+            order_parts.append(f"{key} DESC" if descending else key)
+
+        sql = f"SELECT {'DISTINCT ' if query.distinct else ''}{', '.join(select_parts)} FROM {ROLLUP_TABLE}"
+        if where_parts:
+            sql += f" WHERE {' AND '.join(where_parts)}"
+        if query.group_by:
+            sql += f" GROUP BY {', '.join(query.group_by)}"
+        if order_parts:
+            sql += f" ORDER BY {', '.join(order_parts)}"
+        if query.limit is not None:
+            sql += f" LIMIT {query.limit}"
+            if query.offset is not None:
+                sql += f" OFFSET {query.offset}"
+        return sql
+
+    def rewrite(self, conn, sql: str) -> Optional[str]:
+        """
+        Return rollup SQL equivalent to ``sql``, or None to run it unchanged.
+
+        Args:
+            conn: Open connection, only read (checks the rollup is current, evaluates date bounds)
+            sql: Generated SQL
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._stats['considered'] += 1
+
+        query = parse_aggregate_query(sql)
+        if query is None:
+            return self._reject('unparsed')
+        if _QUALIFIED_RE.search(_STRING_LITERAL_RE.sub("''", query.sql)):
+            return self._reject('qualified_column')
+
+        rollup_sql = self.build_rollup_sql(conn, query)
+        if rollup_sql is None:
+            return None
+
+        self._schedule_refresh()
+        if not self._is_current(conn):
+            return self._reject('rollup_stale')
+        with self._lock:
+            row_ratio = self._row_ratio
+        if row_ratio is None:
+            return self._reject('rollup_not_measured')
+        if row_ratio > self.max_row_ratio:
+            return self._reject('rollup_not_smaller')
+        with self._lock:
+            self._stats['rewritten'] += 1
+        return rollup_sql
+
+    def record_execution(self, seconds: float):
+        """Account time spent running rewritten queries."""
+        with self._lock:
+            self._stats['rollup_query_seconds'] += seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Rewrite counters: considered, rewritten and rejection reasons."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rejected'] = dict(self._stats['rejected'])
+        stats['rewrite_rate'] = stats['rewritten'] / stats['considered'] if stats['considered'] else 0.0
+        stats['enabled'] = self.enabled
+        stats['row_ratio'] = self._row_ratio
+        stats['max_row_ratio'] = self.max_row_ratio
+        return stats
+
+
+def _same_rows(sql: str, expected: List[tuple], actual: List[tuple]) -> bool:
+    """Compare results, ignoring row order that ORDER BY leaves undetermined."""
+    if has_total_order(sql):
+        return expected == actual
+    return sorted(map(repr, expected)) == sorted(map(repr, actual))
+
+
+def _best_time(conn, sql: str, repeat: int) -> Tuple[float, List[tuple]]:
+    best, rows = float('inf'), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = [tuple(row) for row in conn.execute(sql).fetchall()]
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, rows
+
+
+def rollup_report(db_path=None, queries: Sequence[str] = (), history_limit: int = 500,
+                  repeat: int = 3, force: bool = False) -> Dict[str, Any]:
+    """
+    Replay SQL through the rewriter and measure the latency saved.
+
+    Every rewritten query is run both ways and its results compared, so the
+    report also confirms the rewrites are answer-preserving. Row order is
+    only compared where ORDER BY determines it.
+
+    Args:
+        force: Rewrite even when the rollup is not smaller than usage_data
+
+    Returns:
+        Dictionary with per-query timings and totals
+    """
+    conn = get_db_connection(db_path)
+    try:
+        history = conn.execute('''
+            SELECT DISTINCT sql_query FROM query_history
+            WHERE success = 1 AND sql_query IS NOT NULL AND sql_query != ''
+            ORDER BY id DESC LIMIT ?
+        ''', (history_limit,)).fetchall()
+        statements = list(dict.fromkeys([row[0] for row in history] + list(queries)))
+
+        rewriter = RollupRewriter(db_path, max_row_ratio=float('inf') if force else ROLLUP_MAX_ROW_RATIO)
+        rewriter.refresh()
+        entries = []
+        for sql in statements:
+            rollup_sql = rewriter.rewrite(conn, sql)
+            if rollup_sql is None:
+                continue
+            raw_ms, raw_rows = _best_time(conn, sql, repeat)
+            rollup_ms, rollup_rows = _best_time(conn, rollup_sql, repeat)
+            entries.append({
+                'sql': sql,
+                'rollup_sql': rollup_sql,
+                'raw_ms': raw_ms,
+                'rollup_ms': rollup_ms,
+                'saved_ms': raw_ms - rollup_ms,
+                'identical': _same_rows(sql, raw_rows, rollup_rows),
+            })
+    finally:
+        conn.close()
+
+    return {
+        'considered': len(statements),
+        'rewritten': len(entries),
+        'total_saved_ms': sum(entry['saved_ms'] for entry in entries),
+        'all_identical': all(entry['identical'] for entry in entries),
+        'rejected': rewriter.get_stats()['rejected'],
+        'row_ratio': rewriter.get_stats()['row_ratio'],
+        'queries': entries,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain usage_data daily rollups")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the rollup from scratch")
+    parser.add_argument('--report', action='store_true', help="Replay query_history and report savings")
+    parser.add_argument('--include-examples', action='store_true',
+                        help="Also replay the few-shot example queries from core/prompts.py")
+    parser.add_argument('--force', action='store_true',
+                        help="Time rewrites even when the rollup is not smaller than usage_data")
+    args = parser.parse_args(argv)
+
+    conn = get_db_connection()
+    try:
+        result = rebuild_rollups(conn) if args.rebuild else refresh_rollups(conn)
+    finally:
+        conn.close()
+    print(f"✅ Rollup {result['mode']}: rows {result['from_id']}..{result['to_id']}")
+
+    if args.report:
+        extra = []
+        if args.include_examples:
+            from core.prompts import SQL_FEW_SHOT_EXAMPLES
+            extra = [example['sql'] for example in SQL_FEW_SHOT_EXAMPLES]
+        report = rollup_report(queries=extra, force=args.force)
+        if report['row_ratio'] is not None:
+            print(f"Rollup holds {report['row_ratio']:.0%} of usage_data's rows "
+                  f"(rewrites need at most {ROLLUP_MAX_ROW_RATIO:.0%})")
+        print(f"Rewritten {report['rewritten']} of {report['considered']} queries, "
+              f"saved {report['total_saved_ms']:.2f} ms per replay "
+              f"({'all identical' if report['all_identical'] else 'MISMATCHES FOUND'})")
+        for entry in report['queries']:
+            print(f"  {entry['raw_ms']:8.2f} ms -> {entry['rollup_ms']:8.2f} ms  {' '.join(entry['sql'].split())[:90]}")
+        if report['rejected']:
+            print(f"Not rewritten: {report['rejected']}")
+
+
+if __name__ == '__main__':
+    main()
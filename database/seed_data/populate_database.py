@@ -1,15 +1,44 @@
 # populate_database.py
+#
+# Generates realistic usage_data at any size. Columns are produced in whole
+# NumPy blocks (one block = a run of weekdays for every user), optionally on
+# several processes, and bulk-loaded by a single writer with load-tuned
+# pragmas. The same --seed always yields the same data, whatever --workers is.
+#
+#   python database/seed_data/populate_database.py                # ~10k rows
+#   python database/seed_data/populate_database.py --scale 1000 --seed 7 --workers 4   # ~10M rows
 
-import sqlite3
+import argparse
 import os
-import random
-from datetime import date, timedelta, datetime
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+# Add project root to path so database.* imports work when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from database.connection import init_database
+from database.indexes import drop_managed_indexes, ensure_indexes
+from database.rollups import rebuild_rollups
 
 # --- 1. CORE CONFIGURATION ---
 
-DATABASE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'usage.db')
-NUM_INACTIVE_USERS = 15 # Number of users to make inactive for the last 30 days
+DATABASE_FILE = os.getenv('DATABASE_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'usage.db'))
+NUM_INACTIVE_USERS = 15 # Number of users to make inactive for the last 30 days (at scale 1)
 HISTORY_DAYS = 180    # Populate data for the last 6 months
+BLOCK_ROWS = 250_000  # Approximate rows generated (and committed) per block
+
+# Pragmas for the bulk load only; the app's own connections use the pool defaults
+LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,  # 256 MiB
+}
 
 # --- 2. USER AND APPLICATION DEFINITIONS ---
 
@@ -67,21 +96,125 @@ PERSONAS = {
     }
 }
 
-def create_user_profiles():
-    """Assigns a persona and a random activity level to each user."""
-    profiles = {}
-    persona_list = list(PERSONAS.keys())
-    for user in ALL_USERS:
-        profiles[user] = {
-            'persona': random.choice(persona_list),
-            'daily_activity_chance': random.uniform(0.65, 0.95)
-        }
-    return profiles
+PLATFORMS = ['Windows', 'macOS', 'Linux']
+PERSONA_NAMES = list(PERSONAS.keys())
+
+# Lookup tables indexed by the integer codes the generator produces
+_APP_MIN = np.array([APP_PROFILES[app]['min_duration'] for app in APP_NAMES], dtype=np.int64)
+_APP_MAX = np.array([APP_PROFILES[app]['max_duration'] for app in APP_NAMES], dtype=np.int64)
+_APP_LEGACY = np.array([APP_PROFILES[app]['legacy'] for app in APP_NAMES], dtype=np.int64)
+_APP_VERSION_COUNT = np.array([len(APP_PROFILES[app]['versions']) for app in APP_NAMES], dtype=np.int64)
+_MAX_VERSIONS = int(_APP_VERSION_COUNT.max())
+_APP_VERSIONS = np.array([APP_PROFILES[app]['versions'] + [''] * (_MAX_VERSIONS - len(APP_PROFILES[app]['versions']))
+                          for app in APP_NAMES], dtype=object)
+
+
+def _cumulative(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return np.cumsum(weights) / weights.sum()
+
+
+_APP_CDF = np.array([_cumulative(PERSONAS[p]['app_weights']) for p in PERSONA_NAMES])
+_PLATFORM_CDF = np.array([_cumulative(PERSONAS[p]['platform_weights']) for p in PERSONA_NAMES])
+
+
+def user_names(num_users):
+    """Base names first, then numbered repeats (Aarav2, Aarav3, ...) beyond 100 users."""
+    return [ALL_USERS[i % len(ALL_USERS)] + (str(i // len(ALL_USERS) + 1) if i >= len(ALL_USERS) else '')
+            for i in range(num_users)]
+
+
+def create_user_profiles(rng, num_users, num_inactive):
+    """Assigns a persona, a random activity level and inactivity to each user."""
+    inactive = np.zeros(num_users, dtype=bool)
+    inactive[rng.choice(num_users, size=num_inactive, replace=False)] = True
+    return {
+        'persona': rng.integers(0, len(PERSONA_NAMES), size=num_users),
+        'daily_activity_chance': rng.uniform(0.65, 0.95, size=num_users),
+        'inactive': inactive,
+    }
+
+# --- 4. VECTORIZED GENERATION ---
+
+_worker_profiles = None
+
+def _init_worker(profiles):
+    global _worker_profiles
+    _worker_profiles = profiles
 
-# --- 4. DATABASE OPERATIONS ---
+def _sample(cdf_table, group, rng):
+    """Draw one category per row from the CDF of the row's group (persona)."""
+    draws = rng.random(len(group))
+    out = np.empty(len(group), dtype=np.int64)
+    for code in range(len(cdf_table)):
+        mask = group == code
+        out[mask] = np.searchsorted(cdf_table[code], draws[mask], side='right')
+    return np.minimum(out, cdf_table.shape[1] - 1)
+
+def generate_block(days, recent, seed, profiles=None):
+    """
+    Generate all records for a run of days, as column arrays.
+    
+    Args:
+        days: datetime64[D] array of (weekday) dates
+        recent: Boolean array, True for days inside the inactivity window
+        seed: SeedSequence for this block
+        profiles: User profiles (defaults to the worker's copy)
+    
+    Returns:
+        Dictionary of equally long column arrays (codes for categorical columns)
+    """
+    profiles = profiles if profiles is not None else _worker_profiles
+    rng = np.random.default_rng(seed)
+    
+    # One activity draw per (day, user); inactive users sit out the recent days
+    active = rng.random((len(days), len(profiles['persona']))) < profiles['daily_activity_chance']
+    active &= ~(recent[:, None] & profiles['inactive'][None, :])
+    day_index, user_index = np.nonzero(active)  # day-major, like the original loop
+    persona = profiles['persona'][user_index]
+    count = len(user_index)
+    
+    app = _sample(_APP_CDF, persona, rng)
+    platform = _sample(_PLATFORM_CDF, persona, rng)
+    version = (rng.random(count) * _APP_VERSION_COUNT[app]).astype(np.int64)
+    duration = _APP_MIN[app] + (rng.random(count) * (_APP_MAX[app] - _APP_MIN[app] + 1)).astype(np.int64)
+    seconds = (rng.integers(9, 18, count) * 3600 + rng.integers(0, 60, count) * 60
+               + rng.integers(0, 60, count))
+    timestamps = days[day_index].astype('datetime64[s]') + seconds
+    
+    return {
+        'monitor_app_version': rng.integers(0, len(MONITOR_VERSIONS), count),
+        'platform': platform,
+        'user': user_index,
+        'application_name': app,
+        'application_version': version,
+        'log_date': np.char.add(np.datetime_as_string(timestamps, unit='s'), 'Z'),
+        'legacy_app': _APP_LEGACY[app],
+        'duration_seconds': duration,
+    }
+
+def block_rows(block, names):
+    """Decode a generated block into row tuples for executemany."""
+    app = block['application_name']
+    columns = [
+        np.array(MONITOR_VERSIONS, dtype=object)[block['monitor_app_version']].tolist(),
+        np.array(PLATFORMS, dtype=object)[block['platform']].tolist(),
+        names[block['user']].tolist(),
+        np.array(APP_NAMES, dtype=object)[app].tolist(),
+        _APP_VERSIONS[app, block['application_version']].tolist(),
+        block['log_date'].tolist(),
+        block['legacy_app'].tolist(),
+        block['duration_seconds'].tolist(),
+    ]
+    return zip(*columns)
+
+# --- 5. DATABASE OPERATIONS ---
 
 def create_connection(db_file):
-    return sqlite3.connect(db_file)
+    conn = sqlite3.connect(db_file)
+    for pragma, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
 
 def clear_existing_data(conn):
     print("Clearing existing data from the database...")
@@ -91,82 +224,114 @@ def clear_existing_data(conn):
     conn.commit()
     print("Database cleared.")
 
-def generate_and_insert_data(conn):
-    user_profiles = create_user_profiles()
-    inactive_users = set(random.sample(ALL_USERS, NUM_INACTIVE_USERS))
-    print(f"Designated {len(inactive_users)} users to be inactive for the last 30 days.")
+def generate_and_insert_data(conn, scale=1.0, seed=None, workers=1, history_days=HISTORY_DAYS):
+    """
+    Generate and bulk-load usage_data.
+    
+    Args:
+        conn: Connection from create_connection
+        scale: Multiplier on the number of users (1.0 = 100 users, ~10k rows)
+        seed: Seed for reproducible output (random if None)
+        workers: Processes generating blocks; the calling process writes
+        history_days: Days of history ending today
     
-    print("\nStarting data generation (this may take a moment)...")
-    cursor = conn.cursor()
+    Returns:
+        Number of records inserted
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    print(f"Using seed {seed_sequence.entropy} (pass --seed to reproduce).")
+    profile_seed, blocks_seed = seed_sequence.spawn(2)
+    
+    num_users = max(1, round(len(ALL_USERS) * scale))
+    num_inactive = min(num_users, round(NUM_INACTIVE_USERS * scale))
+    profiles = create_user_profiles(np.random.default_rng(profile_seed), num_users, num_inactive)
+    names = np.array(user_names(num_users), dtype=object)
+    print(f"Generating data for {num_users} users; "
+          f"{num_inactive} designated inactive for the last 30 days.")
     
     end_date = date.today()
-    start_date = end_date - timedelta(days=HISTORY_DAYS)
+    start_date = end_date - timedelta(days=history_days)
     thirty_days_ago = end_date - timedelta(days=30)
+    all_days = np.arange(np.datetime64(start_date), np.datetime64(end_date) + 1)
+    days = all_days[np.is_busday(all_days)]  # weekdays only
+    recent = days > np.datetime64(thirty_days_ago)
+    
+    days_per_block = max(1, BLOCK_ROWS // num_users)
+    starts = range(0, len(days), days_per_block)
+    block_seeds = blocks_seed.spawn(len(starts))
+    tasks = [(days[i:i + days_per_block], recent[i:i + days_per_block], block_seed)
+             for i, block_seed in zip(starts, block_seeds)]
+    
+    sql = """INSERT INTO usage_data (monitor_app_version, platform, user, application_name, 
+             application_version, log_date, legacy_app, duration_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
     
-    records_to_insert = []
+    print(f"\nStarting data generation: {len(tasks)} blocks on {workers} worker(s)...")
+    start = time.perf_counter()
     total_records = 0
     
-    current_date = start_date
-    while current_date <= end_date:
-        if current_date.weekday() >= 5:
-            current_date += timedelta(days=1)
-            continue
-            
-        for user in ALL_USERS:
-            if user in inactive_users and current_date > thirty_days_ago:
-                continue
-
-            profile = user_profiles[user]
-            if random.random() > profile['daily_activity_chance']:
-                continue
-
-            persona_data = PERSONAS[profile['persona']]
-            app_name = random.choices(APP_NAMES, weights=persona_data['app_weights'], k=1)[0]
-            platform = random.choices(['Windows', 'macOS', 'Linux'], weights=persona_data['platform_weights'], k=1)[0]
-            
-            app_profile = APP_PROFILES[app_name]
-            app_version = random.choice(app_profile['versions'])
-            duration = random.randint(app_profile['min_duration'], app_profile['max_duration'])
-            
-            log_time = datetime(current_date.year, current_date.month, current_date.day,
-                                random.randint(9, 17), random.randint(0, 59), random.randint(0, 59))
-            
-            record = (random.choice(MONITOR_VERSIONS), platform, user, app_name, app_version,
-                      log_time.isoformat() + "Z", app_profile['legacy'], duration)
-            records_to_insert.append(record)
-
-        if len(records_to_insert) > 1000:
-            sql = """INSERT INTO usage_data (monitor_app_version, platform, user, application_name, 
-                     application_version, log_date, legacy_app, duration_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
-            cursor.executemany(sql, records_to_insert)
-            conn.commit()
-            total_records += len(records_to_insert)
-            print(f"  ... inserted {total_records} records so far.")
-            records_to_insert = []
-            
-        current_date += timedelta(days=1)
-
-    if records_to_insert:
-        sql = """INSERT INTO usage_data (monitor_app_version, platform, user, application_name, 
-                 application_version, log_date, legacy_app, duration_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
-        cursor.executemany(sql, records_to_insert)
+    def write(block):
+        nonlocal total_records
+        conn.executemany(sql, block_rows(block, names))
         conn.commit()
-        total_records += len(records_to_insert)
-
+        total_records += len(block['user'])
+        elapsed = time.perf_counter() - start
+        print(f"  ... inserted {total_records:,} records so far ({total_records / elapsed:,.0f} rows/sec).")
+    
+    if workers <= 1:
+        for task in tasks:
+            write(generate_block(*task, profiles=profiles))
+    else:
+        # Keep a bounded window of blocks in flight so memory stays flat at any scale
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(profiles,)) as executor:
+            pending = []
+            for task in tasks:
+                pending.append(executor.submit(generate_block, *task))
+                if len(pending) >= workers * 2:
+                    write(pending.pop(0).result())
+            for future in pending:
+                write(future.result())
+    
+    elapsed = time.perf_counter() - start
     print("\n---------------------------------")
     print("Data generation complete.")
-    print(f"Total realistic records inserted: {total_records}")
+    print(f"Total realistic records inserted: {total_records:,} in {elapsed:.1f}s "
+          f"({total_records / elapsed if elapsed else 0:,.0f} rows/sec)")
     print("---------------------------------")
+    return total_records
 
-def main():
-    conn = create_connection(DATABASE_FILE)
-    if conn:
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Populate usage_data with realistic synthetic data")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiplier on the number of users (1 = 100 users, ~10k rows; 1000 = ~10M rows)")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible data")
+    parser.add_argument('--workers', type=int, default=1, help="Processes used to generate blocks")
+    parser.add_argument('--days', type=int, default=HISTORY_DAYS, help="Days of history to generate")
+    parser.add_argument('--db', default=DATABASE_FILE, help="Database file to populate")
+    args = parser.parse_args(argv)
+    
+    # Make sure the schema exists (tables, indexes, rollup)
+    init_database(args.db)
+    
+    conn = create_connection(args.db)
+    try:
         clear_existing_data(conn)
-        generate_and_insert_data(conn)
+        
+        # Indexes are rebuilt once at the end instead of being updated per row
+        dropped = drop_managed_indexes(conn)
+        print(f"Dropped {len(dropped)} managed indexes for the bulk load.")
+        
+        generate_and_insert_data(conn, args.scale, args.seed, args.workers, args.days)
+        
+        print("Rebuilding indexes and the daily rollup...")
+        report = ensure_indexes(conn)
+        print(f"Indexes created: {len(report['created'])}.")
+        rollup = rebuild_rollups(conn)
+        print(f"Daily rollup rebuilt over rows {rollup['from_id']}..{rollup['to_id']}.")
+        conn.execute("PRAGMA optimize")
+    finally:
         conn.close()
         print("Database connection closed.")
-    else:
-        print("Error! Cannot create the database connection.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
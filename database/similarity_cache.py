@@ -0,0 +1,607 @@
+"""
+Reuse SQL from previously answered questions that are worded differently.
+
+The SQL cache only matches a question it has seen before. "top 3 apps by
+usage", "which 3 applications were used the longest" and "most used three
+apps" would each cost an LLM call. SimilarityCache handles these in four
+steps.
+
+1. Slots: the app, user and platform values (database/entities.py) and
+   numbers in the question are replaced by slot markers. The same values
+   are located in the known-good SQL: string literals, ``LIMIT n`` and
+   ``'-n days'`` modifiers. Questions whose slots cannot all be located
+   unambiguously are not indexed.
+2. Canonical words: synonyms map to one token (applications -> app,
+   longest -> top, spent -> use) and filler words are dropped. Unknown
+   words also contribute character trigrams, so a misspelling stays close
+   to the original.
+3. Signature: the slot kinds, subject nouns (in order) and operator words
+   (top/bottom, average/total/count, including/excluding, hours/minutes,
+   weekends, date units...) must be equal for two questions to share SQL.
+   "most" and "least", or "excluding Slack" and "including Zoom", never
+   match each other, whatever the threshold.
+4. Similarity: within a signature, each question has a 64-bit SimHash
+   of its weighted features, stored in NumPy uint64 arrays. A lookup is
+   an XOR + popcount over that group. The closest few candidates are then
+   re-ranked by exact cosine similarity against SIMILAR_SQL_THRESHOLD.
+   Words outside the vocabulary ("interns", "mobile") may add a filter the
+   other question lacks, so each one must also appear in the other
+   question, or be a likely misspelling of a word there.
+
+The index is rebuilt from successful query_history rows on first use and
+then grows incrementally: new LLM answers are added by put(), and rows
+recorded by other processes are picked up every
+SIMILAR_SQL_REFRESH_INTERVAL seconds.
+"""
+
+import functools
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from database.connection import get_db_connection
+from database.entities import NUMBER_PATTERN, get_entity_catalog, parse_number, split_words, squash
+from database.sql_cache import normalize_question
+
+# Minimum cosine similarity between question skeletons for SQL reuse
+SIMILAR_SQL_THRESHOLD = float(os.getenv('SIMILAR_SQL_THRESHOLD', '0.8'))
+
+# Questions kept in the index (oldest are dropped first)
+SIMILAR_SQL_MAX_ENTRIES = int(os.getenv('SIMILAR_SQL_MAX_ENTRIES', '100000'))
+
+# Seconds between checks of query_history for rows added by other processes
+SIMILAR_SQL_REFRESH_INTERVAL = float(os.getenv('SIMILAR_SQL_REFRESH_INTERVAL', '30'))
+
+# Candidates re-ranked exactly after the SimHash scan
+CANDIDATES = 8
+
+# query_history rows read per incremental refresh query
+HISTORY_BATCH = 5000
+
+# Weight of each character trigram of an unknown word (the word itself weighs 1)
+_TRIGRAM_WEIGHT = 0.3
+
+# Trigram overlap (Jaccard) at which an unknown word counts as a misspelling of another
+_MISSPELLING_SIMILARITY = 0.5
+
+# word -> canonical token
+_SYNONYMS = {}
+for _token, _words in {
+    'app': 'app apps application applications program programs software tool tools',
+    'user': 'user users people person who whom employee employees',
+    'platform': 'platform platforms os system systems',
+    'use': 'use used uses using usage spent spend spends spending utilized',
+    'top': 'most top longest highest biggest heaviest popular largest greatest max maximum',
+    'bottom': 'least bottom lowest fewest smallest shortest min minimum',
+    'avg': 'average avg mean typical',
+    'total': 'total sum overall combined cumulative',
+    'count': 'count number many',
+    'duration': 'duration time length long',
+    'hours': 'hours hour hrs',
+    'minutes': 'minutes minute mins',
+    'seconds': 'seconds second secs',
+    'not': 'not no excluding exclude excludes except without other others besides',
+    'include': 'including include includes plus',
+    'weekend': 'weekend weekends',
+    'weekday': 'weekday weekdays workday workdays',
+    'session': 'session sessions times often frequently',
+    'distinct': 'distinct unique different',
+    'list': 'list show display name names',
+    'day': 'day days daily',
+    'week': 'week weeks weekly',
+    'month': 'month months monthly',
+    'year': 'year years yearly',
+    'last': 'last past previous recent recently',
+    'this': 'this current',
+    'per': 'per each every',
+    'legacy': 'legacy',
+}.items():
+    for _word in _words.split():
+        _SYNONYMS[_word] = _token
+
+_CANONICAL_TOKENS = frozenset(_SYNONYMS.values())
+
+# Canonical tokens that change the query's meaning: part of the signature
+_OPERATORS = frozenset({
+    'top', 'bottom', 'avg', 'total', 'count', 'distinct', 'list', 'session', 'per', 'legacy',
+    'hours', 'minutes', 'seconds',
+    'day', 'week', 'month', 'year', 'last', 'this', 'today', 'yesterday', 'weekend', 'weekday',
+    'morning', 'afternoon', 'evening', 'night', 'since', 'before', 'after', 'until', 'ago',
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september',
+    'october', 'november', 'december',
+    'and', 'or', 'not', 'include', 'than', 'more', 'less', 'compare', 'vs', 'versus', 'between',
+})
+_SUBJECT_TOKENS = ('user', 'app', 'platform')
+
+_STOPWORDS = frozenset(
+    'which what whats what\'s is are was were be the a an of for on in by with to from at across during over '
+    'within did do does has have had been being me give tell get find please there it its their they how '
+    'much all tracked recorded logged so far ever currently'.split())
+
+# Stands in for a slot value while the question is tokenized
+_SLOT_WORD = 'zzslot'
+_SLOT_MARKER = '\x00{}\x00'
+_MARKER_RE = re.compile(r'\x00(\d+)\x00')
+_NUMBER_RE = re.compile(rf'\b{NUMBER_PATTERN}\b', re.IGNORECASE)
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_LIMIT_RE = re.compile(r'\bLIMIT\s+(\d+)\b', re.IGNORECASE)
+_OFFSET_LITERAL_RE = re.compile(r"'([-+])(\d+) (days?|months?|years?|hours?|minutes?)'", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class SimilarMatch:
+    """
+    SQL reused from a similar question.
+    """
+    sql: str
+    source_question: str
+    similarity: float
+
+
+@dataclass
+class _Skeleton:
+    signature: Tuple[Any, ...]  # slot kinds, subjects and operators; must match exactly
+    features: Dict[str, float]  # weighted features compared by cosine similarity
+    slots: List[Tuple[str, Any]]  # (kind, value) in signature slot order
+    unknown: FrozenSet[str]  # words outside the vocabulary
+
+
+@dataclass
+class _Entry:
+    question: str
+    sql_template: str  # SQL with _SLOT_MARKER placeholders
+    slot_renderers: List[Tuple[int, str]]  # (slot index, rendering mode) per marker
+    signature: Tuple[Any, ...]
+    features: Dict[str, float]
+    unknown: FrozenSet[str]
+    alive: bool = True
+
+
+def _canonical(word: str) -> str:
+    return _SYNONYMS.get(word, word)
+
+
+@functools.lru_cache(maxsize=65536)
+def _trigrams(word: str) -> FrozenSet[str]:
+    padded = f' {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _covered(words: FrozenSet[str], others: FrozenSet[str]) -> bool:
+    """Whether every word is in others or is a likely misspelling of one of them."""
+    for word in words - others:
+        grams = _trigrams(word)
+        if not any(len(grams & _trigrams(other)) >= _MISSPELLING_SIMILARITY * len(grams | _trigrams(other))
+                   for other in others):
+            return False
+    return True
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm if norm else 0.0
+
+
+# Set bits in each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits of each uint64 (np.bitwise_count needs NumPy 2)."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+@functools.lru_cache(maxsize=65536)
+def _feature_signs(feature: str) -> np.ndarray:
+    """The feature's 64-bit hash as a vector of +1/-1."""
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+    return np.unpackbits(np.frombuffer(digest, dtype=np.uint8)).astype(np.float32) * 2 - 1
+
+
+def max_hamming_distance(threshold: float) -> int:
+    """
+    SimHash distance beyond which cosine similarity is very unlikely to reach threshold.
+
+    Each bit differs with probability angle / pi; allow three standard
+    deviations over the expected distance.
+    """
+    p = math.acos(max(-1.0, min(1.0, threshold))) / math.pi
+    return min(64, math.ceil(64 * p + 3 * math.sqrt(64 * p * (1 - p)) + 1))
+
+
+def simhash(features: Dict[str, float]) -> np.uint64:
+    """64-bit SimHash of weighted features (similar sets differ in few bits)."""
+    votes = np.zeros(64, dtype=np.float32)
+    for feature, weight in features.items():
+        votes += weight * _feature_signs(feature)
+    return np.packbits(votes > 0).view('>u8')[0].astype(np.uint64)
+
+
+class _Group:
+    """SimHashes and entry ids for one signature, in growable NumPy arrays."""
+
+    def __init__(self):
+        self.hashes = np.zeros(16, dtype=np.uint64)
+        self.ids = np.zeros(16, dtype=np.int64)
+        self.size = 0
+
+    def add(self, entry_id: int, value: np.uint64):
+        if self.size == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+            self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+        self.hashes[self.size] = value
+        self.ids[self.size] = entry_id
+        self.size += 1
+
+    def nearest(self, value: np.uint64, max_distance: int, limit: int) -> np.ndarray:
+        """Ids of up to ``limit`` entries within max_distance bits of value, closest first."""
+        distances = popcount(self.hashes[:self.size] ^ value)
+        # Raise the cutoff from the minimum until it admits ``limit`` entries;
+        # cheaper than partitioning a large group
+        cutoff = int(distances.min()) if self.size else max_distance + 1
+        while cutoff < max_distance and np.count_nonzero(distances <= cutoff) < limit:
+            cutoff += 1
+        positions = np.flatnonzero(distances <= min(cutoff, max_distance))[:4 * limit]
+        positions = positions[np.argsort(distances[positions], kind='stable')][:limit]
+        return self.ids[positions]
+
+
+class SimilarityCache:
+    """
+    Similarity index from question skeletons to re-parameterizable SQL.
+
+    Args:
+        db_path: Database holding query_history and usage_data
+        threshold: Minimum cosine similarity for reuse
+        max_entries: Questions kept in the index
+        enabled: When False, get() and put() do nothing
+    """
+
+    def __init__(self, db_path=None, threshold: float = SIMILAR_SQL_THRESHOLD,
+                 max_entries: int = SIMILAR_SQL_MAX_ENTRIES,
+                 refresh_interval: float = SIMILAR_SQL_REFRESH_INTERVAL, enabled: bool = True):
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_distance = max_hamming_distance(threshold)
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self.catalog = get_entity_catalog(db_path)
+
+        self._lock = threading.RLock()
+        self._entries: List[_Entry] = []
+        self._groups: Dict[Tuple[Any, ...], _Group] = {}
+        self._by_key: Dict[str, int] = {}  # normalized question -> entry id
+        self._exact: Dict[Tuple[Any, ...], int] = {}  # (signature, features) -> entry id
+        self._reused_from: 'OrderedDict[str, int]' = OrderedDict()  # question key -> source entry id
+        self._prompt_hash = None
+        self._generation = 0  # bumped on reset, so stale history loads are discarded
+        self._history_id = None  # highest query_history id indexed (None: not loaded yet)
+        self._refreshed_at = 0.0
+        self._loading = False
+        self._live = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'unindexable': 0,
+                       'invalidations': 0, 'rebuilds': 0}
+
+    # --- skeletons ---
+
+    def skeleton(self, question: str) -> _Skeleton:
+        """Split a question into its signature, similarity features and slot values."""
+        entities, _ = self.catalog.find_entities(question, ignore=frozenset(_SYNONYMS) | _STOPWORDS)
+        slots, pieces, position = [], [], 0
+        for entity in entities:
+            pieces.append(question[position:entity.start])
+            pieces.append(f' {_SLOT_WORD}{entity.slot} ')
+            slots.append((entity.slot, entity.value))
+            position = entity.end
+        pieces.append(question[position:])
+        text = ''.join(pieces).lower()
+
+        def number_slot(match):
+            slots.append(('n', parse_number(match.group(1))))
+            return f' {_SLOT_WORD}n '
+        # Numbers are slotted in question order after the entities
+        text = _NUMBER_RE.sub(number_slot, text)
+
+        tokens = []
+        for word in split_words(text):
+            word = word.text
+            if word.startswith(_SLOT_WORD):
+                tokens.append(f'<{word[len(_SLOT_WORD):]}>')
+            elif word not in _STOPWORDS:
+                tokens.append(_canonical(word))
+
+        subjects = []
+        for token in tokens:
+            if token in _SUBJECT_TOKENS and (not subjects or subjects[-1] != token):
+                subjects.append(token)
+        operators = tuple(sorted({token for token in tokens if token in _OPERATORS}))
+
+        features: Dict[str, float] = {}
+        unknown = set()
+        for token in tokens:
+            features[token] = features.get(token, 0.0) + 1.0
+            if token not in _CANONICAL_TOKENS and not token.startswith('<'):
+                if token not in _OPERATORS:
+                    unknown.add(token)
+                padded = f' {token} '
+                for i in range(len(padded) - 2):
+                    gram = '#' + padded[i:i + 3]
+                    features[gram] = features.get(gram, 0.0) + _TRIGRAM_WEIGHT
+
+        # Slots are compared by kind; order within a kind is kept for substitution
+        order = sorted(range(len(slots)), key=lambda i: (slots[i][0], i))
+        slots = [slots[i] for i in order]
+        signature = (tuple(kind for kind, _ in slots), tuple(subjects), operators)
+        return _Skeleton(signature, features, slots, frozenset(unknown))
+
+    # --- SQL templates ---
+
+    @staticmethod
+    def _template_sql(sql: str, slots: List[Tuple[str, Any]]) -> Optional[Tuple[str, List[Tuple[int, str]]]]:
+        """
+        Replace every slot value in sql with a marker.
+
+        Returns:
+            (template, renderers), or None if some slot cannot be located
+            unambiguously
+        """
+        values = [value for _, value in slots]
+        if len(set(map(str, values))) != len(values):
+            return None  # two slots with the same value: cannot tell them apart
+
+        renderers: List[Tuple[int, str]] = []
+        found = set()
+
+        def replace_literal(match):
+            literal = match.group()
+            offset = _OFFSET_LITERAL_RE.fullmatch(literal)
+            if offset:
+                for index, (kind, value) in enumerate(slots):
+                    if kind == 'n' and int(offset.group(2)) == value:
+                        found.add(index)
+                        renderers.append((index, f'offset:{offset.group(1)}:{offset.group(3)}'))
+                        return _SLOT_MARKER.format(len(renderers) - 1)
+                return literal
+            content = literal[1:-1].replace("''", "'")
+            core = content.strip('%')
+            for index, (kind, value) in enumerate(slots):
+                if kind != 'n' and core and squash(core) == squash(str(value)):
+                    prefix = content[:len(content) - len(content.lstrip('%'))]
+                    suffix = content[len(content.rstrip('%')):]
+                    case = 'lower' if core == core.lower() else 'upper' if core == core.upper() else 'exact'
+                    found.add(index)
+                    renderers.append((index, f'text:{case}:{prefix}:{suffix}'))
+                    return _SLOT_MARKER.format(len(renderers) - 1)
+            return literal
+
+        def replace_limit(match):
+            for index, (kind, value) in enumerate(slots):
+                if kind == 'n' and int(match.group(1)) == value:
+                    found.add(index)
+                    renderers.append((index, 'number'))
+                    return f"{match.group()[:match.start(1) - match.start()]}{_SLOT_MARKER.format(len(renderers) - 1)}"
+            return match.group()
+
+        # Literals first, then LIMIT outside literals
+        parts = []
+        position = 0
+        for match in _STRING_LITERAL_RE.finditer(sql):
+            parts.append(_LIMIT_RE.sub(replace_limit, sql[position:match.start()]))
+            parts.append(replace_literal(match))
+            position = match.end()
+        parts.append(_LIMIT_RE.sub(replace_limit, sql[position:]))
+
+        if len(found) != len(slots):
+            return None
+        return ''.join(parts), renderers
+
+    @staticmethod
+    def _render(entry: _Entry, slots: List[Tuple[str, Any]]) -> str:
+        def render(match):
+            index, mode = entry.slot_renderers[int(match.group(1))]
+            value = slots[index][1]
+            if mode == 'number':
+                return str(int(value))
+            kind, *options = mode.split(':')
+            if kind == 'offset':
+                sign, unit = options
+                return f"'{sign}{int(value)} {unit}'"
+            case, prefix, suffix = options
+            text = {'lower': str(value).lower(), 'upper': str(value).upper()}.get(case, str(value))
+            return "'" + (prefix + text + suffix).replace("'", "''") + "'"
+        return _MARKER_RE.sub(render, entry.sql_template)
+
+    # --- index maintenance ---
+
+    def _clear(self):
+        self._entries, self._groups, self._by_key, self._exact = [], {}, {}, {}
+        self._reused_from.clear()
+        self._live = 0
+
+    def _index(self, entry: _Entry):
+        entry_id = len(self._entries)
+        self._entries.append(entry)
+        self._by_key[normalize_question(entry.question)] = entry_id
+        self._exact[(entry.signature, frozenset(entry.features.items()))] = entry_id
+        self._groups.setdefault(entry.signature, _Group()).add(entry_id, simhash(entry.features))
+        self._live += 1
+
+    def _add(self, question: str, sql: str) -> bool:
+        if not sql.strip().upper().startswith('SELECT'):
+            return False
+        skeleton = self.skeleton(question)
+        templated = self._template_sql(sql, skeleton.slots)
+        if templated is None:
+            self._stats['unindexable'] += 1
+            return False
+
+        previous = self._by_key.get(normalize_question(question))
+        if previous is not None and self._entries[previous].alive:
+            self._entries[previous].alive = False
+            self._live -= 1
+
+        self._index(_Entry(question, templated[0], templated[1], skeleton.signature, skeleton.features,
+                           skeleton.unknown))
+        if self._live > self.max_entries:
+            self._compact()
+        return True
+
+    def _compact(self):
+        """Rebuild the index from the newest three quarters of the live entries."""
+        keep = [entry for entry in self._entries if entry.alive][-(self.max_entries * 3 // 4):]
+        self._clear()
+        for entry in keep:
+            self._index(entry)
+        self._stats['rebuilds'] += 1
+
+    def _reset(self, prompt_hash: str):
+        self._clear()
+        self._prompt_hash = prompt_hash
+        self._generation += 1
+        self._history_id = None
+        self._refreshed_at = 0.0
+        self._loading = False
+
+    def _read_history(self, conn, after: Optional[int]) -> List[Any]:
+        if after is None:
+            # First load: the newest max_entries successful questions
+            return conn.execute('''
+                SELECT id, query, sql_query FROM query_history
+                WHERE success = 1 AND sql_query IS NOT NULL AND sql_query != ''
+                ORDER BY id DESC LIMIT ?
+            ''', (self.max_entries,)).fetchall()[::-1]
+        return conn.execute('''
+            SELECT id, query, sql_query FROM query_history
+            WHERE id > ? AND success = 1 AND sql_query IS NOT NULL AND sql_query != ''
+            ORDER BY id LIMIT ?
+        ''', (after, HISTORY_BATCH)).fetchall()
+
+    def _load_history(self, generation: int, after: Optional[int]):
+        """Index query_history rows after ``after`` (all of them when None)."""
+        conn = get_db_connection(self.db_path)
+        try:
+            rows = self._read_history(conn, after)
+        except Exception as e:
+            print(f"Warning: Failed to load query_history into the similarity cache: {e}")
+            rows = []
+        finally:
+            conn.close()
+
+        # Index in chunks so lookups are not held up by a large first load
+        for start in range(0, len(rows), HISTORY_BATCH // 10):
+            with self._lock:
+                if generation != self._generation:
+                    return  # prompt changed meanwhile
+                for row in rows[start:start + HISTORY_BATCH // 10]:
+                    if row['query']:
+                        self._add(row['query'], row['sql_query'])
+                    self._history_id = max(self._history_id or 0, row['id'])
+        with self._lock:
+            if generation == self._generation:
+                self._history_id = self._history_id or 0
+                self._loading = False
+
+    def _refresh_from_history(self):
+        """Start indexing query_history rows added since the last refresh (caller holds the lock)."""
+        now = time.monotonic()
+        if self._loading or (self._history_id is not None and now - self._refreshed_at < self.refresh_interval):
+            return
+        self._refreshed_at = now
+        self._loading = True
+        threading.Thread(target=self._load_history, args=(self._generation, self._history_id),
+                         name='similarity-index', daemon=True).start()
+
+    # --- public API ---
+
+    def get(self, question: str, prompt_hash: str) -> Optional[SimilarMatch]:
+        """
+        Find SQL from a similar question, re-parameterized for this one.
+
+        Args:
+            question: Natural language question
+            prompt_hash: Hash of the current SQL-generation prompt (entries
+                built under another prompt are discarded)
+
+        Returns:
+            SimilarMatch, or None if no indexed question is similar enough
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if prompt_hash != self._prompt_hash:
+                self._reset(prompt_hash)
+            self._refresh_from_history()
+
+            skeleton = self.skeleton(question)
+            group = self._groups.get(skeleton.signature)
+            if group is not None:
+                key = normalize_question(question)
+                best, best_score = self._exact.get((skeleton.signature, frozenset(skeleton.features.items()))), 1.0
+                if best is None or not self._entries[best].alive:
+                    best, best_score = None, 0.0
+                    for entry_id in group.nearest(simhash(skeleton.features), self.max_distance, CANDIDATES):
+                        entry = self._entries[int(entry_id)]
+                        if not entry.alive:
+                            continue
+                        # An extra word on either side may be a filter the other SQL lacks
+                        if not (_covered(skeleton.unknown, entry.unknown)
+                                and _covered(entry.unknown, skeleton.unknown)):
+                            continue
+                        score = _cosine(skeleton.features, entry.features)
+                        if score > best_score:
+                            best, best_score = int(entry_id), score
+                if best is not None and best_score >= self.threshold:
+                    entry = self._entries[best]
+                    self._reused_from[key] = best
+                    while len(self._reused_from) > 1024:
+                        self._reused_from.popitem(last=False)
+                    self._stats['hits'] += 1
+                    return SimilarMatch(self._render(entry, skeleton.slots), entry.question, round(best_score, 4))
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, question: str, sql: str, prompt_hash: str):
+        """Index SQL the LLM generated for a question."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if prompt_hash != self._prompt_hash:
+                self._reset(prompt_hash)
+            if self._add(question, sql):
+                self._stats['stores'] += 1
+
+    def invalidate(self, question: str):
+        """Drop a question and the entry its SQL was reused from (e.g. when the SQL failed)."""
+        key = normalize_question(question)
+        with self._lock:
+            for entry_id in (self._by_key.pop(key, None), self._reused_from.pop(key, None)):
+                if entry_id is not None and self._entries[entry_id].alive:
+                    self._entries[entry_id].alive = False
+                    self._live -= 1
+                    self._stats['invalidations'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Index size and hit/miss counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = self._live
+            stats['signatures'] = len(self._groups)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['threshold'] = self.threshold
+        stats['enabled'] = self.enabled
+        return stats
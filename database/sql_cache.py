@@ -0,0 +1,263 @@
+"""
+Question to SQL cache for the Database MCP project.
+
+This module lets the query engine skip the LLM round trip for questions it
+has already answered. It is a two-tier cache:
+
+1. An in-process LRU for the hottest questions.
+2. A persistent ``sql_cache`` table stored next to ``query_history`` in
+   usage.db, so entries survive restarts and are shared by the Flask app
+   and the MCP server.
+
+Entries are keyed on a normalized question and tagged with a hash of the
+SQL-generation prompt, so a schema or prompt change invalidates them. The
+cache is not seeded from ``query_history``: those rows do not record the
+prompt their SQL was generated under.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from database.connection import get_db_connection
+
+# Cache sizing and expiry
+SQL_CACHE_MEMORY_SIZE = int(os.getenv('SQL_CACHE_MEMORY_SIZE', '1024'))
+SQL_CACHE_MAX_ENTRIES = int(os.getenv('SQL_CACHE_MAX_ENTRIES', '10000'))
+SQL_CACHE_TTL_SECONDS = int(os.getenv('SQL_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Run expiry/size eviction on the persistent table every N stores
+MAINTENANCE_INTERVAL = 64
+
+# Skip rewriting last_used_at for persistent hits more often than this
+TOUCH_INTERVAL_SECONDS = 60
+
+_PUNCTUATION_RE = re.compile(r'[?!.,;:"`“”]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question into a cache key.
+
+    Case, surrounding punctuation and repeated whitespace are ignored;
+    numbers and words are kept, so "top 3 apps" and "top 5 apps" differ.
+    """
+    text = unicodedata.normalize('NFKC', question).lower()
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+class SQLCache:
+    """
+    Two-tier (memory LRU + SQLite table) cache of generated SQL by question.
+    """
+
+    def __init__(self, db_path=None, memory_size: int = SQL_CACHE_MEMORY_SIZE,
+                 max_entries: int = SQL_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = SQL_CACHE_TTL_SECONDS, enabled: bool = True):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        self._memory = OrderedDict()  # key -> (sql, prompt_hash, created_at)
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._stores_since_maintenance = 0
+
+        self._stats = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'persistent_evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+        }
+
+    # --- persistent table ---
+
+    def _ensure_table(self, conn):
+        if self._table_ready:
+            return
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                sql_query TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sql_cache_last_used ON sql_cache(last_used_at)')
+        conn.commit()
+        self._table_ready = True
+
+    def _count(self, name: str, amount: int = 1):
+        """Add to a counter (called from many pool threads)."""
+        with self._lock:
+            self._stats[name] += amount
+
+    def _maintain(self, conn):
+        """Drop expired entries and evict least recently used ones over the limit."""
+        cutoff = time.time() - self.ttl_seconds
+        expired = conn.execute('DELETE FROM sql_cache WHERE created_at < ?', (cutoff,)).rowcount
+        self._count('expirations', expired)
+
+        count = conn.execute('SELECT COUNT(*) FROM sql_cache').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            evicted = conn.execute('''
+                DELETE FROM sql_cache WHERE question_key IN (
+                    SELECT question_key FROM sql_cache ORDER BY last_used_at ASC LIMIT ?
+                )
+            ''', (excess,)).rowcount
+            self._count('persistent_evictions', evicted)
+
+    # --- memory tier ---
+
+    def _remember(self, key: str, sql: str, prompt_hash: str, created_at: float):
+        with self._lock:
+            self._memory[key] = (sql, prompt_hash, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self._stats['memory_evictions'] += 1
+
+    # --- public API ---
+
+    def get(self, question: str, prompt_hash: str) -> Optional[str]:
+        """
+        Look up cached SQL for a question.
+
+        Args:
+            question: Natural language question.
+            prompt_hash: Hash of the current SQL-generation prompt.
+
+        Returns:
+            Cached SQL string, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        key = normalize_question(question)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                sql, entry_hash, created_at = entry
+                if entry_hash == prompt_hash and now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return sql
+                del self._memory[key]
+
+        conn = get_db_connection(self.db_path)
+        try:
+            self._ensure_table(conn)
+            row = conn.execute('''
+                SELECT sql_query, prompt_hash, created_at, last_used_at
+                FROM sql_cache WHERE question_key = ?
+            ''', (key,)).fetchone()
+
+            if row is None or row['prompt_hash'] != prompt_hash or now - row['created_at'] >= self.ttl_seconds:
+                self._count('misses')
+                return None
+
+            if now - row['last_used_at'] > TOUCH_INTERVAL_SECONDS:
+                conn.execute('''
+                    UPDATE sql_cache SET last_used_at = ?, hit_count = hit_count + 1
+                    WHERE question_key = ?
+                ''', (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+
+        self._count('persistent_hits')
+        self._remember(key, row['sql_query'], prompt_hash, row['created_at'])
+        return row['sql_query']
+
+    def put(self, question: str, sql: str, prompt_hash: str):
+        """Store generated SQL for a question in both tiers."""
+        if not self.enabled:
+            return
+
+        key = normalize_question(question)
+        now = time.time()
+        self._remember(key, sql, prompt_hash, now)
+
+        conn = get_db_connection(self.db_path)
+        try:
+            self._ensure_table(conn)
+            conn.execute('''
+                INSERT OR REPLACE INTO sql_cache
+                    (question_key, question, sql_query, prompt_hash, created_at, last_used_at, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (key, question, sql, prompt_hash, now, now))
+
+            with self._lock:
+                self._stores_since_maintenance += 1
+                maintain = self._stores_since_maintenance >= MAINTENANCE_INTERVAL
+                if maintain:
+                    self._stores_since_maintenance = 0
+            if maintain:
+                self._maintain(conn)
+            conn.commit()
+        except Exception as e:
+            print(f"Warning: Failed to persist SQL cache entry: {e}")
+        finally:
+            conn.close()
+
+        self._count('stores')
+
+    def invalidate(self, question: str):
+        """Remove a question from both tiers (e.g. when its SQL failed to run)."""
+        key = normalize_question(question)
+        with self._lock:
+            self._memory.pop(key, None)
+
+        conn = get_db_connection(self.db_path)
+        try:
+            if self._table_ready:
+                conn.execute('DELETE FROM sql_cache WHERE question_key = ?', (key,))
+                conn.commit()
+        finally:
+            conn.close()
+        self._count('invalidations')
+
+    def clear(self):
+        """Empty both tiers."""
+        with self._lock:
+            self._memory.clear()
+        conn = get_db_connection(self.db_path)
+        try:
+            if self._table_ready:
+                conn.execute('DELETE FROM sql_cache')
+                conn.commit()
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss/eviction counters.
+
+        Returns:
+            Dictionary of counters plus the derived hit rate.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['persistent_hits']) / lookups if lookups else 0.0
+        stats['enabled'] = self.enabled
+        return stats
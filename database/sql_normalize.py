@@ -0,0 +1,183 @@
+"""
+SQL text normalization helpers.
+
+These helpers produce a canonical form of a SQL statement so that
+semantically identical statements that differ only in layout share cache
+entries.
+"""
+
+import re
+from typing import Any, List, Sequence, Tuple
+
+# String literals, quoted identifiers, comments, whitespace runs and everything else
+_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<param>\?)
+  | (?P<other>[^'"`\[\s?-]+|-)
+""", re.VERBOSE | re.DOTALL)
+
+# Functions whose results change between calls for the same data
+_VOLATILE_FUNCTION_RE = re.compile(
+    r'\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\(', re.IGNORECASE
+)
+_TIME_DEPENDENT_RE = re.compile(r"'now'|\bcurrent_(date|time|timestamp)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Return a canonical form of a SQL statement.
+
+    Comments are removed, whitespace outside literals is collapsed to single
+    spaces and trailing semicolons are dropped. Literals and identifiers are
+    left untouched.
+    """
+    parts = []
+    pending_space = False
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('space', 'comment'):
+            pending_space = bool(parts)
+            continue
+        if pending_space:
+            parts.append(' ')
+            pending_space = False
+        parts.append(match.group())
+    return ''.join(parts).rstrip(' ;')
+
+
+def is_volatile_sql(sql: str) -> bool:
+    """True if the statement calls functions whose results are not repeatable."""
+    return bool(_VOLATILE_FUNCTION_RE.search(sql))
+
+
+def is_time_dependent_sql(sql: str) -> bool:
+    """True if the statement's result depends on the current time."""
+    return bool(_TIME_DEPENDENT_RE.search(sql))
+
+
+def quote_literal(value: Any) -> str:
+    """Render a Python value as a SQLite literal."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(sql: str, params: Sequence[Any]) -> str:
+    """
+    Substitute positional ``?`` parameters with quoted literals.
+
+    The result is used for cache keys, rollup rewriting and display; the
+    statement itself is still executed with bound parameters.
+
+    Raises:
+        ValueError: If the number of placeholders and parameters differ
+    """
+    if not params:
+        return sql
+    values = iter(params)
+    parts, used = [], 0
+    for match in _TOKEN_RE.finditer(sql):
+        if match.lastgroup == 'param':
+            try:
+                parts.append(quote_literal(next(values)))
+            except StopIteration:
+                raise ValueError("More placeholders than parameters in SQL") from None
+            used += 1
+        else:
+            parts.append(match.group())
+    if used != len(params):
+        raise ValueError(f"SQL has {used} placeholders but {len(params)} parameters were given")
+    return ''.join(parts)
+
+
+# Tokens for parameterize_sql(); numbers and words are told apart so literals can be lifted
+_LITERAL_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')
+  | (?P<blob>[xX]'[^']*')
+  | (?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<hex>0[xX][0-9A-Fa-f]+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<param>\?\d*|[:@$][A-Za-z_]\w*)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Clause keywords; literals are only lifted where they are plain values
+_CLAUSE_KEYWORDS = {'SELECT', 'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'ON',
+                    'JOIN', 'UNION', 'EXCEPT', 'INTERSECT', 'VALUES', 'WINDOW', 'USING', 'PARTITION'}
+_LIFTED_CLAUSES = {'WHERE', 'HAVING', 'ON', 'LIMIT', 'OFFSET'}
+_INTEGER_RE = re.compile(r'\d+')
+_UNUSED = object()
+
+
+def parameterize_sql(sql: str, params: Sequence[Any] = ()) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Lift literal values out of a statement into bound parameters.
+
+    String and numeric literals in WHERE, HAVING, ON, LIMIT and OFFSET
+    become ``?``, so statements that differ only in their values share one
+    SQL text: SQLite prepares and plans that shape once per connection and
+    later executions reuse it from the statement cache. Literals elsewhere
+    are kept: in the select list (including anything nested in it) they
+    name result columns, and numbers in GROUP BY / ORDER BY are column
+    positions. Layout is normalized as in
+    normalize_sql().
+
+    Args:
+        sql: Statement, possibly already containing positional ``?`` placeholders
+        params: Values for those placeholders
+
+    Returns:
+        (shape, params): the parameterized statement and all its values in
+        order. Statements using numbered or named parameters are returned
+        normalized but otherwise unchanged.
+    """
+    given = iter(params)
+    parts: List[str] = []
+    values: List[Any] = []
+    clauses = ['']  # current clause per parenthesis depth
+    pending_space = False
+    for match in _LITERAL_TOKEN_RE.finditer(sql):
+        kind, text = match.lastgroup, match.group()
+        if kind in ('space', 'comment'):
+            pending_space = bool(parts)
+            continue
+        if pending_space:
+            parts.append(' ')
+            pending_space = False
+
+        if kind == 'word' and text.upper() in _CLAUSE_KEYWORDS:
+            clauses[-1] = text.upper()
+        elif kind == 'punct' and text == '(':
+            clauses.append(clauses[-1])
+        elif kind == 'punct' and text == ')' and len(clauses) > 1:
+            clauses.pop()
+        elif kind == 'param':
+            if text != '?':
+                return normalize_sql(sql), tuple(params)
+            try:
+                values.append(next(given))
+            except StopIteration:
+                raise ValueError("More placeholders than parameters in SQL") from None
+        elif kind in ('string', 'number') and clauses[-1] in _LIFTED_CLAUSES and 'SELECT' not in clauses[:-1]:
+            if kind == 'string':
+                values.append(text[1:-1].replace("''", "'"))
+            elif _INTEGER_RE.fullmatch(text):
+                values.append(int(text))
+            else:
+                values.append(float(text))
+            text = '?'
+        parts.append(text)
+
+    if next(given, _UNUSED) is not _UNUSED:
+        raise ValueError("More parameters than placeholders in SQL")
+    return ''.join(parts).rstrip(' ;'), tuple(values)
@@ -0,0 +1,222 @@
+"""
+Parameterized execution of generated and user SQL, with shape statistics.
+
+LLM-generated SQL inlines its values (``LOWER(application_name) = 'slack'``),
+so every question used to produce a new SQL string. SQLite re-parsed and
+re-planned each one, and the sqlite3 statement cache (keyed on the exact
+string) never hit across questions. execute_statement() now lifts literals
+into bound parameters first (sql_normalize.parameterize_sql). Statements
+that differ only in their values share one "shape". Each pooled connection
+keeps DB_STATEMENT_CACHE_SIZE prepared statements, plans included, keyed
+on that shape. Connections live as long as the pool, so a shape is
+prepared once per connection and then reused.
+
+ShapeRegistry counts executions per shape, so the real query mix is
+visible: the MCP statistics tool reports the most frequent shapes, and
+``python -m database.statements --report`` replays query_history to show
+the mix of past queries.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+# Add project root to path when run as a script
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core import metrics
+from database.connection import get_db_connection
+from database.sql_normalize import normalize_sql, parameterize_sql
+
+# Lift literals out of SQL before executing it
+SQL_PARAMETERIZE_ENABLED = os.getenv('SQL_PARAMETERIZE_ENABLED', 'True').lower() == 'true'
+
+# Distinct shapes tracked by the registry (least recently seen are dropped)
+SHAPE_REGISTRY_SIZE = int(os.getenv('SHAPE_REGISTRY_SIZE', '2000'))
+
+STATEMENT_EXECUTIONS = metrics.REGISTRY.counter(
+    'sql_statement_executions_total',
+    'SQL statements executed, by whether their parameterized shape was seen before.', ['shape'])
+
+
+def shape_id(shape: str) -> str:
+    """Short stable identifier for a statement shape."""
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+class ShapeRegistry:
+    """
+    Execution counts and timings per parameterized statement shape.
+    """
+
+    def __init__(self, max_shapes: int = SHAPE_REGISTRY_SIZE):
+        self.max_shapes = max_shapes
+        self._shapes: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executions = 0
+        self._repeats = 0
+        self._evicted = 0
+
+    def record(self, shape: str, seconds: float, example: str) -> bool:
+        """
+        Count one execution of a shape.
+
+        Returns:
+            True if the shape had been seen before
+        """
+        with self._lock:
+            self._executions += 1
+            entry = self._shapes.get(shape)
+            if entry is None:
+                entry = self._shapes[shape] = {
+                    'id': shape_id(shape),
+                    'shape': shape,
+                    'example': example,
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'first_seen': time.time(),
+                }
+                while len(self._shapes) > self.max_shapes:
+                    self._shapes.popitem(last=False)
+                    self._evicted += 1
+            else:
+                self._shapes.move_to_end(shape)
+                self._repeats += 1
+            entry['count'] += 1
+            entry['total_seconds'] += seconds
+            entry['last_seen'] = time.time()
+            return entry['count'] > 1
+
+    def top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most frequently executed shapes."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._shapes.values()]
+        entries.sort(key=lambda entry: entry['count'], reverse=True)
+        for entry in entries[:limit]:
+            entry['mean_ms'] = round(entry['total_seconds'] / entry['count'] * 1000, 3)
+        return entries[:limit]
+
+    def get_stats(self, limit: int = 20) -> Dict[str, Any]:
+        """Totals plus the most frequent shapes."""
+        with self._lock:
+            stats = {
+                'executions': self._executions,
+                'distinct_shapes': len(self._shapes),
+                'repeat_executions': self._repeats,
+                'evicted_shapes': self._evicted,
+                'enabled': SQL_PARAMETERIZE_ENABLED,
+            }
+        stats['reuse_rate'] = stats['repeat_executions'] / stats['executions'] if stats['executions'] else 0.0
+        stats['top_shapes'] = self.top(limit)
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._executions = self._repeats = self._evicted = 0
+
+
+# Process-wide registry
+SHAPES = ShapeRegistry()
+
+
+def prepare_statement(sql: str, params: Sequence[Any] = ()) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Return the statement and parameters to hand to SQLite.
+
+    Args:
+        sql: SQL with literals and/or positional ``?`` placeholders
+        params: Values for the placeholders already in sql
+
+    Returns:
+        (shape, params) with literals lifted, or sql unchanged when
+        parameterization is disabled
+    """
+    if not SQL_PARAMETERIZE_ENABLED:
+        return sql, tuple(params)
+    return parameterize_sql(sql, params)
+
+
+def execute_statement(conn, sql: str, params: Sequence[Any] = ()):
+    """
+    Execute SQL as a parameterized shape on conn and record the shape.
+
+    Returns:
+        The sqlite3 cursor
+    """
+    shape, values = prepare_statement(sql, params)
+    started = time.perf_counter()
+    cursor = conn.execute(shape, values)
+    repeated = SHAPES.record(shape, time.perf_counter() - started, sql)
+    STATEMENT_EXECUTIONS.inc(shape='repeat' if repeated else 'new')
+    return cursor
+
+
+def shape_report(db_path=None, history_limit: int = 5000, limit: int = 20) -> Dict[str, Any]:
+    """
+    Group recent query_history SQL by parameterized shape.
+
+    Returns:
+        Dictionary with totals and the most frequent shapes
+    """
+    conn = get_db_connection(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT sql_query FROM query_history
+            WHERE sql_query IS NOT NULL AND sql_query != ''
+            ORDER BY id DESC LIMIT ?
+        ''', (history_limit,)).fetchall()
+    finally:
+        conn.close()
+
+    counts: Dict[str, Dict[str, Any]] = {}
+    unparsed = 0
+    for row in rows:
+        try:
+            shape, _ = parameterize_sql(row['sql_query'])
+        except ValueError:
+            unparsed += 1
+            continue
+        entry = counts.setdefault(shape, {'id': shape_id(shape), 'shape': shape, 'count': 0,
+                                          'example': normalize_sql(row['sql_query'])})
+        entry['count'] += 1
+    top = sorted(counts.values(), key=lambda entry: entry['count'], reverse=True)
+    return {
+        'queries': len(rows),
+        'distinct_sql': len({row['sql_query'] for row in rows}),
+        'distinct_shapes': len(counts),
+        'unparsed': unparsed,
+        'top_shapes': top[:limit],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statement shape statistics")
+    parser.add_argument('--report', action='store_true',
+                        help="Group query_history SQL by parameterized shape")
+    parser.add_argument('--db', help="Database path (default: DATABASE_PATH)")
+    parser.add_argument('--history-limit', type=int, default=5000,
+                        help="Most recent query_history rows to read")
+    parser.add_argument('--top', type=int, default=20, help="Shapes to list")
+    args = parser.parse_args(argv)
+
+    if not args.report:
+        parser.print_help()
+        return
+
+    report = shape_report(args.db, args.history_limit, args.top)
+    print(f"📊 {report['queries']} queries, {report['distinct_sql']} distinct SQL strings, "
+          f"{report['distinct_shapes']} distinct shapes")
+    for entry in report['top_shapes']:
+        print(f"\n{entry['count']:>6}  [{entry['id']}] {entry['shape']}")
+        print(f"        e.g. {entry['example'][:160]}")
+
+
+if __name__ == '__main__':
+    main()
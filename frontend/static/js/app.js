@@ -139,7 +139,8 @@ function updateSidebarButtonState() {
 }
 
 /**
- * Sends the user's question to the backend and displays the answer with enhanced UX.
+ * Sends the user's question to the streaming endpoint and renders each stage as it arrives:
+ * the generated SQL first, then the rows and chart, then the answer token by token.
  * @param {string} question - The user's natural language question.
  */
 async function performLlmQuery(question) {
@@ -151,57 +152,69 @@ async function performLlmQuery(question) {
     
     const loadingIndicator = showLoadingIndicator();
     const chartContainer = document.getElementById('chart-container');
+    chartContainer.classList.add('hidden'); // Charts are embedded in the chat
+    
+    let answerDiv = null;
+    let rows = [];
     
     try {
-        const response = await fetch('/api/llm_query', {
+        const response = await fetch('/api/llm_query/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
             },
             body: JSON.stringify({ query: question }),
         });
 
-        const data = await response.json();
-        hideLoadingIndicator();
+        if (!response.ok || !response.body) {
+            // Request rejected before streaming started
+            const data = await response.json().catch(() => ({}));
+            hideLoadingIndicator();
+            addLog(`🚨 Server Error: ${data.error || 'Unknown server error'}`, 'error');
+            return;
+        }
 
-        if (response.ok) {
-            // Store the data for export functionality
-            lastQueryData = {
-                question: question,
-                answer: data.answer,
-                data: data.data,
-                timestamp: new Date().toISOString()
-            };
-            
-            // Display the answer with embedded chart if data is available
-            if (data.data && data.data.length > 0) {
+        await readEventStream(response, (event, payload) => {
+            if (event === 'sql') {
+                hideLoadingIndicator();
+                addLog(`🧾 SQL: ${payload.sql}`, 'response');
+                showLoadingIndicator();
+            } else if (event === 'data') {
+                hideLoadingIndicator();
+                rows = payload.data || [];
+                let entry;
                 try {
-                    addLogWithChart(data.answer, data.data, data.question);
-                    chartContainer.classList.add('hidden'); // Hide the separate chart container
+                    entry = addLogWithChart('', rows, question);
                 } catch (chartError) {
                     console.error("Error rendering chat chart:", chartError);
-                    addLog(data.answer, 'response', true); // Fallback to text-only response
-                    chartContainer.classList.add('hidden');
+                    entry = addLogWithChart('', [], question); // Fallback to text-only response
                 }
-            } else {
-                // Display text-only response when no data for charts
-                addLog(data.answer, 'response', true);
-                chartContainer.classList.add('hidden');
+                answerDiv = entry.firstChild;
+            } else if (event === 'token') {
+                answerDiv.textContent += payload.text;
+                scrollToBottom();
+            } else if (event === 'done') {
+                answerDiv.textContent = payload.answer;
+                // Store the data for export functionality
+                lastQueryData = {
+                    question: question,
+                    answer: payload.answer,
+                    data: rows,
+                    timestamp: new Date().toISOString()
+                };
+            } else if (event === 'error') {
+                hideLoadingIndicator();
+                addLog(`🚨 Server Error: ${payload.error || 'Unknown server error'}`, 'error');
             }
-
-        } else {
-            // Handle API errors
-            const errorMessage = data.answer || data.error || 'Unknown server error';
-            addLog(`🚨 Server Error: ${errorMessage}`, 'error');
-            chartContainer.classList.add('hidden');
-        }
+        });
 
     } catch (error) {
         hideLoadingIndicator();
         // Handle network errors
         addLog(`🔌 Connection Error: ${error.message}\n\nPlease check your internet connection and try again.`, 'error');
-        chartContainer.classList.add('hidden');
     } finally {
+        hideLoadingIndicator();
         isLoading = false;
         sendBtn.disabled = false;
         sendBtn.innerHTML = '<i class="fas fa-paper-plane"></i> Send';
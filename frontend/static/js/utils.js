@@ -9,6 +9,44 @@ function scrollToBottom() {
     }, 100);
 }
 
+/**
+ * Reads a Server-Sent Events response body and calls onEvent for each event.
+ * EventSource only supports GET, so POST streams are parsed from fetch() here.
+ * @param {Response} response - A fetch() response with a text/event-stream body.
+ * @param {function(string, Object)} onEvent - Called with the event name and parsed JSON data.
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            const dataLines = [];
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            }
+            if (dataLines.length > 0) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
 /**
  * Copy text to clipboard functionality.
  */
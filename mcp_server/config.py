@@ -27,9 +27,19 @@ class MCPServerConfig:
     # MCP Protocol settings
     PROTOCOL_VERSION = "2024-11-05"
     
+    # Upper bound for a single tool call, in seconds
+    TOOL_TIMEOUT_SECONDS = float(os.getenv('MCP_TOOL_TIMEOUT_SECONDS', '120'))
+    
+    # Encoding of result rows in tool responses ('auto' picks the most compact)
+    RESULT_FORMAT = os.getenv('MCP_RESULT_FORMAT', 'auto')
+    
     # Tool definitions
     AVAILABLE_TOOLS = [
         "query_database",
-        "get_schema",
+        "query_database_batch",
+        "get_database_schema",
+        "execute_sql",
+        "ingest_usage_data",
+        "export_query_results",
         "get_statistics"
     ]
@@ -3,7 +3,10 @@
 
 import asyncio
 import json
+import sqlite3
 import sys
+import time
+from pathlib import Path
 from typing import Any, Dict, List, Optional, Sequence
 
 # MCP imports
@@ -18,11 +21,27 @@ from mcp.types import (
     EmbeddedResource,
     ListResourcesResult,
     Resource,
-    ReadResourceResult,
 )
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 
-# Import our database query engine
-from database_tools import DatabaseQueryEngine, process_database_query
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# Import our database query engine (schema and prompt are cached inside the engine,
+# so the get_database_schema tool and the schema resource share one cache)
+from database.query_engine import DatabaseQueryEngine, process_database_query
+from database.async_query_engine import AsyncDatabaseQueryEngine, StageTimeoutError
+from database.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError
+from database.budget import BudgetExceededError, get_budget
+from database.batch import BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS, run_batch_async, validate_batch
+from database.result_encoding import ENCODERS, resolve_encoding
+from database.ingest import SUPPORTED_FORMATS, INGEST_COLUMNS, ingest_text
+from database.connection import get_pool_stats
+from database.statements import SHAPES
+from database.result_export import EXPORT_FORMATS, EXPORTS, RESULT_URI_PREFIX
+from core import metrics
+from mcp_server.config import MCPServerConfig
 
 # Server information
 SERVER_NAME = "database-mcp"
@@ -34,11 +53,38 @@ server = Server(SERVER_NAME)
 # Initialize database query engine
 try:
     db_engine = DatabaseQueryEngine()
+    # Async facade so tool calls never block the event loop
+    async_engine = AsyncDatabaseQueryEngine(db_engine)
     print(f"✅ {SERVER_NAME} v{SERVER_VERSION} initialized successfully")
 except Exception as e:
     print(f"❌ Failed to initialize database engine: {e}")
     sys.exit(1)
 
+def collect_statistics() -> Dict[str, Any]:
+    """Gather metrics and cache/pool statistics (blocking; run via async_engine.run_db)."""
+    return {
+        'metrics': metrics.snapshot(),
+        'sql_cache': db_engine.sql_cache.get_stats(),
+        'similar_sql_cache': db_engine.similar_sql.get_stats(),
+        'templates': db_engine.templates.get_stats(),
+        'result_cache': db_engine.result_cache.get_stats(),
+        'rollups': db_engine.rollups.get_stats(),
+        'columnar': db_engine.columnar.get_stats(),
+        'connection_pool': get_pool_stats(db_engine.db_path),
+        'statement_shapes': SHAPES.get_stats(),
+        'read_replica': db_engine.replica.get_stats() if db_engine.replica else {'enabled': False},
+        'result_exports': EXPORTS.get_stats(),
+    }
+
+def fetch_sample_data(limit: int) -> List[Dict[str, Any]]:
+    """Fetch a few usage_data rows (blocking; run via async_engine.run_db)."""
+    conn = db_engine.get_read_connection()
+    try:
+        sample_results = conn.execute("SELECT * FROM usage_data LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in sample_results]
+    finally:
+        conn.close()
+
 @server.list_tools()
 async def list_tools() -> ListToolsResult:
     """
@@ -73,6 +119,34 @@ async def list_tools() -> ListToolsResult:
                     "required": ["question"]
                 }
             ),
+            Tool(
+                name="query_database_batch",
+                description=(
+                    "Answer several natural language questions about the usage database in one call. "
+                    "Duplicate questions are answered once, questions run concurrently, and results "
+                    "come back in the same order with a per-question answer or error and timing. "
+                    "Use this instead of repeated query_database calls when refreshing a dashboard."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "questions": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": BATCH_MAX_QUESTIONS,
+                            "description": "Natural language questions, answered in this order."
+                        },
+                        "concurrency": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "maximum": 32,
+                            "description": f"Questions processed at the same time (default {BATCH_CONCURRENCY})."
+                        }
+                    },
+                    "required": ["questions"]
+                }
+            ),
             Tool(
                 name="get_database_schema",
                 description=(
@@ -90,7 +164,8 @@ async def list_tools() -> ListToolsResult:
                 description=(
                     "Execute a raw SQL SELECT query against the database. "
                     "Use this for advanced users who want to write their own SQL queries. "
-                    "Only SELECT statements are allowed for security."
+                    "Only SELECT statements are allowed for security. "
+                    "Results are paginated; pass the returned cursor to get the next page."
                 ),
                 inputSchema={
                     "type": "object",
@@ -101,10 +176,104 @@ async def list_tools() -> ListToolsResult:
                                 "SQL SELECT query to execute. Must start with SELECT. "
                                 "Example: 'SELECT user, SUM(duration_seconds) FROM usage_data GROUP BY user'"
                             )
+                        },
+                        "page_size": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "maximum": MAX_PAGE_SIZE,
+                            "description": f"Rows to return per page (default {DEFAULT_PAGE_SIZE})."
+                        },
+                        "cursor": {
+                            "type": "string",
+                            "description": (
+                                "Opaque continuation token from a previous execute_sql call "
+                                "with the same SQL, used to fetch the next page."
+                            )
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": ["auto"] + sorted(ENCODERS),
+                            "description": (
+                                "Encoding of the returned rows. 'auto' (default) picks the most "
+                                "compact of csv, columnar and json."
+                            )
                         }
                     },
                     "required": ["sql"]
                 }
+            ),
+            Tool(
+                name="ingest_usage_data",
+                description=(
+                    "Bulk-insert usage events into the usage_data table. "
+                    "Accepts NDJSON (one JSON object per line) or CSV with a header row. "
+                    f"Each record needs: {', '.join(INGEST_COLUMNS)}. "
+                    "Invalid rows are skipped and reported."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "data": {
+                            "type": "string",
+                            "description": (
+                                "NDJSON or CSV payload. log_date uses 'YYYY-MM-DDTHH:MM:SSZ'. "
+                                "Example line: {\"monitor_app_version\": \"1.3.1\", \"platform\": \"Windows\", "
+                                "\"user\": \"Aarav\", \"application_name\": \"VSCode\", "
+                                "\"application_version\": \"1.74.2\", \"log_date\": \"2024-05-01T09:30:00Z\", "
+                                "\"legacy_app\": false, \"duration_seconds\": 3600}"
+                            )
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": list(SUPPORTED_FORMATS),
+                            "description": "Payload format (default ndjson)."
+                        }
+                    },
+                    "required": ["data"]
+                }
+            ),
+            Tool(
+                name="export_query_results",
+                description=(
+                    "Export the full result of a question or SELECT statement as an Arrow IPC "
+                    "stream or Parquet file, for results too large to return as text. "
+                    "Returns a database://results/<id> resource URI to read the file from, "
+                    "plus its row count, size and column types."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "question": {
+                            "type": "string",
+                            "description": "Natural language question whose result to export."
+                        },
+                        "sql": {
+                            "type": "string",
+                            "description": "SELECT statement whose result to export (instead of a question)."
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": list(EXPORT_FORMATS),
+                            "description": (
+                                "'arrow' (default): uncompressed Arrow IPC stream, zero-copy for "
+                                "pandas/DuckDB. 'parquet': compressed, smallest to transfer."
+                            )
+                        }
+                    }
+                }
+            ),
+            Tool(
+                name="get_statistics",
+                description=(
+                    "Get server performance statistics: per-stage pipeline latency "
+                    "(p50/p95/p99), errors by stage, rows returned, LLM requests and token usage, "
+                    "cache hit rates and connection pool usage."
+                ),
+                inputSchema={
+                    "type": "object",
+                    "properties": {},
+                    "additionalProperties": False
+                }
             )
         ]
     )
@@ -123,14 +292,63 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
     """
     try:
         if name == "query_database":
-            return await handle_database_query(arguments)
+            handler = handle_database_query
+        elif name == "query_database_batch":
+            handler = handle_database_query_batch
         elif name == "get_database_schema":
-            return await handle_get_schema(arguments)
+            handler = handle_get_schema
         elif name == "execute_sql":
-            return await handle_execute_sql(arguments)
+            handler = handle_execute_sql
+        elif name == "ingest_usage_data":
+            handler = handle_ingest_usage_data
+        elif name == "export_query_results":
+            handler = handle_export_query_results
+        elif name == "get_statistics":
+            handler = handle_get_statistics
         else:
             raise ValueError(f"Unknown tool: {name}")
-            
+        
+        # Bound every call; cancellation by the client propagates into the handler
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await asyncio.wait_for(handler(arguments), MCPServerConfig.TOOL_TIMEOUT_SECONDS)
+            outcome = 'success'
+            return result
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise
+        finally:
+            metrics.TOOL_SECONDS.observe(time.perf_counter() - started, tool=name, outcome=outcome)
+    
+    except asyncio.TimeoutError as e:
+        if isinstance(e, StageTimeoutError):
+            error_msg = f"Error executing tool '{name}': {e}"
+        else:
+            error_msg = (f"Error executing tool '{name}': timed out after "
+                         f"MCP_TOOL_TIMEOUT_SECONDS={MCPServerConfig.TOOL_TIMEOUT_SECONDS:g} seconds")
+        print(f"❌ {error_msg}")
+        return CallToolResult(
+            content=[
+                TextContent(
+                    type="text",
+                    text=error_msg
+                )
+            ],
+            isError=True
+        )
+    except BudgetExceededError as e:
+        # Structured so clients can tell a budget stop from a broken query
+        print(f"❌ Error executing tool '{name}': {e}")
+        return CallToolResult(
+            content=[
+                TextContent(
+                    type="text",
+                    text=json.dumps(e.to_dict(), indent=2)
+                )
+            ],
+            isError=True
+        )
     except Exception as e:
         # Return error as text content
         error_msg = f"Error executing tool '{name}': {str(e)}"
@@ -162,7 +380,7 @@ async def handle_database_query(arguments: Dict[str, Any]) -> CallToolResult:
     print(f"🔍 Processing natural language query: {question}")
     
     # Process the query using our database engine
-    result = db_engine.process_natural_language_query(question)
+    result = await async_engine.process_natural_language_query(question, get_budget('mcp_nl'))
     
     # Format response for MCP client
     response_text = f"**Question:** {result['question']}\n\n"
@@ -176,10 +394,10 @@ async def handle_database_query(arguments: Dict[str, Any]) -> CallToolResult:
         # Include sample of data if available
         if len(result['data']) <= 10:
             response_text += "**Raw Data:**\n"
-            response_text += f"```json\n{json.dumps(result['data'], indent=2)}\n```"
+            response_text += resolve_encoding(result['data'], MCPServerConfig.RESULT_FORMAT).fenced()
         else:
             response_text += "**Sample Data (first 5 rows):**\n"
-            response_text += f"```json\n{json.dumps(result['data'][:5], indent=2)}\n```"
+            response_text += resolve_encoding(result['data'][:5], MCPServerConfig.RESULT_FORMAT).fenced()
     
     return CallToolResult(
         content=[
@@ -190,6 +408,48 @@ async def handle_database_query(arguments: Dict[str, Any]) -> CallToolResult:
         ]
     )
 
+async def handle_database_query_batch(arguments: Dict[str, Any]) -> CallToolResult:
+    """
+    Handle batches of natural language database queries.
+    
+    Args:
+        arguments: Dictionary containing 'questions' and optional 'concurrency' keys
+        
+    Returns:
+        CallToolResult with one answer (or error) per question, in order
+    """
+    questions = validate_batch(arguments.get("questions"))
+    concurrency = min(int(arguments.get("concurrency") or BATCH_CONCURRENCY), 32)
+    
+    print(f"🔍 Processing batch of {len(questions)} questions")
+    
+    batch = await run_batch_async(async_engine, questions, concurrency, get_budget('mcp_nl'))
+    
+    response_text = (f"**Batch:** {batch['total']} questions ({batch['unique']} unique), "
+                     f"{batch['succeeded']} succeeded, {batch['failed']} failed "
+                     f"in {batch['wall_seconds']:.2f}s\n\n")
+    for item in batch['results']:
+        response_text += f"### {item['index'] + 1}. {item['question']}\n"
+        if 'duplicate_of' in item:
+            response_text += f"_Same as question {item['duplicate_of'] + 1}._\n\n"
+            continue
+        if item['success']:
+            response_text += f"**Answer:** {item['answer']}\n"
+            response_text += f"- Returned {len(item['data'])} rows in {item['seconds']:.2f}s\n"
+            response_text += f"- Generated SQL: `{item['sql']}`\n\n"
+        else:
+            response_text += f"**Error:** {item['error']} ({item['seconds']:.2f}s)\n\n"
+    
+    return CallToolResult(
+        content=[
+            TextContent(
+                type="text",
+                text=response_text
+            )
+        ],
+        isError=batch['succeeded'] == 0
+    )
+
 async def handle_get_schema(arguments: Dict[str, Any]) -> CallToolResult:
     """
     Handle database schema requests.
@@ -203,19 +463,15 @@ async def handle_get_schema(arguments: Dict[str, Any]) -> CallToolResult:
     print("📋 Retrieving database schema...")
     
     try:
-        schema = db_engine.get_database_schema()
+        schema = await async_engine.get_database_schema()
         
         # Also get some sample data to show what's available
-        conn = db_engine.get_db_connection()
-        sample_query = "SELECT * FROM usage_data LIMIT 3"
-        sample_results = conn.execute(sample_query).fetchall()
-        sample_data = [dict(row) for row in sample_results]
-        conn.close()
+        sample_data = await async_engine.run_db(fetch_sample_data, 3)
         
         response_text = "**Database Schema:**\n\n"
         response_text += f"```sql\n{schema}\n```\n\n"
         response_text += "**Sample Data:**\n"
-        response_text += f"```json\n{json.dumps(sample_data, indent=2)}\n```\n\n"
+        response_text += resolve_encoding(sample_data, MCPServerConfig.RESULT_FORMAT).fenced() + "\n\n"
         response_text += "**Available Fields:**\n"
         
         if sample_data:
@@ -239,10 +495,10 @@ async def handle_execute_sql(arguments: Dict[str, Any]) -> CallToolResult:
     Handle raw SQL execution requests.
     
     Args:
-        arguments: Dictionary containing 'sql' key
+        arguments: Dictionary containing 'sql' and optional 'page_size' / 'cursor' / 'format' keys
         
     Returns:
-        CallToolResult with query results
+        CallToolResult with one page of query results
     """
     sql = arguments.get("sql", "").strip()
     if not sql:
@@ -252,26 +508,35 @@ async def handle_execute_sql(arguments: Dict[str, Any]) -> CallToolResult:
     if not sql.upper().startswith("SELECT"):
         raise ValueError("Only SELECT statements are allowed for security reasons")
     
+    page_size = arguments.get("page_size") or DEFAULT_PAGE_SIZE
+    cursor = arguments.get("cursor") or None
+    result_format = arguments.get("format") or MCPServerConfig.RESULT_FORMAT
+    if result_format != 'auto' and result_format not in ENCODERS:
+        raise ValueError(f"Unsupported format '{result_format}'. Use auto or one of: {', '.join(sorted(ENCODERS))}")
+    
     print(f"💾 Executing raw SQL: {sql}")
     
     try:
-        results = db_engine.execute_sql_query(sql)
-        data = [dict(row) for row in results]
+        page = await async_engine.execute_sql_page(sql, page_size, cursor, get_budget('mcp_sql'))
         
         response_text = f"**Executed SQL:** `{sql}`\n\n"
-        response_text += f"**Results:** {len(data)} rows returned\n\n"
+        response_text += (f"**Results:** rows {page.offset + 1}-{page.offset + len(page.rows)} "
+                          f"({len(page.rows)} rows in this page)\n\n")
         
-        if data:
-            if len(data) <= 20:
-                response_text += "**Data:**\n"
-                response_text += f"```json\n{json.dumps(data, indent=2)}\n```"
-            else:
-                response_text += "**Sample Data (first 10 rows):**\n"
-                response_text += f"```json\n{json.dumps(data[:10], indent=2)}\n```"
-                response_text += f"\n*Note: Showing 10 of {len(data)} total rows*"
+        if page.rows:
+            response_text += "**Data:**\n"
+            response_text += resolve_encoding(page.rows, result_format).fenced()
         else:
             response_text += "No data returned."
         
+        if page.has_more:
+            response_text += (f"\n\n**More rows available.** Call execute_sql again with the same SQL "
+                              f"and cursor: `{page.next_token}`")
+            if not page.stable:
+                response_text += ("\n\n**Warning:** the ORDER BY does not fully determine row order, so "
+                                  "later pages may repeat or skip rows. Order by id (or every GROUP BY "
+                                  "column) for stable pages.")
+        
         return CallToolResult(
             content=[
                 TextContent(
@@ -281,9 +546,124 @@ async def handle_execute_sql(arguments: Dict[str, Any]) -> CallToolResult:
             ]
         )
         
+    except (InvalidCursorError, BudgetExceededError, asyncio.TimeoutError):
+        raise
     except Exception as e:
         raise ValueError(f"SQL execution failed: {str(e)}")
 
+async def handle_ingest_usage_data(arguments: Dict[str, Any]) -> CallToolResult:
+    """
+    Handle bulk ingestion requests.
+    
+    Args:
+        arguments: Dictionary containing 'data' and optional 'format' keys
+        
+    Returns:
+        CallToolResult with ingestion counts and throughput
+    """
+    data = arguments.get("data", "")
+    if not data.strip():
+        raise ValueError("Data parameter is required")
+    data_format = arguments.get("format") or "ndjson"
+    
+    print(f"📥 Ingesting {data_format} payload ({len(data)} bytes)...")
+    
+    # Bounded by the tool timeout rather than the per-query DB timeout
+    result = await async_engine.run_db(ingest_text, data, data_format, timeout=None)
+    
+    response_text = (f"**Ingested:** {result.rows_inserted} of {result.rows_received} rows "
+                     f"in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/sec)\n")
+    if result.rows_rejected:
+        response_text += f"\n**Rejected:** {result.rows_rejected} rows\n"
+        response_text += f"```json\n{json.dumps(result.errors, indent=2)}\n```"
+    
+    return CallToolResult(
+        content=[
+            TextContent(
+                type="text",
+                text=response_text
+            )
+        ]
+    )
+
+async def handle_export_query_results(arguments: Dict[str, Any]) -> CallToolResult:
+    """
+    Handle result export requests.
+    
+    Args:
+        arguments: Dictionary containing 'question' or 'sql' and an optional 'format' key
+        
+    Returns:
+        CallToolResult with the export's resource URI and description
+    """
+    question = (arguments.get("question") or "").strip()
+    sql = (arguments.get("sql") or "").strip()
+    result_format = arguments.get("format") or "arrow"
+    if bool(question) == bool(sql):
+        raise ValueError("Provide exactly one of 'question' or 'sql'")
+    
+    params = ()
+    if sql:
+        # Security check - only allow SELECT statements
+        if not sql.upper().startswith("SELECT"):
+            raise ValueError("Only SELECT statements are allowed for security reasons")
+    else:
+        is_valid, error_msg = db_engine.validate_question(question)
+        if not is_valid:
+            raise ValueError(error_msg)
+        sql, params = await async_engine.resolve_sql(question)
+    
+    print(f"📦 Exporting query results as {result_format}: {sql}")
+    
+    try:
+        export = await async_engine.export_sql_query(sql, result_format, get_budget('export'), params=params)
+    except sqlite3.Error:
+        if question:
+            # Never keep serving SQL that does not run
+            await async_engine.run_db(db_engine.invalidate_question, question)
+        raise
+    
+    details = export.to_dict()
+    response_text = f"**Exported SQL:** `{details['sql']}`\n\n"
+    response_text += (f"**Resource:** `{export.uri}` ({export.format.mimetype}, {export.rows} rows, "
+                      f"{export.bytes:,} bytes; available for {EXPORTS.ttl_seconds:.0f}s)\n\n")
+    response_text += f"**Columns:**\n```json\n{json.dumps(export.columns, indent=2)}\n```"
+    
+    return CallToolResult(
+        content=[
+            TextContent(
+                type="text",
+                text=response_text
+            )
+        ]
+    )
+
+async def handle_get_statistics(arguments: Dict[str, Any]) -> CallToolResult:
+    """
+    Handle server statistics requests.
+    
+    Args:
+        arguments: Empty dictionary (no arguments required)
+        
+    Returns:
+        CallToolResult with metrics, cache and pool statistics as JSON
+    """
+    print("📈 Collecting server statistics...")
+    
+    statistics = await async_engine.run_db(collect_statistics)
+    
+    response_text = "**Server Statistics:**\n"
+    response_text += f"```json\n{json.dumps(statistics, indent=2, default=str)}\n```"
+    
+    return CallToolResult(
+        content=[
+            TextContent(
+                type="text",
+                text=response_text
+            )
+        ]
+    )
+
 @server.list_resources()
 async def list_resources() -> ListResourcesResult:
     """
@@ -306,11 +686,19 @@ async def list_resources() -> ListResourcesResult:
                 description="Sample records from the usage_data table",
                 mimeType="application/json"
             )
+        ] + [
+            Resource(
+                uri=export.uri,
+                name=f"Query Results {export.id}",
+                description=f"{export.rows} rows exported from: {export.sql}",
+                mimeType=export.format.mimetype
+            )
+            for export in EXPORTS.list()
         ]
     )
 
 @server.read_resource()
-async def read_resource(uri: str) -> ReadResourceResult:
+async def read_resource(uri: str) -> List[ReadResourceContents]:
     """
     Read a specific resource by URI.
     
@@ -318,32 +706,22 @@ async def read_resource(uri: str) -> ReadResourceResult:
         uri: Resource URI to read
         
     Returns:
-        ReadResourceResult containing the resource content
+        The resource content (text for the schema and sample, bytes for exports)
     """
+    uri = str(uri)  # the SDK passes a parsed URL
     if uri == "database://usage_data/schema":
-        schema = db_engine.get_database_schema()
-        return ReadResourceResult(
-            contents=[
-                TextContent(
-                    type="text",
-                    text=schema
-                )
-            ]
-        )
+        schema = await async_engine.get_database_schema()
+        return [ReadResourceContents(content=schema, mime_type="application/sql")]
     elif uri == "database://usage_data/sample":
-        conn = db_engine.get_db_connection()
-        sample_results = conn.execute("SELECT * FROM usage_data LIMIT 5").fetchall()
-        sample_data = [dict(row) for row in sample_results]
-        conn.close()
-        
-        return ReadResourceResult(
-            contents=[
-                TextContent(
-                    type="text",
-                    text=json.dumps(sample_data, indent=2)
-                )
-            ]
-        )
+        sample_data = await async_engine.run_db(fetch_sample_data, 5)
+        return [ReadResourceContents(content=json.dumps(sample_data, indent=2), mime_type="application/json")]
+    elif uri.startswith(RESULT_URI_PREFIX):
+        export = EXPORTS.get_by_uri(uri)
+        if export is None:
+            raise ValueError(f"Export not found or expired: {uri}")
+        # Binary contents are sent base64-encoded as a blob
+        data = await async_engine.run_db(export.read_bytes)
+        return [ReadResourceContents(content=data, mime_type=export.format.mimetype)]
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
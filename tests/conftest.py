@@ -0,0 +1,79 @@
+"""
+Shared fixtures: small seeded usage databases.
+
+The seeded database is generated once per session. Tests that write get a
+private copy through ``usage_db`` / ``dense_db``.
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Engines are constructed without ever calling the LLM
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from database.connection import init_database
+from database.seed_data.populate_database import create_connection, generate_and_insert_data
+
+SEED = 20240501
+
+
+def _copy_database(source: Path, target: Path) -> Path:
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return target
+
+
+@pytest.fixture(scope='session')
+def seeded_db(tmp_path_factory) -> Path:
+    """Read-only seeded database (about 3,000 rows, one session per rollup key)."""
+    path = tmp_path_factory.mktemp('seeded') / 'usage.db'
+    init_database(path)
+    conn = create_connection(str(path))
+    try:
+        generate_and_insert_data(conn, scale=0.3, seed=SEED, history_days=120)
+    finally:
+        conn.close()
+    return path
+
+
+@pytest.fixture(scope='session')
+def dense_seeded_db(seeded_db, tmp_path_factory) -> Path:
+    """Seeded database with a second session per key, so the daily rollup is about half its size."""
+    path = _copy_database(seeded_db, tmp_path_factory.mktemp('dense') / 'usage.db')
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('''
+            INSERT INTO usage_data (monitor_app_version, platform, user, application_name,
+                                    application_version, log_date, legacy_app, duration_seconds)
+            SELECT monitor_app_version, platform, user, application_name, application_version,
+                   substr(log_date, 1, 11) || '23:30:00Z', legacy_app, duration_seconds / 2 + 7
+            FROM usage_data ORDER BY id
+        ''')
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+@pytest.fixture
+def usage_db(seeded_db, tmp_path) -> Path:
+    """Private, writable copy of the seeded database."""
+    return _copy_database(seeded_db, tmp_path / 'usage.db')
+
+
+@pytest.fixture
+def dense_db(dense_seeded_db, tmp_path) -> Path:
+    """Private, writable copy of the dense seeded database."""
+    return _copy_database(dense_seeded_db, tmp_path / 'usage.db')
@@ -0,0 +1,40 @@
+"""
+Helpers for differential tests against raw SQLite.
+"""
+
+import sqlite3
+from typing import Any, Iterable, List, Sequence
+
+from database.pagination import has_total_order
+
+
+def _normalize(value: Any) -> Any:
+    # Aggregates computed another way may differ from SQLite in the last float bits
+    if isinstance(value, float):
+        return round(value, 6)
+    return value
+
+
+def normalize_rows(rows: Iterable[Sequence[Any]]) -> List[tuple]:
+    """Rows (tuples, sqlite3.Row or dicts' values) as comparable tuples."""
+    return [tuple(_normalize(value) for value in row) for row in rows]
+
+
+def sqlite_rows(db_path, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Run sql on a fresh, unpooled connection."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def assert_same_result(sql: str, expected, actual):
+    """
+    Assert two results are equal, comparing order only where ORDER BY determines it.
+    """
+    expected, actual = normalize_rows(expected), normalize_rows(actual)
+    if has_total_order(sql):
+        assert actual == expected, sql
+    else:
+        assert sorted(actual, key=repr) == sorted(expected, key=repr), sql
@@ -0,0 +1,82 @@
+"""
+Async engine: answers match SQLite, the event loop keeps running, and timeouts name their stage.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.stub_llm import AsyncStubLLMClient
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.async_query_engine import AsyncDatabaseQueryEngine, StageTimeoutError
+from database.query_engine import DatabaseQueryEngine
+from tests.support import assert_same_result, normalize_rows, sqlite_rows
+
+SLOW_SQL = "SELECT COUNT(*) FROM usage_data a, usage_data b, usage_data c"
+
+
+@pytest.fixture
+def engine(usage_db):
+    engine = AsyncDatabaseQueryEngine(DatabaseQueryEngine(usage_db), max_workers=1)
+    engine.client = AsyncStubLLMClient(latency_ms=20)
+    yield engine
+    engine.shutdown()
+
+
+def test_answers_match_sqlite(usage_db, engine):
+    async def main():
+        return await asyncio.gather(*(engine.process_natural_language_query(example['question'])
+                                      for example in SQL_FEW_SHOT_EXAMPLES[:4]))
+
+    for result in asyncio.run(main()):
+        expected = sqlite_rows(usage_db, result['sql'])
+        assert_same_result(result['sql'], expected, [tuple(row.values()) for row in result['data']])
+
+
+def test_loop_not_blocked_by_queries(engine):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await asyncio.gather(*(engine.process_natural_language_query(example['question'])
+                               for example in SQL_FEW_SHOT_EXAMPLES[:4]))
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(main()) > 0
+
+
+def test_database_timeout_names_stage_and_interrupts(usage_db, engine):
+    async def main():
+        started = time.monotonic()
+        with pytest.raises(StageTimeoutError) as raised:
+            await engine.execute_sql_query(SLOW_SQL, timeout=0.2)
+        # The statement was interrupted, so the single worker is free again
+        rows = await engine.execute_sql_query("SELECT COUNT(*) FROM usage_data", timeout=5)
+        return raised.value, rows, time.monotonic() - started
+
+    error, rows, elapsed = asyncio.run(main())
+    assert (error.stage, error.setting, error.seconds) == ('database', 'DB_TIMEOUT_SECONDS', 0.2)
+    assert 'DB_TIMEOUT_SECONDS' in str(error)
+    assert isinstance(error, asyncio.TimeoutError)
+    assert normalize_rows(rows) == sqlite_rows(usage_db, "SELECT COUNT(*) FROM usage_data")
+    assert elapsed < 5
+
+
+def test_llm_timeout_names_stage(engine):
+    engine.client = AsyncStubLLMClient(latency_ms=500)
+
+    async def main():
+        with pytest.raises(StageTimeoutError) as raised:
+            await engine.generate_sql_from_question("Which app was used the most last week?", timeout=0.05)
+        return raised.value
+
+    error = asyncio.run(main())
+    assert (error.stage, error.setting) == ('LLM', 'LLM_TIMEOUT_SECONDS')
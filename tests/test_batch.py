@@ -0,0 +1,124 @@
+"""
+Batched questions: duplicates run once, concurrency is bounded, failures stay per item.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from benchmarks.stub_llm import AsyncStubLLMClient
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.async_query_engine import AsyncDatabaseQueryEngine, StageTimeoutError
+from database.batch import dedupe_questions, run_batch, run_batch_async, validate_batch
+from database.budget import BudgetExceededError, QueryBudget
+from database.query_engine import DatabaseQueryEngine
+from tests.support import assert_same_result, sqlite_rows
+
+
+class _Recorder:
+    """Fake question processor that tracks calls and how many run at once."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, question):
+        with self._lock:
+            self.calls.append(question)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _answer(question):
+        if question.startswith('fail'):
+            raise ValueError(f"cannot answer {question}")
+        return {'answer': question.upper()}
+
+    def __call__(self, question):
+        self._enter(question)
+        try:
+            time.sleep(self.delay)
+            return self._answer(question)
+        finally:
+            self._exit()
+
+    async def process_natural_language_query(self, question, budget=None):
+        self._enter(question)
+        try:
+            await asyncio.sleep(self.delay)
+            if question == 'slow llm':
+                raise StageTimeoutError('LLM', 'LLM_TIMEOUT_SECONDS', 0.5)
+            if question == 'too many rows':
+                raise BudgetExceededError('rows', budget, 0.1, rows=11)
+            return self._answer(question)
+        finally:
+            self._exit()
+
+
+def test_dedupe_uses_normalized_questions():
+    unique, mapping = dedupe_questions(["Top apps?", "top  apps", "Top 3 apps", "TOP APPS"])
+    assert unique == ["Top apps?", "Top 3 apps"]
+    assert mapping == [0, 0, 1, 0]
+
+
+@pytest.mark.parametrize('questions', [[], "one question", [1, 2], ["q"] * 1000])
+def test_invalid_batches_rejected(questions):
+    with pytest.raises(ValueError):
+        validate_batch(questions)
+
+
+def test_thread_batch_keeps_order_and_isolates_failures():
+    process = _Recorder()
+    questions = ['a', 'fail 1', 'b', 'A', 'c']
+    batch = run_batch(process, questions, concurrency=4)
+
+    assert sorted(process.calls) == ['a', 'b', 'c', 'fail 1']
+    assert [item['question'] for item in batch['results']] == questions
+    assert [item['success'] for item in batch['results']] == [True, False, True, True, True]
+    assert batch['results'][3]['answer'] == 'A' and batch['results'][3]['duplicate_of'] == 0
+    assert 'cannot answer' in batch['results'][1]['error']
+    assert (batch['total'], batch['unique'], batch['succeeded'], batch['failed']) == (5, 4, 4, 1)
+
+
+def test_thread_batch_bounds_concurrency():
+    process = _Recorder(delay=0.05)
+    batch = run_batch(process, [f'q{n}' for n in range(12)], concurrency=3)
+    assert process.peak == 3
+    assert batch['wall_seconds'] < 12 * 0.05
+
+
+def test_async_batch_bounds_concurrency_and_reports_errors():
+    engine = _Recorder(delay=0.05)
+    budget = QueryBudget('test', max_rows=10)
+    questions = [f'q{n}' for n in range(6)] + ['slow llm', 'too many rows']
+    batch = asyncio.run(run_batch_async(engine, questions, concurrency=2, budget=budget))
+
+    assert engine.peak == 2
+    items = {item['question']: item for item in batch['results']}
+    assert 'LLM_TIMEOUT_SECONDS' in items['slow llm']['error']
+    assert items['too many rows']['budget_exceeded']['kind'] == 'rows'
+    assert (batch['succeeded'], batch['failed']) == (6, 2)
+
+
+def test_async_batch_answers_match_sqlite(usage_db):
+    engine = AsyncDatabaseQueryEngine(DatabaseQueryEngine(usage_db), max_workers=2)
+    engine.client = AsyncStubLLMClient(latency_ms=5)
+    questions = [example['question'] for example in SQL_FEW_SHOT_EXAMPLES[:4]]
+    try:
+        batch = asyncio.run(run_batch_async(engine, questions + questions[:2], concurrency=3))
+    finally:
+        engine.shutdown()
+
+    assert (batch['total'], batch['unique'], batch['failed']) == (6, 4, 0)
+    for item in batch['results']:
+        expected = sqlite_rows(usage_db, item['sql'])
+        assert_same_result(item['sql'], expected, [tuple(row.values()) for row in item['data']])
@@ -0,0 +1,75 @@
+"""
+Query budgets: time limits and cancellation stop statements inside SQLite, row caps stop fetching.
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from database.budget import BudgetExceededError, QueryBudget, QueryGuard, get_budget
+from database.query_engine import DatabaseQueryEngine
+
+SLOW_SQL = "SELECT COUNT(*) FROM usage_data a, usage_data b, usage_data c"
+
+
+@pytest.fixture
+def conn(seeded_db):
+    conn = sqlite3.connect(seeded_db, check_same_thread=False)
+    yield conn
+    conn.close()
+
+
+def _run(conn, guard, sql):
+    with guard.attach(conn):
+        return guard.fetch(conn.execute(sql))
+
+
+def test_time_budget_interrupts_statement(conn):
+    guard = QueryGuard(QueryBudget('test', time_limit_seconds=0.1))
+    started = time.monotonic()
+    with pytest.raises(BudgetExceededError) as raised:
+        _run(conn, guard, SLOW_SQL)
+    assert raised.value.kind == 'time'
+    assert time.monotonic() - started < 5
+    # The handler is removed, so the connection is usable again
+    assert conn.execute("SELECT COUNT(*) FROM usage_data").fetchone()[0] > 0
+
+
+def test_row_cap(conn):
+    budget = QueryBudget('test', max_rows=10)
+    assert len(_run(conn, QueryGuard(budget), "SELECT id FROM usage_data LIMIT 10")) == 10
+    with pytest.raises(BudgetExceededError) as raised:
+        _run(conn, QueryGuard(budget), "SELECT id FROM usage_data")
+    error = raised.value
+    assert (error.kind, error.rows) == ('rows', 11)
+    assert error.to_dict()['budget'] == {'entry_point': 'test', 'time_limit_seconds': None, 'max_rows': 10}
+
+
+def test_cancel_from_another_thread_interrupts(conn):
+    guard = QueryGuard(QueryBudget('test'))
+    threading.Timer(0.1, guard.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(BudgetExceededError) as raised:
+        _run(conn, guard, SLOW_SQL)
+    assert raised.value.kind == 'cancelled'
+    assert time.monotonic() - started < 5
+
+
+def test_cancelled_guard_refuses_to_start(conn):
+    guard = QueryGuard(QueryBudget('test'))
+    guard.cancel()
+    with pytest.raises(BudgetExceededError):
+        _run(conn, guard, "SELECT 1")
+
+
+def test_engine_enforces_guard_and_recovers(usage_db):
+    engine = DatabaseQueryEngine(usage_db)
+    with pytest.raises(BudgetExceededError):
+        engine.execute_sql_query(SLOW_SQL, guard=QueryGuard(QueryBudget('test', time_limit_seconds=0.1)))
+    assert engine.execute_sql_query("SELECT COUNT(*) FROM usage_data")[0][0] > 0
+
+
+def test_unknown_entry_point_uses_default():
+    assert get_budget('no-such-entry-point') is get_budget('default')
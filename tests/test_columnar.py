@@ -0,0 +1,84 @@
+"""
+Differential tests: aggregates answered from the columnar store must match SQLite row for row.
+"""
+
+import sqlite3
+
+import pytest
+
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.columnar import ColumnarStore
+from tests.support import assert_same_result, sqlite_rows
+
+QUERIES = [example['sql'] for example in SQL_FEW_SHOT_EXAMPLES] + [
+    "SELECT COUNT(*) FROM usage_data",
+    "SELECT application_name, SUM(duration_seconds) AS total, COUNT(*) AS sessions FROM usage_data "
+    "GROUP BY application_name ORDER BY total DESC",
+    "SELECT platform, user, AVG(duration_seconds) FROM usage_data WHERE legacy_app = 0 GROUP BY platform, user",
+    "SELECT platform, MIN(duration_seconds) AS shortest, MAX(duration_seconds) AS longest FROM usage_data "
+    "GROUP BY platform ORDER BY platform",
+    "SELECT user, COUNT(*) AS n FROM usage_data WHERE log_date >= '2024-03-01' AND application_name = 'Slack' "
+    "GROUP BY user ORDER BY n DESC, user LIMIT 5",
+    "SELECT DISTINCT platform FROM usage_data ORDER BY platform",
+    "SELECT SUM(duration_seconds) FROM usage_data WHERE user = 'nobody'",
+]
+
+CHANGES = [
+    "UPDATE usage_data SET duration_seconds = duration_seconds + 1000 WHERE id % 3 = 0",
+    "UPDATE usage_data SET application_name = 'Renamed' WHERE application_name = 'Slack'",
+    "DELETE FROM usage_data WHERE id % 4 = 0",
+    "INSERT INTO usage_data (monitor_app_version, platform, user, application_name, application_version, "
+    "log_date, legacy_app, duration_seconds) SELECT monitor_app_version, platform, user, 'NewApp', "
+    "application_version, log_date, legacy_app, duration_seconds FROM usage_data WHERE id % 9 = 0",
+]
+
+
+def _assert_matches_sqlite(db_path, store: ColumnarStore) -> int:
+    assert store.wait_until_loaded(timeout=60)
+    answered = 0
+    for sql in QUERIES:
+        rows = store.execute(sql)
+        if rows is None:
+            continue
+        answered += 1
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.execute(sql)
+            names = [column[0] for column in cursor.description]
+            expected = cursor.fetchall()
+        finally:
+            conn.close()
+        assert all(isinstance(row, sqlite3.Row) and row.keys() == names for row in rows), sql
+        assert_same_result(sql, expected, rows)
+    return answered
+
+
+def test_answers_match_sqlite(usage_db):
+    store = ColumnarStore(usage_db)
+    assert _assert_matches_sqlite(usage_db, store) >= len(QUERIES) // 2, store.get_stats()['rejected']
+
+
+def test_first_load_does_not_block(usage_db):
+    store = ColumnarStore(usage_db)
+    assert store.execute(QUERIES[-1]) is None  # answered by SQLite while the snapshot is built
+    assert store.wait_until_loaded(timeout=60)
+    assert store.execute(QUERIES[-1]) is not None
+
+
+@pytest.mark.parametrize('change', CHANGES)
+def test_follows_changes(usage_db, change):
+    store = ColumnarStore(usage_db)
+    _assert_matches_sqlite(usage_db, store)
+    conn = sqlite3.connect(usage_db)
+    try:
+        conn.execute(change)
+        conn.commit()
+    finally:
+        conn.close()
+    assert _assert_matches_sqlite(usage_db, store)
+    stats = store.get_stats()
+    assert stats['rows'] == sqlite_rows(usage_db, "SELECT COUNT(*) FROM usage_data")[0][0]
+    if change.startswith('INSERT'):
+        assert stats['appends'] == 1
+    else:
+        assert stats['loads'] == 2
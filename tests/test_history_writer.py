@@ -0,0 +1,99 @@
+"""
+Background query_history writer and the compressed history store.
+"""
+
+import threading
+import time
+
+from database.connection import get_db_connection
+from database.history_store import ensure_history_schema, get_history_item, list_history
+from database.history_writer import HistoryWriter
+
+
+def _result(n: int):
+    return {'answer': f'answer {n}', 'sql': f'SELECT {n}', 'data': [{'n': n}], 'row_count': 1}
+
+
+def _history(db_path, limit=500):
+    conn = get_db_connection(db_path)
+    try:
+        ensure_history_schema(conn, key=str(db_path))
+        return list_history(conn, limit)
+    finally:
+        conn.close()
+
+
+def test_close_writes_queued_rows(usage_db):
+    writer = HistoryWriter(usage_db, flush_interval=0.05, retention_interval=0)
+    for n in range(25):
+        assert writer.record(f'question {n}', _result(n))
+    writer.close()
+    items = _history(usage_db)['items']
+    assert sorted(item['query'] for item in items) == sorted(f'question {n}' for n in range(25))
+    assert not writer.record('late', _result(0))  # closed writers drop rows
+
+
+def test_flush_waits_for_earlier_rows(usage_db):
+    writer = HistoryWriter(usage_db, flush_interval=0.05, retention_interval=0)
+    try:
+        writer.record('first', _result(1))
+        assert writer.flush(timeout=5)
+        assert [item['query'] for item in _history(usage_db)['items']] == ['first']
+    finally:
+        writer.close()
+
+
+def test_flush_is_bounded_while_rows_keep_arriving(usage_db):
+    writer = HistoryWriter(usage_db, flush_interval=0.05, retention_interval=0)
+    stop = threading.Event()
+
+    def produce():
+        n = 0
+        while not stop.is_set():
+            writer.record(f'busy {n}', _result(n))
+            n += 1
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    try:
+        started = time.monotonic()
+        writer.flush(timeout=1)
+        assert time.monotonic() - started < 3
+    finally:
+        stop.set()
+        producer.join()
+        writer.close()
+
+
+def test_stored_response_round_trips(usage_db):
+    writer = HistoryWriter(usage_db, flush_interval=0.01, retention_interval=0)
+    writer.record('round trip', _result(7))
+    writer.close()
+    summary = _history(usage_db)['items'][0]
+    assert summary['answer_preview'] == 'answer 7' and summary['row_count'] == 1
+    conn = get_db_connection(usage_db)
+    try:
+        item = get_history_item(conn, summary['id'])
+    finally:
+        conn.close()
+    assert item['response']['data'] == [{'n': 7}]
+    assert item['sql_query'] == 'SELECT 7'
+
+
+def test_history_pages_by_keyset(usage_db):
+    writer = HistoryWriter(usage_db, flush_interval=0.01, retention_interval=0)
+    for n in range(7):
+        writer.record(f'page {n}', _result(n))
+    writer.close()
+    conn = get_db_connection(usage_db)
+    try:
+        seen, before = [], None
+        while True:
+            page = list_history(conn, 3, before)
+            seen += [item['id'] for item in page['items']]
+            before = page['next_before']
+            if before is None:
+                break
+    finally:
+        conn.close()
+    assert len(seen) == len(set(seen)) == 7
@@ -0,0 +1,76 @@
+"""
+Managed indexes and the index advisor.
+"""
+
+import sqlite3
+
+from database.indexes import (ADVISED_INDEX_PREFIX, INDEX_DEFINITIONS, IndexAdvisor, IndexDefinition,
+                              _existing_indexes, ensure_indexes)
+
+LEGACY_SQL = ("SELECT COUNT(DISTINCT application_name) AS result FROM usage_data "
+              "WHERE legacy_app = 1 AND LOWER(platform) = 'windows'")
+UNUSED = IndexDefinition('idx_usage_version_unused', 'usage_data', ('monitor_app_version',))
+
+
+def _index_names(db_path, prefix='idx_'):
+    conn = sqlite3.connect(db_path)
+    try:
+        return set(_existing_indexes(conn, prefix))
+    finally:
+        conn.close()
+
+
+def _grow(db_path, doublings: int):
+    conn = sqlite3.connect(db_path)
+    try:
+        for _ in range(doublings):
+            conn.execute('''
+                INSERT INTO usage_data (monitor_app_version, platform, user, application_name,
+                                        application_version, log_date, legacy_app, duration_seconds)
+                SELECT monitor_app_version, platform, user, application_name, application_version,
+                       log_date, legacy_app, duration_seconds
+                FROM usage_data
+            ''')
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_ensure_indexes_drops_retired_and_keeps_foreign(usage_db):
+    conn = sqlite3.connect(usage_db)
+    try:
+        conn.execute("CREATE INDEX idx_usage_retired ON usage_data (user)")
+        conn.execute("CREATE INDEX idx_other_user ON usage_data (user)")
+        report = ensure_indexes(conn)
+    finally:
+        conn.close()
+    assert report['dropped'] == ['idx_usage_retired']
+    assert report['unchanged'] == [definition.name for definition in INDEX_DEFINITIONS]
+    assert 'idx_other_user' in _index_names(usage_db)
+
+
+def test_audit_separates_needed_from_unused_and_changes_nothing(usage_db):
+    _grow(usage_db, 4)  # about 50,000 rows, so full scans take measurable time
+    conn = sqlite3.connect(usage_db)
+    try:
+        ensure_indexes(conn, INDEX_DEFINITIONS + [UNUSED])
+    finally:
+        conn.close()
+    before = _index_names(usage_db)
+
+    audits = {audit.name: audit for audit in IndexAdvisor(usage_db, history_limit=0).audit([LEGACY_SQL])}
+
+    assert set(audits) == {definition.name for definition in INDEX_DEFINITIONS + [UNUSED]}
+    assert audits['idx_usage_legacy_platform_app'].verdict == 'needed'
+    assert audits['idx_usage_legacy_platform_app'].slowest_sql == LEGACY_SQL
+    assert audits[UNUSED.name].verdict == 'unused'
+    assert _index_names(usage_db) == before
+
+
+def test_advisor_rolls_back_proposals_unless_applied(usage_db):
+    sql = "SELECT application_version, COUNT(*) FROM usage_data GROUP BY application_version"
+    entries = IndexAdvisor(usage_db, history_limit=0, repeat=1).run(extra_queries=[sql])
+    assert entries[0].proposal is not None
+    assert entries[0].before_ms is not None and entries[0].after_ms is not None
+    assert not _index_names(usage_db, ADVISED_INDEX_PREFIX)
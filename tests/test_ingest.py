@@ -0,0 +1,121 @@
+"""
+Bulk ingestion: bad rows are counted and reported, good rows land in usage_data.
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+from database import ingest
+from database.ingest import MAX_REPORTED_ERRORS, IngestError, ingest_stream, ingest_text
+from tests.support import sqlite_rows
+
+ROW = {
+    'monitor_app_version': '2.1.0', 'platform': 'Linux', 'user': 'ingest.user',
+    'application_name': 'Slack', 'application_version': '4.0', 'log_date': '2024-03-01T10:00:00Z',
+    'legacy_app': False, 'duration_seconds': 120,
+}
+HEADER = ','.join(ROW)
+INGESTED_SQL = ("SELECT platform, application_name, legacy_app, duration_seconds FROM usage_data "
+                "WHERE user = 'ingest.user' ORDER BY duration_seconds")
+
+
+def _ndjson(*rows) -> str:
+    return ''.join((row if isinstance(row, str) else json.dumps({**ROW, **row})) + '\n' for row in rows)
+
+
+def _csv(*lines) -> str:
+    return HEADER + '\n' + ''.join(line + '\n' for line in lines)
+
+
+def _csv_line(**changes) -> str:
+    return ','.join(str(value) for value in {**ROW, **changes}.values())
+
+
+def _indexes(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'usage_data' AND sql IS NOT NULL"))
+    finally:
+        conn.close()
+
+
+def test_ndjson_rejections_are_counted_with_line_numbers(usage_db):
+    text = _ndjson(
+        {'duration_seconds': 1},
+        'not json',
+        '[1, 2]',
+        '',
+        {'log_date': '2024-03-01'},
+        {'duration_seconds': -5},
+        {'legacy_app': 'maybe'},
+        {'duration_seconds': 2, 'legacy_app': 'true'},
+    ) + json.dumps({key: value for key, value in ROW.items() if key != 'user'}) + '\n'
+    result = ingest_text(text, 'ndjson', usage_db, refresh_rollup=False)
+
+    assert (result.rows_received, result.rows_inserted, result.rows_rejected) == (8, 2, 6)
+    assert [error['line'] for error in result.errors] == [2, 3, 5, 6, 7, 9]
+    assert 'log_date' in result.errors[2]['error'] and 'user' in result.errors[5]['error']
+    assert sqlite_rows(usage_db, INGESTED_SQL) == [('Linux', 'Slack', 0, 1), ('Linux', 'Slack', 1, 2)]
+
+
+def test_csv_rejections_are_counted_with_line_numbers(usage_db):
+    text = _csv(
+        _csv_line(duration_seconds=1),
+        _csv_line(duration_seconds=2) + ',extra',
+        _csv_line(legacy_app='maybe'),
+        _csv_line(duration_seconds='1.5'),
+        _csv_line(duration_seconds=3, legacy_app='TRUE'),
+    )
+    result = ingest_text(text, 'csv', usage_db, refresh_rollup=False)
+
+    assert (result.rows_received, result.rows_inserted, result.rows_rejected) == (5, 2, 3)
+    assert [error['line'] for error in result.errors] == [3, 4, 5]
+    assert sqlite_rows(usage_db, INGESTED_SQL) == [('Linux', 'Slack', 0, 1), ('Linux', 'Slack', 1, 3)]
+
+
+def test_every_rejection_counted_but_report_capped(usage_db):
+    bad = MAX_REPORTED_ERRORS + 25
+    text = _ndjson(*[{'duration_seconds': -1}] * bad, {'duration_seconds': 9})
+    result = ingest_text(text, 'ndjson', usage_db, batch_size=20, refresh_rollup=False)
+    assert result.rows_rejected == bad and len(result.errors) == MAX_REPORTED_ERRORS
+    assert result.rows_inserted == 1
+
+
+def test_csv_header_must_name_every_column(usage_db):
+    with pytest.raises(IngestError):
+        ingest_text('platform,user\nLinux,someone\n', 'csv', usage_db)
+
+
+def test_rebuilt_indexes_match_and_rows_land(usage_db):
+    before = _indexes(usage_db)
+    text = _ndjson(*[{'duration_seconds': n} for n in range(50)])
+    result = ingest_text(text, 'ndjson', usage_db, batch_size=10, rebuild_indexes=True, refresh_rollup=False)
+    assert result.indexes_rebuilt and result.rows_inserted == 50
+    assert _indexes(usage_db) == before
+    assert len(sqlite_rows(usage_db, INGESTED_SQL)) == 50
+
+
+def test_large_load_switches_to_rebuild(usage_db, monkeypatch):
+    monkeypatch.setattr(ingest, 'INGEST_REBUILD_MIN_ROWS', 20)
+    monkeypatch.setattr(ingest, 'INGEST_REBUILD_RATIO', 0.0)
+    small = ingest_text(_ndjson({'duration_seconds': 1}), 'ndjson', usage_db, refresh_rollup=False)
+    large = ingest_text(_ndjson(*[{'duration_seconds': n} for n in range(50)]), 'ndjson', usage_db,
+                        batch_size=10, refresh_rollup=False)
+    assert not small.indexes_rebuilt and large.indexes_rebuilt
+
+
+def test_failed_load_keeps_indexes_and_rows(usage_db):
+    before_indexes = _indexes(usage_db)
+    before_rows = sqlite_rows(usage_db, "SELECT COUNT(*) FROM usage_data")
+
+    def lines():
+        yield from _ndjson(*[{'duration_seconds': n} for n in range(30)]).splitlines(keepends=True)
+        raise RuntimeError("connection reset")
+
+    with pytest.raises(RuntimeError):
+        ingest_stream(lines(), 'ndjson', usage_db, batch_size=10, rebuild_indexes=True, refresh_rollup=False)
+    assert _indexes(usage_db) == before_indexes
+    assert sqlite_rows(usage_db, "SELECT COUNT(*) FROM usage_data") == before_rows
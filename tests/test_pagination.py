@@ -0,0 +1,94 @@
+"""
+Cursor pagination: pages must add up to the full result, and tampered tokens must be rejected.
+"""
+
+import sqlite3
+
+import pytest
+
+from database.pagination import (InvalidCursorError, _fingerprint, build_page, encode_token, fetch_page_rows,
+                                 has_total_order, plan_page)
+from database.sql_normalize import normalize_sql
+from tests.support import normalize_rows, sqlite_rows
+
+
+@pytest.fixture
+def conn(seeded_db):
+    conn = sqlite3.connect(seeded_db)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def _all_pages(conn, sql, page_size):
+    pages, token = [], None
+    while True:
+        plan = plan_page(sql, page_size, token)
+        page = build_page(plan, fetch_page_rows(conn, plan))
+        pages.append(page)
+        token = page.next_token
+        if token is None:
+            return pages
+
+
+@pytest.mark.parametrize('sql, mode', [
+    ("SELECT * FROM usage_data", 'keyset'),
+    ("SELECT id, user FROM usage_data WHERE platform = 'Linux' ORDER BY id DESC", 'keyset'),
+    ("SELECT user, COUNT(*) AS n FROM usage_data GROUP BY user ORDER BY user", 'offset'),
+])
+def test_pages_add_up_to_the_full_result(seeded_db, conn, sql, mode):
+    pages = _all_pages(conn, sql, 97)
+    assert {page.mode for page in pages} == {mode}
+    assert all(page.stable for page in pages)
+    rows = [tuple(row.values()) for page in pages for row in page.rows]
+    expected = sqlite_rows(seeded_db, sql)
+    if mode == 'keyset' and 'ORDER BY' not in sql:
+        expected = sorted(expected)  # keyset pages come in id order
+    assert normalize_rows(rows) == normalize_rows(expected)
+
+
+def test_offset_pages_without_total_order_are_unstable(conn):
+    plan = plan_page("SELECT user, platform FROM usage_data ORDER BY user", 10)
+    assert plan.mode == 'offset' and not plan.stable
+    assert not build_page(plan, fetch_page_rows(conn, plan)).stable
+
+
+@pytest.mark.parametrize('sql, total', [
+    ("SELECT * FROM usage_data ORDER BY log_date, id", True),
+    ("SELECT user, platform, COUNT(*) FROM usage_data GROUP BY user, platform ORDER BY platform, user", True),
+    ("SELECT user, platform, COUNT(*) FROM usage_data GROUP BY user, platform ORDER BY user", False),
+    ("SELECT * FROM usage_data ORDER BY log_date", False),
+    ("SELECT * FROM usage_data", False),
+])
+def test_has_total_order(sql, total):
+    assert has_total_order(sql) is total
+
+
+SQL = "SELECT user, COUNT(*) AS n FROM usage_data GROUP BY user ORDER BY user"
+
+
+@pytest.mark.parametrize('state', [
+    {'o': 'ten'},
+    {'o': 1.5},
+    {'o': None},
+    {'o': True},
+    {'o': -10},
+    {'o': 10, 'k': 'abc'},
+])
+def test_tampered_token_rejected(state):
+    token = encode_token({'f': _fingerprint(normalize_sql(SQL)), **state})
+    with pytest.raises(InvalidCursorError):
+        plan_page(SQL, 10, token)
+
+
+@pytest.mark.parametrize('token', ['not base64 !', encode_token(['a list']), encode_token({'o': 10})])
+def test_malformed_or_foreign_token_rejected(token):
+    with pytest.raises(InvalidCursorError):
+        plan_page(SQL, 10, token)
+
+
+def test_token_for_other_sql_rejected(conn):
+    plan = plan_page(SQL, 5)
+    token = build_page(plan, fetch_page_rows(conn, plan)).next_token
+    with pytest.raises(InvalidCursorError):
+        plan_page(SQL.replace('ORDER BY user', 'ORDER BY n'), 5, token)
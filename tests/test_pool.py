@@ -0,0 +1,109 @@
+"""
+Connection pool: bounded size, reuse on close, waits and timeouts.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from database.pool import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def pool(usage_db):
+    pool = ConnectionPool(usage_db, max_size=2, timeout=5)
+    yield pool
+    pool.close()
+
+
+def test_exhausted_pool_times_out(pool):
+    first, second = pool.acquire(), pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.05)
+    assert time.monotonic() - started < 2
+    stats = pool.get_stats()
+    assert (stats['timeouts'], stats['in_use'], stats['utilisation']) == (1, 2, 1.0)
+    first.close()
+    second.close()
+
+
+def test_close_returns_connection_for_reuse(pool):
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.close()
+    conn.close()  # a second close is a no-op
+    with pool.connection() as again:
+        assert again.raw is raw
+    stats = pool.get_stats()
+    assert (stats['connections_created'], stats['idle_connections'], stats['in_use']) == (1, 1, 0)
+
+
+def test_waiter_gets_released_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    threading.Timer(0.1, held[0].close).start()
+    conn = pool.acquire(timeout=5)
+    assert conn.raw is held[0].raw
+    assert pool.get_stats()['waits'] == 1
+    conn.close()
+    held[1].close()
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    count = conn.execute("SELECT COUNT(*) FROM usage_data").fetchone()[0]
+    conn.execute("DELETE FROM usage_data")
+    conn.close()
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM usage_data").fetchone()[0] == count
+
+
+def test_broken_idle_connection_is_replaced(usage_db):
+    pool = ConnectionPool(usage_db, max_size=1, health_check_interval=0)
+    try:
+        conn = pool.acquire()
+        raw = conn.raw
+        conn.close()
+        raw.close()  # break it while idle
+        with pool.connection() as conn:
+            assert conn.raw is not raw
+            assert conn.execute("SELECT 1").fetchone()[0] == 1
+        stats = pool.get_stats()
+        assert (stats['health_check_failures'], stats['connections_discarded']) == (1, 1)
+    finally:
+        pool.close()
+
+
+def test_async_acquire_waits_without_blocking_loop(pool):
+    held = [pool.acquire(), pool.acquire()]
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        with pytest.raises(PoolTimeoutError):
+            await pool.acquire_async(timeout=0.2)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(main()) > 5
+    for conn in held:
+        conn.close()
+
+
+def test_closed_pool_refuses_and_closes_on_release(pool):
+    conn = pool.acquire()
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    conn.close()
+    assert pool.get_stats()['open_connections'] == 0
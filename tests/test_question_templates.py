@@ -0,0 +1,64 @@
+"""
+Template SQL must answer like hand-written SQL, and ambiguous questions must go to the LLM.
+"""
+
+import pytest
+
+from database.question_templates import TemplateMatcher
+from tests.support import assert_same_result, sqlite_rows
+
+# (question, reference SQL the template must agree with)
+MATCHED = [
+    ("What is the total usage time for Slack?",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack'"),
+    ("What is the average duration for Chrome?",
+     "SELECT AVG(duration_seconds) FROM usage_data WHERE application_name = 'Chrome'"),
+    ("How many sessions did Figma have?",
+     "SELECT COUNT(*) FROM usage_data WHERE application_name = 'Figma'"),
+    ("How many users used Excel?",
+     "SELECT COUNT(DISTINCT user) FROM usage_data WHERE application_name = 'Excel'"),
+    ("Which app has the most sessions?",
+     "SELECT application_name, COUNT(*) AS n FROM usage_data GROUP BY application_name "
+     "ORDER BY n DESC LIMIT 1"),
+    ("Top 3 users by usage time",
+     "SELECT user, SUM(duration_seconds) AS total FROM usage_data GROUP BY user "
+     "ORDER BY total DESC LIMIT 3"),
+    ("List all platforms",
+     "SELECT DISTINCT platform FROM usage_data ORDER BY platform"),
+]
+
+# Questions a template would answer with the wrong aggregate
+FALLTHROUGH = [
+    "Which user has the longest session?",
+    "Which app had the biggest session?",
+    "Which user spent the most time in one session?",
+    "Which users have the longest sessions?",
+    "Which application has the highest average duration?",
+    "Which user has the highest average session time?",
+    "What is the average number of sessions?",
+    "What is the average session count for Slack?",
+    "How many users have used the average app?",
+]
+
+
+@pytest.fixture
+def matcher(seeded_db):
+    return TemplateMatcher(seeded_db)
+
+
+@pytest.mark.parametrize('question, reference', MATCHED)
+def test_template_matches_reference_sql(seeded_db, matcher, question, reference):
+    match = matcher.match(question)
+    assert match is not None, question
+    expected = sqlite_rows(seeded_db, reference)
+    actual = sqlite_rows(seeded_db, match.sql, match.params)
+    if 'LIMIT' in reference:
+        # Ties at the cut-off may legitimately differ; compare the ranking measure
+        assert [row[-1] for row in actual] == [row[-1] for row in expected], match.sql
+    else:
+        assert_same_result(match.sql, expected, actual)
+
+
+@pytest.mark.parametrize('question', FALLTHROUGH)
+def test_ambiguous_questions_go_to_llm(matcher, question):
+    assert matcher.match(question) is None, matcher.match(question)
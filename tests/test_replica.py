@@ -0,0 +1,109 @@
+"""
+In-memory read replica: answers match the file, stale copies are never read, swaps are safe.
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from database import replica as replica_module
+from database.replica import ReadReplica
+from tests.support import sqlite_rows
+
+SQL = "SELECT platform, COUNT(*), SUM(duration_seconds) FROM usage_data GROUP BY platform ORDER BY platform"
+
+
+@pytest.fixture
+def replica(usage_db):
+    replica = ReadReplica(usage_db)
+    yield replica
+    replica.close()
+
+
+def _read(replica, sql=SQL):
+    conn = replica.acquire()
+    try:
+        return [tuple(row) for row in conn.execute(sql).fetchall()]
+    finally:
+        conn.close()
+
+
+def _write(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _wait_for_refreshes(replica, count, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = replica.get_stats()
+        if stats['refreshes'] >= count and not stats['refreshing']:
+            return stats
+        time.sleep(0.01)
+    raise AssertionError(f"replica did not refresh: {replica.get_stats()}")
+
+
+def test_replica_matches_file_and_is_read_only(usage_db, replica):
+    assert replica.refresh()
+    assert _read(replica) == sqlite_rows(usage_db, SQL)
+    conn = replica.acquire()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM usage_data")
+    finally:
+        conn.close()
+    stats = replica.get_stats()
+    assert (stats['replica_reads'], stats['fallback_reads']) == (2, 0)
+    assert stats['memory_bytes'] > 0
+
+
+@pytest.mark.parametrize('change', [
+    "UPDATE usage_data SET duration_seconds = duration_seconds * 2 WHERE platform = 'Linux'",
+    "DELETE FROM usage_data WHERE platform = 'Windows'",
+])
+def test_stale_replica_falls_back_then_swaps(usage_db, replica, change):
+    replica.refresh()
+    _write(usage_db, change)
+    expected = sqlite_rows(usage_db, SQL)
+
+    assert _read(replica) == expected  # served by the file while the copy is stale
+    assert replica.get_stats()['fallback_reads'] == 1
+
+    _wait_for_refreshes(replica, 2)
+    assert _read(replica) == expected
+    stats = replica.get_stats()
+    assert stats['replica_reads'] == 1 and stats['last_refresh_lag_seconds'] is not None
+
+
+def test_schema_change_makes_replica_stale(usage_db, replica):
+    replica.refresh()
+    _write(usage_db, "CREATE TABLE notes (id INTEGER PRIMARY KEY)")
+    _read(replica)
+    assert replica.get_stats()['fallback_reads'] == 1
+    _wait_for_refreshes(replica, 2)
+    assert _read(replica, "SELECT COUNT(*) FROM notes") == [(0,)]
+
+
+def test_connection_survives_swap(usage_db, replica):
+    replica.refresh()
+    held = replica.acquire()
+    before = [tuple(row) for row in held.execute(SQL).fetchall()]
+    _write(usage_db, "DELETE FROM usage_data WHERE platform = 'Linux'")
+    assert replica.refresh()
+    # The old copy stays readable until its last connection is returned
+    assert [tuple(row) for row in held.execute(SQL).fetchall()] == before
+    held.close()
+    assert _read(replica) == sqlite_rows(usage_db, SQL)
+
+
+def test_oversized_database_is_not_copied(usage_db, replica, monkeypatch):
+    monkeypatch.setattr(replica_module, 'READ_REPLICA_MAX_MB', 1e-6)
+    assert not replica.refresh()
+    assert _read(replica) == sqlite_rows(usage_db, SQL)
+    stats = replica.get_stats()
+    assert 'READ_REPLICA_MAX_MB' in stats['last_error'] and stats['fallback_reads'] == 1
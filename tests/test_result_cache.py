@@ -0,0 +1,98 @@
+"""
+Result cache: repeated queries are served from memory until usage_data changes.
+"""
+
+import sqlite3
+
+import pytest
+
+from database.query_engine import DatabaseQueryEngine
+from database.result_cache import ResultCache, estimate_rows_size
+from tests.support import normalize_rows, sqlite_rows
+
+SQL = "SELECT user, SUM(duration_seconds) AS total FROM usage_data GROUP BY user ORDER BY total DESC, user"
+
+
+@pytest.fixture
+def engine(usage_db):
+    return DatabaseQueryEngine(usage_db)
+
+
+def _write(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run(engine, sql=SQL, params=()):
+    return normalize_rows(engine.execute_sql_query(sql, params=params))
+
+
+def test_repeat_is_served_from_cache(usage_db, engine):
+    first = _run(engine)
+    assert _run(engine) == first == normalize_rows(sqlite_rows(usage_db, SQL))
+    assert engine.result_cache.get_stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('change', [
+    "UPDATE usage_data SET duration_seconds = duration_seconds + 1000 WHERE id % 3 = 0",
+    "DELETE FROM usage_data WHERE id % 4 = 0",
+    "INSERT INTO usage_data (monitor_app_version, platform, user, application_name, application_version, "
+    "log_date, legacy_app, duration_seconds) VALUES ('1.0', 'Linux', 'new.user', 'Slack', '1', "
+    "'2024-03-01T10:00:00Z', 0, 99999)",
+])
+def test_writes_from_other_connections_invalidate(usage_db, engine, change):
+    before = _run(engine)
+    _write(usage_db, change)
+    after = _run(engine)
+    assert after == normalize_rows(sqlite_rows(usage_db, SQL))
+    assert after != before
+    assert engine.result_cache.get_stats()['stale'] == 1
+
+
+def test_unrelated_writes_keep_entries(usage_db, engine):
+    _run(engine)
+    _write(usage_db, "INSERT INTO query_history (query, sql_query, success) VALUES ('q', ?, 1)", (SQL,))
+    _run(engine)
+    assert engine.result_cache.get_stats()['hits'] == 1
+
+
+def test_parameters_are_part_of_the_key(usage_db, engine):
+    sql = "SELECT COUNT(*) FROM usage_data WHERE platform = ?"
+    for platform in ('Linux', 'Windows', 'Linux'):
+        assert _run(engine, sql, (platform,)) == sqlite_rows(usage_db, sql, (platform,))
+    assert engine.result_cache.get_stats()['hits'] == 1
+
+
+def test_volatile_sql_is_not_cached(engine):
+    sql = "SELECT COUNT(*) FROM usage_data WHERE abs(random()) >= 0"
+    _run(engine, sql)
+    _run(engine, sql)
+    stats = engine.result_cache.get_stats()
+    assert (stats['hits'], stats['stores']) == (0, 0)
+
+
+def test_lru_eviction_stays_within_budget():
+    rows = [(n, 'x' * 100) for n in range(10)]
+    cache = ResultCache(max_bytes=estimate_rows_size(rows) * 4)
+    for key in 'abcde':
+        assert cache.put(key, 1, rows)
+    cache.get('b', 1)  # most recently used survives
+    cache.put('f', 1, rows)
+    stats = cache.get_stats()
+    assert stats['bytes_used'] <= stats['max_bytes']
+    assert cache.get('a', 1) is None and cache.get('c', 1) is None
+    assert cache.get('b', 1) == rows
+    assert stats['evictions'] == 2
+
+
+def test_oversized_and_expired_entries():
+    cache = ResultCache(max_bytes=4096)
+    assert not cache.put('big', 1, [('x' * 2048,)])
+    cache.put('soon', 1, [(1,)], ttl=0)
+    assert cache.get('soon', 1) is None
+    stats = cache.get_stats()
+    assert (stats['rejected_too_large'], stats['expired']) == (1, 1)
@@ -0,0 +1,82 @@
+"""
+Arrow IPC / Parquet exports must read back as the rows SQLite returns.
+"""
+
+import io
+import sqlite3
+
+import pytest
+
+from database.result_export import ExportError, ExportStore
+from tests.support import sqlite_rows
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.ipc  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+SQL = ("SELECT id, user, application_name, duration_seconds, duration_seconds / 3600.0 AS hours, legacy_app "
+       "FROM usage_data WHERE platform = ? ORDER BY id")
+
+
+def _read(export):
+    data = export.read_bytes()
+    if export.format.name == 'parquet':
+        return pq.read_table(io.BytesIO(data))
+    return pyarrow.ipc.open_stream(data).read_all()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExportStore(directory=str(tmp_path / 'exports'))
+    yield store
+    store.clear()
+
+
+@pytest.mark.parametrize('result_format', ['arrow', 'parquet'])
+def test_export_round_trip(seeded_db, store, result_format):
+    conn = sqlite3.connect(seeded_db)
+    try:
+        export = store.export(conn, SQL, ('Linux',), result_format=result_format)
+    finally:
+        conn.close()
+    table = _read(export)
+    expected = sqlite_rows(seeded_db, SQL, ('Linux',))
+    assert export.rows == table.num_rows == len(expected)
+    assert table.column_names == ['id', 'user', 'application_name', 'duration_seconds', 'hours', 'legacy_app']
+    assert [tuple(row.values()) for row in table.to_pylist()] == expected
+    assert "'Linux'" in export.sql and '?' not in export.sql
+    assert store.get_by_uri(export.uri) is export
+
+
+def test_leading_nulls_take_the_later_type(store, tmp_path):
+    conn = sqlite3.connect(tmp_path / 'nulls.db')
+    try:
+        conn.execute("CREATE TABLE t (id INTEGER, value REAL)")
+        conn.executemany("INSERT INTO t VALUES (?, ?)", [(n, None if n < 5 else n / 2) for n in range(10)])
+        export = store.export(conn, "SELECT id, value FROM t ORDER BY id")
+    finally:
+        conn.close()
+    table = _read(export)
+    assert str(table.schema.field('value').type) == 'double'
+    assert table.column('value').to_pylist() == [None] * 5 + [n / 2 for n in range(5, 10)]
+
+
+def test_unknown_format_rejected(seeded_db, store):
+    conn = sqlite3.connect(seeded_db)
+    try:
+        with pytest.raises(ExportError):
+            store.export(conn, "SELECT 1", result_format='xlsx')
+    finally:
+        conn.close()
+
+
+def test_clear_deletes_files(seeded_db, store):
+    conn = sqlite3.connect(seeded_db)
+    try:
+        export = store.export(conn, "SELECT user FROM usage_data LIMIT 3")
+    finally:
+        conn.close()
+    store.clear()
+    assert store.get(export.id) is None
+    with pytest.raises(FileNotFoundError):
+        export.read_bytes()
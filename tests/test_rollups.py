@@ -0,0 +1,97 @@
+"""
+Differential tests: SQL rewritten to usage_daily_rollup must answer exactly like usage_data.
+"""
+
+import sqlite3
+
+import pytest
+
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.rollups import RollupRewriter
+from tests.support import assert_same_result, sqlite_rows
+
+QUERIES = [example['sql'] for example in SQL_FEW_SHOT_EXAMPLES] + [
+    "SELECT COUNT(*) AS sessions FROM usage_data",
+    "SELECT platform, COUNT(*) AS sessions, MIN(duration_seconds) AS shortest, "
+    "MAX(duration_seconds) AS longest FROM usage_data GROUP BY platform ORDER BY platform",
+    "SELECT application_name, AVG(duration_seconds) AS average FROM usage_data "
+    "WHERE log_date >= '2024-01-01' GROUP BY application_name ORDER BY average DESC, application_name",
+    "SELECT user, SUM(duration_seconds) AS total FROM usage_data WHERE LOWER(application_name) = 'slack' "
+    "AND log_date >= strftime('%Y-%m-%dT00:00:00Z', 'now', '-30 days') GROUP BY user ORDER BY total DESC, user",
+    "SELECT DISTINCT platform FROM usage_data WHERE legacy_app = 1 ORDER BY platform",
+    "SELECT COUNT(DISTINCT user) AS users FROM usage_data WHERE log_date BETWEEN '2024-02-01' AND '2024-02-29'",
+]
+
+
+def _rewritten(db_path, rewriter: RollupRewriter):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [(sql, rewriter.rewrite(conn, sql)) for sql in QUERIES]
+    finally:
+        conn.close()
+
+
+def test_rewrites_match_usage_data(dense_db):
+    rewriter = RollupRewriter(dense_db)
+    rewriter.refresh()
+    pairs = [(sql, rollup_sql) for sql, rollup_sql in _rewritten(dense_db, rewriter) if rollup_sql]
+    assert len(pairs) >= len(QUERIES) - 2, rewriter.get_stats()['rejected']
+    for sql, rollup_sql in pairs:
+        assert_same_result(sql, sqlite_rows(dense_db, sql), sqlite_rows(dense_db, rollup_sql))
+
+
+def test_rollup_not_used_when_not_smaller(usage_db):
+    # Seeded data has one session per rollup key, so the rollup saves nothing
+    rewriter = RollupRewriter(usage_db)
+    rewriter.refresh()
+    assert all(rollup_sql is None for _, rollup_sql in _rewritten(usage_db, rewriter))
+    stats = rewriter.get_stats()
+    assert stats['row_ratio'] > rewriter.max_row_ratio
+    assert stats['rejected'].get('rollup_not_smaller')
+
+
+@pytest.mark.parametrize('change', [
+    "UPDATE usage_data SET duration_seconds = duration_seconds + 100000 WHERE id % 7 = 0",
+    "DELETE FROM usage_data WHERE id % 5 = 0",
+])
+def test_rollup_follows_updates_and_deletes(dense_db, change):
+    rewriter = RollupRewriter(dense_db)
+    sql = ("SELECT user, SUM(duration_seconds) AS total, COUNT(*) AS sessions FROM usage_data "
+           "GROUP BY user ORDER BY user")
+    conn = sqlite3.connect(dense_db)
+    try:
+        rewriter.refresh()
+        assert rewriter.rewrite(conn, sql) is not None
+        conn.execute(change)
+        conn.commit()
+        # Stale: answered from usage_data while the rollup refreshes in the background
+        assert rewriter.rewrite(conn, sql) is None
+        rewriter.wait_for_refresh(timeout=30)
+        rollup_sql = rewriter.rewrite(conn, sql)
+    finally:
+        conn.close()
+    assert rollup_sql is not None
+    assert_same_result(sql, sqlite_rows(dense_db, sql), sqlite_rows(dense_db, rollup_sql))
+
+
+def test_rewrite_only_reads(dense_db):
+    rewriter = RollupRewriter(dense_db, max_row_ratio=1.0)  # the delete leaves single-session keys
+    rewriter.refresh()
+    writer = sqlite3.connect(dense_db)
+    try:
+        writer.execute("DELETE FROM usage_data WHERE id % 11 = 0")
+        writer.commit()
+    finally:
+        writer.close()
+
+    # A read-only connection would fail on any write; the stale rollup is simply not used
+    conn = sqlite3.connect(f"file:{dense_db}?mode=ro", uri=True)
+    try:
+        assert rewriter.rewrite(conn, QUERIES[-1]) is None
+        assert rewriter.get_stats()['rejected'].get('rollup_stale') == 1
+        rewriter.wait_for_refresh(timeout=30)
+        rollup_sql = rewriter.rewrite(conn, QUERIES[-1])
+    finally:
+        conn.close()
+    assert rollup_sql is not None
+    assert_same_result(QUERIES[-1], sqlite_rows(dense_db, QUERIES[-1]), sqlite_rows(dense_db, rollup_sql))
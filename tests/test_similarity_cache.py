@@ -0,0 +1,88 @@
+"""
+Reused SQL must answer the new question, and questions that differ in meaning must not share SQL.
+"""
+
+import numpy as np
+import pytest
+
+from database.similarity_cache import SimilarityCache, popcount
+from tests.support import assert_same_result, sqlite_rows
+
+PROMPT = 'test-prompt'
+
+# (indexed question, its SQL, similar question, SQL written for the similar question)
+REUSED = [
+    ("What is the total usage time for Slack?",
+     "SELECT SUM(duration_seconds) AS total FROM usage_data WHERE application_name = 'Slack'",
+     "Total time spent in Chrome",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Chrome'"),
+    ("Top 3 apps by usage",
+     "SELECT application_name, SUM(duration_seconds) AS total FROM usage_data "
+     "GROUP BY application_name ORDER BY total DESC, application_name LIMIT 3",
+     "Which five applications were used the most?",
+     "SELECT application_name, SUM(duration_seconds) AS total FROM usage_data "
+     "GROUP BY application_name ORDER BY total DESC, application_name LIMIT 5"),
+    ("How many hours did Windows users spend in Excel?",
+     "SELECT SUM(duration_seconds) / 3600.0 FROM usage_data WHERE platform = 'Windows' "
+     "AND application_name = 'Excel'",
+     "How many hours did Linux users spend in Figma?",
+     "SELECT SUM(duration_seconds) / 3600.0 FROM usage_data WHERE platform = 'Linux' "
+     "AND application_name = 'Figma'"),
+]
+
+# (indexed question, its SQL, question that must not reuse it)
+NOT_REUSED = [
+    ("Total usage time excluding Slack",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE LOWER(application_name) != 'slack'",
+     "Total usage time including Zoom"),
+    ("Total Slack usage excluding weekends",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack' "
+     "AND strftime('%w', log_date) NOT IN ('0', '6')",
+     "Total Slack usage on weekends"),
+    ("Total Slack usage",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack'",
+     "Total Slack usage on weekends"),
+    ("How many hours did users spend in Slack?",
+     "SELECT SUM(duration_seconds) / 3600.0 FROM usage_data WHERE application_name = 'Slack'",
+     "How many minutes did users spend in Slack?"),
+    ("Which apps did the most users use?",
+     "SELECT application_name, COUNT(DISTINCT user) AS users FROM usage_data "
+     "GROUP BY application_name ORDER BY users DESC",
+     "Which apps did the least users use?"),
+    ("Total Slack usage by interns",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack' AND user LIKE 'intern%'",
+     "Total Slack usage"),
+    ("Total Slack usage",
+     "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack'",
+     "Total Slack usage on mobile"),
+]
+
+
+@pytest.fixture
+def cache(usage_db):
+    return SimilarityCache(usage_db, refresh_interval=3600)
+
+
+@pytest.mark.parametrize('question, sql, similar, reference', REUSED)
+def test_reused_sql_matches_reference(usage_db, cache, question, sql, similar, reference):
+    cache.put(question, sql, PROMPT)
+    match = cache.get(similar, PROMPT)
+    assert match is not None, similar
+    assert_same_result(reference, sqlite_rows(usage_db, reference), sqlite_rows(usage_db, match.sql))
+
+
+@pytest.mark.parametrize('question, sql, other', NOT_REUSED)
+def test_different_meaning_not_reused(cache, question, sql, other):
+    cache.put(question, sql, PROMPT)
+    assert cache.get(other, PROMPT) is None
+
+
+def test_misspelling_still_reused(cache):
+    cache.put("What was the total usage time of Slack by contractors in the last week?",
+              "SELECT SUM(duration_seconds) FROM usage_data WHERE application_name = 'Slack'", PROMPT)
+    assert cache.get("What was the total usage time of Chrome by contracters in the last week?", PROMPT)
+
+
+def test_popcount_matches_bit_count():
+    values = np.array([0, 1, 2 ** 63, 2 ** 64 - 1, 0x0123456789ABCDEF], dtype=np.uint64)
+    assert popcount(values).tolist() == [bin(int(value)).count('1') for value in values]
@@ -0,0 +1,87 @@
+"""
+Two-tier question to SQL cache.
+"""
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from database.sql_cache import MAINTENANCE_INTERVAL, SQLCache, normalize_question
+
+PROMPT = 'prompt-a'
+SQL = "SELECT COUNT(*) FROM usage_data"
+
+
+def test_normalize_question_keeps_numbers():
+    assert normalize_question("  Top 3   APPS?! ") == normalize_question("top 3 apps")
+    assert normalize_question("top 3 apps") != normalize_question("top 5 apps")
+
+
+def test_memory_then_persistent_hit(usage_db):
+    cache = SQLCache(usage_db)
+    cache.put("How many sessions?", SQL, PROMPT)
+    assert cache.get("how many sessions", PROMPT) == SQL
+
+    # A new process (empty memory tier) reads the persistent table
+    restarted = SQLCache(usage_db)
+    assert restarted.get("How many sessions?", PROMPT) == SQL
+    stats = restarted.get_stats()
+    assert (stats['persistent_hits'], stats['memory_hits']) == (1, 0)
+    assert restarted.get("How many sessions?", PROMPT) == SQL
+    assert restarted.get_stats()['memory_hits'] == 1
+
+
+def test_prompt_change_invalidates(usage_db):
+    cache = SQLCache(usage_db)
+    cache.put("How many sessions?", SQL, PROMPT)
+    assert cache.get("How many sessions?", 'prompt-b') is None
+    assert SQLCache(usage_db).get("How many sessions?", 'prompt-b') is None
+
+
+def test_not_seeded_from_history(usage_db):
+    # query_history rows do not say which prompt produced their SQL
+    conn = sqlite3.connect(usage_db)
+    try:
+        conn.execute("INSERT INTO query_history (query, sql_query, success, timestamp) "
+                     "VALUES ('Old question', 'SELECT 1', 1, '2024-01-01 00:00:00')")
+        conn.commit()
+    finally:
+        conn.close()
+    assert SQLCache(usage_db).get("Old question", PROMPT) is None
+
+
+def test_invalidate_removes_both_tiers(usage_db):
+    cache = SQLCache(usage_db)
+    cache.put("How many sessions?", SQL, PROMPT)
+    cache.invalidate("How many sessions?")
+    assert cache.get("How many sessions?", PROMPT) is None
+    assert SQLCache(usage_db).get("How many sessions?", PROMPT) is None
+
+
+def test_expired_entries_miss(usage_db):
+    cache = SQLCache(usage_db, ttl_seconds=0)
+    cache.put("How many sessions?", SQL, PROMPT)
+    assert cache.get("How many sessions?", PROMPT) is None
+
+
+def test_persistent_table_is_capped(usage_db):
+    cache = SQLCache(usage_db, max_entries=10)
+    for n in range(MAINTENANCE_INTERVAL):
+        cache.put(f"question {n}", SQL, PROMPT)
+    conn = sqlite3.connect(usage_db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0] == 10
+    finally:
+        conn.close()
+    assert cache.get_stats()['persistent_evictions'] == MAINTENANCE_INTERVAL - 10
+
+
+def test_counters_are_exact_under_concurrency(usage_db):
+    cache = SQLCache(usage_db, memory_size=0)  # every lookup goes to the table
+    cache.put("How many sessions?", SQL, PROMPT)
+    lookups = 400
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda n: cache.get("How many sessions?" if n % 2 else f"miss {n}", PROMPT),
+                          range(lookups)))
+    stats = cache.get_stats()
+    assert stats['persistent_hits'] + stats['misses'] == lookups
+    assert stats['misses'] == lookups // 2
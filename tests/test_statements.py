@@ -0,0 +1,60 @@
+"""
+Differential tests: SQL run with its literals lifted into parameters must return what SQLite returns for the raw SQL.
+"""
+
+import sqlite3
+
+import pytest
+
+from core.prompts import SQL_FEW_SHOT_EXAMPLES
+from database.sql_normalize import parameterize_sql
+from database.statements import execute_statement
+
+QUERIES = [example['sql'] for example in SQL_FEW_SHOT_EXAMPLES] + [
+    "SELECT user, duration_seconds FROM usage_data WHERE application_name = 'Slack' AND duration_seconds > 3600 "
+    "ORDER BY duration_seconds DESC, id LIMIT 10 OFFSET 5",
+    "SELECT COUNT(*) FROM usage_data WHERE legacy_app = '1'",
+    "SELECT COUNT(*) FROM usage_data WHERE duration_seconds > '100'",
+    "SELECT COUNT(*) FROM usage_data WHERE duration_seconds BETWEEN 60.5 AND 1e4",
+    "SELECT COUNT(*) FROM usage_data WHERE duration_seconds > -1 AND user NOT IN ('Aanya', 'Aditi')",
+    "SELECT COUNT(*) FROM usage_data WHERE user LIKE 'A%' ESCAPE '\\' -- 'comment'",
+    "SELECT COUNT(*) FROM usage_data WHERE application_name = 'It''s' OR platform = \"platform\"",
+    "SELECT 'label' AS kind, 42, COUNT(*) FROM usage_data WHERE platform = 'Linux'",
+    "SELECT CASE WHEN duration_seconds > 600 THEN 'long' ELSE 'short' END AS bucket, COUNT(*) "
+    "FROM usage_data GROUP BY 1 ORDER BY 1",
+    "SELECT application_name, SUM(duration_seconds) AS total FROM usage_data GROUP BY application_name "
+    "HAVING SUM(duration_seconds) > 100000 AND COUNT(*) >= 10 ORDER BY 2 DESC, 1",
+    "SELECT user FROM usage_data WHERE id IN (SELECT id FROM usage_data WHERE duration_seconds < 120 LIMIT 3) "
+    "ORDER BY user",
+    "SELECT a.user, COUNT(*) FROM usage_data a JOIN usage_data b ON a.id = b.id AND b.platform = 'macOS' "
+    "WHERE a.log_date >= strftime('%Y-%m-%dT00:00:00Z', '2024-03-01', '-7 days') GROUP BY a.user ORDER BY a.user",
+    "SELECT COUNT(*) FROM usage_data WHERE log_date >= '2024-03-01' AND log_date < date('2024-03-01', '+1 month')",
+]
+
+
+def _run(db_path, sql, params=(), parameterized=False):
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = execute_statement(conn, sql, params) if parameterized else conn.execute(sql, params)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sql', QUERIES)
+def test_parameterized_matches_raw_sql(seeded_db, sql):
+    # Same column names and the same rows in the same order
+    assert _run(seeded_db, sql, parameterized=True) == _run(seeded_db, sql)
+
+
+def test_existing_placeholders_keep_their_values(seeded_db):
+    sql = "SELECT COUNT(*) FROM usage_data WHERE platform = ? AND duration_seconds > 300 AND user != ?"
+    params = ('Windows', 'Aanya')
+    assert _run(seeded_db, sql, params, parameterized=True) == _run(seeded_db, sql, params)
+
+
+def test_shapes_shared_across_values():
+    first, first_params = parameterize_sql("SELECT COUNT(*) FROM usage_data WHERE platform = 'Linux' LIMIT 5")
+    second, second_params = parameterize_sql("SELECT COUNT(*) FROM usage_data WHERE platform = 'macOS' LIMIT 9")
+    assert first == second
+    assert (first_params, second_params) == (('Linux', 5), ('macOS', 9))